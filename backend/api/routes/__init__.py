@@ -7,6 +7,7 @@ from fastapi import APIRouter
 from .chat import router as chat_router
 from .sessions import router as sessions_router
 from .auth import router as auth_router
+from .metrics import router as metrics_router
 
 # Create main router
 api_router = APIRouter()
@@ -14,4 +15,5 @@ api_router = APIRouter()
 # Include all sub-routers
 api_router.include_router(auth_router)
 api_router.include_router(chat_router)
-api_router.include_router(sessions_router)
\ No newline at end of file
+api_router.include_router(sessions_router)
+api_router.include_router(metrics_router)
\ No newline at end of file
@@ -3,25 +3,165 @@
 Chat-related API routes.
 """
 
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import StreamingResponse
-from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Request, Response, WebSocket, WebSocketDisconnect, status
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import json
+import time
 from models.chat import ChatRequest
-from services.firebase_service import firebase_service
+from config.settings import settings
+from services.storage import SessionNotFound, storage_service
+from services.conversation_memory import conversation_memory
 from services.openai_service import openai_service
+from services.model_router import model_router
+from services.response_cache import response_cache
+from services.admission import AdmissionRejected, admission_controller
+from services.generation import generation_manager
+from services.stream_broker import stream_broker
+from services.single_flight import single_flight
+from services.stage_timings import stage_timings
 from services.auth_service import auth_service
 from utils.constants import (
     ERROR_SESSION_REQUIRED,
+    ERROR_SESSION_NOT_FOUND,
+    ERROR_OPENAI_STREAMING,
+    ERROR_SERVER_BUSY,
+    ERROR_STREAM_EXPIRED,
+    ERROR_MESSAGE_NOT_SAVED,
     LOG_CHAT_REQUEST,
     LOG_CHAT_COMPLETE,
-    LOG_CHAT_ERROR
+    LOG_CHAT_ERROR,
+    LOG_CHAT_REJECTED,
+    LOG_CHAT_TRUNCATED,
+    LOG_CHAT_RESUMED,
+    LOG_CHAT_RESUME_MISSED,
+    LOG_CHAT_ATTACHED,
+    LOG_CHAT_PERSIST_FAILED,
+    LOG_CHAT_SESSION_MISSING,
+    LOG_CHAT_DEDUPED,
+    ERROR_WS_INVALID_MESSAGE,
+    ERROR_WS_TOO_MANY_REPLIES,
+    LOG_WS_CONNECTED,
+    LOG_WS_CLOSED,
+    WS_CLOSE_UNAUTHORIZED
 )
+from utils.sse import EventStreamResponse, coalesce_events, format_event, parse_event_id
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+async def reply_chunks(events: AsyncIterator[Tuple[str, str]]) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    A reply's (event id, chunk) pairs as `chunk` turn events.
+    
+    Deltas arriving close together are joined into one event (see
+    `coalesce_events`), whichever transport sends them.
+    """
+    events = coalesce_events(
+        events,
+        settings.sse_coalesce_window_ms / 1000,
+        settings.sse_coalesce_max_bytes
+    )
+    try:
+        async for pair in events:
+            yield "chunk", pair
+    finally:
+        await events.aclose()
+
+
+async def sse_frames(session_id: str, events: AsyncIterator[Tuple[str, Any]]):
+    """
+    SSE frames for turn events, then the completion signal.
+    
+    `queue` events carry the queue position. Chunk events carry ids
+    "<stream id>:<chunk index>", which a reconnecting EventSource sends
+    back as `Last-Event-ID`. A reply that fails ends with an `error` event
+    instead.
+    """
+    try:
+        async for kind, value in events:
+            if kind == "queue":
+                yield format_event(json.dumps({"position": value}), event="queue")
+            else:
+                event_id, chunk = value
+                yield format_event(chunk, event_id=event_id)
+        
+        # Send completion signal
+        yield format_event("[DONE]")
+    
+    except Exception as e:
+        logger.error(LOG_CHAT_ERROR.format(
+            session_id=session_id,
+            error=str(e)
+        ))
+        yield format_event(str(e), event="error")
+    
+    finally:
+        await events.aclose()
+
+
+def reply_events(session_id: str, events: AsyncIterator[Tuple[str, str]]):
+    """SSE frames for a reply's (event id, chunk) pairs (see `sse_frames`)."""
+    return sse_frames(session_id, reply_chunks(events))
+
+
+async def error_event(message: str):
+    """A single SSE `error` event."""
+    yield format_event(message, event="error")
+
+
+async def events_after(events: AsyncIterator[Tuple[str, str]], index: int) -> AsyncIterator[Tuple[str, str]]:
+    """A reply's (event id, chunk) pairs after chunk `index`."""
+    try:
+        async for event_id, chunk in events:
+            if parse_event_id(event_id)[1] > index:
+                yield event_id, chunk
+    finally:
+        await events.aclose()
+
+
+async def resume_stream(session_id: str, last_event_id: str) -> EventStreamResponse:
+    """
+    Continue a reply after a reconnect, without storing or generating anything.
+    
+    The reply is looked up on this worker first (live or in the replay
+    buffer), then followed from the worker generating it, since the
+    reconnect may land on another worker than the original request.
+    
+    Args:
+        session_id: The chat session ID
+        last_event_id: The id of the last event the client received
+        
+    Returns:
+        StreamingResponse with the rest of the reply, or an `error` event
+        if the reply is no longer available
+    """
+    position = parse_event_id(last_event_id)
+    events = None
+    if position is not None:
+        stream_id, index = position
+        generation = generation_manager.resume(stream_id, session_id)
+        if generation is not None:
+            events = generation.events(index + 1)
+        else:
+            live = await stream_broker.attach(session_id, stream_id=stream_id)
+            if live is not None:
+                events = events_after(live, index)
+    
+    if events is None:
+        logger.warning(LOG_CHAT_RESUME_MISSED.format(session_id=session_id, event_id=last_event_id))
+        return EventStreamResponse(error_event(ERROR_STREAM_EXPIRED))
+    
+    logger.info(LOG_CHAT_RESUMED.format(
+        stream_id=stream_id,
+        session_id=session_id,
+        index=index
+    ))
+    return EventStreamResponse(reply_events(session_id, events))
+
+
 @router.post("")
 async def chat_endpoint(payload: ChatRequest):
     """
@@ -33,41 +173,314 @@ async def chat_endpoint(payload: ChatRequest):
     Returns:
         Dictionary with assistant's reply
         
+    Raises:
+        HTTPException: 404 if the session does not exist
+        
     Note:
         This is mainly for testing. Production should use /stream endpoint
     """
-    firebase_service.store_message(payload.session_id, "user", payload.user_input)
+    try:
+        await storage_service.store_message(payload.session_id, "user", payload.user_input)
+    except SessionNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=ERROR_SESSION_NOT_FOUND)
     
     # For test endpoint, just return a simple message
     assistant_reply = "This endpoint is for testing. Please use /chat/stream for real-time responses."
-    firebase_service.store_message(payload.session_id, "assistant", assistant_reply)
+    await storage_service.store_message(payload.session_id, "assistant", assistant_reply)
     
     return {"reply": assistant_reply}
 
 
+async def open_turn(
+    session_id: str,
+    user_input: str,
+    user_id: str,
+    user_type: str,
+    no_cache: bool = False,
+    request_id: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Start answering a message, whichever transport carries the reply.
+    
+    Everything that can refuse the message happens before this returns.
+    The returned events are `("queue", position)` while the turn waits for
+    an upstream slot, then `("chunk", (event id, text))` for the reply;
+    iterating raises if the reply fails. A duplicate of a message already
+    being answered (same `request_id`, or the same text without one), or
+    a second request for a reply that is generating, follows that reply
+    instead of starting another. A retry (same `request_id`) of a reply
+    that failed or was cut off generates it again without storing the
+    message a second time.
+    
+    Args:
+        session_id: The chat session ID
+        user_input: The user's message
+        user_id: Caller whose share of the upstream slots the turn uses
+        user_type: The caller's token type (scheduling weight)
+        no_cache: Skip the response cache and always call the model
+        request_id: Idempotency key, the same for every retry of one submission
+        
+    Returns:
+        The turn's events. Closing them early detaches from the reply; if
+        nothing else reads it, the upstream call is cancelled after the
+        resume grace and the partial reply is saved marked as truncated.
+        
+    Raises:
+        AdmissionRejected: If the upstream queue is full (nothing is stored)
+        SessionNotFound: If the session does not exist and the user message
+            is saved before generating; when it is saved alongside the
+            reply, the reply fails with it instead and nothing is stored
+    """
+    # Log request
+    logger.info(LOG_CHAT_REQUEST.format(
+        session_id=session_id,
+        input_length=len(user_input)
+    ))
+    
+    # Duplicate submissions wait for the first one's reply and follow it;
+    # if it stops before generating, one of them takes over
+    while True:
+        flight, leader = single_flight.join(session_id, user_input, request_id)
+        if leader:
+            break
+        generation = await flight.wait()
+        if generation is not None:
+            logger.info(LOG_CHAT_DEDUPED.format(session_id=session_id))
+            return reply_chunks(generation.events())
+    
+    # Follow a reply to the same message that is already generating
+    live = await stream_broker.attach(session_id, user_input)
+    if live is not None:
+        single_flight.abandon(flight)
+        logger.info(LOG_CHAT_ATTACHED.format(session_id=session_id))
+        return reply_chunks(live)
+    
+    # Claim an upstream slot (or a queue place) before anything is stored
+    try:
+        ticket = admission_controller.enter(user_id, user_type)
+    except AdmissionRejected:
+        single_flight.abandon(flight)
+        logger.warning(LOG_CHAT_REJECTED.format(session_id=session_id))
+        raise
+    
+    timer = stage_timings.timer()
+    user_message = {"role": "user", "content": user_input}
+    persist = None
+    # Set once generating, so a failed user-message write can stop the reply
+    generation = None
+    
+    async def persist_user_message():
+        """Save the user message; time it whether or not it overlaps generation."""
+        started = time.perf_counter()
+        try:
+            written = await storage_service.store_message(session_id, "user", user_input)
+            if asyncio.isfuture(written):
+                # Queued by the write-behind worker: saved once it commits
+                await written
+        except SessionNotFound:
+            logger.warning(LOG_CHAT_SESSION_MISSING.format(session_id=session_id))
+            raise
+        except Exception as e:
+            logger.error(LOG_CHAT_PERSIST_FAILED.format(session_id=session_id, error=str(e)))
+            raise RuntimeError(ERROR_MESSAGE_NOT_SAVED) from e
+        finally:
+            stage_timings.record("persist_user", time.perf_counter() - started)
+    
+    def persisted(task):
+        """Roll the reply back if the user message could not be saved."""
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            single_flight.saved(flight, history)
+        elif generation is not None:
+            generation.fail(task.exception())
+    
+    try:
+        if flight.history is not None:
+            # A retry of a reply that failed or was cut off: the message is
+            # already stored, so only the reply is generated again
+            history = flight.history
+            timer.mark("history")
+        elif settings.chat_overlap_persistence:
+            # Read the earlier turns and the summary together (both usually
+            # cached), then save the user message while the reply generates
+            history, _ = await asyncio.gather(
+                storage_service.get_chat_history(session_id),
+                conversation_memory.prefetch(session_id)
+            )
+            history = history + [user_message]
+            timer.mark("history")
+            persist = asyncio.get_running_loop().create_task(persist_user_message())
+            persist.add_done_callback(persisted)
+        else:
+            await persist_user_message()
+            history = await storage_service.get_chat_history(session_id)
+            single_flight.saved(flight, history)
+            timer.mark("history")
+        context = await conversation_memory.build_context(session_id, history)
+        
+        # Pick the model tier (and its reply budget) from cheap request features
+        tier = model_router.route(user_input, history).tier
+        
+        # Identical prompts replay a cached reply instead of calling the model
+        cache_key = openai_service.cache_key(context, tier)
+        cached_chunks = await response_cache.get(cache_key, "chat_stream", bypass=no_cache)
+        timer.mark("context")
+    except BaseException:
+        # Including cancellation, e.g. a WebSocket turn cancelled while preparing
+        ticket.release()
+        single_flight.abandon(flight)
+        raise
+    
+    if cached_chunks is not None:
+        ticket.release()
+    
+    # Filled in with the model that actually served the reply
+    meta = {}
+    
+    async def completion_chunks():
+        """Stream the model reply, caching it only if it completes."""
+        chunks = []
+        try:
+            async for chunk in openai_service.stream_completion(context, meta, tier):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            logger.error(f"{ERROR_OPENAI_STREAMING}: {str(e)}")
+            yield f"Error: {str(e)}"
+            return
+        
+        await response_cache.put(cache_key, chunks)
+    
+    async def finish(generation):
+        """Save the reply (partial if the client left) once it stops generating."""
+        ticket.release()
+        
+        # The reply is only saved after the message it answers; if that
+        # failed, the turn is dropped and readers get the error
+        if persist is not None:
+            await persist
+        
+        reply = generation.text
+        if generation.truncated:
+            if not reply:
+                return
+            logger.info(LOG_CHAT_TRUNCATED.format(session_id=session_id, length=len(reply)))
+        
+        await storage_service.store_message(
+            session_id, "assistant", reply,
+            model=meta.get("model"),
+            truncated=generation.truncated
+        )
+        if not generation.truncated:
+            logger.info(LOG_CHAT_COMPLETE.format(session_id=session_id))
+        
+        # Fold aged-out turns into the session summary off the request path
+        conversation_memory.schedule_update(
+            session_id,
+            history + [{"role": "assistant", "content": reply}]
+        )
+    
+    async def turn_events():
+        """Queue positions until a slot is free, then the reply's chunks."""
+        nonlocal generation
+        
+        try:
+            if cached_chunks is not None:
+                source = response_cache.replay(cached_chunks)
+            else:
+                # Report the queue position until a slot frees up
+                async for position in ticket.wait():
+                    yield "queue", position
+                source = completion_chunks()
+            timer.mark("queue")
+            
+            # Don't start a reply to a message that could not be saved
+            if persist is not None and persist.done():
+                persist.result()
+            
+            # Generate in the background; leaving early cancels the upstream call
+            generation = generation_manager.start(
+                session_id, source, finish,
+                reply_budget=tier.max_tokens if cached_chunks is None else 0
+            )
+            stream_broker.own(session_id, user_input, generation)
+            single_flight.start(flight, generation)
+            
+            chunks = reply_chunks(generation.events())
+            first = True
+            try:
+                async for event in chunks:
+                    if first:
+                        first = False
+                        timer.mark("first_token")
+                        timer.total("ttft")
+                    yield event
+            finally:
+                await chunks.aclose()
+        
+        finally:
+            # Once generating, the slot is released when the reply finishes
+            if generation is None:
+                ticket.release()
+                single_flight.abandon(flight)
+    
+    return turn_events()
+
+
 @router.get("/stream")
 async def chat_stream(
+    request: Request,
     session_id: str, 
     user_input: str,
-    token: Optional[str] = None
+    token: Optional[str] = None,
+    no_cache: bool = False,
+    request_id: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None)
 ):
     """
     Stream chat responses using Server-Sent Events (SSE).
     
     Args:
+        request: The incoming request (its client address schedules callers without a token)
         session_id: The chat session ID (query parameter)
         user_input: The user's message (query parameter)
         token: JWT token for authentication (query parameter for SSE)
+        no_cache: Skip the response cache and always call the model
+        request_id: Idempotency key, the same for every retry of one submission
+        last_event_id: `Last-Event-ID` header of a reconnecting EventSource
         
     Returns:
-        StreamingResponse with SSE formatted data
+        StreamingResponse with SSE formatted data. While the request waits
+        for upstream capacity, `queue` events carry its queue position.
+        A request for a reply to the same message that is already
+        generating (a second tab, or a reconnect racing the original)
+        follows that reply instead of starting another; so does a
+        duplicate of a request that has not started generating yet (same
+        `request_id`, or same message without one). Chunk events carry
+        ids; a reconnect sending `Last-Event-ID` gets the rest of the same
+        reply (live or from the replay buffer) and stores nothing. If the
+        client disconnects and does not come back within the resume grace,
+        the upstream call is cancelled and the partial reply is saved
+        marked as truncated.
+        
+    Raises:
+        HTTPException: 503 with Retry-After if the upstream queue is full,
+            404 if the session does not exist
     """
     # Verify token if provided (for SSE authentication)
+    payload = {}
     if token:
         try:
             payload = auth_service.verify_token(token)
         except:
             pass  # Continue without auth for backward compatibility
+    
+    # Upstream slots are shared fairly per user (per client address without a token)
+    client_host = request.client.host if request.client else "unknown"
+    user_id = payload.get("sub") or f"ip:{client_host}"
+    user_type = payload.get("type", "anonymous")
+    
     # Validate inputs
     if not session_id or not user_input:
         raise HTTPException(
@@ -75,45 +488,194 @@ async def chat_stream(
             detail=ERROR_SESSION_REQUIRED
         )
     
-    # Log request
-    logger.info(LOG_CHAT_REQUEST.format(
-        session_id=session_id,
-        input_length=len(user_input)
-    ))
+    # A reconnecting EventSource picks up its reply where it left off
+    if last_event_id:
+        return await resume_stream(session_id, last_event_id)
     
-    # Store user message
-    firebase_service.store_message(session_id, "user", user_input)
-    history = firebase_service.get_chat_history(session_id)
+    try:
+        events = await open_turn(session_id, user_input, user_id, user_type, no_cache, request_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=ERROR_SERVER_BUSY,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except SessionNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=ERROR_SESSION_NOT_FOUND)
     
-    async def event_generator():
-        """Generate SSE events for streaming response."""
-        assistant_message = ""
+    return EventStreamResponse(sse_frames(session_id, events))
+
+
+@router.get("/live")
+async def chat_live(session_id: str):
+    """
+    Follow the reply a session is generating, e.g. from a second tab.
+    
+    Args:
+        session_id: The chat session ID (query parameter)
         
+    Returns:
+        StreamingResponse with the reply from its first chunk, in the same
+        SSE format as /stream, or 204 No Content (which stops EventSource
+        from reconnecting) if the session is not generating a reply
+    """
+    live = await stream_broker.attach(session_id)
+    if live is None:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    
+    logger.info(LOG_CHAT_ATTACHED.format(session_id=session_id))
+    return EventStreamResponse(reply_events(session_id, live))
+
+
+async def receive_message(websocket: WebSocket) -> Optional[Dict[str, Any]]:
+    """
+    Read the next client message.
+    
+    Returns:
+        The message if it is a JSON object, else None
+        
+    Raises:
+        WebSocketDisconnect: If the client closed the connection
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    
+    try:
+        data = json.loads(message.get("text") or "")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    Chat over one WebSocket carrying any number of replies, for any sessions.
+    
+    The first message authenticates the connection once:
+    `{"type": "auth", "token": "<jwt>"}`, answered with `{"type": "ready"}`,
+    or the socket is closed with code 4401. Then the client sends:
+    
+    - `{"type": "send", "id": "<turn id>", "session_id": ..., "user_input": ...,
+      "no_cache": false}` to answer a message. The turn id is also its
+      idempotency key (see `request_id` on /stream), so it must be unique.
+    - `{"type": "cancel", "id": ...}` to stop receiving a reply. It is cut
+      off as if its EventSource had been closed, and acknowledged with
+      `{"type": "cancelled", "id": ...}`.
+      
+    Each turn is answered with `queue` (`position`) and `chunk` (`event_id`,
+    `data`) messages, then `done` or `error` (`message`, plus `retry_after`
+    when the queue is full), all carrying the turn id. Replies go through
+    the same pipeline as /stream. At most `ws_max_turns` run at once per
+    connection. Outgoing messages wait in a bounded queue: a client that
+    reads slowly pauses its replies (their generations keep buffering, so
+    the next chunk carries more text) and stops the connection's incoming
+    messages from being read, rather than piling messages up in memory.
+    
+    Args:
+        websocket: The client connection
+    """
+    await websocket.accept()
+    try:
+        message = await asyncio.wait_for(receive_message(websocket), settings.ws_auth_timeout_seconds)
+        payload = None
+        if message is not None and message.get("type") == "auth":
+            payload = auth_service.verify_token(str(message.get("token") or ""))
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, HTTPException):
+        payload = None
+    
+    if payload is None:
+        await websocket.close(code=WS_CLOSE_UNAUTHORIZED)
+        return
+    
+    user_id = payload.get("sub") or "unknown"
+    user_type = payload.get("type", "anonymous")
+    logger.info(LOG_WS_CONNECTED.format(user_id=user_id))
+    
+    outbox: "asyncio.Queue[str]" = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+    turns: Dict[str, asyncio.Task] = {}
+    
+    async def send(message: Dict[str, Any]) -> None:
+        """Queue a message, waiting while the client is behind."""
+        await outbox.put(json.dumps(message))
+    
+    async def write() -> None:
+        while True:
+            await websocket.send_text(await outbox.get())
+    
+    async def run_turn(turn_id: str, session_id: str, user_input: str, no_cache: bool) -> None:
         try:
-            # Stream OpenAI response
-            async for chunk in openai_service.stream_chat_completion(history):
-                assistant_message += chunk
-                yield f"data: {chunk}\n\n"
-            
-            # Store complete message
-            firebase_service.store_message(session_id, "assistant", assistant_message)
-            logger.info(LOG_CHAT_COMPLETE.format(session_id=session_id))
-            
-            # Send completion signal
-            yield "data: [DONE]\n\n"
-            
+            # Scoped to the user, so other clients' turn ids never collide
+            events = await open_turn(
+                session_id, user_input, user_id, user_type, no_cache,
+                request_id=f"{user_id}:{turn_id}"
+            )
+        except AdmissionRejected as e:
+            await send({"type": "error", "id": turn_id, "message": ERROR_SERVER_BUSY, "retry_after": e.retry_after})
+            return
         except Exception as e:
-            logger.error(LOG_CHAT_ERROR.format(
-                session_id=session_id,
-                error=str(e)
-            ))
-            yield f"event: error\ndata: {str(e)}\n\n"
-    
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-        }
-    )
\ No newline at end of file
+            logger.error(LOG_CHAT_ERROR.format(session_id=session_id, error=str(e)))
+            await send({"type": "error", "id": turn_id, "message": str(e)})
+            return
+        
+        try:
+            async for kind, value in events:
+                if kind == "queue":
+                    await send({"type": "queue", "id": turn_id, "position": value})
+                else:
+                    await send({"type": "chunk", "id": turn_id, "event_id": value[0], "data": value[1]})
+            await send({"type": "done", "id": turn_id})
+        except Exception as e:
+            logger.error(LOG_CHAT_ERROR.format(session_id=session_id, error=str(e)))
+            await send({"type": "error", "id": turn_id, "message": str(e)})
+        finally:
+            await events.aclose()
+    
+    def forget(turn_id: str, task: asyncio.Task) -> None:
+        if turns.get(turn_id) is task:
+            del turns[turn_id]
+    
+    writer = asyncio.get_running_loop().create_task(write())
+    try:
+        await websocket.send_json({"type": "ready"})
+        while True:
+            message = await receive_message(websocket) or {}
+            kind = message.get("type")
+            turn_id = str(message["id"]) if message.get("id") is not None else None
+            
+            if kind == "send":
+                session_id = message.get("session_id")
+                user_input = message.get("user_input")
+                if (
+                    turn_id is None or turn_id in turns
+                    or not isinstance(session_id, str) or not session_id
+                    or not isinstance(user_input, str) or not user_input
+                ):
+                    await send({"type": "error", "id": turn_id, "message": ERROR_WS_INVALID_MESSAGE})
+                elif len(turns) >= settings.ws_max_turns:
+                    await send({"type": "error", "id": turn_id, "message": ERROR_WS_TOO_MANY_REPLIES})
+                else:
+                    task = asyncio.get_running_loop().create_task(
+                        run_turn(turn_id, session_id, user_input, bool(message.get("no_cache")))
+                    )
+                    turns[turn_id] = task
+                    task.add_done_callback(lambda task, turn_id=turn_id: forget(turn_id, task))
+            elif kind == "cancel" and turn_id in turns:
+                turns[turn_id].cancel()
+                await send({"type": "cancelled", "id": turn_id})
+            else:
+                await send({"type": "error", "id": turn_id, "message": ERROR_WS_INVALID_MESSAGE})
+    
+    except WebSocketDisconnect:
+        pass
+    
+    finally:
+        # Leaving detaches every reply, as closing their EventSources would
+        tasks = list(turns.values()) + [writer]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(LOG_WS_CLOSED.format(user_id=user_id))
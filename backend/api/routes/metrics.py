@@ -0,0 +1,68 @@
+# api/routes/metrics.py
+"""
+Runtime metrics API routes.
+"""
+
+from fastapi import APIRouter
+from services.history_cache import history_cache
+from services.context_builder import context_builder
+from services.conversation_memory import conversation_memory
+from services.response_cache import response_cache
+from services.http_pool import http_pool
+from services.admission import admission_controller
+from services.generation import generation_manager
+from services.stream_broker import stream_broker
+from services.single_flight import single_flight
+from services.stage_timings import stage_timings
+from services.openai_service import openai_service
+from services.model_router import model_router
+from services.storage import storage_service, WriteBehindStorage
+from typing import Dict, Any
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("")
+async def get_metrics() -> Dict[str, Any]:
+    """
+    Get in-process performance counters.
+    
+    Returns:
+        Dictionary of counters grouped by component
+        
+    Example Response:
+        {
+            "history_cache": {"sessions": 12, "hits": 40, "misses": 12, ...},
+            "write_behind": {"pending": 0, "commits": 31, ...},
+            "context": {"builds": 52, "messages_counted": 104, "trimmed": 3, ...},
+            "memory": {"sessions": 8, "updates": 5, "summarized_messages": 60, ...},
+            "response_cache": {"entries": 4, "endpoints": {"chat_stream": {"hit_rate": 0.2, ...}}, ...},
+            "upstream_pool": {"in_flight": 3, "max_connections": 100, "saturated": 0, ...},
+            "admission": {"active": 50, "queue_depth": 4, "rejected": 2, "wait_seconds": {...}, ...},
+            "hedging": {"ttft_p95": 0.8, "hedged": 3, "hedge_wins": 2, ...},
+            "circuit_breakers": {"breakers": {"gpt-3.5-turbo": {"state": "open", ...}}, "fallbacks": 7, "events": [...]},
+            "routing": {"router": "rules", "tiers": {"fast": 40, "standard": 12}, "reasons": {...}},
+            "generation": {"running": 3, "truncated": 2, "tokens_avoided": 1650, ...},
+            "fanout": {"live": 3, "local_subscribers": 5, "remote_subscribers": 1, ...},
+            "dedupe": {"keys": 2, "leaders": 40, "duplicates": 6, "abandoned": 0},
+            "chat_stages": {"history": {"count": 52, "mean_ms": 1.4, "p50_ms": 0.9, "p95_ms": 4.2}, ...}
+        }
+    """
+    write_behind = storage_service.backend
+    
+    return {
+        "history_cache": history_cache.stats(),
+        "write_behind": write_behind.stats() if isinstance(write_behind, WriteBehindStorage) else None,
+        "context": context_builder.stats(),
+        "memory": conversation_memory.stats(),
+        "response_cache": response_cache.stats(),
+        "upstream_pool": http_pool.stats(),
+        "admission": admission_controller.stats(),
+        "hedging": openai_service.hedger.stats(),
+        "circuit_breakers": openai_service.breakers.stats(),
+        "routing": model_router.stats(),
+        "generation": generation_manager.stats(),
+        "fanout": stream_broker.stats(),
+        "dedupe": single_flight.stats(),
+        "chat_stages": stage_timings.stats()
+    }
@@ -3,18 +3,26 @@
 Session management API routes with optional authentication.
 """
 
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List, Dict, Optional
-from services.firebase_service import firebase_service
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from typing import Any, Dict, List, Optional
+from config.settings import settings
+from models.chat import BulkDeleteRequest
+from services.storage import storage_service
+from services.deletion_service import deletion_service
 from services.auth_service import auth_service
 from utils.constants import (
     ERROR_FETCH_SESSIONS,
+    ERROR_INVALID_CURSOR,
     ERROR_CREATE_CHAT,
     ERROR_FETCH_MESSAGES,
+    ERROR_FETCH_SESSION,
+    ERROR_SESSION_NOT_FOUND,
     ERROR_DELETE_SESSION,
-    SUCCESS_SESSION_DELETED,
+    ERROR_DELETION_JOB_NOT_FOUND,
+    ERROR_TOO_MANY_SESSIONS,
+    SUCCESS_DELETION_SCHEDULED,
     LOG_SESSION_CREATED,
-    LOG_SESSION_DELETED
+    LOG_DELETION_SCHEDULED
 )
 import logging
 
@@ -24,25 +32,42 @@ router = APIRouter(prefix="/chats", tags=["sessions"])
 
 @router.get("")
 async def get_all_sessions(
+    limit: int = Query(settings.sessions_page_size, ge=1, le=settings.sessions_max_page_size),
+    cursor: Optional[str] = None,
     user_id: str = Depends(auth_service.get_current_user)
-) -> Dict[str, List[Dict[str, str]]]:
+) -> Dict[str, Any]:
     """
-    Get all chat sessions for the authenticated user.
+    Get one page of chat sessions for the authenticated user, most recently active first.
+    
+    Args:
+        limit: Maximum number of sessions to return
+        cursor: Opaque `next_cursor` from the previous page
+        
+    Returns:
+        Dictionary with 'sessions' and 'next_cursor' (None on the last page)
     """
     try:
         # Get sessions for authenticated user only
-        sessions = firebase_service.list_user_sessions(user_id)
+        page = await storage_service.list_user_sessions(user_id, limit, cursor)
         
         return {
             "sessions": [
                 {
                     "id": session.get("session_id"),
-                    "title": session.get("title", "Untitled Chat")
+                    "title": session.get("title", "Untitled Chat"),
+                    "message_count": session.get("message_count", 0),
+                    "last_message_at": session.get("last_message_at")
                 }
-                for session in sessions
-            ]
+                for session in page.sessions
+            ],
+            "next_cursor": page.next_cursor
         }
         
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ERROR_INVALID_CURSOR
+        )
     except Exception as e:
         logger.error(f"Error fetching sessions for user {user_id}: {str(e)}")
         raise HTTPException(
@@ -59,7 +84,7 @@ async def create_chat(
     Create a new chat session for the authenticated user.
     """
     try:
-        session_id = firebase_service.create_session(user_id=user_id)
+        session_id = await storage_service.create_session(user_id=user_id)
         logger.info(f"Created chat {session_id} for user {user_id}")
         
         return {"session_id": session_id}
@@ -72,18 +97,77 @@ async def create_chat(
         )
 
 
+@router.get("/{session_id}")
+async def get_session(
+    session_id: str,
+    user_id: Optional[str] = Depends(auth_service.get_current_user_optional)
+) -> Dict[str, Any]:
+    """
+    Get a chat session's metadata without loading its messages.
+    
+    Args:
+        session_id: The chat session ID
+        
+    Returns:
+        Dictionary with 'title', 'message_count', 'last_seq', 'created_at'
+        and 'last_message_at'
+    """
+    try:
+        metadata = await storage_service.get_session_metadata(session_id)
+    except Exception as e:
+        logger.error(f"Error fetching session {session_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=ERROR_FETCH_SESSION
+        )
+    
+    if metadata is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=ERROR_SESSION_NOT_FOUND
+        )
+    
+    return {
+        "id": session_id,
+        "title": metadata["title"],
+        "message_count": metadata["message_count"],
+        "last_seq": metadata["last_seq"],
+        "created_at": metadata["created_at"],
+        "last_message_at": metadata["last_message_at"]
+    }
+
+
 @router.get("/{session_id}/messages")
 async def get_session_messages(
     session_id: str,
+    limit: int = Query(settings.messages_page_size, ge=1, le=settings.messages_max_page_size),
+    before: Optional[str] = None,
     user_id: Optional[str] = Depends(auth_service.get_current_user_optional)
-) -> Dict[str, List[Dict[str, str]]]:
+) -> Dict[str, Any]:
     """
-    Get all messages for a specific chat session.
+    Get the newest window of messages for a chat session.
+    
+    Args:
+        session_id: The chat session ID
+        limit: Maximum number of messages to return
+        before: Opaque `next_before` from a previous window, to load older messages
+        
+    Returns:
+        Dictionary with 'messages' (oldest first), 'has_more' and 'next_before'
     """
     try:
-        messages = firebase_service.get_chat_history(session_id)
-        return {"messages": messages}
+        page = await storage_service.get_messages_page(session_id, limit, before)
+        return {
+            "messages": page.messages,
+            "has_more": page.has_more,
+            "next_before": page.next_before
+        }
         
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ERROR_INVALID_CURSOR
+        )
     except Exception as e:
         logger.error(f"Error fetching messages for session {session_id}: {str(e)}")
         raise HTTPException(
@@ -92,23 +176,72 @@ async def get_session_messages(
         )
 
 
-@router.delete("/{session_id}")
+@router.post("/bulk-delete", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_delete_chat_sessions(
+    request: BulkDeleteRequest,
+    user_id: Optional[str] = Depends(auth_service.get_current_user_optional)
+) -> Dict[str, Any]:
+    """
+    Schedule deletion of several chat sessions in one background job.
+    
+    Args:
+        request: Session IDs to delete
+        
+    Returns:
+        The job ID and status; poll GET /chats/deletions/{job_id} for progress
+    """
+    if len(request.session_ids) > settings.deletion_max_sessions_per_job:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ERROR_TOO_MANY_SESSIONS.format(limit=settings.deletion_max_sessions_per_job)
+        )
+    
+    return await _schedule_deletion(request.session_ids)
+
+
+@router.get("/deletions/{job_id}")
+async def get_deletion_job(
+    job_id: str,
+    user_id: Optional[str] = Depends(auth_service.get_current_user_optional)
+) -> Dict[str, Any]:
+    """
+    Get the progress of a deletion job.
+    """
+    job = deletion_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=ERROR_DELETION_JOB_NOT_FOUND
+        )
+    
+    return job.to_dict()
+
+
+@router.delete("/{session_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_chat_session(
     session_id: str,
     user_id: Optional[str] = Depends(auth_service.get_current_user_optional)
-) -> Dict[str, str]:
+) -> Dict[str, Any]:
     """
-    Delete a chat session and all its messages.
+    Hide a chat session immediately and delete its messages in the background.
+    
+    Returns:
+        The job ID and status; poll GET /chats/deletions/{job_id} for progress
     """
+    return await _schedule_deletion([session_id])
+
+
+async def _schedule_deletion(session_ids: List[str]) -> Dict[str, Any]:
+    """Tombstone sessions and start a deletion job, mapping failures to a 500."""
     try:
-        firebase_service.delete_session(session_id)
-        logger.info(LOG_SESSION_DELETED.format(session_id=session_id))
+        job = await deletion_service.submit(session_ids)
+        logger.info(LOG_DELETION_SCHEDULED.format(job_id=job.job_id, count=len(job.session_ids)))
         
-        return {"detail": SUCCESS_SESSION_DELETED}
+        return {"detail": SUCCESS_DELETION_SCHEDULED, **job.to_dict()}
         
     except Exception as e:
-        logger.error(f"Error deleting session {session_id}: {str(e)}")
+        logger.error(f"Error scheduling deletion of {session_ids}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=ERROR_DELETE_SESSION
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,101 @@
+# benchmarks/chat_pipeline.py
+"""
+Chat stream stage timings with the user-message write serial or overlapped.
+
+Runs `--sessions` concurrent chats of `--turns` turns each through the real
+/chat/stream route, over in-memory storage that adds `--storage-ms` to every
+read and write (a durable store without the write-behind queue), and the
+fake provider with a `--ttft-ms` time to first token. The first turn of each
+chat misses the history cache; later turns hit it. Per-stage timings come
+from the same counters as `chat_stages` in /metrics, measured on the server.
+
+Usage:
+    python -m benchmarks.chat_pipeline [--sessions 20] [--turns 5] [--storage-ms 20] [--ttft-ms 200]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("SUMMARIZER_BACKEND", "stub")
+# Every client shares one address, so lift the per-user stream limit
+os.environ.setdefault("ADMISSION_MAX_PER_USER", "1000")
+
+import httpx
+from config.settings import settings
+from main import app
+from services.openai_service import openai_service
+from services.providers import FakeProvider
+from services.stage_timings import stage_timings
+from services.storage import InMemoryStorage, storage_service
+
+# Per-request INFO logs would dominate the output
+logging.disable(logging.INFO)
+
+STAGES = ("history", "persist_user", "context", "queue", "first_token", "ttft")
+
+
+class SlowStorage(InMemoryStorage):
+    """In-memory storage with a fixed round trip on every call."""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+
+    async def store_message(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        await super().store_message(*args, **kwargs)
+
+    async def get_chat_history(self, session_id):
+        await asyncio.sleep(self.latency)
+        return await super().get_chat_history(session_id)
+
+    async def get_summary(self, session_id):
+        await asyncio.sleep(self.latency)
+        return await super().get_summary(session_id)
+
+
+async def chat(client, turns):
+    session_id = await storage_service.create_session(user_id="bench")
+    for turn in range(turns):
+        params = {"session_id": session_id, "user_input": f"Question {turn}", "no_cache": "true"}
+        response = await client.get("/chat/stream", params=params)
+        assert response.text.endswith("data: [DONE]\n\n"), response.text
+
+
+async def run(sessions, turns, storage_latency, ttft):
+    """Return the stage timings of one mode."""
+    stage_timings.reset()
+    provider = FakeProvider(reply="A short answer.", first_token_delays=(ttft,), token_delay=0)
+    with patch.object(storage_service, "backend", SlowStorage(storage_latency)), \
+            patch.object(openai_service, "provider", provider):
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            await asyncio.gather(*(chat(client, turns) for _ in range(sessions)))
+    return stage_timings.stats()
+
+
+def main(sessions, turns, storage_ms, ttft_ms):
+    print(f"{sessions} sessions x {turns} turns, storage {storage_ms:.0f} ms per call, "
+          f"upstream first token {ttft_ms:.0f} ms")
+    print(f"{'mode':>8}" + "".join(f"{stage + ' ms':>16}" for stage in STAGES) + f"{'ttft p95 ms':>14}")
+    for name, overlap in (("serial", False), ("overlap", True)):
+        with patch.object(settings, "chat_overlap_persistence", overlap):
+            stats = asyncio.run(run(sessions, turns, storage_ms / 1000, ttft_ms / 1000))
+        print(f"{name:>8}" + "".join(f"{stats[stage]['mean_ms']:>16.1f}" for stage in STAGES)
+              + f"{stats['ttft']['p95_ms']:>14.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--storage-ms", type=float, default=20)
+    parser.add_argument("--ttft-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    main(args.sessions, args.turns, args.storage_ms, args.ttft_ms)
@@ -0,0 +1,166 @@
+# benchmarks/chat_transport.py
+"""
+Connections and CPU per message for chat over SSE versus the WebSocket.
+
+Runs `--clients` concurrent chats of `--messages` messages each through
+uvicorn and the real routes, over in-memory storage, with the fake provider
+streaming `--tokens` tokens per reply. Over SSE every message opens a new
+connection to /chat/stream with the token and message in the URL, as the
+browser's EventSource does. Over the WebSocket each client opens one
+connection to /chat/ws, authenticates once and sends every message on it.
+The server runs in a child process, so its CPU time is measured apart from
+the clients'.
+
+Usage:
+    python -m benchmarks.chat_transport [--clients 100] [--messages 10] [--tokens 50]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import uuid
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("SUMMARIZER_BACKEND", "stub")
+# Every client shares one user, so lift the per-user and global stream limits
+os.environ.setdefault("ADMISSION_MAX_PER_USER", "100000")
+os.environ.setdefault("ADMISSION_MAX_CONCURRENT", "100000")
+
+import uvicorn
+from websockets.asyncio.client import connect
+from main import app
+from services.auth_service import auth_service
+from services.openai_service import openai_service
+from services.providers import FakeProvider
+
+# Per-request INFO logs would dominate the output
+logging.disable(logging.INFO)
+
+
+async def sse_chat(port, token, session_id, messages):
+    """Send each message on a new /chat/stream connection; return the replies."""
+    replies = []
+    for index in range(messages):
+        query = urlencode({"session_id": session_id, "user_input": f"Message {index}", "token": token, "no_cache": "true"})
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET /chat/stream?{query} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode())
+        body = await reader.read()
+        writer.close()
+
+        # Chunked transfer framing never splits an SSE line here, so plain line filtering is enough
+        lines = body.decode().split("\n")
+        replies.append("".join(line[len("data: "):] for line in lines if line.startswith("data: ") and line != "data: [DONE]"))
+    return replies
+
+
+async def ws_chat(port, token, session_id, messages):
+    """Send every message over one authenticated /chat/ws connection; return the replies."""
+    replies = []
+    async with connect(f"ws://127.0.0.1:{port}/chat/ws") as websocket:
+        await websocket.send(json.dumps({"type": "auth", "token": token}))
+        assert json.loads(await websocket.recv())["type"] == "ready"
+        for index in range(messages):
+            turn_id = uuid.uuid4().hex
+            await websocket.send(json.dumps({
+                "type": "send",
+                "id": turn_id,
+                "session_id": session_id,
+                "user_input": f"Message {index}",
+                "no_cache": True,
+            }))
+            chunks = []
+            while True:
+                message = json.loads(await websocket.recv())
+                if message["type"] == "chunk":
+                    chunks.append(message["data"])
+                elif message["type"] in ("done", "error"):
+                    break
+            replies.append("".join(chunks))
+    return replies
+
+
+def serve(ports, tokens, token_delay):
+    """Child process: run the app with the fake provider and report its port."""
+    reply = " ".join(f"tok{i}" for i in range(tokens))
+    provider = FakeProvider(reply=reply, first_token_delays=(0.0,), token_delay=token_delay)
+    server = uvicorn.Server(uvicorn.Config(
+        app,
+        host="127.0.0.1",
+        port=0,
+        lifespan="off",
+        log_level="warning",
+        backlog=4096
+    ))
+
+    async def main():
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        ports.put(server.servers[0].sockets[0].getsockname()[1])
+        await serving
+
+    with patch.object(openai_service, "provider", provider):
+        asyncio.run(main())
+
+
+def server_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def clients_run(chat, port, clients, messages):
+    token = auth_service.create_access_token({"sub": "bench-user", "type": "anonymous"})
+    sessions = [uuid.uuid4().hex for _ in range(clients)]
+    return await asyncio.gather(*(chat(port, token, session_id, messages) for session_id in sessions))
+
+
+def run(chat, clients, messages, tokens, token_delay):
+    """Return (elapsed seconds, server CPU seconds, client CPU seconds, replies) for one transport."""
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(ports, tokens, token_delay))
+    server.start()
+    port = ports.get()
+
+    before = server_cpu()
+    client_cpu, start = time.process_time(), time.perf_counter()
+    replies = asyncio.run(clients_run(chat, port, clients, messages))
+    elapsed, client_cpu = time.perf_counter() - start, time.process_time() - client_cpu
+
+    # Uvicorn shuts down gracefully on SIGTERM; the child's CPU time is known once it exits
+    server.terminate()
+    server.join()
+    return elapsed, server_cpu() - before, client_cpu, replies
+
+
+def main(clients, messages, tokens, token_delay):
+    print(f"{clients} clients x {messages} messages, {tokens} tokens per reply, "
+          f"one token every {token_delay * 1000:.0f} ms")
+    print(f"{'transport':>10}{'connections':>13}{'messages/s':>12}"
+          f"{'server CPU ms/msg':>19}{'client CPU ms/msg':>19}{'wall s':>8}")
+    replies = {}
+    total = clients * messages
+    for name, chat, connections in (("sse", sse_chat, total), ("websocket", ws_chat, clients)):
+        elapsed, cpu, client_cpu, replies[name] = run(chat, clients, messages, tokens, token_delay)
+        print(f"{name:>10}{connections:>13}{total / elapsed:>12.0f}"
+              f"{cpu / total * 1000:>19.2f}{client_cpu / total * 1000:>19.2f}{elapsed:>8.2f}")
+    print(f"identical text: {replies['sse'] == replies['websocket']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    args = parser.parse_args()
+
+    main(args.clients, args.messages, args.tokens, args.token_delay)
@@ -0,0 +1,89 @@
+# benchmarks/context_assembly.py
+"""
+Context assembly microbenchmark for sessions of increasing length.
+
+For each session size, measures one chat turn's context assembly: append a
+user message to the history and build the prompt. The "recount" variant
+tokenizes the whole history every turn (what a naive budget check costs);
+the "cached" variant uses ContextBuilder's per-session prefix sums.
+
+Usage:
+    python -m benchmarks.context_assembly [--sizes 10,1000,10000] [--turns 200]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config.settings import settings
+from services.context_builder import ContextBuilder
+from utils.tokens import count_message_tokens
+
+CONTENT = "This is a fairly typical chat message with a couple of sentences in it. " * 3
+
+
+def recount_build(history, budget):
+    """Baseline: tokenize the whole history, then keep the newest messages that fit."""
+    counts = [count_message_tokens(message) for message in history]
+    start = len(history) - 1
+    total = counts[start]
+    while start > 0 and total + counts[start - 1] <= budget:
+        start -= 1
+        total += counts[start]
+    return history[start:]
+
+
+def make_history(size):
+    roles = ("user", "assistant")
+    return [{"role": roles[i % 2], "content": CONTENT} for i in range(size)]
+
+
+def run_size(size, turns):
+    """Return (recount, cached-cold, cached-warm) per-turn timings in microseconds."""
+    builder = ContextBuilder(
+        context_window=settings.openai_context_window,
+        reply_tokens=settings.openai_max_tokens,
+        max_sessions=10
+    )
+
+    history = make_history(size)
+    start = time.perf_counter()
+    builder.build("bench", history)
+    cold = (time.perf_counter() - start) * 1e6
+
+    cached, recount = [], []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"{CONTENT} turn {turn}"})
+
+        start = time.perf_counter()
+        cached_context = builder.build("bench", history)
+        cached.append((time.perf_counter() - start) * 1e6)
+
+        start = time.perf_counter()
+        recount_context = recount_build(history, builder.budget)
+        recount.append((time.perf_counter() - start) * 1e6)
+
+        assert cached_context == recount_context
+
+    return statistics.median(recount), cold, statistics.median(cached)
+
+
+def main(sizes, turns):
+    print(f"Prompt budget: {settings.openai_context_window} - {settings.openai_max_tokens} reply tokens")
+    print(f"{'messages':>10}{'recount us':>14}{'cached cold us':>16}{'cached warm us':>16}")
+    for size in sizes:
+        recount, cold, warm = run_size(size, turns)
+        print(f"{size:>10}{recount:>14.1f}{cold:>16.1f}{warm:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10,1000,10000")
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    main([int(x) for x in args.sizes.split(",")], args.turns)
@@ -0,0 +1,212 @@
+# benchmarks/event_loop_lag.py
+"""
+Event-loop lag benchmark for the Firestore data layer.
+
+Runs N concurrent "chat turns" (store user message, read history) against a
+fake Firestore that adds a fixed round-trip latency, while a probe task
+measures how late the event loop wakes it up. The blocking variant mimics
+the old sync client; the async variant uses FirebaseService as shipped.
+
+Usage:
+    python -m benchmarks.event_loop_lag [--latency-ms 20] [--levels 1,10,50,100]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.firebase_service import FirebaseService
+
+PROBE_INTERVAL = 0.005
+
+
+class _Snapshot:
+    """Minimal stand-in for a Firestore document snapshot."""
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data or {}
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _FakeQuery:
+    def __init__(self, docs, latency):
+        self._docs = docs
+        self._latency = latency
+
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def where(self, *args, **kwargs):
+        return self
+
+    async def stream(self):
+        await asyncio.sleep(self._latency)
+        for doc_id, data in list(self._docs.items()):
+            yield _Snapshot(doc_id, data)
+
+
+class _FakeDocument:
+    def __init__(self, store, docs, path, doc_id, latency):
+        self._store = store
+        self._docs = docs
+        self._path = path
+        self.id = doc_id
+        self._latency = latency
+
+    def collection(self, name):
+        return _FakeCollection(self._store, f"{self._path}/{self.id}/{name}", self._latency)
+
+    async def get(self, field_paths=None):
+        await asyncio.sleep(self._latency)
+        return self._snapshot()
+
+    async def set(self, data):
+        await asyncio.sleep(self._latency)
+        self._write(data, merge=False)
+
+    async def update(self, data):
+        await asyncio.sleep(self._latency)
+        self._write(data, merge=True)
+
+    def _snapshot(self):
+        return _Snapshot(self.id, self._docs.get(self.id))
+
+    def _write(self, data, merge):
+        if merge:
+            self._docs.setdefault(self.id, {}).update(data)
+        else:
+            self._docs[self.id] = dict(data)
+
+
+class _FakeCollection(_FakeQuery):
+    def __init__(self, store, path, latency):
+        super().__init__(store.setdefault(path, {}), latency)
+        self._store = store
+        self._path = path
+
+    def document(self, doc_id=None):
+        doc_id = doc_id or str(len(self._docs))
+        return _FakeDocument(self._store, self._docs, self._path, doc_id, self._latency)
+
+    async def add(self, data):
+        await asyncio.sleep(self._latency)
+        self._docs[str(len(self._docs))] = dict(data)
+
+
+class _FakeBatch:
+    """Applies queued writes in a single simulated round trip."""
+
+    def __init__(self, latency):
+        self._latency = latency
+        self._writes = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._writes.append((doc_ref, data, merge))
+
+    async def commit(self):
+        await asyncio.sleep(self._latency)
+        for doc_ref, data, merge in self._writes:
+            doc_ref._write(data, merge)
+
+
+class FakeAsyncFirestore:
+    """Async Firestore stand-in with a fixed per-call latency."""
+
+    def __init__(self, latency):
+        self._store = {}
+        self._latency = latency
+
+    def collection(self, name):
+        return _FakeCollection(self._store, name, self._latency)
+
+    def batch(self):
+        return _FakeBatch(self._latency)
+
+    async def get_all(self, refs, field_paths=None):
+        await asyncio.sleep(self._latency)
+        for doc_ref in refs:
+            yield doc_ref._snapshot()
+
+
+class BlockingFirebaseService:
+    """Mimics the previous data layer: sync round trips inside async handlers."""
+
+    def __init__(self, latency):
+        self._latency = latency
+
+    async def store_message(self, session_id, role, content):
+        time.sleep(self._latency)
+        if role == "user":
+            time.sleep(self._latency * 2)
+
+    async def get_chat_history(self, session_id):
+        time.sleep(self._latency)
+        return []
+
+
+async def _probe(samples, stop):
+    """Record how late the loop resumes a task sleeping PROBE_INTERVAL."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def _chat_turn(service, session_id):
+    await service.store_message(session_id, "user", "hello there, how are you?")
+    await service.get_chat_history(session_id)
+
+
+async def run_level(service, concurrency):
+    """Run `concurrency` chat turns at once and return (p50, p99, max) lag in ms."""
+    samples = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(samples, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    await asyncio.gather(*(
+        _chat_turn(service, f"session-{i}") for i in range(concurrency)
+    ))
+
+    stop.set()
+    await probe
+
+    samples_ms = sorted(s * 1000 for s in samples) or [0.0]
+    p99 = samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.99))]
+    return statistics.median(samples_ms), p99, samples_ms[-1]
+
+
+async def main(latency_ms, levels):
+    latency = latency_ms / 1000
+    async_service = FirebaseService()
+    async_service.db = FakeAsyncFirestore(latency)
+
+    variants = [
+        ("blocking", BlockingFirebaseService(latency)),
+        ("async", async_service),
+    ]
+
+    print(f"Simulated Firestore latency: {latency_ms} ms per round trip")
+    print(f"{'variant':<10}{'concurrency':>12}{'p50 lag ms':>12}{'p99 lag ms':>12}{'max lag ms':>12}")
+    for name, service in variants:
+        for level in levels:
+            p50, p99, worst = await run_level(service, level)
+            print(f"{name:<10}{level:>12}{p50:>12.2f}{p99:>12.2f}{worst:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--levels", default="1,10,50,100")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.latency_ms, [int(x) for x in args.levels.split(",")]))
@@ -0,0 +1,112 @@
+# benchmarks/fair_scheduling.py
+"""
+Tail latency of light users while one heavy user floods the endpoint.
+
+A heavy user keeps `--heavy-streams` requests open at all times; each light
+user sends one request every `--light-interval` seconds. Every request holds
+an upstream slot for a simulated completion of `--service` seconds. The
+"fifo" variant schedules everyone as one user (a single first-come queue);
+the "fair" variant uses per-user deficit round robin with the per-user
+in-flight limit.
+
+Usage:
+    python -m benchmarks.fair_scheduling [--slots 4] [--heavy-streams 40] [--light-users 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.admission import AdmissionController
+
+
+async def request(controller, user_id, service, latencies):
+    """Wait for a slot, hold it for one simulated completion, record latency."""
+    start = time.perf_counter()
+    ticket = controller.enter(user_id, "anonymous")
+    try:
+        async for _ in ticket.wait():
+            pass
+        await asyncio.sleep(service)
+    finally:
+        ticket.release()
+    latencies.append(time.perf_counter() - start)
+
+
+async def heavy_user(controller, streams, service, latencies, stop):
+    """Keep `streams` requests in flight until stopped."""
+    async def stream():
+        while not stop.is_set():
+            await request(controller, "heavy", service, latencies)
+
+    await asyncio.gather(*(stream() for _ in range(streams)))
+
+
+async def light_user(controller, user_id, interval, service, latencies, stop):
+    """Send one request per interval until stopped."""
+    pending = []
+    while not stop.is_set():
+        pending.append(asyncio.create_task(request(controller, user_id, service, latencies)))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*pending)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(fair, slots, heavy_streams, light_users, interval, service, duration):
+    """Return (light latencies, heavy latencies) for one scheduling variant."""
+    controller = AdmissionController(
+        max_concurrent=slots,
+        max_queue=100000,
+        max_wait_seconds=3600,
+        retry_after=1,
+        max_per_user=max(1, slots // 2) if fair else slots,
+        max_queued_per_user=100000
+    )
+    if not fair:
+        # One shared identity turns the scheduler into a single FIFO queue
+        controller.enter = lambda user_id, user_type="", enter=controller.enter: enter("everyone", user_type)
+
+    light, heavy = [], []
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(heavy_user(controller, heavy_streams, service, heavy, stop))]
+    tasks += [
+        asyncio.create_task(light_user(controller, f"light-{i}", interval, service, light, stop))
+        for i in range(light_users)
+    ]
+
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return light, heavy
+
+
+def main(slots, heavy_streams, light_users, interval, service, duration):
+    print(f"{slots} slots, {service * 1000:.0f} ms completions, heavy user with {heavy_streams} open streams, "
+          f"{light_users} light users every {interval * 1000:.0f} ms, {duration:.0f} s")
+    print(f"{'scheduler':>10}{'light p50 ms':>14}{'light p95 ms':>14}{'light p99 ms':>14}{'light max ms':>14}{'heavy req/s':>13}")
+    for name, fair in (("fifo", False), ("fair", True)):
+        light, heavy = asyncio.run(run(fair, slots, heavy_streams, light_users, interval, service, duration))
+        p50, p95, p99 = (percentile(light, pct) * 1000 for pct in (50, 95, 99))
+        print(f"{name:>10}{p50:>14.1f}{p95:>14.1f}{p99:>14.1f}{max(light) * 1000:>14.1f}{len(heavy) / duration:>13.1f}")
+    print(f"(an uncontended request takes {service * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--heavy-streams", type=int, default=40)
+    parser.add_argument("--light-users", type=int, default=5)
+    parser.add_argument("--light-interval", type=float, default=0.2)
+    parser.add_argument("--service", type=float, default=0.05)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    main(args.slots, args.heavy_streams, args.light_users, args.light_interval, args.service, args.duration)
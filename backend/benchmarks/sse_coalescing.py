@@ -0,0 +1,118 @@
+# benchmarks/sse_coalescing.py
+"""
+SSE frames per second and CPU per stream with and without delta coalescing.
+
+Serves `--streams` concurrent replies from the fake provider, one token per
+delta every `--token-delay` seconds, through uvicorn and the same stages as
+/chat/stream: a background generation, its (event id, chunk) reader, the
+coalescing stage, SSE frame formatting and EventStreamResponse. Clients in
+the same process read the raw responses over TCP, so CPU time covers both
+ends. The "per-delta" variant sends one frame per token; the "coalesced"
+variant batches tokens for up to `--window-ms` milliseconds or
+`--max-bytes` bytes.
+
+Usage:
+    python -m benchmarks.sse_coalescing [--streams 200] [--tokens 200] [--window-ms 20]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import uvicorn
+from services.generation import GenerationManager
+from services.providers import FakeProvider
+from utils.sse import EventStreamResponse, coalesce_events
+
+
+def make_app(provider, window, max_bytes, frame_counts):
+    """ASGI app streaming one fake reply per request."""
+    manager = GenerationManager()
+
+    async def finish(generation):
+        pass
+
+    async def frames():
+        generation = manager.start("bench", await provider.open("m", [], 0, 0), finish)
+        events = coalesce_events(generation.events(), window, max_bytes)
+        count = 0
+        try:
+            async for event_id, chunk in events:
+                count += 1
+                yield f"id: {event_id}\ndata: {chunk}\n\n"
+        finally:
+            await events.aclose()
+        frame_counts.append(count + 1)
+        yield "data: [DONE]\n\n"
+
+    async def app(scope, receive, send):
+        await EventStreamResponse(frames())(scope, receive, send)
+
+    return app
+
+
+async def client(port):
+    """Request one stream and return the reply text it carried."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /chat/stream HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+    body = await reader.read()
+    writer.close()
+
+    # Chunked transfer framing never splits an SSE line here, so plain line filtering is enough
+    lines = body.decode().split("\n")
+    return "".join(line[len("data: "):] for line in lines if line.startswith("data: ") and line != "data: [DONE]")
+
+
+async def run(streams, tokens, token_delay, window, max_bytes):
+    """Return (frames, elapsed seconds, CPU seconds, replies) for one variant."""
+    reply = " ".join(f"tok{i}" for i in range(tokens))
+    provider = FakeProvider(reply=reply, first_token_delays=(0.0,), token_delay=token_delay)
+    frame_counts = []
+    server = uvicorn.Server(uvicorn.Config(
+        make_app(provider, window, max_bytes, frame_counts),
+        host="127.0.0.1",
+        port=0,
+        lifespan="off",
+        log_level="warning",
+        backlog=4096
+    ))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    cpu, start = time.process_time(), time.perf_counter()
+    replies = await asyncio.gather(*(client(port) for _ in range(streams)))
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+
+    server.should_exit = True
+    await serving
+    return sum(frame_counts), elapsed, cpu, replies
+
+
+def main(streams, tokens, token_delay, window_ms, max_bytes):
+    print(f"{streams} streams x {tokens} tokens, one token every {token_delay * 1000:.0f} ms, "
+          f"window {window_ms:.0f} ms / {max_bytes} bytes")
+    print(f"{'variant':>10}{'frames':>10}{'frames/s':>11}{'frames/stream':>15}{'CPU ms/stream':>15}{'wall s':>8}")
+    replies = {}
+    for name, window in (("per-delta", 0), ("coalesced", window_ms / 1000)):
+        frames, elapsed, cpu, replies[name] = asyncio.run(run(streams, tokens, token_delay, window, max_bytes))
+        print(f"{name:>10}{frames:>10}{frames / elapsed:>11.0f}{frames / streams:>15.1f}"
+              f"{cpu / streams * 1000:>15.2f}{elapsed:>8.2f}")
+    print(f"identical text: {replies['per-delta'] == replies['coalesced']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--window-ms", type=float, default=20)
+    parser.add_argument("--max-bytes", type=int, default=1024)
+    args = parser.parse_args()
+
+    main(args.streams, args.tokens, args.token_delay, args.window_ms, args.max_bytes)
@@ -3,6 +3,7 @@
 Application settings and configuration.
 """
 
+import json
 import os
 from dotenv import load_dotenv
 
@@ -22,6 +23,103 @@ class Settings:
     openai_model = "gpt-3.5-turbo"
     openai_temperature = 0.7
     openai_max_tokens = 1000
+    openai_context_window = 4096
+    # Tried in order when the breakers of the models before them are open
+    openai_fallback_models = [m.strip() for m in os.getenv("OPENAI_FALLBACK_MODELS", "").split(",") if m.strip()]
+    
+    # Model Routing Settings (tier per request from cheap features of the prompt)
+    model_router = os.getenv("MODEL_ROUTER", "rules")  # or "static" for one tier
+    model_tiers = json.loads(os.getenv("MODEL_TIERS", "{}"))  # e.g. {"complex": {"model": "gpt-4o"}}
+    router_keyword_rules = json.loads(os.getenv("ROUTER_KEYWORD_RULES", "[]"))  # [[regex, tier], ...]
+    router_complex_min_chars = 1200
+    router_complex_min_history = 40
+    
+    # Upstream HTTP Pool Settings (shared by every model call)
+    upstream_max_connections = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+    upstream_keepalive_seconds = 30.0
+    upstream_connect_timeout = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+    upstream_first_byte_timeout = float(os.getenv("UPSTREAM_FIRST_BYTE_TIMEOUT", "20"))
+    upstream_read_timeout = float(os.getenv("UPSTREAM_READ_TIMEOUT", "30"))
+    upstream_total_timeout = float(os.getenv("UPSTREAM_TOTAL_TIMEOUT", "300"))
+    
+    # Completion Provider Settings
+    llm_provider = os.getenv("LLM_PROVIDER", "openai")  # or "fake" for offline load tests
+    
+    # Hedging Settings (race a second request when the first token is late)
+    hedge_enabled = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    hedge_min_samples = 20
+    hedge_window = 500
+    hedge_max_ratio = 0.1
+    
+    # Circuit Breaker Settings (per model; latency is time to first token)
+    breaker_failure_rate = 0.5
+    breaker_slow_call_seconds = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "10"))
+    breaker_slow_call_rate = 0.5
+    breaker_window = 20
+    breaker_min_calls = 10
+    breaker_open_seconds = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+    breaker_half_open_probes = 3
+    breaker_event_history = 100
+    
+    # Admission Control Settings (caps concurrent streaming completions)
+    admission_max_concurrent = int(os.getenv("ADMISSION_MAX_CONCURRENT", "50"))
+    admission_max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+    admission_max_wait_seconds = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "30"))
+    admission_retry_after_seconds = 5
+    admission_max_per_user = int(os.getenv("ADMISSION_MAX_PER_USER", "4"))
+    admission_max_queued_per_user = int(os.getenv("ADMISSION_MAX_QUEUED_PER_USER", "8"))
+    admission_user_weights = json.loads(os.getenv("ADMISSION_USER_WEIGHTS", '{"anonymous": 1}'))
+    
+    # Stream Resume Settings (reconnects with Last-Event-ID replay the reply)
+    stream_resume_grace_seconds = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "5"))
+    stream_replay_max_bytes = 16 * 1024 * 1024
+    stream_replay_stream_max_bytes = 64 * 1024
+    stream_replay_ttl_seconds = 60
+    
+    # Chat Pipeline Settings (the user message is saved while the reply generates)
+    chat_overlap_persistence = os.getenv("CHAT_OVERLAP_PERSISTENCE", "true").lower() == "true"
+    stage_timing_window = 1000
+    
+    # Chat Dedupe Settings (duplicate submissions follow the first one's reply)
+    chat_dedupe_ttl_seconds = float(os.getenv("CHAT_DEDUPE_TTL_SECONDS", "30"))  # client request ids only
+    chat_dedupe_max_keys = 10000
+    
+    # WebSocket Chat Settings (one authenticated connection carries many replies)
+    ws_auth_timeout_seconds = 10
+    ws_max_turns = int(os.getenv("WS_MAX_TURNS", "8"))  # replies in progress per connection
+    ws_send_queue_size = 64  # messages queued per connection before its replies pause
+    
+    # SSE Coalescing Settings (reply deltas batched into fewer, larger frames)
+    sse_coalesce_window_ms = float(os.getenv("SSE_COALESCE_WINDOW_MS", "20"))  # 0 sends every delta
+    sse_coalesce_max_bytes = 1024
+    
+    # Stream Fan-out Settings (requests for a reply already generating attach to it)
+    stream_pubsub_backend = os.getenv("STREAM_PUBSUB_BACKEND", "memory")  # or "sqlite" for several workers on one host
+    stream_pubsub_path = os.getenv("STREAM_PUBSUB_PATH", "pubsub.db")
+    stream_pubsub_poll_interval = 0.01
+    stream_subscriber_queue_size = 256
+    stream_sync_timeout_seconds = 0.5
+    stream_idle_timeout_seconds = 60
+    
+    # Context Assembly Settings (prompt budget = context window - max_tokens)
+    context_cache_max_sessions = 1000
+    
+    # Conversation Memory Settings (rolling summary of older turns)
+    memory_enabled = True
+    memory_recent_messages = 20
+    memory_summary_batch = 10
+    memory_summary_max_tokens = 300
+    memory_cache_max_sessions = 1000
+    summarizer_backend = os.getenv("SUMMARIZER_BACKEND", "openai")  # or "stub"
+    
+    # Response Cache Settings (opt-in; replays identical prompts without a model call)
+    response_cache_enabled = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    response_cache_max_entries = 1000
+    response_cache_max_bytes = 32 * 1024 * 1024
+    response_cache_ttl_seconds = 60 * 60
+    response_cache_dir = os.getenv("RESPONSE_CACHE_DIR", "")  # empty disables the disk tier
+    response_cache_disk_max_entries = 10000
     
     # CORS Settings
     allowed_origins = ["http://localhost:3000"]
@@ -29,6 +127,47 @@ class Settings:
     # Firebase Settings  
     firebase_key_path = "firebase-key.json"
     
+    # Storage Settings ("firestore", "sqlite" or "memory")
+    storage_backend = os.getenv("STORAGE_BACKEND", "firestore")
+    sqlite_path = os.getenv("SQLITE_PATH", "chatbot.db")
+    
+    # History Cache Settings
+    history_cache_max_sessions = 1000
+    history_cache_max_bytes = 64 * 1024 * 1024
+    history_cache_ttl_seconds = 15 * 60
+    # Other workers' writes don't reach this process's cache; check each hit
+    # against the stored message count (defaults on with a cross-process pub/sub)
+    history_cache_validate = os.getenv(
+        "HISTORY_CACHE_VALIDATE",
+        "false" if stream_pubsub_backend == "memory" else "true"
+    ).lower() == "true"
+    
+    # Pagination Settings
+    sessions_page_size = 50
+    sessions_max_page_size = 200
+    messages_page_size = 50
+    messages_max_page_size = 200
+    
+    # Transcript Compaction Settings (Firestore backend)
+    compaction_enabled = True
+    compaction_chunk_size = 100
+    compaction_keep_recent = 20
+    
+    # Deletion Settings
+    deletion_batch_parallelism = 4
+    deletion_session_parallelism = 4
+    deletion_max_sessions_per_job = 100
+    deletion_job_retention = 1000
+    
+    # Write-behind Settings (message writes are batched off the request path)
+    write_behind_enabled = True
+    write_behind_max_batch = 200
+    write_behind_flush_interval = 0.05
+    write_behind_max_attempts = 5  # failed commits of one batch before it is dead-lettered
+    write_behind_retry_backoff = 0.1  # seconds before the first retry, doubled per attempt
+    write_behind_max_retry_backoff = 5.0
+    write_behind_max_dead_letters = 1000  # newest dead-lettered messages kept for inspection
+    
     # Auth Settings
     secret_key = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     
@@ -7,6 +7,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api.routes import api_router
 from config.settings import settings
+from services.storage import storage_service
+from services.deletion_service import deletion_service
+from services.conversation_memory import conversation_memory
+from services.generation import generation_manager
+from services.stream_broker import stream_broker
+from services.pubsub import pubsub
+from services.openai_service import openai_service
 from utils.constants import API_TITLE, API_DESCRIPTION, API_VERSION
 import logging
 
@@ -63,6 +70,7 @@ async def startup_event():
     Performs initialization tasks when the application starts.
     """
     logging.info(f"{API_TITLE} v{API_VERSION} starting up...")
+    await openai_service.start()
 
 
 @app.on_event("shutdown")
@@ -73,6 +81,13 @@ async def shutdown_event():
     Performs cleanup tasks when the application shuts down.
     """
     logging.info(f"{API_TITLE} shutting down...")
+    await deletion_service.close()
+    await generation_manager.close()
+    await stream_broker.close()
+    await pubsub.close()
+    await conversation_memory.close()
+    await openai_service.close()
+    await storage_service.close()
 
 
 if __name__ == "__main__":
@@ -4,7 +4,7 @@ Pydantic models for chat-related data structures.
 """
 
 from pydantic import BaseModel, Field
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
 
@@ -28,10 +28,14 @@ class ChatMessage(BaseModel):
         role: Either 'user' or 'assistant'
         content: The message content
         timestamp: When the message was created
+        model: Model that generated an assistant message, if recorded
+        truncated: Whether the reply was cut off because the client disconnected
     """
     role: Literal["user", "assistant"]
     content: str
     timestamp: Optional[datetime] = None
+    model: Optional[str] = None
+    truncated: bool = False
 
 
 class ChatSession(BaseModel):
@@ -57,4 +61,14 @@ class ChatResponse(BaseModel):
         reply: The assistant's response (for non-streaming)
     """
     session_id: str
-    reply: str
\ No newline at end of file
+    reply: str
+
+
+class BulkDeleteRequest(BaseModel):
+    """
+    Model for bulk session deletion requests.
+    
+    Attributes:
+        session_ids: Sessions to delete in one background job
+    """
+    session_ids: List[str] = Field(..., min_length=1, description="Chat session IDs to delete")
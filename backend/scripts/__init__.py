@@ -0,0 +1 @@
+"""One-off maintenance scripts (run with ``python -m scripts.<name>``)."""
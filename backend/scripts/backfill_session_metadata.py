@@ -0,0 +1,33 @@
+# scripts/backfill_session_metadata.py
+"""
+Backfill denormalized chat metadata in Firestore.
+
+Chats created before `message_count`, `last_seq`, `last_message_at` and
+`title_locked` were added are missing from the activity-ordered session
+listing until this runs. Already-migrated chats are skipped, so it is safe
+to re-run. SQLite databases are migrated automatically on open.
+
+Usage:
+    python -m scripts.backfill_session_metadata
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.firebase_service import FirebaseService
+
+
+async def main() -> None:
+    service = FirebaseService()
+    try:
+        updated = await service.backfill_session_metadata()
+    finally:
+        await service.close()
+    print(f"Backfilled metadata for {updated} chats")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
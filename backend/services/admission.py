@@ -0,0 +1,372 @@
+# services/admission.py
+"""
+Admission control for upstream model calls.
+
+A fixed number of completions run at once. Further requests wait for up to
+a maximum time in per-user queues that are served by weighted deficit round
+robin, so one user flooding the endpoint cannot starve everyone else. When
+the queues are full, requests are rejected straight away so clients can
+back off and retry.
+"""
+
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+from collections import deque
+import asyncio
+import bisect
+from config.settings import settings
+
+# Upper bounds (seconds) of the queue wait-time histogram buckets
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Smallest accepted scheduling weight (keeps every user making progress)
+MIN_WEIGHT = 0.01
+
+
+class AdmissionRejected(Exception):
+    """Raised when the wait queue, or the user's share of it, is full."""
+    
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a queued request waits longer than the maximum wait time."""
+
+
+class _UserQueue:
+    """One user's running and waiting requests."""
+    
+    __slots__ = ("user_id", "weight", "active", "waiters", "deficit")
+    
+    def __init__(self, user_id: str, weight: float):
+        self.user_id = user_id
+        self.weight = weight
+        self.active = 0
+        self.waiters: Deque["Ticket"] = deque()
+        self.deficit = 0.0
+
+
+class Ticket:
+    """
+    One request's claim on a completion slot.
+    
+    Attributes:
+        granted: Whether the request holds a slot
+    """
+    
+    def __init__(self, controller: "AdmissionController", queue: _UserQueue):
+        self._controller = controller
+        self._queue = queue
+        self._loop = asyncio.get_running_loop()
+        self._signal = self._loop.create_future()
+        self.enqueued_at = self._loop.time()
+        self.granted = False
+        self.released = False
+    
+    @property
+    def user_id(self) -> str:
+        """The user the request is scheduled as."""
+        return self._queue.user_id
+    
+    @property
+    def position(self) -> int:
+        """Estimated 1-based place in the wait queue, or 0 once granted."""
+        return 0 if self.granted else self._controller._position(self)
+    
+    async def wait(self) -> AsyncIterator[int]:
+        """
+        Wait for a slot, yielding the queue position whenever it changes.
+        
+        Yields nothing if the slot was granted on entry. Abandoning the
+        iteration (e.g. on client disconnect) leaves the queue.
+        
+        Raises:
+            AdmissionTimeout: If no slot frees up within the maximum wait time
+        """
+        deadline = self.enqueued_at + self._controller.max_wait_seconds
+        last_position = None
+        
+        try:
+            while not self.granted:
+                position = self.position
+                if position != last_position:
+                    last_position = position
+                    yield position
+                    continue
+                
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    self._controller._leave(self, timed_out=True)
+                    raise AdmissionTimeout(f"No upstream capacity within {self._controller.max_wait_seconds}s")
+                
+                try:
+                    await asyncio.wait_for(self._signal, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                self._signal = self._loop.create_future()
+        finally:
+            if not self.granted:
+                self._controller._leave(self)
+    
+    def release(self) -> None:
+        """Give the slot back, or leave the queue if still waiting."""
+        if self.released:
+            return
+        self.released = True
+        
+        if self.granted:
+            self._controller._release(self)
+        else:
+            self._controller._leave(self)
+    
+    def _notify(self) -> None:
+        """Wake a waiting `wait()` so it re-reads its position."""
+        if not self._signal.done():
+            self._signal.set_result(None)
+
+
+class AdmissionController:
+    """
+    Concurrency cap with bounded, time-limited, per-user fair wait queues.
+    
+    Note:
+        Each request costs one unit; a user with weight 2 is granted twice
+        as many slots per round as a user with weight 1 while both have
+        requests waiting. A user never holds more than `max_per_user` slots,
+        even when others are idle. State is per process; with several
+        workers each enforces its own limits.
+    """
+    
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        max_wait_seconds: float,
+        retry_after: int,
+        max_per_user: Optional[int] = None,
+        max_queued_per_user: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None
+    ):
+        """
+        Initialize the admission controller.
+        
+        Args:
+            max_concurrent: Completions allowed to run at once
+            max_queue: Requests allowed to wait for a slot
+            max_wait_seconds: Longest a request may wait before giving up
+            retry_after: Seconds suggested to rejected clients
+            max_per_user: Completions one user may run at once (default: no limit)
+            max_queued_per_user: Requests one user may have waiting (default: max_queue)
+            weights: Scheduling weight by user type; unknown types weigh 1
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.retry_after = retry_after
+        self.max_per_user = max_per_user or max_concurrent
+        self.max_queued_per_user = max_queued_per_user or max_queue
+        self.weights = weights or {}
+        self.active = 0
+        self.queued = 0
+        self._users: Dict[str, _UserQueue] = {}
+        self._rotation: Deque[_UserQueue] = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.abandoned = 0
+        self._wait_counts: List[int] = [0] * (len(WAIT_BUCKETS) + 1)
+        self._wait_total = 0.0
+    
+    def enter(self, user_id: str = "", user_type: str = "") -> Ticket:
+        """
+        Claim a slot, or a place in the user's queue if none is free.
+        
+        Args:
+            user_id: Identity the request is scheduled as
+            user_type: Selects the user's weight (e.g. "anonymous")
+        
+        Returns:
+            A ticket; wait on it with `Ticket.wait()` and always release it
+        
+        Raises:
+            AdmissionRejected: If the queue or the user's share of it is full
+        """
+        queue = self._users.get(user_id)
+        if queue is None:
+            weight = max(self.weights.get(user_type, 1.0), MIN_WEIGHT)
+            queue = self._users[user_id] = _UserQueue(user_id, weight)
+        
+        can_run = self.active < self.max_concurrent and queue.active < self.max_per_user
+        if not can_run and (self.queued >= self.max_queue or len(queue.waiters) >= self.max_queued_per_user):
+            self.rejected += 1
+            self._forget_if_idle(queue)
+            raise AdmissionRejected(self.retry_after)
+        
+        ticket = Ticket(self, queue)
+        if can_run:
+            # A free slot with requests still waiting means they are all
+            # held back by their own user's limit, so this one goes first
+            self._grant(ticket)
+        else:
+            if not queue.waiters:
+                self._rotation.append(queue)
+            queue.waiters.append(ticket)
+            self.queued += 1
+        return ticket
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return slot usage, queue depth, rejections and the wait-time histogram."""
+        cumulative = 0
+        histogram = {}
+        for bound, count in zip([*WAIT_BUCKETS, "+Inf"], self._wait_counts):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "users_active": sum(1 for queue in self._users.values() if queue.active),
+            "users_waiting": len(self._rotation),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "abandoned": self.abandoned,
+            "wait_seconds": {
+                "count": self.admitted,
+                "sum": self._wait_total,
+                "buckets": histogram,
+            },
+        }
+    
+    def _grant(self, ticket: Ticket) -> None:
+        """Hand a slot to a ticket and record how long it waited."""
+        waited = ticket._loop.time() - ticket.enqueued_at
+        ticket.granted = True
+        ticket._queue.active += 1
+        self.active += 1
+        self.admitted += 1
+        self._wait_counts[bisect.bisect_left(WAIT_BUCKETS, waited)] += 1
+        self._wait_total += waited
+        ticket._notify()
+    
+    def _release(self, ticket: Ticket) -> None:
+        """Free a slot and pass it on to the next waiter in fair order."""
+        queue = ticket._queue
+        queue.active -= 1
+        self.active -= 1
+        self._dispatch()
+        self._forget_if_idle(queue)
+    
+    def _dispatch(self) -> None:
+        """Grant free slots to waiters and tell the rest their new positions."""
+        granted = False
+        while self.active < self.max_concurrent:
+            ticket = self._next_waiter()
+            if ticket is None:
+                break
+            self.queued -= 1
+            self._grant(ticket)
+            granted = True
+        
+        if granted:
+            for queue in self._rotation:
+                for waiter in queue.waiters:
+                    waiter._notify()
+    
+    def _next_waiter(self) -> Optional[Ticket]:
+        """
+        Pop the next waiter by deficit round robin.
+        
+        The user at the head of the rotation earns its weight in credit when
+        it has less than one request's worth, spends one unit per grant and
+        moves to the back once its credit runs out. Users at their in-flight
+        limit are skipped without earning credit.
+        """
+        blocked = 0
+        while self._rotation and blocked < len(self._rotation):
+            queue = self._rotation[0]
+            if queue.active >= self.max_per_user:
+                blocked += 1
+                self._rotation.rotate(-1)
+                continue
+            
+            blocked = 0
+            if queue.deficit < 1:
+                queue.deficit += queue.weight
+                if queue.deficit < 1:
+                    self._rotation.rotate(-1)
+                    continue
+            
+            queue.deficit -= 1
+            ticket = queue.waiters.popleft()
+            if not queue.waiters:
+                self._rotation.popleft()
+                queue.deficit = 0.0
+            elif queue.deficit < 1:
+                self._rotation.rotate(-1)
+            return ticket
+        
+        return None
+    
+    def _leave(self, ticket: Ticket, timed_out: bool = False) -> None:
+        """Remove a ticket that stopped waiting."""
+        queue = ticket._queue
+        try:
+            queue.waiters.remove(ticket)
+        except ValueError:
+            return
+        
+        self.queued -= 1
+        if timed_out:
+            self.timed_out += 1
+        else:
+            self.abandoned += 1
+        
+        if not queue.waiters:
+            self._rotation.remove(queue)
+            queue.deficit = 0.0
+            self._forget_if_idle(queue)
+        for other in self._rotation:
+            for waiter in other.waiters:
+                waiter._notify()
+    
+    def _forget_if_idle(self, queue: _UserQueue) -> None:
+        """Drop a user's state once nothing of theirs is running or waiting."""
+        if not queue.active and not queue.waiters:
+            self._users.pop(queue.user_id, None)
+    
+    def _position(self, ticket: Ticket) -> int:
+        """
+        Estimate how many grants happen before this ticket's.
+        
+        Other users are served in proportion to their weight, so while this
+        user's earlier requests and this one are granted, each other user
+        gets about `rounds * weight` of theirs.
+        """
+        queue = ticket._queue
+        try:
+            index = queue.waiters.index(ticket)
+        except ValueError:
+            return 0
+        
+        rounds = (index + 1) / queue.weight
+        ahead = index
+        for other in self._rotation:
+            if other is not queue:
+                ahead += min(len(other.waiters), int(rounds * other.weight))
+        return ahead + 1
+
+
+# Create singleton instance
+admission_controller = AdmissionController(
+    max_concurrent=settings.admission_max_concurrent,
+    max_queue=settings.admission_max_queue,
+    max_wait_seconds=settings.admission_max_wait_seconds,
+    retry_after=settings.admission_retry_after_seconds,
+    max_per_user=settings.admission_max_per_user,
+    max_queued_per_user=settings.admission_max_queued_per_user,
+    weights=settings.admission_user_weights
+)
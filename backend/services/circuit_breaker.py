@@ -0,0 +1,271 @@
+# services/circuit_breaker.py
+"""
+Per-model circuit breakers.
+
+A breaker watches a rolling window of recent calls to one model. When too
+many of them fail, or take too long to produce a first token, it opens and
+calls skip that model (falling back to the next one in the chain) until a
+cool-down has passed. Then a few probe calls are let through; if they
+succeed the breaker closes again, otherwise it re-opens.
+"""
+
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+from collections import deque
+import time
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when every model in the fallback chain has an open breaker."""
+
+
+class Permit(NamedTuple):
+    """
+    A call let through by `CircuitBreaker.allow`, to report its outcome with.
+    
+    Attributes:
+        probe: Whether the call is a half-open probe
+        epoch: The breaker's state change count when the call was let through
+    """
+    probe: bool
+    epoch: int
+
+
+class CircuitBreaker:
+    """
+    Error-rate and slow-call breaker for one model.
+    
+    Note:
+        Latency is time to first token, so a long but steadily streaming
+        reply is not a slow call. Calls must be reported with
+        `record_success`, `record_failure` or `release` and the permit
+        `allow` returned, or half-open probes are never given back. Streams
+        are long-lived, so an outcome often arrives after the breaker has
+        changed state; it is then ignored, as it says nothing about the
+        model since then.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float,
+        slow_call_seconds: float,
+        slow_call_rate_threshold: float,
+        window: int,
+        min_calls: int,
+        open_seconds: float,
+        half_open_probes: int,
+        on_transition: Optional[Callable[[str, str, str], None]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize the breaker.
+        
+        Args:
+            name: Model (or endpoint) the breaker guards
+            failure_rate_threshold: Failed fraction of the window that opens the breaker
+            slow_call_seconds: First-token latency from which a call counts as slow
+            slow_call_rate_threshold: Slow fraction of the window that opens the breaker
+            window: Number of recent calls the rates are taken over
+            min_calls: Calls needed in the window before the rates are trusted
+            open_seconds: How long the breaker stays open before probing
+            half_open_probes: Probe calls let through, and successes needed to close
+            on_transition: Called with (name, old state, new state) on every change
+            clock: Monotonic time source
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._on_transition = on_transition
+        self._clock = clock
+        self._calls: Deque[tuple] = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._epoch = 0
+        self.rejected = 0
+        self.times_opened = 0
+    
+    def allow(self) -> Optional[Permit]:
+        """Return a permit if a call may go to this model now, else None."""
+        if self.state == OPEN:
+            if self._clock() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return None
+            self._transition(HALF_OPEN)
+        
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                return None
+            self._probes_in_flight += 1
+            return Permit(True, self._epoch)
+        
+        return Permit(False, self._epoch)
+    
+    def record_success(self, permit: Permit, latency: float) -> None:
+        """Report a call that produced its first token after `latency` seconds."""
+        if permit.epoch != self._epoch:
+            return
+        slow = latency >= self.slow_call_seconds
+        
+        if permit.probe:
+            self._probes_in_flight -= 1
+            if slow:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._transition(CLOSED)
+            return
+        
+        self._calls.append((False, slow))
+        self._evaluate()
+    
+    def record_failure(self, permit: Permit) -> None:
+        """Report a call that failed before its first token."""
+        if permit.epoch != self._epoch:
+            return
+        
+        if permit.probe:
+            self._probes_in_flight -= 1
+            self._open()
+            return
+        
+        self._calls.append((True, False))
+        self._evaluate()
+    
+    def release(self, permit: Permit) -> None:
+        """Report a call abandoned without an outcome (e.g. the client left)."""
+        if permit.probe and permit.epoch == self._epoch:
+            self._probes_in_flight -= 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the state and the rates over the current window."""
+        failure_rate, slow_rate = self._rates()
+        return {
+            "state": self.state,
+            "calls": len(self._calls),
+            "failure_rate": failure_rate,
+            "slow_call_rate": slow_rate,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
+    
+    def _rates(self):
+        if not self._calls:
+            return 0.0, 0.0
+        failures = sum(1 for failed, _ in self._calls if failed)
+        slow = sum(1 for _, is_slow in self._calls if is_slow)
+        return failures / len(self._calls), slow / len(self._calls)
+    
+    def _evaluate(self) -> None:
+        """Open the breaker if the window breaches either threshold."""
+        if self.state != CLOSED or len(self._calls) < self.min_calls:
+            return
+        failure_rate, slow_rate = self._rates()
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._open()
+    
+    def _open(self) -> None:
+        self.opened_at = self._clock()
+        self.times_opened += 1
+        self._transition(OPEN)
+    
+    def _transition(self, state: str) -> None:
+        old, self.state = self.state, state
+        self._epoch += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == CLOSED:
+            self._calls.clear()
+        
+        logger.warning(f"Circuit breaker for {self.name}: {old} -> {state}")
+        if self._on_transition:
+            self._on_transition(self.name, old, state)
+
+
+class CircuitBreakers:
+    """
+    The breakers of every model in use, plus a log of recent events.
+    
+    Breakers are created on first use with shared thresholds. Events are
+    state changes and fallbacks (a reply served by a model other than the
+    primary), newest last.
+    """
+    
+    def __init__(self, event_history: int, **breaker_options):
+        """
+        Initialize the registry.
+        
+        Args:
+            event_history: Number of recent events kept
+            **breaker_options: CircuitBreaker arguments shared by every breaker
+        """
+        self._options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=event_history)
+        self.fallbacks = 0
+    
+    def get(self, name: str) -> CircuitBreaker:
+        """Return the breaker for a model, creating it if needed."""
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(
+                name, on_transition=self._record_transition, **self._options
+            )
+        return breaker
+    
+    def record_fallback(self, primary: str, served_by: str, reasons: List[str]) -> None:
+        """Log that a reply came from a fallback model, and why the earlier ones were skipped."""
+        self.fallbacks += 1
+        logger.info(f"Completion fell back from {primary} to {served_by}: {'; '.join(reasons)}")
+        self.events.append({
+            "type": "fallback",
+            "at": time.time(),
+            "from": primary,
+            "to": served_by,
+            "reasons": reasons,
+        })
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return per-model breaker stats, the fallback count and recent events."""
+        return {
+            "breakers": {name: breaker.stats() for name, breaker in self._breakers.items()},
+            "fallbacks": self.fallbacks,
+            "events": list(self.events),
+        }
+    
+    def _record_transition(self, name: str, old: str, new: str) -> None:
+        self.events.append({
+            "type": "state",
+            "at": time.time(),
+            "model": name,
+            "from": old,
+            "to": new,
+        })
+
+
+# Create singleton instance
+circuit_breakers = CircuitBreakers(
+    event_history=settings.breaker_event_history,
+    failure_rate_threshold=settings.breaker_failure_rate,
+    slow_call_seconds=settings.breaker_slow_call_seconds,
+    slow_call_rate_threshold=settings.breaker_slow_call_rate,
+    window=settings.breaker_window,
+    min_calls=settings.breaker_min_calls,
+    open_seconds=settings.breaker_open_seconds,
+    half_open_probes=settings.breaker_half_open_probes
+)
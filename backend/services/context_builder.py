@@ -0,0 +1,154 @@
+# services/context_builder.py
+"""
+Token-budgeted assembly of the message list sent to the model.
+"""
+
+from typing import Callable, List, Dict, Optional
+from collections import OrderedDict
+import bisect
+from config.settings import settings
+from utils.tokens import count_message_tokens, REPLY_PRIMING_TOKENS
+
+
+class _SessionTokens:
+    """Running token totals for one session's history."""
+    
+    __slots__ = ("prefix", "last_key")
+    
+    def __init__(self):
+        # prefix[i] is the token total of the first i messages
+        self.prefix: List[int] = [0]
+        self.last_key: Optional[tuple] = None
+
+
+def _message_key(message: Dict[str, str]) -> tuple:
+    """Identify a message cheaply enough to detect a rewritten history."""
+    return (message.get("role"), hash(message.get("content")))
+
+
+class ContextBuilder:
+    """
+    Selects the newest messages of a history that fit the prompt budget.
+    
+    Note:
+        Per-session token counts are cached as prefix sums. Histories only
+        grow by appending, so each build counts just the new messages and
+        finds the cut-off with a binary search. A history that no longer
+        extends the cached one (edited, truncated or another session
+        reusing the ID) is recounted from scratch.
+    """
+    
+    def __init__(
+        self,
+        context_window: int,
+        reply_tokens: int,
+        max_sessions: int,
+        count_tokens: Callable[[Dict[str, str]], int] = count_message_tokens
+    ):
+        """
+        Initialize the context builder.
+        
+        Args:
+            context_window: Model context size in tokens
+            reply_tokens: Tokens reserved for the reply (the `max_tokens` sent to the model)
+            max_sessions: Number of sessions whose token counts are cached
+            count_tokens: Function returning one message's token cost
+        """
+        self.budget = context_window - reply_tokens - REPLY_PRIMING_TOKENS
+        self.max_sessions = max_sessions
+        self.count_tokens = count_tokens
+        self._sessions: "OrderedDict[str, _SessionTokens]" = OrderedDict()
+        self.builds = 0
+        self.messages_counted = 0
+        self.recounts = 0
+        self.trimmed = 0
+    
+    def build(
+        self,
+        session_id: str,
+        history: List[Dict[str, str]],
+        budget: Optional[int] = None,
+        start: int = 0
+    ) -> List[Dict[str, str]]:
+        """
+        Return the longest suffix of the history that fits the token budget.
+        
+        Args:
+            session_id: The chat session ID the history belongs to
+            history: Full history, oldest first
+            budget: Prompt tokens available, defaults to the configured budget
+            start: Index of the oldest message that may be included
+        
+        Returns:
+            The newest messages that fit, oldest first. The latest message is
+            always included, even if it alone exceeds the budget.
+        """
+        self.builds += 1
+        if not history:
+            return []
+        
+        prefix = self._prefix_sums(session_id, history)
+        budget = self.budget if budget is None else budget
+        
+        start = min(start, len(history) - 1)
+        
+        # First index whose suffix total fits: prefix[-1] - prefix[cutoff] <= budget
+        cutoff = bisect.bisect_left(prefix, prefix[-1] - budget, lo=start, hi=len(history))
+        cutoff = min(cutoff, len(history) - 1)
+        
+        if cutoff > start:
+            self.trimmed += 1
+        return history[cutoff:]
+    
+    def count(self, session_id: str, history: List[Dict[str, str]]) -> int:
+        """Return the total token cost of a history, using the cache."""
+        return self._prefix_sums(session_id, history)[-1] if history else 0
+    
+    def forget(self, session_id: str) -> None:
+        """Drop a session's cached counts."""
+        self._sessions.pop(session_id, None)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return cache occupancy and assembly counters."""
+        return {
+            "sessions": len(self._sessions),
+            "budget": self.budget,
+            "builds": self.builds,
+            "messages_counted": self.messages_counted,
+            "recounts": self.recounts,
+            "trimmed": self.trimmed,
+        }
+    
+    def _prefix_sums(self, session_id: str, history: List[Dict[str, str]]) -> List[int]:
+        """Bring a session's prefix sums up to date with its history."""
+        entry = self._sessions.get(session_id)
+        counted = len(entry.prefix) - 1 if entry else 0
+        
+        if entry is None or counted > len(history) or (
+            counted and _message_key(history[counted - 1]) != entry.last_key
+        ):
+            if entry is not None:
+                self.recounts += 1
+            entry = _SessionTokens()
+            counted = 0
+        
+        prefix = entry.prefix
+        for message in history[counted:]:
+            prefix.append(prefix[-1] + self.count_tokens(message))
+        self.messages_counted += len(history) - counted
+        entry.last_key = _message_key(history[-1])
+        
+        self._sessions[session_id] = entry
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        
+        return prefix
+
+
+# Create singleton instance
+context_builder = ContextBuilder(
+    context_window=settings.openai_context_window,
+    reply_tokens=settings.openai_max_tokens,
+    max_sessions=settings.context_cache_max_sessions
+)
@@ -0,0 +1,267 @@
+# services/conversation_memory.py
+"""
+Rolling summaries of older conversation turns.
+
+The prompt for a turn is the session's summary followed by the messages it
+does not cover yet, so prompt size stays roughly flat however long the
+conversation gets.
+"""
+
+from typing import List, Dict, Optional, Protocol
+from collections import OrderedDict
+import asyncio
+from config.settings import settings
+from services.context_builder import ContextBuilder, context_builder
+from services.storage import StorageBackend, SessionSummary, storage_service
+from utils.constants import SUMMARY_CONTEXT_TEMPLATE
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marks a session whose summary has not been looked up yet
+_NOT_LOADED = object()
+
+
+class Summarizer(Protocol):
+    """Anything that can fold new messages into a running summary."""
+    
+    async def summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """Return `summary` updated with `messages` (oldest first)."""
+        ...
+
+
+class StubSummarizer:
+    """
+    Deterministic summarizer for tests and offline development.
+    
+    Keeps one clipped line per message and trims the oldest lines once the
+    summary grows past `max_chars`.
+    """
+    
+    def __init__(self, max_chars: int = 2000, line_chars: int = 80):
+        """
+        Initialize the stub summarizer.
+        
+        Args:
+            max_chars: Maximum summary length
+            line_chars: Characters kept from each message
+        """
+        self.max_chars = max_chars
+        self.line_chars = line_chars
+        self.calls = 0
+    
+    async def summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """Append a clipped line per message to the summary."""
+        self.calls += 1
+        lines = [f"{m['role']}: {m['content'][:self.line_chars]}" for m in messages]
+        text = "\n".join(line for line in [summary, *lines] if line)
+        return text[-self.max_chars:]
+
+
+def create_summarizer(name: Optional[str] = None) -> Summarizer:
+    """
+    Build a summarizer by name.
+    
+    Args:
+        name: "openai" or "stub"; defaults to settings.summarizer_backend
+    
+    Returns:
+        A Summarizer implementation
+    
+    Raises:
+        ValueError: If the name is unknown
+    """
+    name = (name or settings.summarizer_backend).lower()
+    
+    if name == "openai":
+        from services.openai_service import openai_service
+        return openai_service
+    if name == "stub":
+        return StubSummarizer()
+    
+    raise ValueError(f"Unknown summarizer: {name}")
+
+
+class ConversationMemory:
+    """
+    Builds prompts from a rolling summary plus recent turns.
+    
+    Note:
+        After each reply, messages older than the newest `recent_messages`
+        are folded into the summary in the background, `summary_batch` at a
+        time at least, so the summarizer sees only messages it has not
+        summarized before. Summaries are stored with the session and cached
+        in process.
+    """
+    
+    def __init__(
+        self,
+        storage: StorageBackend,
+        builder: ContextBuilder,
+        summarizer: Summarizer,
+        enabled: bool,
+        recent_messages: int,
+        summary_batch: int,
+        max_sessions: int
+    ):
+        """
+        Initialize conversation memory.
+        
+        Args:
+            storage: Storage backend holding the summaries
+            builder: Context builder that trims the prompt to the token budget
+            summarizer: Summarizer used for background updates
+            enabled: When False, prompts are the trimmed history alone
+            recent_messages: Newest messages never folded into the summary
+            summary_batch: Minimum number of new messages per summary update
+            max_sessions: Number of sessions whose summaries are cached
+        """
+        self.storage = storage
+        self.builder = builder
+        self.summarizer = summarizer
+        self.enabled = enabled
+        self.recent_messages = recent_messages
+        self.summary_batch = summary_batch
+        self.max_sessions = max_sessions
+        self._summaries: "OrderedDict[str, Optional[SessionSummary]]" = OrderedDict()
+        self._updates: Dict[str, asyncio.Task] = {}
+        self.updates = 0
+        self.summarized_messages = 0
+        self.failures = 0
+    
+    async def build_context(self, session_id: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Build the message list for the model.
+        
+        Args:
+            session_id: The chat session ID
+            history: Full history, oldest first
+        
+        Returns:
+            The summary as a system message (when there is one) followed by
+            the newest uncovered messages that fit the token budget
+        """
+        if not self.enabled:
+            return self.builder.build(session_id, history)
+        
+        summary = await self._load(session_id)
+        
+        # A summary covering more than the history belongs to a different transcript
+        if summary is None or summary.covered > len(history):
+            return self.builder.build(session_id, history)
+        
+        summary_message = {
+            "role": "system",
+            "content": SUMMARY_CONTEXT_TEMPLATE.format(summary=summary.text)
+        }
+        budget = self.builder.budget - self.builder.count_tokens(summary_message)
+        recent = self.builder.build(session_id, history, budget=budget, start=summary.covered)
+        
+        return [summary_message] + recent
+    
+    async def prefetch(self, session_id: str) -> None:
+        """Load the session's summary ahead of `build_context` (e.g. alongside the history read)."""
+        if self.enabled:
+            await self._load(session_id)
+    
+    def schedule_update(self, session_id: str, history: List[Dict[str, str]]) -> None:
+        """
+        Fold newly aged-out messages into the summary in the background.
+        
+        Args:
+            session_id: The chat session ID
+            history: Full history including the latest reply
+        """
+        if not self.enabled or session_id in self._updates:
+            return
+        
+        target = len(history) - self.recent_messages
+        cached = self._summaries.get(session_id)
+        covered = cached.covered if cached else 0
+        if target - covered < self.summary_batch:
+            return
+        
+        async def run() -> None:
+            try:
+                await self.update(session_id, history, target)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Summary update failed for session {session_id}: {str(e)}")
+            finally:
+                self._updates.pop(session_id, None)
+        
+        self._updates[session_id] = asyncio.get_running_loop().create_task(run())
+    
+    async def update(self, session_id: str, history: List[Dict[str, str]], target: int) -> Optional[SessionSummary]:
+        """
+        Extend the session's summary to cover the first `target` messages.
+        
+        Args:
+            session_id: The chat session ID
+            history: Full history, oldest first
+            target: Number of leading messages the summary should cover
+        
+        Returns:
+            The new summary, or None if the stored one already covers `target`
+        """
+        current = await self._load(session_id)
+        covered = current.covered if current else 0
+        if target <= covered:
+            return None
+        
+        text = await self.summarizer.summarize(current.text if current else "", history[covered:target])
+        summary = SessionSummary(text, target)
+        
+        await self.storage.store_summary(session_id, summary)
+        self._remember(session_id, summary)
+        self.updates += 1
+        self.summarized_messages += target - covered
+        return summary
+    
+    def forget(self, session_id: str) -> None:
+        """Drop a session's cached summary."""
+        self._summaries.pop(session_id, None)
+    
+    async def close(self) -> None:
+        """Wait for in-flight summary updates."""
+        if self._updates:
+            await asyncio.gather(*self._updates.values(), return_exceptions=True)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return summary cache occupancy and update counters."""
+        return {
+            "sessions": len(self._summaries),
+            "in_flight": len(self._updates),
+            "updates": self.updates,
+            "summarized_messages": self.summarized_messages,
+            "failures": self.failures,
+        }
+    
+    async def _load(self, session_id: str) -> Optional[SessionSummary]:
+        """Return the session's summary from the cache, reading storage on a miss."""
+        summary = self._summaries.get(session_id, _NOT_LOADED)
+        if summary is _NOT_LOADED:
+            summary = await self.storage.get_summary(session_id)
+            self._remember(session_id, summary)
+        else:
+            self._summaries.move_to_end(session_id)
+        return summary
+    
+    def _remember(self, session_id: str, summary: Optional[SessionSummary]) -> None:
+        """Cache a summary (or its absence), evicting the least recently used."""
+        self._summaries[session_id] = summary
+        self._summaries.move_to_end(session_id)
+        while len(self._summaries) > self.max_sessions:
+            self._summaries.popitem(last=False)
+
+
+# Create singleton instance
+conversation_memory = ConversationMemory(
+    storage_service,
+    context_builder,
+    create_summarizer(),
+    enabled=settings.memory_enabled,
+    recent_messages=settings.memory_recent_messages,
+    summary_batch=settings.memory_summary_batch,
+    max_sessions=settings.memory_cache_max_sessions
+)
@@ -0,0 +1,152 @@
+# services/deletion_service.py
+"""
+Background deletion of chat sessions with pollable job status.
+"""
+
+from typing import List, Dict, Optional, Any
+from collections import OrderedDict
+from datetime import datetime, timezone
+import asyncio
+import uuid
+from config.settings import settings
+from services.storage import StorageBackend, storage_service
+from utils.constants import LOG_SESSION_DELETED
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Job states
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class DeletionJob:
+    """
+    Progress of one deletion request.
+    
+    Attributes:
+        job_id: Unique job identifier
+        session_ids: Sessions to delete
+        status: One of pending, running, completed or failed
+        deleted: Sessions deleted so far
+        failed: Session IDs whose deletion raised
+    """
+    
+    def __init__(self, session_ids: List[str]):
+        self.job_id = str(uuid.uuid4())
+        self.session_ids = session_ids
+        self.status = JOB_PENDING
+        self.deleted = 0
+        self.failed: List[str] = []
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for API responses."""
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total": len(self.session_ids),
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class DeletionService:
+    """
+    Service that tombstones sessions immediately and deletes them in the background.
+    
+    Note:
+        Jobs live in process memory, so their status is only visible on the
+        worker that accepted them. A session whose job dies with the process
+        stays tombstoned (hidden) and can be deleted again.
+    """
+    
+    def __init__(self, storage: StorageBackend, session_parallelism: int, retention: int):
+        """
+        Initialize the deletion service.
+        
+        Args:
+            storage: Storage backend to delete from
+            session_parallelism: Sessions deleted concurrently per job
+            retention: Number of jobs kept for status lookups
+        """
+        self.storage = storage
+        self.session_parallelism = session_parallelism
+        self.retention = retention
+        self._jobs: "OrderedDict[str, DeletionJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+    
+    async def submit(self, session_ids: List[str]) -> DeletionJob:
+        """
+        Tombstone sessions and schedule their deletion.
+        
+        Args:
+            session_ids: Sessions to delete
+        
+        Returns:
+            The new job (status 'pending')
+        
+        Raises:
+            Exception: If tombstoning fails; nothing is scheduled then
+        """
+        session_ids = list(dict.fromkeys(session_ids))
+        await asyncio.gather(*(self.storage.tombstone_session(sid) for sid in session_ids))
+        
+        job = DeletionJob(session_ids)
+        self._remember(job)
+        self._tasks[job.job_id] = asyncio.get_running_loop().create_task(self._run(job))
+        return job
+    
+    def get_job(self, job_id: str) -> Optional[DeletionJob]:
+        """Return a job by ID, or None if unknown or expired."""
+        return self._jobs.get(job_id)
+    
+    async def close(self) -> None:
+        """Wait for running jobs so deletions are not cut off mid-way."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+    
+    async def _run(self, job: DeletionJob) -> None:
+        """Delete every session in a job with bounded parallelism."""
+        job.status = JOB_RUNNING
+        semaphore = asyncio.Semaphore(self.session_parallelism)
+        
+        async def delete_one(session_id: str) -> None:
+            async with semaphore:
+                try:
+                    await self.storage.delete_session(session_id)
+                    job.deleted += 1
+                    logger.info(LOG_SESSION_DELETED.format(session_id=session_id))
+                except Exception as e:
+                    job.failed.append(session_id)
+                    logger.error(f"Error deleting session {session_id}: {str(e)}")
+        
+        try:
+            await asyncio.gather(*(delete_one(sid) for sid in job.session_ids))
+        finally:
+            job.status = JOB_FAILED if job.failed else JOB_COMPLETED
+            job.finished_at = datetime.now(timezone.utc)
+            self._tasks.pop(job.job_id, None)
+    
+    def _remember(self, job: DeletionJob) -> None:
+        """Store a job, dropping the oldest finished jobs beyond the retention limit."""
+        self._jobs[job.job_id] = job
+        
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.retention:
+                break
+            if self._jobs[job_id].finished_at is not None:
+                del self._jobs[job_id]
+
+
+# Create singleton instance
+deletion_service = DeletionService(
+    storage_service,
+    session_parallelism=settings.deletion_session_parallelism,
+    retention=settings.deletion_job_retention
+)
@@ -1,38 +1,84 @@
 # services/firebase_service.py
 """
 Firebase service for database operations.
+
+All Firestore round trips go through the async client so that route
+handlers can await them without stalling the event loop.
 """
 
-from typing import List, Dict, Optional, Literal
+from typing import Any, List, Dict, Optional, Literal, Set, TYPE_CHECKING
+from datetime import datetime
+import asyncio
+import json
 import uuid
-from firebase_admin import firestore
+import zlib
+from firebase_admin import firestore, firestore_async
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore_v1.async_transaction import async_transactional
+from google.cloud.firestore_v1.base_query import FieldFilter
 from config.firebase import get_firebase_app
+from config.settings import settings
 from utils.constants import (
     DEFAULT_CHAT_TITLE, 
     UNTITLED_CHAT,
-    TITLE_WORD_LIMIT,
-    TITLE_SUFFIX,
     LOG_SESSIONS_FOUND
 )
+from utils.timestamps import MessageClock
+from utils.titles import derive_chat_title
 import logging
 
+if TYPE_CHECKING:
+    # Only needed for annotations; importing the storage package here would
+    # be circular because it builds this backend at import time
+    from services.storage.base import MessageWrite, MessagePage, SessionPage, SessionSummary
+
 logger = logging.getLogger(__name__)
 
+# Firestore rejects batches with more operations than this
+FIRESTORE_BATCH_LIMIT = 500
+
+# Chat document fields returned by get_session_metadata
+SESSION_METADATA_FIELDS = [
+    "title", "title_locked", "message_count", "last_seq", "created_at", "last_message_at"
+]
+
+# Sessions remembered as title-locked before the set is reset
+TITLED_SESSIONS_MAX = 100_000
+
+# Uncompressed content cap per snapshot chunk (Firestore documents max out at 1 MiB)
+SNAPSHOT_MAX_BYTES = 800_000
+
 
 class FirebaseService:
     """
-    Service class for Firebase Firestore operations.
+    Firestore implementation of the storage backend protocol.
     """
     
     def __init__(self):
-        """Initialize Firebase service with Firestore client."""
-        self.db = firestore.client(app=get_firebase_app())
+        """Initialize Firebase service; the Firestore client is created on first use."""
+        self._db = None
+        self._compactions: Dict[str, asyncio.Task] = {}
+        self._titled_sessions: Set[str] = set()
+        self._clock = MessageClock()
     
-    def store_message(
+    @property
+    def db(self) -> firestore_async.AsyncClient:
+        """Lazily create the async Firestore client."""
+        if self._db is None:
+            self._db = firestore_async.client(app=get_firebase_app())
+        return self._db
+    
+    @db.setter
+    def db(self, value) -> None:
+        self._db = value
+    
+    async def store_message(
         self, 
         session_id: str, 
         role: Literal["user", "assistant"], 
-        content: str
+        content: str,
+        model: Optional[str] = None,
+        truncated: bool = False
     ) -> None:
         """
         Store a message in the chat session.
@@ -41,51 +87,186 @@ class FirebaseService:
             session_id: The chat session ID
             role: Either 'user' or 'assistant'
             content: The message content
+            model: Model that generated the message, if any
+            truncated: Whether the message is a partial reply
+            
+        Raises:
+            SessionNotFound: If the chat document does not exist
             
         Side Effects:
-            - Updates chat title if it's the first user message
+            - Updates the chat's metadata, and its title on the first user message
         """
-        chat_ref = self.db.collection("chats").document(session_id)
-        messages_ref = chat_ref.collection("messages")
+        # Deferred for the same reason as the TYPE_CHECKING import above
+        from services.storage.base import MessageWrite
+        
+        # Client timestamps, like queued writes, so both paths share one ordering
+        await self.store_messages([MessageWrite(session_id, role, content, self._clock.now(), model, truncated)])
+    
+    async def store_messages(self, messages: List["MessageWrite"]) -> None:
+        """
+        Store several messages using as few WriteBatch commits as possible.
+        
+        Args:
+            messages: Messages to persist, in order
+            
+        Raises:
+            SessionNotFound: After committing the rest, if some chat
+                documents do not exist
+                
+        Side Effects:
+            - Increments `message_count`/`last_seq` and sets `last_message_at`
+              on each chat document, in the same commit as its messages
+            - Sets and locks chat titles that are still default
+            
+        Note:
+            Messages carry client timestamps instead of SERVER_TIMESTAMP so
+            that writes committed together keep their relative order. Chat
+            metadata is updated, never upserted, so messages for a session
+            deleted while they were queued are dropped instead of recreating
+            it as an ownerless chat document.
+        """
+        # Deferred for the same reason as the TYPE_CHECKING import above
+        from services.storage.base import SessionNotFound
+        
+        if not messages:
+            return
         
-        # Add message with timestamp
-        messages_ref.add({
-            "role": role,
-            "content": content,
-            "timestamp": firestore.SERVER_TIMESTAMP
-        })
+        chats_ref = self.db.collection("chats")
+        titles = await self._pending_titles(messages)
         
-        # Update title on first user message
-        if role == "user":
-            self._update_chat_title_if_needed(chat_ref, content)
+        by_session: Dict[str, List["MessageWrite"]] = {}
+        for message in messages:
+            by_session.setdefault(message.session_id, []).append(message)
+        
+        # Each group is a session's messages plus its metadata update, and is
+        # never split across commits, so the counters match the messages
+        groups: List[tuple] = []
+        for session_id, session_messages in by_session.items():
+            chat_ref = chats_ref.document(session_id)
+            for start in range(0, len(session_messages), FIRESTORE_BATCH_LIMIT - 1):
+                chunk = session_messages[start:start + FIRESTORE_BATCH_LIMIT - 1]
+                metadata = {
+                    "message_count": firestore.Increment(len(chunk)),
+                    "last_seq": firestore.Increment(len(chunk)),
+                    "last_message_at": chunk[-1].timestamp
+                }
+                if start == 0 and session_id in titles:
+                    metadata["title"] = titles[session_id]
+                    metadata["title_locked"] = True
+                
+                group = [
+                    (chat_ref.collection("messages").document(), {
+                        "role": m.role,
+                        "content": m.content,
+                        "timestamp": m.timestamp,
+                        **({"model": m.model} if m.model else {}),
+                        **({"truncated": True} if m.truncated else {})
+                    })
+                    for m in chunk
+                ]
+                groups.append((session_id, chat_ref, metadata, group))
+        
+        # Pack whole groups into commits that stay within Firestore's batch limit
+        commits, current, size = [], [], 0
+        for group in groups:
+            if size + len(group[3]) + 1 > FIRESTORE_BATCH_LIMIT:
+                commits.append(current)
+                current, size = [], 0
+            current.append(group)
+            size += len(group[3]) + 1
+        commits.append(current)
+        
+        missing: List[str] = []
+        for commit in commits:
+            try:
+                await self._commit_groups(commit)
+            except NotFound:
+                # A chat deleted while its messages were queued fails the
+                # whole commit; drop its messages and commit the others
+                kept = await self._existing_groups(commit)
+                kept_sessions = {group[0] for group in kept}
+                for session_id, _, _, _ in commit:
+                    if session_id not in kept_sessions and session_id not in missing:
+                        missing.append(session_id)
+                await self._commit_groups(kept)
+        
+        if len(self._titled_sessions) + len(titles) > TITLED_SESSIONS_MAX:
+            self._titled_sessions.clear()
+        self._titled_sessions.update(titles)
+        
+        if missing:
+            raise SessionNotFound(missing)
     
-    def _update_chat_title_if_needed(
-        self, 
-        chat_ref: firestore.DocumentReference, 
-        content: str
-    ) -> None:
+    async def _commit_groups(self, groups: List[tuple]) -> None:
+        """Commit message groups, each with its chat metadata update, in one WriteBatch."""
+        if not groups:
+            return
+        
+        batch = self.db.batch()
+        for _, chat_ref, metadata, messages in groups:
+            for doc_ref, data in messages:
+                batch.set(doc_ref, data)
+            batch.update(chat_ref, metadata)
+        await batch.commit()
+    
+    async def _existing_groups(self, groups: List[tuple]) -> List[tuple]:
         """
-        Update chat title based on first user message if still default.
+        Drop message groups whose chat document no longer exists.
         
         Args:
-            chat_ref: Reference to the chat document
-            content: The user's message content
+            groups: (session ID, chat ref, metadata, messages) groups of a failed commit
+            
+        Returns:
+            The groups whose chat still exists, in order
+        """
+        refs = {session_id: chat_ref for session_id, chat_ref, _, _ in groups}
+        existing = {
+            doc.id
+            async for doc in self.db.get_all(list(refs.values()), field_paths=[])
+            if doc.exists
+        }
+        return [group for group in groups if group[0] in existing]
+    
+    async def _pending_titles(self, messages: List["MessageWrite"]) -> Dict[str, str]:
+        """
+        Work out title updates for a set of queued messages.
+        
+        Args:
+            messages: Messages about to be written
+            
+        Returns:
+            Mapping of session ID to new title for chats whose title is not locked
+            
+        Note:
+            `title_locked` never goes back to False, so sessions seen locked
+            are remembered and not read again.
         """
-        chat_doc = chat_ref.get()
-        if chat_doc.exists:
+        first_user_message = {}
+        for message in messages:
+            if message.role == "user" and message.session_id not in self._titled_sessions:
+                first_user_message.setdefault(message.session_id, message.content)
+        
+        if not first_user_message:
+            return {}
+        
+        chats_ref = self.db.collection("chats")
+        refs = [chats_ref.document(session_id) for session_id in first_user_message]
+        titles = {}
+        
+        # One round trip for every untitled chat touched by the batch
+        async for chat_doc in self.db.get_all(refs, field_paths=["title", "title_locked"]):
+            if not chat_doc.exists:
+                continue
             chat_data = chat_doc.to_dict()
-            if chat_data.get("title") in [DEFAULT_CHAT_TITLE, None]:
-                # Take first N words as title
-                words = content.strip().split()[:TITLE_WORD_LIMIT]
-                title = " ".join(words)
-                
-                # Add ellipsis if message is longer
-                if len(words) == TITLE_WORD_LIMIT and len(content.strip().split()) > TITLE_WORD_LIMIT:
-                    title += TITLE_SUFFIX
-                    
-                chat_ref.update({"title": title})
+            # Chats written before `title_locked` existed count as locked once retitled
+            if chat_data.get("title_locked") or chat_data.get("title") not in [DEFAULT_CHAT_TITLE, None]:
+                self._titled_sessions.add(chat_doc.id)
+            else:
+                titles[chat_doc.id] = derive_chat_title(first_user_message[chat_doc.id])
+        
+        return titles
     
-    def get_chat_history(self, session_id: str) -> List[Dict[str, str]]:
+    async def get_chat_history(self, session_id: str) -> List[Dict[str, str]]:
         """
         Retrieve all messages for a chat session.
         
@@ -94,57 +275,402 @@ class FirebaseService:
             
         Returns:
             List of message dictionaries with 'role' and 'content'
+            
+        Note:
+            Reads compacted snapshot chunks first, then only the message
+            documents after the last compacted one. Schedules a background
+            compaction when that tail grows past the configured threshold.
+        """
+        chat_ref = self.db.collection("chats").document(session_id)
+        history = []
+        last_snapshot = None
+        
+        async for snapshot in chat_ref.collection("snapshots").order_by("__name__").stream():
+            last_snapshot = snapshot.to_dict()
+            history.extend(
+                {"role": role, "content": content}
+                for role, content in json.loads(zlib.decompress(last_snapshot["messages"]))
+            )
+        
+        query = self._ordered_messages(chat_ref, last_snapshot)
+        tail_length = 0
+        
+        async for doc in query.stream():
+            data = doc.to_dict()
+            history.append({
+                "role": data.get("role"),
+                "content": data.get("content")
+            })
+            tail_length += 1
+        
+        if settings.compaction_enabled and tail_length >= self._compaction_trigger():
+            self._schedule_compaction(session_id)
+        
+        return history
+    
+    async def compact_session(self, session_id: str) -> int:
         """
-        chat_ref = self.db.collection("chats").document(session_id).collection("messages")
-        docs = chat_ref.order_by("timestamp").stream()
+        Fold stable older messages of a session into snapshot chunks.
         
-        return [
-            {
-                "role": doc.to_dict().get("role"),
-                "content": doc.to_dict().get("content")
-            }
-            for doc in docs
+        Args:
+            session_id: The chat session ID
+            
+        Returns:
+            Number of messages folded into new snapshots
+            
+        Note:
+            The newest `compaction_keep_recent` messages are never compacted,
+            and only full chunks of `compaction_chunk_size` messages (or of
+            SNAPSHOT_MAX_BYTES) are written. Each chunk stores zlib-compressed
+            JSON plus the position of its last message, so the chunks alone
+            tell readers where the uncompacted tail starts. Message documents
+            are kept for windowed reads and deletion.
+        """
+        chat_ref = self.db.collection("chats").document(session_id)
+        snapshots_ref = chat_ref.collection("snapshots")
+        
+        existing = [
+            doc async for doc in snapshots_ref
+            .order_by("__name__")
+            .select(["last_timestamp", "last_message_id"])
+            .stream()
         ]
+        last_snapshot = existing[-1].to_dict() if existing else None
+        
+        tail = [doc async for doc in self._ordered_messages(chat_ref, last_snapshot).stream()]
+        stable = tail[:max(0, len(tail) - settings.compaction_keep_recent)]
+        
+        chunks = []
+        current, current_bytes = [], 0
+        for doc in stable:
+            data = doc.to_dict()
+            size = len(data.get("content") or "")
+            if current and (
+                len(current) == settings.compaction_chunk_size
+                or current_bytes + size > SNAPSHOT_MAX_BYTES
+            ):
+                chunks.append(current)
+                current, current_bytes = [], 0
+            current.append((doc, data))
+            current_bytes += size
+        
+        # A trailing partial chunk waits until it fills up
+        if len(current) == settings.compaction_chunk_size:
+            chunks.append(current)
+        
+        if not chunks:
+            return 0
+        
+        operations = []
+        for index, chunk in enumerate(chunks, start=len(existing)):
+            last_doc, last_data = chunk[-1]
+            payload = json.dumps(
+                [[data.get("role"), data.get("content")] for _, data in chunk],
+                separators=(",", ":")
+            ).encode()
+            operations.append((snapshots_ref.document(f"{index:08d}"), {
+                "messages": zlib.compress(payload),
+                "count": len(chunk),
+                "last_timestamp": last_data.get("timestamp"),
+                "last_message_id": last_doc.id
+            }))
+        
+        # create() fails if a concurrent compaction already wrote the chunk
+        for start in range(0, len(operations), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for doc_ref, data in operations[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.create(doc_ref, data)
+            await batch.commit()
+        
+        compacted = sum(len(chunk) for chunk in chunks)
+        logger.info(f"Compacted {compacted} messages into {len(chunks)} snapshots for session {session_id}")
+        return compacted
     
-    def list_user_sessions(self, user_id: str) -> List[Dict[str, str]]:
+    def _ordered_messages(self, chat_ref, last_snapshot: Optional[Dict]):
+        """Query the session's messages in history order, after the last compacted one."""
+        query = (
+            chat_ref.collection("messages")
+            .order_by("timestamp")
+            .order_by("__name__")
+        )
+        
+        if last_snapshot:
+            query = query.start_after({
+                "timestamp": last_snapshot["last_timestamp"],
+                "__name__": last_snapshot["last_message_id"]
+            })
+        
+        return query
+    
+    def _compaction_trigger(self) -> int:
+        """Uncompacted tail length at which a full chunk can be compacted."""
+        return settings.compaction_keep_recent + settings.compaction_chunk_size
+    
+    def _schedule_compaction(self, session_id: str) -> None:
+        """Compact a session in the background unless already in progress."""
+        if session_id in self._compactions:
+            return
+        
+        async def run() -> None:
+            try:
+                await self.compact_session(session_id)
+            except Exception as e:
+                logger.warning(f"Compaction failed for session {session_id}: {str(e)}")
+            finally:
+                self._compactions.pop(session_id, None)
+        
+        self._compactions[session_id] = asyncio.get_running_loop().create_task(run())
+    
+    async def get_messages_page(
+        self, 
+        session_id: str, 
+        limit: int, 
+        before: Optional[str] = None
+    ) -> "MessagePage":
         """
-        List all chat sessions for a specific user.
+        Retrieve the newest window of messages older than a cursor.
+        
+        Args:
+            session_id: The chat session ID
+            limit: Maximum number of messages to return
+            before: Cursor from a previous window, if any
+            
+        Returns:
+            MessagePage with messages oldest first and the next cursor
+            
+        Raises:
+            ValueError: If the cursor is malformed
+            
+        Note:
+            Cursors point at the oldest message already returned, so
+            messages appended meanwhile never shift older windows.
+        """
+        # Deferred for the same reason as the TYPE_CHECKING import above
+        from services.storage.base import MessagePage, encode_cursor, decode_cursor
+        
+        query = (
+            self.db.collection("chats").document(session_id).collection("messages")
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)
+        )
+        
+        if before:
+            timestamp, last_id = decode_cursor(before, str, str)
+            query = query.start_after({
+                "timestamp": datetime.fromisoformat(timestamp),
+                "__name__": last_id
+            })
+        
+        # Fetch one extra document to learn whether older messages exist
+        docs = [doc async for doc in query.limit(limit + 1).stream()]
+        has_more = len(docs) > limit
+        window = list(reversed(docs[:limit]))
+        
+        next_before = None
+        if has_more:
+            oldest = window[0]
+            next_before = encode_cursor([oldest.get("timestamp").isoformat(), oldest.id])
+        
+        return MessagePage(
+            [
+                {
+                    "role": data.get("role"),
+                    "content": data.get("content"),
+                    **({"model": data["model"]} if data.get("model") else {}),
+                    **({"truncated": True} if data.get("truncated") else {})
+                }
+                for data in (doc.to_dict() for doc in window)
+            ],
+            has_more,
+            next_before
+        )
+    
+    async def list_user_sessions(
+        self, 
+        user_id: str, 
+        limit: int, 
+        cursor: Optional[str] = None
+    ) -> "SessionPage":
+        """
+        List one page of chat sessions for a specific user, most recently active first.
         
         Args:
             user_id: The user's ID
+            limit: Maximum number of sessions to return
+            cursor: Cursor from the previous page, if any
             
         Returns:
-            List of session dictionaries with 'session_id' and 'title'
+            SessionPage with session summary dicts and the next cursor
+            
+        Raises:
+            ValueError: If the cursor is malformed
+            
+        Note:
+            Uses the (user_id ASC, last_message_at DESC) composite index from
+            firestore.indexes.json and only fetches the summary fields.
+            Chats created before `last_message_at` existed need
+            `backfill_session_metadata` to show up.
         """
-        sessions_ref = self.db.collection("chats")
+        # Deferred for the same reason as the TYPE_CHECKING import above
+        from services.storage.base import SessionPage, encode_cursor, decode_cursor
+        
+        query = (
+            self.db.collection("chats")
+            .where(filter=FieldFilter("user_id", "==", user_id))
+            .order_by("last_message_at", direction=firestore.Query.DESCENDING)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)
+            .select(["title", "last_message_at", "message_count"])
+        )
+        
+        if cursor:
+            last_message_at, last_id = decode_cursor(cursor, str, str)
+            query = query.start_after({
+                "last_message_at": datetime.fromisoformat(last_message_at),
+                "__name__": last_id
+            })
+        
+        # Fetch one extra document to learn whether another page exists
+        docs = [doc async for doc in query.limit(limit + 1).stream()]
+        page = docs[:limit]
+        
         sessions = []
+        for doc in page:
+            data = doc.to_dict()
+            sessions.append({
+                "session_id": doc.id,
+                "title": data.get("title", UNTITLED_CHAT),
+                "message_count": data.get("message_count", 0),
+                "last_message_at": data.get("last_message_at")
+            })
+        
+        next_cursor = None
+        if len(docs) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor([last.get("last_message_at").isoformat(), last.id])
+        
+        logger.info(f"Found {len(sessions)} sessions for user {user_id}")
+        return SessionPage(sessions, next_cursor)
+    
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a chat's denormalized metadata without touching its messages.
         
-        try:
-            # Simple query - just filter by user_id without ordering
-            docs = sessions_ref.where("user_id", "==", user_id).stream()
+        Args:
+            session_id: The chat session ID
             
-            for doc in docs:
-                data = doc.to_dict()
-                sessions.append({
-                    "session_id": doc.id,
-                    "title": data.get("title", UNTITLED_CHAT),
-                    "created_at": data.get("created_at")
-                })
+        Returns:
+            Dictionary with 'session_id', 'title', 'title_locked',
+            'message_count', 'last_seq', 'created_at' and 'last_message_at',
+            or None if the chat does not exist
+        """
+        chat_doc = await self.db.collection("chats").document(session_id).get(
+            field_paths=SESSION_METADATA_FIELDS
+        )
+        if not chat_doc.exists:
+            return None
+        
+        data = chat_doc.to_dict()
+        return {
+            "session_id": session_id,
+            "title": data.get("title", UNTITLED_CHAT),
+            "title_locked": data.get("title_locked", False),
+            "message_count": data.get("message_count", 0),
+            "last_seq": data.get("last_seq", 0),
+            "created_at": data.get("created_at"),
+            "last_message_at": data.get("last_message_at")
+        }
+    
+    async def backfill_session_metadata(self) -> int:
+        """
+        Add denormalized metadata to chats written before it existed.
+        
+        Returns:
+            Number of chats updated
             
-            # Sort in Python instead of Firebase
-            sessions.sort(key=lambda x: x.get('created_at', 0), reverse=True)
+        Note:
+            Counts each legacy chat's messages with an aggregation query and
+            reads only its newest message. Safe to re-run.
+        """
+        updated = 0
+        
+        async for chat_doc in self.db.collection("chats").select(
+            ["title", "created_at", "message_count"]
+        ).stream():
+            data = chat_doc.to_dict()
+            if "message_count" in data:
+                continue
             
-            # Remove created_at from response
-            for session in sessions:
-                session.pop('created_at', None)
-                
-        except Exception as e:
-            logger.warning(f"Error querying user sessions: {e}")
+            messages_ref = chat_doc.reference.collection("messages")
+            count_result = await messages_ref.count().get()
+            message_count = count_result[0][0].value
+            
+            newest = [
+                doc async for doc in messages_ref
+                .order_by("timestamp", direction=firestore.Query.DESCENDING)
+                .select(["timestamp"])
+                .limit(1)
+                .stream()
+            ]
+            
+            await chat_doc.reference.update({
+                "message_count": message_count,
+                "last_seq": message_count,
+                "last_message_at": newest[0].get("timestamp") if newest else data.get("created_at"),
+                "title_locked": data.get("title") not in [DEFAULT_CHAT_TITLE, None]
+            })
+            updated += 1
         
-        logger.info(f"Found {len(sessions)} sessions for user {user_id}")
-        return sessions
+        logger.info(f"Backfilled metadata for {updated} chats")
+        return updated
+    
+    async def get_summary(self, session_id: str) -> Optional["SessionSummary"]:
+        """
+        Read a chat's rolling summary from the chat document.
+        
+        Args:
+            session_id: The chat session ID
+            
+        Returns:
+            The stored summary, or None if the chat has none
+        """
+        # Deferred for the same reason as the TYPE_CHECKING import above
+        from services.storage.base import SessionSummary
+        
+        chat_doc = await self.db.collection("chats").document(session_id).get(
+            field_paths=["summary", "summary_covers"]
+        )
+        data = chat_doc.to_dict() if chat_doc.exists else None
+        if not data or data.get("summary") is None:
+            return None
+        
+        return SessionSummary(data["summary"], data.get("summary_covers", 0))
+    
+    async def store_summary(self, session_id: str, summary: "SessionSummary") -> None:
+        """
+        Save a chat's rolling summary unless a newer one is stored.
+        
+        Args:
+            session_id: The chat session ID
+            summary: Summary text and the number of messages it covers
+            
+        Note:
+            Runs in a transaction so a slower worker cannot replace a summary
+            that covers more messages.
+        """
+        chat_ref = self.db.collection("chats").document(session_id)
+        
+        @async_transactional
+        async def write(transaction) -> None:
+            chat_doc = await chat_ref.get(field_paths=["summary_covers"], transaction=transaction)
+            if chat_doc.exists and chat_doc.to_dict().get("summary_covers", 0) < summary.covered:
+                transaction.update(chat_ref, {
+                    "summary": summary.text,
+                    "summary_covers": summary.covered
+                })
+        
+        await write(self.db.transaction())
     
-    def create_session(self, session_id: Optional[str] = None, user_id: Optional[str] = None) -> str:
+    async def create_session(self, session_id: Optional[str] = None, user_id: Optional[str] = None) -> str:
         """
         Create a new chat session.
         
@@ -160,17 +686,43 @@ class FirebaseService:
         
         session_data = {
             "created_at": firestore.SERVER_TIMESTAMP,
-            "title": DEFAULT_CHAT_TITLE
+            "title": DEFAULT_CHAT_TITLE,
+            "title_locked": False,
+            "message_count": 0,
+            "last_seq": 0,
+            # Empty chats sort by creation time until their first message
+            "last_message_at": firestore.SERVER_TIMESTAMP
         }
         
         if user_id:
             session_data["user_id"] = user_id
             
-        self.db.collection("chats").document(session_id).set(session_data)
+        await self.db.collection("chats").document(session_id).set(session_data)
         
         return session_id
     
-    def delete_session(self, session_id: str) -> None:
+    async def tombstone_session(self, session_id: str) -> None:
+        """
+        Hide a chat session from its owner's listings until it is deleted.
+        
+        Args:
+            session_id: The chat session ID
+            
+        Note:
+            Moves `user_id` to `deleted_user_id`, so the
+            (user_id, last_message_at) listing query skips the session.
+        """
+        chat_ref = self.db.collection("chats").document(session_id)
+        chat_doc = await chat_ref.get()
+        
+        if chat_doc.exists and chat_doc.to_dict().get("user_id"):
+            await chat_ref.update({
+                "deleted_user_id": chat_doc.to_dict()["user_id"],
+                "user_id": firestore.DELETE_FIELD,
+                "deleted_at": firestore.SERVER_TIMESTAMP
+            })
+    
+    async def delete_session(self, session_id: str) -> None:
         """
         Delete a chat session and all its messages.
         
@@ -178,20 +730,35 @@ class FirebaseService:
             session_id: The chat session ID to delete
             
         Note:
-            Uses batch operations for efficient deletion
+            Deletes in WriteBatch commits of at most FIRESTORE_BATCH_LIMIT
+            operations, with up to `deletion_batch_parallelism` in flight
         """
         session_ref = self.db.collection("chats").document(session_id)
-        messages_ref = session_ref.collection("messages")
+        refs = []
         
-        # Batch delete all messages
-        batch = self.db.batch()
-        for msg in messages_ref.stream():
-            batch.delete(msg.reference)
-        batch.commit()
+        # Only document names are needed, so skip the field payloads
+        for name in ("messages", "snapshots"):
+            async for doc in session_ref.collection(name).select([]).stream():
+                refs.append(doc.reference)
+        
+        semaphore = asyncio.Semaphore(settings.deletion_batch_parallelism)
+        
+        async def delete_chunk(chunk) -> None:
+            async with semaphore:
+                batch = self.db.batch()
+                for ref in chunk:
+                    batch.delete(ref)
+                await batch.commit()
+        
+        await asyncio.gather(*(
+            delete_chunk(refs[start:start + FIRESTORE_BATCH_LIMIT])
+            for start in range(0, len(refs), FIRESTORE_BATCH_LIMIT)
+        ))
         
         # Delete the chat document
-        session_ref.delete()
-
-
-# Create singleton instance
-firebase_service = FirebaseService()
\ No newline at end of file
+        await session_ref.delete()
+        self._titled_sessions.discard(session_id)
+    
+    async def close(self) -> None:
+        """Release the Firestore client reference."""
+        self._db = None
\ No newline at end of file
@@ -0,0 +1,374 @@
+# services/generation.py
+"""
+Assistant replies generated independently of the responses streaming them.
+
+A Generation runs a reply's chunk source (the upstream completion) in its
+own task and keeps the chunks produced so far; the HTTP response that
+started it is only a reader. When the last reader goes away, e.g. the
+browser closed its EventSource, the task is cancelled at once, which aborts
+the upstream request, and the reply produced so far is handed to the
+finish callback marked as truncated.
+
+Every generation has a stream id, so a client whose connection dropped can
+resume it from the chunk it last saw (SSE `Last-Event-ID`). A generation
+left without readers is only cancelled after a short grace period, giving
+the client time to reconnect, and finished replies stay resumable for a
+while in a replay buffer bounded by bytes and age.
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import time
+import uuid
+from config.settings import settings
+from utils.tokens import count_text_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Generation:
+    """
+    One reply being generated in the background.
+    
+    Attributes:
+        id: Stream id, used to resume the reply after a reconnect
+        session_id: The chat session the reply belongs to
+        chunks: Chunks produced so far, in order
+        done: Whether the source finished (or was cancelled) and the finish
+            callback has run
+        truncated: Whether the reply was cut off before its source finished
+        error: Exception raised by the source or the finish callback,
+            re-raised to readers
+    """
+    
+    def __init__(
+        self,
+        manager: "GenerationManager",
+        session_id: str,
+        source: AsyncIterator[str],
+        on_finish: Callable[["Generation"], Awaitable[None]],
+        reply_budget: int
+    ):
+        self._manager = manager
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.chunks: List[str] = []
+        self.done = False
+        self.truncated = False
+        self.error: Optional[BaseException] = None
+        self.readers = 0
+        self._finishing = False
+        self._source = source
+        self._on_finish = on_finish
+        self._reply_budget = reply_budget
+        self._orphaned: Optional[asyncio.TimerHandle] = None
+        self._failure: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    @property
+    def text(self) -> str:
+        """The reply produced so far."""
+        return "".join(self.chunks)
+    
+    @property
+    def size(self) -> int:
+        """Size of the chunks in bytes, encoded as UTF-8."""
+        return sum(len(chunk.encode()) for chunk in self.chunks)
+    
+    async def read(self, start: int = 0) -> AsyncIterator[str]:
+        """
+        Stream the reply's chunks from index `start`, then follow new ones.
+        
+        Closing the iterator before the reply is done detaches the reader.
+        Once the last reader has detached, the generation is cancelled
+        unless a new reader attaches within the manager's resume grace.
+        
+        Raises:
+            Exception: What the source or finish callback raised, once all
+                chunks are read
+        """
+        self.readers += 1
+        if self._orphaned is not None:
+            self._orphaned.cancel()
+            self._orphaned = None
+        chunks = self.follow(start)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+            self.readers -= 1
+            if not self.readers and not self.done:
+                self._orphan()
+    
+    async def follow(self, start: int = 0) -> AsyncIterator[str]:
+        """
+        Like `read`, but without keeping the generation alive.
+        
+        Used to relay the reply elsewhere (e.g. to other workers) without
+        counting as one of its readers.
+        """
+        index = start
+        while True:
+            while index < len(self.chunks):
+                index += 1
+                yield self.chunks[index - 1]
+            if self.done:
+                break
+            changed = self._changed
+            await changed.wait()
+        
+        if self.error is not None:
+            raise self.error
+    
+    async def events(self, start: int = 0) -> AsyncIterator[Tuple[str, str]]:
+        """
+        `read` the reply as (event id, chunk) pairs.
+        
+        Event ids are "<stream id>:<chunk index>" (see `utils.sse.parse_event_id`).
+        """
+        reader = self.read(start)
+        try:
+            async for chunk in reader:
+                yield f"{self.id}:{start}", chunk
+                start += 1
+        finally:
+            await reader.aclose()
+    
+    def cancel(self) -> None:
+        """Stop generating; the reply so far is finished as truncated."""
+        # Never interrupt the finish callback that saves the reply
+        if not self._finishing:
+            self._task.cancel()
+    
+    def fail(self, error: BaseException) -> None:
+        """Stop generating and end the reply with `error` instead of as truncated."""
+        if not self._finishing:
+            self._failure = error
+            self._task.cancel()
+    
+    async def wait(self) -> None:
+        """Wait until the reply is done and its finish callback has run."""
+        await asyncio.shield(self._task)
+    
+    def _orphan(self) -> None:
+        grace = self._manager.resume_grace
+        if grace <= 0:
+            self.cancel()
+        else:
+            self._orphaned = asyncio.get_running_loop().call_later(grace, self._cancel_if_orphaned)
+    
+    def _cancel_if_orphaned(self) -> None:
+        self._orphaned = None
+        if not self.readers:
+            self.cancel()
+    
+    async def _run(self) -> None:
+        try:
+            async for chunk in self._source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            # The task is only cancelled on purpose: the reply is cut off or failed
+            if self._failure is not None:
+                self.error = self._failure
+            else:
+                self.truncated = True
+        except Exception as e:
+            logger.error(f"Generating reply for session {self.session_id} failed: {str(e)}")
+            self.error = e
+        self._finishing = True
+        
+        self._manager._record(self)
+        try:
+            await self._on_finish(self)
+        except Exception as e:
+            logger.error(f"Finishing reply for session {self.session_id} failed: {str(e)}")
+            self.error = self.error or e
+        finally:
+            self.done = True
+            self._notify()
+            self._manager._forget(self)
+    
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class GenerationManager:
+    """
+    Starts generations, keeps them resumable and counts what disconnects
+    cost and saved.
+    
+    Note:
+        Running generations can always be resumed; their size is bounded
+        by the reply budget. Finished ones are kept for `replay_ttl` seconds
+        if they fit in `replay_stream_max_bytes`, evicting the oldest when
+        all of them exceed `replay_max_bytes`.
+        
+        Tokens avoided are estimated as the reply budget (`max_tokens`) left
+        unused when a generation is cut off, an upper bound on what the
+        model would have gone on to produce.
+    """
+    
+    def __init__(
+        self,
+        resume_grace: float = 0,
+        replay_max_bytes: int = 0,
+        replay_stream_max_bytes: int = 0,
+        replay_ttl: float = 0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize with no running generations.
+        
+        Args:
+            resume_grace: Seconds a generation keeps running without readers,
+                waiting for its client to reconnect (0 cancels at once)
+            replay_max_bytes: Maximum size of all finished replies kept for
+                resuming (0 keeps none)
+            replay_stream_max_bytes: Largest finished reply kept for resuming
+            replay_ttl: Seconds a finished reply stays resumable
+            clock: Monotonic time source (injectable for tests)
+        """
+        self.resume_grace = resume_grace
+        self.replay_max_bytes = replay_max_bytes
+        self.replay_stream_max_bytes = replay_stream_max_bytes
+        self.replay_ttl = replay_ttl
+        self._clock = clock
+        self._running: Dict[str, Generation] = {}
+        self._replay: "OrderedDict[str, tuple]" = OrderedDict()
+        self._replay_bytes = 0
+        self.started = 0
+        self.completed = 0
+        self.truncated = 0
+        self.tokens_generated = 0
+        self.tokens_avoided = 0
+        self.resumed = 0
+        self.resume_misses = 0
+        self.replay_evictions = 0
+    
+    def start(
+        self,
+        session_id: str,
+        source: AsyncIterator[str],
+        on_finish: Callable[[Generation], Awaitable[None]],
+        reply_budget: int = 0
+    ) -> Generation:
+        """
+        Start generating a reply in the background.
+        
+        Args:
+            session_id: The chat session the reply belongs to
+            source: The reply's chunks
+            on_finish: Awaited with the generation once the source ends or
+                is cancelled, e.g. to persist the (possibly partial) reply
+            reply_budget: Tokens the source may still produce (0 when it
+                costs nothing, such as a cached replay)
+                
+        Returns:
+            The running generation; read it with `Generation.read()`
+        """
+        generation = Generation(self, session_id, source, on_finish, reply_budget)
+        self._running[generation.id] = generation
+        self.started += 1
+        return generation
+    
+    def resume(self, stream_id: str, session_id: str) -> Optional[Generation]:
+        """
+        Find a running or recently finished generation to resume.
+        
+        Args:
+            stream_id: The generation's id, from the client's last event id
+            session_id: The chat session the client is streaming
+            
+        Returns:
+            The generation, or None if it is unknown, expired, evicted or
+            belongs to another session
+        """
+        generation = self._running.get(stream_id)
+        if generation is None:
+            self._expire()
+            entry = self._replay.get(stream_id)
+            generation = entry[0] if entry is not None else None
+        
+        if generation is None or generation.session_id != session_id:
+            self.resume_misses += 1
+            return None
+        self.resumed += 1
+        return generation
+    
+    async def close(self) -> None:
+        """Cancel running generations and wait for their partial replies to be saved."""
+        running = list(self._running.values())
+        for generation in running:
+            generation.cancel()
+        await asyncio.gather(*(generation.wait() for generation in running), return_exceptions=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return running and truncated counts, and token counts for cut-off replies."""
+        return {
+            "running": len(self._running),
+            "started": self.started,
+            "completed": self.completed,
+            "truncated": self.truncated,
+            "tokens_generated_before_disconnect": self.tokens_generated,
+            "tokens_avoided": self.tokens_avoided,
+            "resumed": self.resumed,
+            "resume_misses": self.resume_misses,
+            "replay_streams": len(self._replay),
+            "replay_bytes": self._replay_bytes,
+            "replay_evictions": self.replay_evictions,
+        }
+    
+    def _record(self, generation: Generation) -> None:
+        if not generation.truncated:
+            self.completed += 1
+            return
+        
+        generated = count_text_tokens(generation.text)
+        avoided = max(0, generation._reply_budget - generated)
+        self.truncated += 1
+        self.tokens_generated += generated
+        self.tokens_avoided += avoided
+        logger.info(
+            f"Reply for session {generation.session_id} cut off after {generated} tokens "
+            f"(up to {avoided} avoided)"
+        )
+    
+    def _forget(self, generation: Generation) -> None:
+        self._running.pop(generation.id, None)
+        
+        # Keep the finished reply around for clients that reconnect late
+        size = generation.size
+        if self.replay_ttl <= 0 or size > min(self.replay_stream_max_bytes, self.replay_max_bytes):
+            return
+        self._replay[generation.id] = (generation, size, self._clock() + self.replay_ttl)
+        self._replay_bytes += size
+        self._expire()
+        while self._replay_bytes > self.replay_max_bytes:
+            _, (_, size, _) = self._replay.popitem(last=False)
+            self._replay_bytes -= size
+            self.replay_evictions += 1
+    
+    def _expire(self) -> None:
+        """Drop finished replies whose replay window has passed (oldest first)."""
+        now = self._clock()
+        while self._replay:
+            stream_id, (_, size, expires_at) = next(iter(self._replay.items()))
+            if expires_at > now:
+                break
+            del self._replay[stream_id]
+            self._replay_bytes -= size
+
+
+# Create singleton instance
+generation_manager = GenerationManager(
+    resume_grace=settings.stream_resume_grace_seconds,
+    replay_max_bytes=settings.stream_replay_max_bytes,
+    replay_stream_max_bytes=settings.stream_replay_stream_max_bytes,
+    replay_ttl=settings.stream_replay_ttl_seconds
+)
@@ -0,0 +1,204 @@
+# services/hedging.py
+"""
+Hedged requests against slow time-to-first-token.
+
+A completion whose first token is later than a high percentile of recent
+time-to-first-token (TTFT) is raced against an identical second request;
+whichever produces a token first is streamed and the other is cancelled.
+"""
+
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+from collections import deque
+import asyncio
+import contextlib
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TTFTTracker:
+    """Rolling window of recent time-to-first-token samples."""
+    
+    def __init__(self, window: int):
+        """
+        Initialize the tracker.
+        
+        Args:
+            window: Number of most recent samples kept
+        """
+        self._samples: Deque[float] = deque(maxlen=window)
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+    
+    def record(self, seconds: float) -> None:
+        """Add a sample."""
+        self._samples.append(seconds)
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        """Return the pct-th percentile of the window, or None if it is empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Hedger:
+    """
+    Streams a completion, hedging it when its first token is late.
+    
+    Note:
+        No hedge is sent until `min_samples` TTFTs have been seen, and at
+        most `max_ratio` of requests are hedged, so a provider-wide slowdown
+        cannot double the load on the provider.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool,
+        percentile: float,
+        min_samples: int,
+        window: int,
+        max_ratio: float
+    ):
+        """
+        Initialize the hedger.
+        
+        Args:
+            enabled: When False, every completion is a single request
+            percentile: TTFT percentile after which a hedge is sent
+            min_samples: Samples needed before hedging starts
+            window: Number of recent TTFT samples the percentile is taken over
+            max_ratio: Largest fraction of requests that may be hedged
+        """
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.ttft = TTFTTracker(window)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+    
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait for a first token before hedging, or None to not hedge."""
+        if not self.enabled or len(self.ttft) < self.min_samples:
+            return None
+        if self.hedged >= self.max_ratio * self.requests:
+            return None
+        return self.ttft.percentile(self.percentile)
+    
+    async def stream(self, start: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Stream one completion, racing a second attempt if the first is slow.
+        
+        Args:
+            start: Starts an attempt; called once, or twice when hedging
+        
+        Yields:
+            The winning attempt's chunks
+        
+        Raises:
+            Exception: What the attempt raised, or the second one's error
+                when both attempts fail
+        """
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        delay = self.hedge_delay()
+        
+        attempts = [_Attempt(start(), loop.time())]
+        winner: Optional[_Attempt] = None
+        
+        try:
+            done, _ = await asyncio.wait({attempts[0].first}, timeout=delay)
+            if not done:
+                self.hedged += 1
+                logger.info(f"Hedging completion after {delay:.3f}s without a first token")
+                attempts.append(_Attempt(start(), loop.time()))
+            
+            winner = await self._first_to_answer(attempts)
+            self.ttft.record(winner.ttft(loop))
+            if winner is not attempts[0]:
+                self.hedge_wins += 1
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.cancel()
+        
+        try:
+            first = winner.first.result()
+            if first is not None:
+                yield first
+                async for chunk in winner.stream:
+                    yield chunk
+        finally:
+            await winner.stream.aclose()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return TTFT percentiles and hedging counters."""
+        return {
+            "enabled": self.enabled,
+            "samples": len(self.ttft),
+            "ttft_p50": self.ttft.percentile(50),
+            "ttft_p95": self.ttft.percentile(95),
+            "ttft_p99": self.ttft.percentile(99),
+            "hedge_after": self.hedge_delay(),
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+    
+    @staticmethod
+    async def _first_to_answer(attempts) -> "_Attempt":
+        """Wait for the first attempt to yield a chunk (or finish empty)."""
+        pending = {attempt.first: attempt for attempt in attempts}
+        error = None
+        
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                attempt = pending.pop(task)
+                if task.exception() is None:
+                    return attempt
+                error = task.exception()
+        
+        raise error
+
+
+class _Attempt:
+    """One in-flight request and the task fetching its first chunk."""
+    
+    def __init__(self, stream: AsyncIterator[str], started: float):
+        self.stream = stream
+        self.started = started
+        self.first_at: Optional[float] = None
+        self.first = asyncio.ensure_future(self._first_chunk())
+    
+    async def _first_chunk(self) -> Optional[str]:
+        try:
+            chunk = await self.stream.__anext__()
+        except StopAsyncIteration:
+            chunk = None
+        self.first_at = asyncio.get_running_loop().time()
+        return chunk
+    
+    def ttft(self, loop: asyncio.AbstractEventLoop) -> float:
+        return (self.first_at or loop.time()) - self.started
+    
+    async def cancel(self) -> None:
+        """Stop the attempt and release its connection."""
+        self.first.cancel()
+        await asyncio.wait({self.first})
+        with contextlib.suppress(Exception):
+            await self.stream.aclose()
+
+
+# Create singleton instance
+hedger = Hedger(
+    enabled=settings.hedge_enabled,
+    percentile=settings.hedge_percentile,
+    min_samples=settings.hedge_min_samples,
+    window=settings.hedge_window,
+    max_ratio=settings.hedge_max_ratio
+)
@@ -0,0 +1,191 @@
+# services/history_cache.py
+"""
+In-process LRU cache of per-session chat history.
+"""
+
+from typing import List, Dict, Optional
+from collections import OrderedDict
+from config.settings import settings
+import time
+
+# Rough per-message overhead (dict + two strings) added to content size
+MESSAGE_OVERHEAD_BYTES = 100
+
+
+class _Entry:
+    """A cached transcript and its bookkeeping."""
+    
+    __slots__ = ("messages", "size", "expires_at")
+    
+    def __init__(self, messages: List[Dict[str, str]], ttl: float):
+        self.messages = messages
+        self.size = sum(_message_size(m) for m in messages)
+        self.expires_at = time.monotonic() + ttl
+
+
+def _message_size(message: Dict[str, str]) -> int:
+    """Approximate the memory footprint of a message in bytes."""
+    return len(message.get("content") or "") + MESSAGE_OVERHEAD_BYTES
+
+
+class HistoryCache:
+    """
+    LRU cache of chat transcripts bounded by session count, bytes and TTL.
+    
+    Note:
+        Entries are filled from the storage backend on first read and then
+        kept current by `append`, so warm sessions never re-read storage.
+        A fill that races with an append is discarded (see `reserve`).
+    """
+    
+    def __init__(self, max_sessions: int, max_bytes: int, ttl_seconds: float):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_sessions: Maximum number of cached sessions
+            max_bytes: Maximum approximate size of all cached transcripts
+            ttl_seconds: Lifetime of an entry since it was last written
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._fills: Dict[str, object] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+    
+    def get(self, session_id: str) -> Optional[List[Dict[str, str]]]:
+        """
+        Return a copy of the cached transcript, or None on a miss.
+        
+        Args:
+            session_id: The chat session ID
+        """
+        entry = self._entries.get(session_id)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(session_id)
+            self.expirations += 1
+            entry = None
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return [dict(m) for m in entry.messages]
+    
+    def reserve(self, session_id: str) -> object:
+        """
+        Start a fill for a session and return its token.
+        
+        Any append or invalidation before `fill` makes the token stale.
+        """
+        token = object()
+        self._fills[session_id] = token
+        return token
+    
+    def fill(self, session_id: str, messages: List[Dict[str, str]], token: object) -> bool:
+        """
+        Cache a transcript read from storage if the fill is still current.
+        
+        Args:
+            session_id: The chat session ID
+            messages: Transcript read from storage
+            token: Token returned by `reserve`
+            
+        Returns:
+            True if the transcript was cached
+        """
+        if self._fills.get(session_id) is not token:
+            return False
+        del self._fills[session_id]
+        
+        self._remove(session_id)
+        entry = _Entry([dict(m) for m in messages], self.ttl_seconds)
+        if entry.size > self.max_bytes:
+            return False
+        
+        self._entries[session_id] = entry
+        self._bytes += entry.size
+        self._evict()
+        return True
+    
+    def append(self, session_id: str, message: Dict[str, str]) -> None:
+        """
+        Append a newly stored message to a warm session.
+        
+        Cold sessions are left alone; they are filled on the next read.
+        """
+        self._fills.pop(session_id, None)
+        
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        
+        size = _message_size(message)
+        entry.messages.append(dict(message))
+        entry.size += size
+        entry.expires_at = time.monotonic() + self.ttl_seconds
+        self._bytes += size
+        self._entries.move_to_end(session_id)
+        self._evict()
+    
+    def invalidate(self, session_id: str) -> None:
+        """Drop a session from the cache and cancel any in-flight fill."""
+        self._fills.pop(session_id, None)
+        self._remove(session_id)
+    
+    def discard_stale(self, session_id: str) -> None:
+        """Drop an entry found to be behind storage, counting its hit as a miss."""
+        self.invalidate(session_id)
+        self.hits -= 1
+        self.misses += 1
+        self.stale += 1
+    
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        self._entries.clear()
+        self._fills.clear()
+        self._bytes = 0
+    
+    def stats(self) -> Dict[str, float]:
+        """Return cache counters and current occupancy."""
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale": self.stale,
+        }
+    
+    def _remove(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+    
+    def _evict(self) -> None:
+        """Evict least recently used entries until within limits."""
+        while self._entries and (
+            len(self._entries) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+
+# Create singleton instance
+history_cache = HistoryCache(
+    max_sessions=settings.history_cache_max_sessions,
+    max_bytes=settings.history_cache_max_bytes,
+    ttl_seconds=settings.history_cache_ttl_seconds
+)
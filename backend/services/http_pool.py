@@ -0,0 +1,167 @@
+# services/http_pool.py
+"""
+Long-lived HTTP connection pool for upstream model calls.
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+import aiohttp
+import openai
+from config.settings import settings
+
+
+class HTTPPool:
+    """
+    One shared aiohttp session with bounded connections and stream timeouts.
+    
+    Note:
+        The OpenAI SDK opens a new session (and TLS handshake) per call
+        unless one is installed through `openai.aiosession`; `request()`
+        installs this pool's session for the calling task. Before `start()`
+        is called (e.g. in tests) requests fall back to the SDK default.
+        aiohttp speaks HTTP/1.1 only, so reuse comes from keep-alive.
+    """
+    
+    def __init__(
+        self,
+        max_connections: int,
+        keepalive_seconds: float,
+        connect_timeout: float,
+        first_byte_timeout: float,
+        read_timeout: float,
+        total_timeout: float
+    ):
+        """
+        Initialize the pool (no connections are opened until `start()`).
+        
+        Args:
+            max_connections: Maximum open connections; further requests queue
+            keepalive_seconds: How long idle connections are kept for reuse
+            connect_timeout: Seconds allowed to establish a connection
+            first_byte_timeout: Seconds allowed until the first streamed chunk
+            read_timeout: Seconds allowed between streamed chunks
+            total_timeout: Seconds allowed for a whole request
+        """
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.saturated = 0
+        self.first_byte_timeouts = 0
+        self.read_timeouts = 0
+    
+    @property
+    def request_timeout(self) -> Tuple[float, float]:
+        """The SDK's (connect, total) timeout pair."""
+        return (self.connect_timeout, self.total_timeout)
+    
+    async def start(self) -> None:
+        """Open the shared session."""
+        if self._session is not None:
+            return
+        
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections,
+            keepalive_timeout=self.keepalive_seconds
+        )
+        self._session = aiohttp.ClientSession(connector=connector)
+    
+    async def close(self) -> None:
+        """Close the shared session and its connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    @asynccontextmanager
+    async def request(self):
+        """
+        Track one upstream request and route it through the shared session.
+        
+        Requests that start while every connection is busy are counted as
+        saturated; they wait in the connector's queue.
+        """
+        self.requests += 1
+        if self.in_flight >= self.max_connections:
+            self.saturated += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        
+        if self._session is not None:
+            openai.aiosession.set(self._session)
+        
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+    
+    async def stream(self, response: Awaitable[AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Open a streamed response and re-yield it, enforcing stream timeouts.
+        
+        Args:
+            response: Awaitable returning the streamed response
+        
+        Raises:
+            asyncio.TimeoutError: If the first chunk, or any later one, is late
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.first_byte_timeout
+        
+        try:
+            chunks = await asyncio.wait_for(response, self.first_byte_timeout)
+        except asyncio.TimeoutError:
+            self.first_byte_timeouts += 1
+            raise asyncio.TimeoutError(f"No response within {self.first_byte_timeout}s")
+        
+        iterator = chunks.__aiter__()
+        timeout = deadline - loop.time()
+        first = True
+        
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), max(timeout, 0))
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                if first:
+                    self.first_byte_timeouts += 1
+                    raise asyncio.TimeoutError(f"No response within {self.first_byte_timeout}s")
+                self.read_timeouts += 1
+                raise asyncio.TimeoutError(f"Stream stalled for {self.read_timeout}s")
+            
+            first = False
+            timeout = self.read_timeout
+            yield chunk
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return pool occupancy and saturation counters."""
+        return {
+            "started": self._session is not None,
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "utilization": self.in_flight / self.max_connections if self.max_connections else 0.0,
+            "requests": self.requests,
+            "saturated": self.saturated,
+            "first_byte_timeouts": self.first_byte_timeouts,
+            "read_timeouts": self.read_timeouts,
+        }
+
+
+# Create singleton instance
+http_pool = HTTPPool(
+    max_connections=settings.upstream_max_connections,
+    keepalive_seconds=settings.upstream_keepalive_seconds,
+    connect_timeout=settings.upstream_connect_timeout,
+    first_byte_timeout=settings.upstream_first_byte_timeout,
+    read_timeout=settings.upstream_read_timeout,
+    total_timeout=settings.upstream_total_timeout
+)
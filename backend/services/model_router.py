@@ -0,0 +1,257 @@
+# services/model_router.py
+"""
+Per-request model routing.
+
+Before a completion is requested, the router picks a model tier from cheap
+features of the request: the input length, how long the conversation is,
+whether it contains code and a table of keyword rules. Trivial turns
+("thanks!") go to a fast tier with a small reply budget; long or technical
+ones to a tier tuned for them. A short question is not a trivial turn, so
+input length alone never picks the fast tier.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Protocol
+from collections import Counter
+import re
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tier parameters; MODEL_TIERS overrides any of them per tier
+DEFAULT_TIERS = {
+    "fast": {"max_tokens": 300, "temperature": 0.5},
+    "standard": {},
+    "complex": {"temperature": 0.3},
+}
+
+# (regular expression, tier) pairs checked in order; the first match wins
+DEFAULT_KEYWORD_RULES = [
+    (r"^\W*(hi|hello|hey|thanks|thank you|thx|cool|great|nice|bye|goodbye)\W*$", "fast"),
+    (r"\b(debug|refactor|stack trace|traceback|algorithm|prove|derive|step by step|in detail)\b", "complex"),
+]
+
+CODE_PATTERN = re.compile(r"```|^( {4}|\t)\S", re.MULTILINE)
+
+
+class ModelTier(NamedTuple):
+    """
+    A model and the request parameters used with it.
+    
+    Attributes:
+        name: Tier name, as used in routing rules and logs
+        model: Model to call
+        max_tokens: Reply token limit
+        temperature: Sampling temperature
+    """
+    name: str
+    model: str
+    max_tokens: int
+    temperature: float
+
+
+class RouteDecision(NamedTuple):
+    """
+    The tier chosen for one request.
+    
+    Attributes:
+        tier: The chosen tier
+        reason: Which rule picked it
+        features: The request features the decision was based on
+    """
+    tier: ModelTier
+    reason: str
+    features: Dict[str, Any]
+
+
+class ModelRouter(Protocol):
+    """Anything that can pick a model tier for a chat turn."""
+    
+    def route(self, user_input: str, history: List[Dict[str, str]]) -> RouteDecision:
+        """Choose a tier for `user_input`, given the session's history."""
+        ...
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return decision counters."""
+        ...
+
+
+def build_tiers(
+    model: str,
+    max_tokens: int,
+    temperature: float,
+    overrides: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, ModelTier]:
+    """
+    Build the tier table from the default model parameters.
+    
+    Args:
+        model: Model every tier uses unless overridden
+        max_tokens: Reply limit of the standard tier, and the cap for every
+            tier (the prompt budget is sized for it)
+        temperature: Temperature of the standard tier
+        overrides: Per-tier parameter overrides, e.g. {"complex": {"model": "gpt-4o"}}
+    
+    Returns:
+        Tiers by name
+    """
+    tiers = {}
+    for name in {**DEFAULT_TIERS, **(overrides or {})}:
+        params = {"model": model, "max_tokens": max_tokens, "temperature": temperature}
+        params.update(DEFAULT_TIERS.get(name, {}))
+        params.update((overrides or {}).get(name, {}))
+        tiers[name] = ModelTier(
+            name,
+            params["model"],
+            min(int(params["max_tokens"]), max_tokens),
+            float(params["temperature"])
+        )
+    return tiers
+
+
+class StaticRouter:
+    """Sends every request to one tier."""
+    
+    def __init__(self, tier: ModelTier):
+        """
+        Initialize the router.
+        
+        Args:
+            tier: The tier used for everything
+        """
+        self.tier = tier
+        self.decisions: Counter = Counter()
+    
+    def route(self, user_input: str, history: List[Dict[str, str]]) -> RouteDecision:
+        """Return the fixed tier."""
+        self.decisions[self.tier.name] += 1
+        return RouteDecision(self.tier, "static", {})
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return decision counters."""
+        return {"router": "static", "tiers": dict(self.decisions), "reasons": {"static": sum(self.decisions.values())}}
+
+
+class RuleRouter:
+    """
+    Picks a tier from request features.
+    
+    Rules, first match wins: code in the input goes to the complex tier,
+    then the keyword table, then long inputs or long conversations go to
+    the complex tier. Everything else is standard.
+    """
+    
+    def __init__(
+        self,
+        tiers: Dict[str, ModelTier],
+        keyword_rules: List[tuple],
+        complex_min_chars: int,
+        complex_min_history: int
+    ):
+        """
+        Initialize the router.
+        
+        Args:
+            tiers: Tiers by name; must include "fast", "standard" and "complex"
+            keyword_rules: (regular expression, tier name) pairs, matched
+                case-insensitively against the input
+            complex_min_chars: Shortest input routed to the complex tier by length
+            complex_min_history: Fewest messages that send a session to the complex tier
+        
+        Raises:
+            ValueError: If a rule names an unknown tier
+        """
+        for _, tier in keyword_rules:
+            if tier not in tiers:
+                raise ValueError(f"Routing rule names unknown tier: {tier}")
+        
+        self.tiers = tiers
+        self.keyword_rules = [(re.compile(pattern, re.IGNORECASE), tier) for pattern, tier in keyword_rules]
+        self.complex_min_chars = complex_min_chars
+        self.complex_min_history = complex_min_history
+        self.decisions: Counter = Counter()
+        self.reasons: Counter = Counter()
+    
+    def route(self, user_input: str, history: List[Dict[str, str]]) -> RouteDecision:
+        """
+        Choose a tier for a chat turn.
+        
+        Args:
+            user_input: The new user message
+            history: The session's messages, including the new one
+        
+        Returns:
+            The decision, which is also logged
+        """
+        text = user_input.strip()
+        features = {
+            "chars": len(text),
+            "history": len(history),
+            "code": bool(CODE_PATTERN.search(user_input)),
+        }
+        tier, reason = self._choose(text, features)
+        
+        self.decisions[tier] += 1
+        self.reasons[reason] += 1
+        logger.info(
+            f"Routed to {tier} ({reason}): chars={features['chars']} "
+            f"history={features['history']} code={features['code']}"
+        )
+        return RouteDecision(self.tiers[tier], reason, features)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return how often each tier and each rule was chosen."""
+        return {"router": "rules", "tiers": dict(self.decisions), "reasons": dict(self.reasons)}
+    
+    def _choose(self, text: str, features: Dict[str, Any]) -> tuple:
+        if features["code"]:
+            return "complex", "code"
+        
+        for pattern, tier in self.keyword_rules:
+            match = pattern.search(text)
+            if match:
+                return tier, f"keyword:{match.group(0).strip(' !?.,').lower()}"
+        
+        if features["chars"] >= self.complex_min_chars:
+            return "complex", "long_input"
+        if features["history"] >= self.complex_min_history:
+            return "complex", "long_history"
+        return "standard", "default"
+
+
+def create_router(name: Optional[str] = None) -> ModelRouter:
+    """
+    Build a model router by name.
+    
+    Args:
+        name: "rules" or "static"; defaults to settings.model_router
+    
+    Returns:
+        A ModelRouter implementation
+    
+    Raises:
+        ValueError: If the name is unknown
+    """
+    name = (name or settings.model_router).lower()
+    tiers = build_tiers(
+        settings.openai_model,
+        settings.openai_max_tokens,
+        settings.openai_temperature,
+        settings.model_tiers
+    )
+    
+    if name == "static":
+        return StaticRouter(tiers["standard"])
+    if name == "rules":
+        return RuleRouter(
+            tiers,
+            settings.router_keyword_rules or DEFAULT_KEYWORD_RULES,
+            complex_min_chars=settings.router_complex_min_chars,
+            complex_min_history=settings.router_complex_min_history
+        )
+    
+    raise ValueError(f"Unknown model router: {name}")
+
+
+# Create singleton instance
+model_router = create_router()
@@ -3,10 +3,23 @@
 OpenAI service for chat completions.
 """
 
+import asyncio
 import openai
-from typing import List, Dict, AsyncGenerator
+from typing import Any, List, Dict, AsyncGenerator, Optional
 from config.settings import settings
-from utils.constants import ERROR_OPENAI_STREAMING
+from services.admission import AdmissionController, admission_controller
+from services.circuit_breaker import CircuitBreakers, CircuitOpenError, circuit_breakers
+from services.http_pool import HTTPPool, http_pool
+from services.hedging import Hedger, hedger as default_hedger
+from services.model_router import ModelTier
+from services.providers import CompletionProvider, completion_provider
+from services.response_cache import ResponseCache
+from utils.constants import (
+    ERROR_OPENAI_STREAMING,
+    SUMMARY_ADMISSION_USER,
+    SUMMARY_SYSTEM_PROMPT,
+    SUMMARY_UPDATE_TEMPLATE
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,48 +33,202 @@ class OpenAIService:
     Service class for OpenAI API interactions.
     """
     
-    def __init__(self):
-        """Initialize OpenAI service with configuration."""
+    def __init__(
+        self,
+        pool: Optional[HTTPPool] = None,
+        provider: Optional[CompletionProvider] = None,
+        hedger: Optional[Hedger] = None,
+        breakers: Optional[CircuitBreakers] = None,
+        admission: Optional[AdmissionController] = None
+    ):
+        """
+        Initialize OpenAI service with configuration.
+        
+        Args:
+            pool: Connection pool for API calls, defaults to the shared pool
+            provider: Source of streamed completions, defaults to the configured provider
+            hedger: Time-to-first-token hedging policy, defaults to the shared one
+            breakers: Per-model circuit breakers, defaults to the shared ones
+            admission: Upstream slot limiter for background calls, defaults to the shared one
+        """
         self.model = settings.openai_model
+        self.fallback_models = list(settings.openai_fallback_models)
         self.temperature = settings.openai_temperature
         self.max_tokens = settings.openai_max_tokens
+        self.pool = pool or http_pool
+        self.provider = provider or completion_provider
+        self.hedger = hedger or default_hedger
+        self.breakers = breakers or circuit_breakers
+        self.admission = admission or admission_controller
     
-    async def stream_chat_completion(
+    async def start(self) -> None:
+        """Open the pooled HTTP session used for API calls."""
+        await self.pool.start()
+    
+    async def close(self) -> None:
+        """Close the pooled HTTP session."""
+        await self.pool.close()
+    
+    async def stream_completion(
         self, 
-        history: List[Dict[str, str]]
+        history: List[Dict[str, str]],
+        meta: Optional[Dict[str, Any]] = None,
+        tier: Optional[ModelTier] = None
     ) -> AsyncGenerator[str, None]:
         """
-        Stream chat completion from OpenAI.
+        Stream chat completion from OpenAI, raising on failure.
+        
+        Models are tried in order, the tier's (or the default) model then
+        the fallback chain, skipping any whose circuit breaker is open. A
+        model that fails before its first token hands over to the next one;
+        once a reply has started it is never switched. A request whose first token
+        is unusually late may be hedged with a second identical request
+        (see `Hedger`).
         
         Args:
             history: List of message dictionaries with 'role' and 'content'
-            
+            meta: If given, receives the serving model under 'model'
+            tier: Model and parameters chosen by the router; defaults to the
+                configured model, temperature and max_tokens
+                
         Yields:
             String chunks of the assistant's response
             
         Raises:
+            CircuitOpenError: If every model's breaker is open
             Exception: If OpenAI API call fails
         """
-        try:
-            # Create streaming chat completion
-            response = await openai.ChatCompletion.acreate(
-                model=self.model,
-                messages=history,
-                stream=True,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
+        loop = asyncio.get_running_loop()
+        tier = tier or self.default_tier
+        reasons = []
+        error: Optional[Exception] = None
+        
+        for model in dict.fromkeys([tier.model, *self.fallback_models]):
+            breaker = self.breakers.get(model)
+            permit = breaker.allow()
+            if permit is None:
+                reasons.append(f"{model} circuit open")
+                continue
+            
+            started = loop.time()
+            stream = self.hedger.stream(lambda model=model: self._attempt(history, model, tier))
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                breaker.record_failure(permit)
+                reasons.append(f"{model} failed: {e}")
+                error = e
+                continue
+            except BaseException:
+                breaker.release(permit)
+                raise
+            
+            breaker.record_success(permit, loop.time() - started)
+            if model != tier.model:
+                self.breakers.record_fallback(tier.model, model, reasons)
+            if meta is not None:
+                meta["model"] = model
             
-            # Stream response chunks
-            async for chunk in response:
-                content = chunk.choices[0].delta.get("content", "")
-                if content:
+            if first is None:
+                return
+            try:
+                yield first
+                async for content in stream:
                     yield content
+            finally:
+                await stream.aclose()
+            return
+        
+        raise error or CircuitOpenError(f"No model available: {'; '.join(reasons)}")
+    
+    async def _attempt(
+        self,
+        history: List[Dict[str, str]],
+        model: str,
+        tier: ModelTier
+    ) -> AsyncGenerator[str, None]:
+        """One upstream request, bounded by the connect, first-token and idle deadlines."""
+        async with self.pool.request():
+            response = self.provider.open(model, history, tier.temperature, tier.max_tokens)
+            async for content in self.pool.stream(response):
+                yield content
+    
+    async def stream_chat_completion(
+        self, 
+        history: List[Dict[str, str]]
+    ) -> AsyncGenerator[str, None]:
+        """
+        Stream chat completion from OpenAI.
+        
+        Args:
+            history: List of message dictionaries with 'role' and 'content'
+            
+        Yields:
+            String chunks of the assistant's response; a failure is logged
+            and yielded as a final "Error: ..." chunk
+        """
+        try:
+            async for content in self.stream_completion(history):
+                yield content
                     
         except Exception as e:
             error_msg = f"{ERROR_OPENAI_STREAMING}: {str(e)}"
             logger.error(error_msg)
             yield f"Error: {str(e)}"
+    
+    @property
+    def default_tier(self) -> ModelTier:
+        """The configured model and parameters, used when no tier is routed."""
+        return ModelTier("default", self.model, self.max_tokens, self.temperature)
+    
+    def cache_key(self, history: List[Dict[str, str]], tier: Optional[ModelTier] = None) -> str:
+        """Return the response cache key for a prompt under a tier's (or the default) model parameters."""
+        tier = tier or self.default_tier
+        return ResponseCache.make_key(tier.model, tier.temperature, tier.max_tokens, history)
+    
+    async def summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """
+        Fold new messages into a running conversation summary.
+        
+        The update goes through the same provider, pool and breakers as a
+        reply, and holds an admission slot while it runs. Summaries queue
+        as their own user, so they take at most one user's share of the
+        slots.
+        
+        Args:
+            summary: The current summary (empty for the first update)
+            messages: Messages not yet covered by the summary, oldest first
+            
+        Returns:
+            The updated summary
+            
+        Raises:
+            AdmissionRejected: If the admission queue is full
+            AdmissionTimeout: If no slot frees up in time
+            CircuitOpenError: If every model's breaker is open
+            Exception: If OpenAI API call fails
+        """
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": SUMMARY_UPDATE_TEMPLATE.format(
+                summary=summary or "(none)",
+                messages=transcript
+            )}
+        ]
+        tier = ModelTier("summary", self.model, settings.memory_summary_max_tokens, 0)
+        
+        ticket = self.admission.enter(SUMMARY_ADMISSION_USER)
+        try:
+            async for _ in ticket.wait():
+                pass
+            chunks = [content async for content in self.stream_completion(prompt, tier=tier)]
+        finally:
+            ticket.release()
+        
+        return "".join(chunks).strip()
 
 
 # Create singleton instance
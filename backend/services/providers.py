@@ -0,0 +1,167 @@
+# services/providers.py
+"""
+Completion providers: where streamed model replies come from.
+"""
+
+from typing import AsyncIterator, Dict, List, Optional, Protocol, Sequence
+import asyncio
+import itertools
+import openai
+from config.settings import settings
+from services.http_pool import HTTPPool, http_pool
+
+
+class CompletionProvider(Protocol):
+    """Anything that can open a streamed chat completion."""
+    
+    async def open(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> AsyncIterator[str]:
+        """
+        Send a completion request.
+        
+        Returns:
+            The reply's non-empty content chunks, once the provider has
+            accepted the request
+        """
+        ...
+
+
+class OpenAIProvider:
+    """Streams completions from the OpenAI API through the shared HTTP pool."""
+    
+    def __init__(self, pool: HTTPPool):
+        """
+        Initialize the provider.
+        
+        Args:
+            pool: Connection pool supplying the SDK's connect and total timeouts
+        """
+        self.pool = pool
+    
+    async def open(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> AsyncIterator[str]:
+        """Create a streaming chat completion."""
+        response = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            stream=True,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            request_timeout=self.pool.request_timeout
+        )
+        return self._contents(response)
+    
+    @staticmethod
+    async def _contents(response) -> AsyncIterator[str]:
+        async for chunk in response:
+            content = chunk.choices[0].delta.get("content", "")
+            if content:
+                yield content
+
+
+class FakeProvider:
+    """
+    Local provider with controllable latency for tests and load tests.
+    
+    Each call takes the next value from `first_token_delays` (cycling), so
+    a test can make, say, every tenth call slow.
+    """
+    
+    def __init__(
+        self,
+        reply: str = "This is a simulated reply from the fake provider.",
+        first_token_delays: Sequence[float] = (0.05,),
+        token_delay: float = 0.01,
+        tokens_per_chunk: int = 1
+    ):
+        """
+        Initialize the fake provider.
+        
+        Args:
+            reply: Text every completion streams back
+            first_token_delays: Seconds before the first chunk, per call, cycled
+            token_delay: Seconds between chunks
+            tokens_per_chunk: Words sent per chunk
+        """
+        self.reply = reply
+        self.token_delay = token_delay
+        self.tokens_per_chunk = tokens_per_chunk
+        self._first_token_delays = itertools.cycle(first_token_delays)
+        self.calls = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.last_request: Optional[Dict] = None
+    
+    async def open(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int
+    ) -> AsyncIterator[str]:
+        """Start a simulated completion."""
+        self.calls += 1
+        self.last_request = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        return self._stream(next(self._first_token_delays))
+    
+    async def _stream(self, first_token_delay: float) -> AsyncIterator[str]:
+        words = self.reply.split(" ")
+        chunks = [
+            " ".join(words[i:i + self.tokens_per_chunk]) + " "
+            for i in range(0, len(words), self.tokens_per_chunk)
+        ]
+        chunks[-1] = chunks[-1].rstrip()
+        
+        try:
+            await asyncio.sleep(first_token_delay)
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(self.token_delay)
+                yield chunk
+            self.completed += 1
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+
+
+def create_provider(name: Optional[str] = None, pool: Optional[HTTPPool] = None) -> CompletionProvider:
+    """
+    Build a completion provider by name.
+    
+    Args:
+        name: "openai" or "fake"; defaults to settings.llm_provider
+        pool: Connection pool for the OpenAI provider
+    
+    Returns:
+        A CompletionProvider implementation
+    
+    Raises:
+        ValueError: If the name is unknown
+    """
+    name = (name or settings.llm_provider).lower()
+    
+    if name == "openai":
+        return OpenAIProvider(pool or http_pool)
+    if name == "fake":
+        return FakeProvider()
+    
+    raise ValueError(f"Unknown completion provider: {name}")
+
+
+# Create singleton instance
+completion_provider = create_provider()
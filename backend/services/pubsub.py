@@ -0,0 +1,380 @@
+# services/pubsub.py
+"""
+Publish/subscribe channels used to relay live replies between workers.
+
+Messages are JSON-compatible dicts and delivery is fire-and-forget, as with
+Redis pub/sub: a subscriber only sees messages published while it is
+subscribed, and each subscription buffers at most `max_queue` messages.
+When a slow subscriber's buffer is full, further messages are dropped and
+the subscription is flagged as overflowed so it can catch up another way.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Protocol, Set
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import sqlite3
+import time
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pubsub_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pubsub_subscribers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_pubsub_subscribers_channel ON pubsub_subscribers (channel, expires);
+"""
+
+
+class Subscription:
+    """
+    One subscriber's bounded buffer of messages on a channel.
+    
+    Attributes:
+        channel: The channel subscribed to
+        overflowed: Whether messages were dropped since the flag was last
+            cleared
+        dropped: Messages dropped because the buffer was full
+    """
+    
+    def __init__(self, pubsub: "PubSub", channel: str, max_queue: int):
+        self._pubsub = pubsub
+        self.channel = channel
+        self.overflowed = False
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+    
+    async def get(self) -> Dict[str, Any]:
+        """Wait for the next message."""
+        return await self._queue.get()
+    
+    async def close(self) -> None:
+        """Stop receiving messages."""
+        self._pubsub._unsubscribe(self)
+    
+    def _deliver(self, message: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.dropped += 1
+
+
+class PubSub(Protocol):
+    """Anything that can publish to and subscribe to named channels."""
+    
+    async def publish(self, channel: str, message: Dict[str, Any]) -> int:
+        """Send a message to the channel's current subscribers; return how many there are."""
+        ...
+    
+    async def subscribe(self, channel: str, max_queue: int) -> Subscription:
+        """Start receiving the channel's messages into a buffer of `max_queue`."""
+        ...
+    
+    async def close(self) -> None:
+        """Release connections and background tasks."""
+        ...
+
+
+class InMemoryPubSub:
+    """
+    Process-local pub/sub.
+    
+    Stands in for a networked broker: everything connected to the same
+    instance, such as several brokers acting as workers in tests, sees each
+    other's messages. Several worker processes need `SQLitePubSub` (one
+    host) or a networked backend behind the same interface.
+    """
+    
+    def __init__(self):
+        """Initialize with no channels."""
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+    
+    async def publish(self, channel: str, message: Dict[str, Any]) -> int:
+        """
+        Deliver a message to the channel's subscribers.
+        
+        Args:
+            channel: Channel name
+            message: JSON-compatible message
+            
+        Returns:
+            Number of subscribers the message was delivered to
+        """
+        subscriptions = self._channels.get(channel, ())
+        for subscription in list(subscriptions):
+            subscription._deliver(message)
+        self.published += 1
+        return len(subscriptions)
+    
+    async def subscribe(self, channel: str, max_queue: int) -> Subscription:
+        """
+        Subscribe to a channel.
+        
+        Args:
+            channel: Channel name
+            max_queue: Messages buffered before new ones are dropped
+            
+        Returns:
+            The subscription; close it when done
+        """
+        subscription = Subscription(self, channel, max_queue)
+        self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+    
+    async def close(self) -> None:
+        """Nothing to release."""
+    
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._channels.get(subscription.channel)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._channels[subscription.channel]
+
+
+class SQLitePubSub:
+    """
+    Pub/sub between the worker processes of one host, through a shared
+    SQLite file.
+    
+    Lets several uvicorn workers share live replies without running a
+    broker. Published messages are appended to a table, and each process
+    polls it every `poll_interval` seconds and hands new rows to its own
+    subscriptions. Subscriptions are registered in the file, so `publish`
+    counts the subscribers of every process; each process refreshes its
+    registrations, and those of a process that died stop counting after
+    `subscriber_ttl` seconds. Messages are deleted after `retention`
+    seconds, which only needs to outlast the polling.
+    
+    Note:
+        All queries go through a single worker thread per process, as in
+        `SQLiteStorage`. Delivery latency is up to one poll interval.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        poll_interval: float,
+        retention: float = 30.0,
+        subscriber_ttl: float = 10.0
+    ):
+        """
+        Initialize the backend.
+        
+        Args:
+            path: Database file shared by the processes
+            poll_interval: Seconds between reads of new messages
+            retention: Seconds published messages are kept
+            subscriber_ttl: Seconds a registration counts without being refreshed
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.subscriber_ttl = subscriber_ttl
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-pubsub")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._channels: Dict[str, Set[Subscription]] = {}
+        # Each subscription's registration row and the last message id
+        # published before it subscribed
+        self._rows: Dict[Subscription, int] = {}
+        self._since: Dict[Subscription, int] = {}
+        self._closed_rows: List[int] = []
+        self._last_id = 0
+        self._last_upkeep = 0.0
+        self._poller: Optional[asyncio.Task] = None
+        self.published = 0
+    
+    async def publish(self, channel: str, message: Dict[str, Any]) -> int:
+        """
+        Append a message for every process's subscribers of the channel.
+        
+        Args:
+            channel: Channel name
+            message: JSON-compatible message
+            
+        Returns:
+            Number of subscribers registered on the channel, in any process
+        """
+        payload = json.dumps(message)
+        
+        def insert(conn: sqlite3.Connection) -> int:
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT INTO pubsub_messages (channel, payload, created_at) VALUES (?, ?, ?)",
+                    (channel, payload, now)
+                )
+                return conn.execute(
+                    "SELECT COUNT(*) FROM pubsub_subscribers WHERE channel = ? AND expires > ?",
+                    (channel, now)
+                ).fetchone()[0]
+        
+        receivers = await self._run(insert)
+        self.published += 1
+        return receivers
+    
+    async def subscribe(self, channel: str, max_queue: int) -> Subscription:
+        """
+        Subscribe to a channel in every process.
+        
+        Args:
+            channel: Channel name
+            max_queue: Messages buffered before new ones are dropped
+            
+        Returns:
+            The subscription; close it when done
+        """
+        def register(conn: sqlite3.Connection) -> tuple:
+            with conn:
+                row = conn.execute(
+                    "INSERT INTO pubsub_subscribers (channel, expires) VALUES (?, ?)",
+                    (channel, time.time() + self.subscriber_ttl)
+                ).lastrowid
+                since = conn.execute("SELECT COALESCE(MAX(id), 0) FROM pubsub_messages").fetchone()[0]
+            return row, since
+        
+        row, since = await self._run(register)
+        subscription = Subscription(self, channel, max_queue)
+        self._rows[subscription] = row
+        self._since[subscription] = since
+        self._channels.setdefault(channel, set()).add(subscription)
+        
+        if self._poller is None or self._poller.done():
+            self._last_id = max(self._last_id, since)
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        return subscription
+    
+    async def close(self) -> None:
+        """Stop polling, drop this process's registrations and close the file."""
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        
+        rows = self._closed_rows + list(self._rows.values())
+        
+        def release(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.executemany("DELETE FROM pubsub_subscribers WHERE id = ?", [(row,) for row in rows])
+            conn.close()
+        
+        if self._conn is not None:
+            await self._run(release)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+    
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._channels.get(subscription.channel)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._channels[subscription.channel]
+        
+        # The registration is deleted by the next poll
+        row = self._rows.pop(subscription, None)
+        self._since.pop(subscription, None)
+        if row is not None:
+            self._closed_rows.append(row)
+    
+    async def _poll(self) -> None:
+        """Deliver new messages to local subscriptions until there are none."""
+        while self._rows or self._closed_rows:
+            try:
+                await self._poll_once()
+            except Exception as e:
+                logger.error(f"Polling pub/sub messages failed: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+    
+    async def _poll_once(self) -> None:
+        now = time.time()
+        closed, self._closed_rows = self._closed_rows, []
+        live = list(self._rows.values())
+        upkeep = now - self._last_upkeep >= 1.0
+        if upkeep:
+            self._last_upkeep = now
+        last_id = self._last_id
+        
+        def fetch(conn: sqlite3.Connection) -> list:
+            with conn:
+                if closed:
+                    conn.executemany("DELETE FROM pubsub_subscribers WHERE id = ?", [(row,) for row in closed])
+                if upkeep:
+                    # Refresh this process's registrations and expire everyone's old rows
+                    conn.executemany(
+                        "UPDATE pubsub_subscribers SET expires = ? WHERE id = ?",
+                        [(now + self.subscriber_ttl, row) for row in live]
+                    )
+                    conn.execute("DELETE FROM pubsub_subscribers WHERE expires <= ?", (now,))
+                    conn.execute("DELETE FROM pubsub_messages WHERE created_at < ?", (now - self.retention,))
+            return conn.execute(
+                "SELECT id, channel, payload FROM pubsub_messages WHERE id > ? ORDER BY id",
+                (last_id,)
+            ).fetchall()
+        
+        for message_id, channel, payload in await self._run(fetch):
+            self._last_id = message_id
+            subscriptions = [
+                subscription
+                for subscription in self._channels.get(channel, ())
+                if self._since.get(subscription, message_id) < message_id
+            ]
+            if subscriptions:
+                message = json.loads(payload)
+                for subscription in subscriptions:
+                    subscription._deliver(message)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open the file and create the tables on first use (worker thread only)."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+    
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run fn(connection) on the worker thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect()))
+
+
+def create_pubsub(name: Optional[str] = None) -> PubSub:
+    """
+    Build the pub/sub backend by name.
+    
+    Args:
+        name: "memory" or "sqlite"; defaults to settings.stream_pubsub_backend
+        
+    Returns:
+        A PubSub implementation
+        
+    Raises:
+        ValueError: If the name is unknown
+    """
+    name = (name or settings.stream_pubsub_backend).lower()
+    
+    if name == "memory":
+        return InMemoryPubSub()
+    if name == "sqlite":
+        return SQLitePubSub(settings.stream_pubsub_path, settings.stream_pubsub_poll_interval)
+    
+    raise ValueError(f"Unknown pub/sub backend: {name}")
+
+
+# Create singleton instance
+pubsub = create_pubsub()
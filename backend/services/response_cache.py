@@ -0,0 +1,267 @@
+# services/response_cache.py
+"""
+Cache of completed model replies keyed by the exact prompt and parameters.
+"""
+
+from typing import Any, List, Dict, Optional, AsyncGenerator
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+import time
+from config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Disk entries are pruned to the configured maximum every this many writes
+DISK_PRUNE_INTERVAL = 100
+
+
+class _Entry:
+    """A cached reply as the chunks it was streamed in."""
+    
+    __slots__ = ("chunks", "size", "expires_at")
+    
+    def __init__(self, chunks: List[str], expires_at: float):
+        self.chunks = chunks
+        self.size = sum(len(chunk) for chunk in chunks)
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """
+    LRU cache of model replies with TTL, a byte cap and an optional disk tier.
+    
+    Note:
+        Only replies that streamed to completion are stored. Chunks are
+        kept as streamed, so a hit replays with the same SSE framing as the
+        original reply. Disk entries carry a wall-clock expiry and are read
+        and written off the event loop.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool,
+        max_entries: int,
+        max_bytes: int,
+        ttl_seconds: float,
+        disk_dir: Optional[str] = None,
+        disk_max_entries: int = 0
+    ):
+        """
+        Initialize the cache.
+        
+        Args:
+            enabled: When False, every lookup is a bypass
+            max_entries: Maximum number of replies kept in memory
+            max_bytes: Maximum total size of replies kept in memory
+            ttl_seconds: Lifetime of a cached reply
+            disk_dir: Directory for the on-disk tier, or None to disable it
+            disk_max_entries: Maximum number of replies kept on disk
+        """
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = disk_max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._disk_writes = 0
+        self._endpoints: Dict[str, Dict[str, int]] = {}
+        self.disk_hits = 0
+        self.evictions = 0
+        
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        messages: List[Dict[str, str]]
+    ) -> str:
+        """
+        Hash the model parameters and prompt into a cache key.
+        
+        Args:
+            model: Model name
+            temperature: Sampling temperature
+            max_tokens: Reply token limit
+            messages: The exact messages sent to the model
+        
+        Returns:
+            Hex SHA-256 digest
+        """
+        payload = json.dumps(
+            {
+                "model": model,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "messages": [[m.get("role"), m.get("content")] for m in messages]
+            },
+            separators=(",", ":"),
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    async def get(self, key: str, endpoint: str, bypass: bool = False) -> Optional[List[str]]:
+        """
+        Look up a cached reply.
+        
+        Args:
+            key: Key from `make_key`
+            endpoint: Name the lookup is counted under
+            bypass: Skip the cache for this request
+        
+        Returns:
+            The reply's chunks, or None on a miss or bypass
+        """
+        counters = self._counters(endpoint)
+        if bypass or not self.enabled:
+            counters["bypassed"] += 1
+            return None
+        
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            entry = None
+        
+        if entry is None and self.disk_dir:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._insert(key, entry)
+        
+        if entry is None:
+            counters["misses"] += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        counters["hits"] += 1
+        return list(entry.chunks)
+    
+    async def put(self, key: str, chunks: List[str]) -> None:
+        """
+        Store a completed reply.
+        
+        Args:
+            key: Key from `make_key`
+            chunks: The reply as streamed
+        """
+        if not self.enabled or not chunks:
+            return
+        
+        self._insert(key, _Entry(list(chunks), time.monotonic() + self.ttl_seconds))
+        
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, chunks)
+            except OSError as e:
+                logger.warning(f"Response cache disk write failed: {str(e)}")
+    
+    @staticmethod
+    async def replay(chunks: List[str]) -> AsyncGenerator[str, None]:
+        """Yield cached chunks like a live completion stream."""
+        for chunk in chunks:
+            yield chunk
+    
+    def clear(self) -> None:
+        """Drop every in-memory entry (counters and disk entries are kept)."""
+        self._entries.clear()
+        self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return occupancy and per-endpoint hit rates."""
+        endpoints = {}
+        for endpoint, counters in self._endpoints.items():
+            lookups = counters["hits"] + counters["misses"]
+            endpoints[endpoint] = dict(counters, hit_rate=counters["hits"] / lookups if lookups else 0.0)
+        
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "disk_hits": self.disk_hits,
+            "endpoints": endpoints,
+        }
+    
+    def _counters(self, endpoint: str) -> Dict[str, int]:
+        return self._endpoints.setdefault(endpoint, {"hits": 0, "misses": 0, "bypassed": 0})
+    
+    def _insert(self, key: str, entry: _Entry) -> None:
+        """Add an entry and evict least recently used ones beyond the limits."""
+        self._remove(key)
+        if entry.size > self.max_bytes:
+            return
+        
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+    
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+    
+    def _read_disk(self, key: str) -> Optional[_Entry]:
+        """Load an unexpired entry from disk (worker thread only)."""
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        remaining = data["expires_at"] - time.time()
+        if remaining <= 0:
+            return None
+        return _Entry(data["chunks"], time.monotonic() + remaining)
+    
+    def _write_disk(self, key: str, chunks: List[str]) -> None:
+        """Persist an entry atomically and prune old files now and then (worker thread only)."""
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": time.time() + self.ttl_seconds, "chunks": chunks}, f)
+        os.replace(tmp_path, path)
+        
+        self._disk_writes += 1
+        if self._disk_writes % DISK_PRUNE_INTERVAL == 0:
+            self._prune_disk()
+    
+    def _prune_disk(self) -> None:
+        """Delete the oldest files beyond disk_max_entries (worker thread only)."""
+        with os.scandir(self.disk_dir) as entries:
+            files = [e for e in entries if e.name.endswith(".json")]
+        
+        excess = len(files) - self.disk_max_entries
+        if excess <= 0:
+            return
+        
+        files.sort(key=lambda e: e.stat().st_mtime)
+        for entry in files[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+# Create singleton instance
+response_cache = ResponseCache(
+    enabled=settings.response_cache_enabled,
+    max_entries=settings.response_cache_max_entries,
+    max_bytes=settings.response_cache_max_bytes,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+    disk_dir=settings.response_cache_dir,
+    disk_max_entries=settings.response_cache_disk_max_entries
+)
@@ -0,0 +1,218 @@
+# services/single_flight.py
+"""
+Single-flight table for duplicate chat submissions.
+
+Double clicks and client retries send the same message several times
+within milliseconds. Each submission is keyed by its session and either a
+client-supplied request id or a hash of the message; the first one leads
+(stores the message and starts the reply) and the others wait for its
+generation and follow it, so one upstream completion is made and one pair
+of messages is stored.
+
+A key derived from the message is forgotten as soon as its reply is done,
+so sending the same text again later is a new turn. A client-supplied
+request id is remembered for a while after the reply is done, so a retry
+that arrives late replays the reply instead of storing it twice. If the
+reply failed or was cut off, the retry answers the message again; the
+message itself is only stored again if the first attempt never stored it.
+"""
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import time
+from config.settings import settings
+from services.generation import Generation
+
+
+class Flight:
+    """
+    One chat submission and the duplicates waiting on it.
+    
+    Attributes:
+        key: The submission's key
+        sticky: Whether the key was supplied by the client (kept after the
+            reply is done)
+        generation: The reply, once the leader has started it
+        history: The turn's prompt history, ending with the message, once
+            the message is stored; a leader finding it set reruns the reply
+            without storing the message again
+    """
+    
+    def __init__(self, key: str, sticky: bool, history: Optional[List[Dict[str, Any]]] = None):
+        self.key = key
+        self.sticky = sticky
+        self.generation: Optional[Generation] = None
+        self.history = history
+        self.expires: Optional[float] = None
+        self._rerun = False
+        self._settled = asyncio.Event()
+    
+    async def wait(self) -> Optional[Generation]:
+        """
+        Wait for the leader to start the reply or give up.
+        
+        Returns:
+            The leader's generation, or None if it stopped before generating
+        """
+        await self._settled.wait()
+        return self.generation
+
+
+class SingleFlight:
+    """
+    Short-lived table of chat submissions in flight.
+    
+    Only used on the event loop thread, so no locking is needed.
+    """
+    
+    def __init__(self, ttl: float, max_keys: int, clock=time.monotonic):
+        """
+        Initialize an empty table.
+        
+        Args:
+            ttl: Seconds a client-supplied key is kept after its reply is done
+            max_keys: Keys kept at most; the oldest are forgotten first
+            clock: Time source, replaceable in tests
+        """
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._clock = clock
+        self._flights: "OrderedDict[str, Flight]" = OrderedDict()
+        self._watchers: Set[asyncio.Task] = set()
+        self.leaders = 0
+        self.duplicates = 0
+        self.abandoned = 0
+        self.reruns = 0
+    
+    def join(
+        self,
+        session_id: str,
+        user_input: str,
+        request_id: Optional[str] = None
+    ) -> Tuple[Flight, bool]:
+        """
+        Join the flight for a submission, starting one if there is none.
+        
+        Args:
+            session_id: The chat session ID
+            user_input: The message being sent
+            request_id: Client-supplied idempotency key, if any
+            
+        Returns:
+            The flight and whether this submission leads it. The leader
+            must end with `start` or `abandon`; if the flight's `history`
+            is set, the message is already stored.
+        """
+        self._expire()
+        key = request_key(session_id, user_input, request_id)
+        
+        flight = self._flights.get(key)
+        if flight is not None and not flight._rerun:
+            self.duplicates += 1
+            return flight, False
+        
+        history = None
+        if flight is not None:
+            # A retry of a reply that failed or was cut off after its
+            # message was stored answers it again from the same history
+            history = flight.history
+            self.reruns += 1
+        flight = Flight(key, sticky=request_id is not None, history=history)
+        self._flights[key] = flight
+        while len(self._flights) > self.max_keys:
+            self._flights.popitem(last=False)
+        self.leaders += 1
+        return flight, True
+    
+    def start(self, flight: Flight, generation: Generation) -> None:
+        """Hand the leader's generation to the waiting duplicates."""
+        flight.generation = generation
+        flight._settled.set()
+        
+        watcher = asyncio.get_running_loop().create_task(generation.wait())
+        self._watchers.add(watcher)
+        watcher.add_done_callback(self._watchers.discard)
+        watcher.add_done_callback(lambda _: self._finished(flight))
+    
+    def saved(self, flight: Flight, history: List[Dict[str, Any]]) -> None:
+        """Note that the leader stored the message, answering it from `history`."""
+        flight.history = history
+    
+    def abandon(self, flight: Flight) -> None:
+        """
+        Drop a flight whose leader stopped before generating (rejected,
+        failed or following another worker's reply). Waiting duplicates
+        join again and one of them leads. If the message was stored, the
+        key is kept so that leader only reruns the reply.
+        """
+        if flight.generation is None:
+            self.abandoned += 1
+            flight._settled.set()
+        if flight.history is not None and flight.sticky and self._flights.get(flight.key) is flight:
+            flight._rerun = True
+            flight.expires = self._clock() + self.ttl
+        else:
+            self._remove(flight)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return key and submission counts."""
+        return {
+            "keys": len(self._flights),
+            "leaders": self.leaders,
+            "duplicates": self.duplicates,
+            "abandoned": self.abandoned,
+            "reruns": self.reruns,
+        }
+    
+    def _finished(self, flight: Flight) -> None:
+        # A failed or truncated reply should be run again rather than
+        # replayed; only the reply, if the message itself was stored
+        generation = flight.generation
+        rerun = generation.error is not None or generation.truncated
+        if not flight.sticky or (rerun and flight.history is None):
+            self._remove(flight)
+        elif self._flights.get(flight.key) is flight:
+            flight._rerun = rerun
+            if not rerun:
+                flight.history = None
+            flight.expires = self._clock() + self.ttl
+            self._flights.move_to_end(flight.key)
+    
+    def _expire(self) -> None:
+        now = self._clock()
+        while self._flights:
+            flight = next(iter(self._flights.values()))
+            if flight.expires is None or flight.expires > now:
+                break
+            self._flights.popitem(last=False)
+    
+    def _remove(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+
+def request_key(session_id: str, user_input: str, request_id: Optional[str] = None) -> str:
+    """
+    Key identifying one submission of a message.
+    
+    Args:
+        session_id: The chat session ID
+        user_input: The message being sent
+        request_id: Client-supplied idempotency key, if any
+        
+    Returns:
+        The session plus the request id, or plus a hash of the message
+    """
+    if request_id is not None:
+        return f"{session_id}:id:{request_id}"
+    digest = hashlib.sha256(user_input.encode("utf-8")).hexdigest()
+    return f"{session_id}:input:{digest}"
+
+
+# Create singleton instance
+single_flight = SingleFlight(
+    ttl=settings.chat_dedupe_ttl_seconds,
+    max_keys=settings.chat_dedupe_max_keys
+)
@@ -0,0 +1,82 @@
+# services/stage_timings.py
+"""
+Per-stage timings of chat stream requests.
+
+Each request times its stages back to back (history read, context
+assembly, queueing, first token) plus the user-message write, which may
+run alongside the others. Recent samples per stage are kept so the
+metrics endpoint can report means and percentiles.
+"""
+
+from typing import Any, Callable, Deque, Dict
+from collections import deque
+import time
+from config.settings import settings
+
+
+class StageTimings:
+    """Recent durations of each request stage."""
+    
+    def __init__(self, window: int):
+        """
+        Initialize with no samples.
+        
+        Args:
+            window: Samples kept per stage for the percentiles
+        """
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+    
+    def record(self, stage: str, seconds: float) -> None:
+        """Add one duration for a stage."""
+        if stage not in self._samples:
+            self._samples[stage] = deque(maxlen=self.window)
+            self._counts[stage] = 0
+        self._samples[stage].append(seconds)
+        self._counts[stage] += 1
+    
+    def timer(self) -> "StageTimer":
+        """Start timing one request."""
+        return StageTimer(self)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return the count, mean, p50 and p95 (ms) of each stage."""
+        stages = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            stages[stage] = {
+                "count": self._counts[stage],
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+            }
+        return stages
+    
+    def reset(self) -> None:
+        """Drop every sample."""
+        self._samples.clear()
+        self._counts.clear()
+
+
+class StageTimer:
+    """Times one request's consecutive stages."""
+    
+    def __init__(self, timings: StageTimings, clock: Callable[[], float] = time.perf_counter):
+        self._timings = timings
+        self._clock = clock
+        self.started = self._last = clock()
+    
+    def mark(self, stage: str) -> None:
+        """Record the time since the previous mark (or the start) as `stage`."""
+        now = self._clock()
+        self._timings.record(stage, now - self._last)
+        self._last = now
+    
+    def total(self, stage: str) -> None:
+        """Record the time since the start as `stage`."""
+        self._timings.record(stage, self._clock() - self.started)
+
+
+# Create singleton instance
+stage_timings = StageTimings(window=settings.stage_timing_window)
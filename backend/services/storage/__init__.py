@@ -0,0 +1,94 @@
+# services/storage/__init__.py
+"""
+Pluggable chat storage backends.
+
+The active backend is chosen by `settings.storage_backend`:
+    - "firestore": FirebaseService (default)
+    - "sqlite": SQLiteStorage at `settings.sqlite_path`
+    - "memory": InMemoryStorage
+    
+The module-level `storage_service` queues message writes through
+WriteBehindStorage (when enabled) and wraps the result in CachedStorage
+so chat history is served from the in-process history cache when warm.
+When several workers share the backend, cache hits are checked against
+the stored message count (`settings.history_cache_validate`).
+"""
+
+from typing import Optional
+from config.settings import settings
+from services.history_cache import history_cache
+from .base import StorageBackend, MessageWrite, MessagePage, SessionNotFound, SessionPage, SessionSummary
+from .cached import CachedStorage
+from .write_behind import WriteBehindStorage
+from .memory import InMemoryStorage
+from .sqlite import SQLiteStorage
+
+
+def create_storage_backend(backend: Optional[str] = None) -> StorageBackend:
+    """
+    Build a storage backend by name.
+    
+    Args:
+        backend: Backend name; defaults to settings.storage_backend
+        
+    Returns:
+        A StorageBackend implementation
+        
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    backend = (backend or settings.storage_backend).lower()
+    
+    if backend == "firestore":
+        # Imported lazily so firebase_admin is only needed when selected
+        from services.firebase_service import FirebaseService
+        return FirebaseService()
+    if backend == "sqlite":
+        return SQLiteStorage(settings.sqlite_path)
+    if backend == "memory":
+        return InMemoryStorage()
+    
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def build_storage_service() -> CachedStorage:
+    """
+    Build the storage stack used by the API routes.
+    
+    Returns:
+        The configured backend behind the write-behind queue and history cache
+    """
+    backend = create_storage_backend()
+    
+    if settings.write_behind_enabled:
+        backend = WriteBehindStorage(
+            backend,
+            max_batch=settings.write_behind_max_batch,
+            flush_interval=settings.write_behind_flush_interval,
+            max_attempts=settings.write_behind_max_attempts,
+            retry_backoff=settings.write_behind_retry_backoff,
+            max_retry_backoff=settings.write_behind_max_retry_backoff,
+            max_dead_letters=settings.write_behind_max_dead_letters
+        )
+    
+    return CachedStorage(backend, history_cache, validate=settings.history_cache_validate)
+
+
+# Create singleton instance
+storage_service = build_storage_service()
+
+__all__ = [
+    "StorageBackend",
+    "MessageWrite",
+    "MessagePage",
+    "SessionNotFound",
+    "SessionPage",
+    "SessionSummary",
+    "CachedStorage",
+    "WriteBehindStorage",
+    "InMemoryStorage",
+    "SQLiteStorage",
+    "create_storage_backend",
+    "build_storage_service",
+    "storage_service",
+]
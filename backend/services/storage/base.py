@@ -0,0 +1,238 @@
+# services/storage/base.py
+"""
+Storage backend protocol shared by every persistence implementation.
+"""
+
+from typing import Any, List, Dict, Optional, Literal, NamedTuple, Protocol, runtime_checkable
+from datetime import datetime, timezone
+import asyncio
+import base64
+import json
+from utils.constants import ERROR_SESSION_NOT_FOUND
+
+
+class MessageWrite(NamedTuple):
+    """
+    A message waiting to be persisted by `store_messages`.
+    
+    Attributes:
+        session_id: The chat session ID
+        role: Either 'user' or 'assistant'
+        content: The message content
+        timestamp: Client-assigned time, strictly increasing per process so
+            messages committed together keep their order
+        model: Model that generated an assistant message, if known
+        truncated: Whether the message is a partial reply cut off by a disconnect
+    """
+    session_id: str
+    role: Literal["user", "assistant"]
+    content: str
+    timestamp: datetime
+    model: Optional[str] = None
+    truncated: bool = False
+
+
+class SessionNotFound(Exception):
+    """
+    Raised when messages are stored for a session that does not exist.
+    
+    Every backend commits the messages of the sessions that do exist and
+    drops the others, so a session deleted while its messages were queued
+    is never recreated.
+    
+    Attributes:
+        session_ids: The sessions whose messages were dropped
+    """
+    
+    def __init__(self, session_ids: List[str]):
+        super().__init__(ERROR_SESSION_NOT_FOUND)
+        self.session_ids = session_ids
+
+
+class SessionPage(NamedTuple):
+    """
+    One page of a user's sessions.
+    
+    Attributes:
+        sessions: Session dictionaries with 'session_id', 'title', 'message_count'
+            and 'last_message_at', most recently active first
+        next_cursor: Opaque cursor for the following page, or None on the last page
+    """
+    sessions: List[Dict[str, str]]
+    next_cursor: Optional[str]
+
+
+class SessionSummary(NamedTuple):
+    """
+    Rolling summary of a session's older messages.
+    
+    Attributes:
+        text: The summary text
+        covered: Number of leading messages the summary stands in for
+    """
+    text: str
+    covered: int
+
+
+class MessagePage(NamedTuple):
+    """
+    A window of a session's messages, ending just before a cursor.
+    
+    Attributes:
+        messages: 'role'/'content' dicts, oldest first within the window;
+            assistant messages also carry 'model' when it was recorded
+            and 'truncated' when the reply was cut off
+        has_more: Whether older messages exist before this window
+        next_before: Cursor for the next older window, or None when has_more is False
+    """
+    messages: List[Dict[str, str]]
+    has_more: bool
+    next_before: Optional[str]
+
+
+def encode_cursor(position: List[Any]) -> str:
+    """
+    Encode a backend-specific sort position as an opaque cursor.
+    
+    Args:
+        position: JSON-serializable sort key of the last returned item
+        
+    Returns:
+        URL-safe cursor string
+    """
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: Any) -> List[Any]:
+    """
+    Decode a cursor produced by `encode_cursor`.
+    
+    Args:
+        cursor: Cursor string from a previous page
+        *types: Expected type (or tuple of types) of each position field;
+            a cursor of another shape is rejected before it reaches a query
+            
+    Returns:
+        The sort position it encodes
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    
+    if not isinstance(position, list):
+        raise ValueError("Invalid cursor")
+    if types and (
+        len(position) != len(types)
+        or any(
+            # JSON true/false decode to bools, which are ints to isinstance
+            isinstance(value, bool) or not isinstance(value, expected)
+            for value, expected in zip(position, types)
+        )
+    ):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def epoch_to_datetime(timestamp: float) -> datetime:
+    """
+    Convert an epoch timestamp stored by a local backend to an aware UTC datetime.
+    
+    Args:
+        timestamp: Seconds since the epoch
+        
+    Returns:
+        The same instant as a timezone-aware datetime
+    """
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """
+    Operations the API routes need from a chat storage backend.
+    
+    Every method is a coroutine so that backends can be awaited from
+    request handlers without blocking the event loop.
+    """
+    
+    async def store_message(
+        self, 
+        session_id: str, 
+        role: Literal["user", "assistant"], 
+        content: str,
+        model: Optional[str] = None,
+        truncated: bool = False
+    ) -> Optional["asyncio.Future[None]"]:
+        """
+        Append a message (and the model that wrote it) to a session and set its title on the first user message.
+        
+        Returns None once the message is stored. A backend that queues
+        writes instead returns a future resolved when it is committed.
+        Raises (or fails the future with) SessionNotFound if the session
+        does not exist.
+        """
+        ...
+    
+    async def store_messages(self, messages: List[MessageWrite]) -> None:
+        """Persist several messages in order, with the same title side effects, in as few commits as possible (SessionNotFound after committing the rest if some sessions do not exist)."""
+        ...
+    
+    async def get_chat_history(self, session_id: str) -> List[Dict[str, str]]:
+        """Return the session's messages, oldest first, as 'role'/'content' dicts."""
+        ...
+    
+    async def get_messages_page(
+        self, 
+        session_id: str, 
+        limit: int, 
+        before: Optional[str] = None
+    ) -> MessagePage:
+        """Return the newest `limit` messages older than `before` (ValueError if malformed)."""
+        ...
+    
+    async def list_user_sessions(
+        self, 
+        user_id: str, 
+        limit: int, 
+        cursor: Optional[str] = None
+    ) -> SessionPage:
+        """Return up to `limit` sessions, most recently active first, after `cursor` (ValueError if malformed)."""
+        ...
+    
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a session's denormalized metadata (title, title_locked, message_count, last_seq, created_at, last_message_at), or None."""
+        ...
+    
+    async def get_summary(self, session_id: str) -> Optional[SessionSummary]:
+        """Return the session's rolling summary, or None if it has none."""
+        ...
+    
+    async def store_summary(self, session_id: str, summary: SessionSummary) -> None:
+        """Save a rolling summary unless the stored one already covers more messages."""
+        ...
+    
+    async def create_session(
+        self, 
+        session_id: Optional[str] = None, 
+        user_id: Optional[str] = None
+    ) -> str:
+        """Create a session and return its ID."""
+        ...
+    
+    async def tombstone_session(self, session_id: str) -> None:
+        """Hide a session from its owner's listings ahead of deletion."""
+        ...
+    
+    async def delete_session(self, session_id: str) -> None:
+        """Delete a session and all of its messages."""
+        ...
+    
+    async def close(self) -> None:
+        """Release any resources held by the backend."""
+        ...
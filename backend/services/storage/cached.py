@@ -0,0 +1,145 @@
+# services/storage/cached.py
+"""
+Storage backend wrapper that serves chat history from the history cache.
+"""
+
+from typing import Any, List, Dict, Optional, Literal
+import asyncio
+from services.history_cache import HistoryCache
+from .base import StorageBackend, MessageWrite, MessagePage, SessionPage, SessionSummary
+
+
+class CachedStorage:
+    """
+    Read-through, write-through history cache in front of a backend.
+    
+    Note:
+        The first read of a session fills the cache; every stored message
+        is appended to it, so later turns read history without touching
+        the backend. The cache only sees this process's writes, so when
+        several workers share the backend (`validate`), each hit is checked
+        against the session's stored message count, one metadata read
+        instead of the whole transcript.
+    """
+    
+    def __init__(self, backend: StorageBackend, cache: HistoryCache, validate: bool = False):
+        """
+        Initialize the wrapper.
+        
+        Args:
+            backend: The storage backend to wrap
+            cache: Cache holding per-session transcripts
+            validate: Check cache hits against the backend's message count,
+                for backends other processes also write to
+        """
+        self.backend = backend
+        self.cache = cache
+        self.validate = validate
+    
+    async def store_message(
+        self, 
+        session_id: str, 
+        role: Literal["user", "assistant"], 
+        content: str,
+        model: Optional[str] = None,
+        truncated: bool = False
+    ) -> Optional["asyncio.Future[None]"]:
+        """Store a message and append it to the cached transcript."""
+        try:
+            written = await self.backend.store_message(session_id, role, content, model, truncated)
+        except Exception:
+            self.cache.invalidate(session_id)
+            raise
+        self.cache.append(session_id, {"role": role, "content": content})
+        
+        # A queued write that never lands must not linger in the transcript
+        if asyncio.isfuture(written):
+            written.add_done_callback(
+                lambda future: future.cancelled() or future.exception() is None or self.cache.invalidate(session_id)
+            )
+        return written
+    
+    async def store_messages(self, messages: List[MessageWrite]) -> None:
+        """Store several messages and append them to cached transcripts."""
+        for message in messages:
+            await self.store_message(message.session_id, message.role, message.content, message.model, message.truncated)
+    
+    async def get_chat_history(self, session_id: str) -> List[Dict[str, str]]:
+        """Return the cached transcript, reading the backend on a miss."""
+        history = self.cache.get(session_id)
+        if history is not None and self.validate:
+            # Another worker may have stored messages since the entry was filled
+            metadata = await self.backend.get_session_metadata(session_id)
+            if metadata is None or metadata["message_count"] != len(history):
+                self.cache.discard_stale(session_id)
+                history = None
+        if history is not None:
+            return history
+        
+        token = self.cache.reserve(session_id)
+        history = await self.backend.get_chat_history(session_id)
+        self.cache.fill(session_id, history, token)
+        return history
+    
+    async def get_messages_page(
+        self, 
+        session_id: str, 
+        limit: int, 
+        before: Optional[str] = None
+    ) -> MessagePage:
+        """Read a window of messages from the backend (cursors are backend-specific)."""
+        return await self.backend.get_messages_page(session_id, limit, before)
+    
+    async def list_user_sessions(
+        self, 
+        user_id: str, 
+        limit: int, 
+        cursor: Optional[str] = None
+    ) -> SessionPage:
+        """List the user's sessions from the backend."""
+        return await self.backend.list_user_sessions(user_id, limit, cursor)
+    
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Read session metadata from the backend."""
+        return await self.backend.get_session_metadata(session_id)
+    
+    async def get_summary(self, session_id: str) -> Optional[SessionSummary]:
+        """Read the rolling summary from the backend."""
+        return await self.backend.get_summary(session_id)
+    
+    async def store_summary(self, session_id: str, summary: SessionSummary) -> None:
+        """Save a rolling summary in the backend."""
+        await self.backend.store_summary(session_id, summary)
+    
+    async def create_session(
+        self, 
+        session_id: Optional[str] = None, 
+        user_id: Optional[str] = None
+    ) -> str:
+        """Create a session; freshly generated sessions start warm and empty."""
+        created_id = await self.backend.create_session(session_id=session_id, user_id=user_id)
+        
+        # A new session is known to be empty, so its first turn is a cache hit
+        if not session_id:
+            self.cache.fill(created_id, [], self.cache.reserve(created_id))
+        return created_id
+    
+    async def tombstone_session(self, session_id: str) -> None:
+        """Hide a session from listings ahead of deletion."""
+        await self.backend.tombstone_session(session_id)
+    
+    async def delete_session(self, session_id: str) -> None:
+        """Delete a session and drop its cached transcript."""
+        self.cache.invalidate(session_id)
+        await self.backend.delete_session(session_id)
+        self.cache.invalidate(session_id)
+    
+    async def flush(self) -> None:
+        """Wait until queued writes reach the backend (no-op without write-behind)."""
+        flush = getattr(self.backend, "flush", None)
+        if flush is not None:
+            await flush()
+    
+    async def close(self) -> None:
+        """Close the wrapped backend."""
+        await self.backend.close()
@@ -0,0 +1,297 @@
+# services/storage/memory.py
+"""
+In-memory storage backend for tests, load tests and local development.
+"""
+
+from typing import Any, List, Dict, Optional, Literal
+import itertools
+import time
+import uuid
+from utils.constants import DEFAULT_CHAT_TITLE, UNTITLED_CHAT
+from utils.titles import derive_chat_title
+from .base import MessageWrite, MessagePage, SessionNotFound, SessionPage, SessionSummary, encode_cursor, decode_cursor, epoch_to_datetime
+
+
+class InMemoryStorage:
+    """
+    Process-local storage backend.
+    
+    Note:
+        Lock-free by design: every method mutates plain dicts without
+        awaiting in between, so each call is atomic on the event loop.
+        Data is lost when the process exits.
+    """
+    
+    def __init__(self):
+        """Initialize empty session and message tables."""
+        self._sessions: Dict[str, Dict] = {}
+        self._messages: Dict[str, List[Dict[str, str]]] = {}
+        self._summaries: Dict[str, SessionSummary] = {}
+        self._order = itertools.count()
+    
+    async def store_message(
+        self, 
+        session_id: str, 
+        role: Literal["user", "assistant"], 
+        content: str,
+        model: Optional[str] = None,
+        truncated: bool = False
+    ) -> None:
+        """
+        Store a message in the chat session.
+        
+        Args:
+            session_id: The chat session ID
+            role: Either 'user' or 'assistant'
+            content: The message content
+            model: Model that generated the message, if any
+            truncated: Whether the message is a partial reply
+            
+        Raises:
+            SessionNotFound: If the session does not exist
+            
+        Side Effects:
+            - Updates the session's metadata, and its title on the first user message
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise SessionNotFound([session_id])
+        
+        message = {"role": role, "content": content}
+        if model:
+            message["model"] = model
+        if truncated:
+            message["truncated"] = True
+        self._messages.setdefault(session_id, []).append(message)
+        
+        session["message_count"] += 1
+        session["last_seq"] += 1
+        session["last_message_at"] = time.time()
+        session["activity_order"] = next(self._order)
+        
+        if role == "user" and not session["title_locked"]:
+            session["title"] = derive_chat_title(content)
+            session["title_locked"] = True
+    
+    async def store_messages(self, messages: List[MessageWrite]) -> None:
+        """
+        Store several messages in order.
+        
+        Args:
+            messages: Messages to persist
+            
+        Raises:
+            SessionNotFound: After storing the rest, if some sessions do not exist
+        """
+        missing = []
+        for message in messages:
+            if message.session_id not in self._sessions:
+                if message.session_id not in missing:
+                    missing.append(message.session_id)
+                continue
+            await self.store_message(message.session_id, message.role, message.content, message.model, message.truncated)
+        
+        if missing:
+            raise SessionNotFound(missing)
+    
+    async def get_chat_history(self, session_id: str) -> List[Dict[str, str]]:
+        """
+        Retrieve all messages for a chat session.
+        
+        Args:
+            session_id: The chat session ID
+            
+        Returns:
+            List of message dictionaries with 'role' and 'content'
+        """
+        return [
+            {"role": message["role"], "content": message["content"]}
+            for message in self._messages.get(session_id, [])
+        ]
+    
+    async def get_messages_page(
+        self, 
+        session_id: str, 
+        limit: int, 
+        before: Optional[str] = None
+    ) -> MessagePage:
+        """
+        Retrieve the newest window of messages older than a cursor.
+        
+        Args:
+            session_id: The chat session ID
+            limit: Maximum number of messages to return
+            before: Cursor from a previous window, if any
+            
+        Returns:
+            MessagePage with messages oldest first and the next cursor
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        messages = self._messages.get(session_id, [])
+        end = decode_cursor(before, int)[0] if before else len(messages)
+        start = max(0, end - limit)
+        
+        # Positions are list indexes, which appends never shift
+        return MessagePage(
+            [dict(message) for message in messages[start:end]],
+            start > 0,
+            encode_cursor([start]) if start > 0 else None
+        )
+    
+    async def list_user_sessions(
+        self, 
+        user_id: str, 
+        limit: int, 
+        cursor: Optional[str] = None
+    ) -> SessionPage:
+        """
+        List one page of chat sessions for a specific user, most recently active first.
+        
+        Args:
+            user_id: The user's ID
+            limit: Maximum number of sessions to return
+            cursor: Cursor from the previous page, if any
+            
+        Returns:
+            SessionPage with session summary dicts and the next cursor
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        owned = sorted(
+            (
+                ((data["last_message_at"], data["activity_order"]), session_id, data)
+                for session_id, data in self._sessions.items()
+                if data.get("user_id") == user_id
+            ),
+            key=lambda item: item[0],
+            reverse=True
+        )
+        
+        if cursor:
+            after = tuple(decode_cursor(cursor, (int, float), int))
+            owned = [item for item in owned if item[0] < after]
+        
+        page = owned[:limit]
+        next_cursor = encode_cursor(list(page[-1][0])) if len(owned) > limit else None
+        
+        return SessionPage(
+            [
+                {
+                    "session_id": session_id,
+                    "title": data.get("title", UNTITLED_CHAT),
+                    "message_count": data["message_count"],
+                    "last_message_at": epoch_to_datetime(data["last_message_at"])
+                }
+                for _, session_id, data in page
+            ],
+            next_cursor
+        )
+    
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a session's metadata without touching its messages.
+        
+        Args:
+            session_id: The chat session ID
+            
+        Returns:
+            Metadata dictionary, or None if the session does not exist
+        """
+        data = self._sessions.get(session_id)
+        if data is None:
+            return None
+        
+        return {
+            "session_id": session_id,
+            "title": data["title"],
+            "title_locked": data["title_locked"],
+            "message_count": data["message_count"],
+            "last_seq": data["last_seq"],
+            "created_at": epoch_to_datetime(data["created_at"]),
+            "last_message_at": epoch_to_datetime(data["last_message_at"])
+        }
+    
+    async def get_summary(self, session_id: str) -> Optional[SessionSummary]:
+        """
+        Read a session's rolling summary.
+        
+        Args:
+            session_id: The chat session ID
+            
+        Returns:
+            The stored summary, or None if the session has none
+        """
+        return self._summaries.get(session_id)
+    
+    async def store_summary(self, session_id: str, summary: SessionSummary) -> None:
+        """
+        Save a session's rolling summary unless a newer one is stored.
+        
+        Args:
+            session_id: The chat session ID
+            summary: Summary text and the number of messages it covers
+        """
+        current = self._summaries.get(session_id)
+        if current is None or summary.covered > current.covered:
+            self._summaries[session_id] = summary
+    
+    async def create_session(
+        self, 
+        session_id: Optional[str] = None, 
+        user_id: Optional[str] = None
+    ) -> str:
+        """
+        Create a new chat session.
+        
+        Args:
+            session_id: Optional session ID, generates UUID if not provided
+            user_id: Optional user ID for session ownership
+            
+        Returns:
+            The session ID
+        """
+        if not session_id:
+            session_id = str(uuid.uuid4())
+        
+        now = time.time()
+        self._sessions[session_id] = {
+            "created_at": now,
+            "title": DEFAULT_CHAT_TITLE,
+            "title_locked": False,
+            "message_count": 0,
+            "last_seq": 0,
+            "last_message_at": now,
+            "activity_order": next(self._order),
+            "user_id": user_id
+        }
+        
+        return session_id
+    
+    async def tombstone_session(self, session_id: str) -> None:
+        """
+        Hide a session from listings until it is deleted.
+        
+        Args:
+            session_id: The chat session ID
+        """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session["deleted_user_id"] = session.pop("user_id", None)
+    
+    async def delete_session(self, session_id: str) -> None:
+        """
+        Delete a chat session and all its messages.
+        
+        Args:
+            session_id: The chat session ID to delete
+        """
+        self._messages.pop(session_id, None)
+        self._summaries.pop(session_id, None)
+        self._sessions.pop(session_id, None)
+    
+    async def close(self) -> None:
+        """Nothing to release for the in-memory backend."""
+
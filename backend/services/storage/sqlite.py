@@ -0,0 +1,460 @@
+# services/storage/sqlite.py
+"""
+SQLite storage backend for single-node deployments.
+"""
+
+from typing import List, Dict, Optional, Literal, Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import sqlite3
+import time
+import uuid
+from utils.constants import DEFAULT_CHAT_TITLE, UNTITLED_CHAT
+from utils.titles import derive_chat_title
+from .base import MessageWrite, MessagePage, SessionNotFound, SessionPage, SessionSummary, encode_cursor, decode_cursor, epoch_to_datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    deleted_user_id TEXT,
+    title_locked INTEGER NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    last_message_at REAL,
+    summary TEXT,
+    summary_covers INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    model TEXT,
+    truncated INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+# Columns added to chats after the first release, with their definitions
+CHAT_COLUMN_MIGRATIONS = {
+    "deleted_user_id": "TEXT",
+    "title_locked": "INTEGER NOT NULL DEFAULT 0",
+    "message_count": "INTEGER NOT NULL DEFAULT 0",
+    "last_seq": "INTEGER NOT NULL DEFAULT 0",
+    "last_message_at": "REAL",
+    "summary": "TEXT",
+    "summary_covers": "INTEGER NOT NULL DEFAULT 0",
+}
+
+# Columns added to messages after the first release, with their definitions
+MESSAGE_COLUMN_MIGRATIONS = {
+    "model": "TEXT",
+    "truncated": "INTEGER NOT NULL DEFAULT 0",
+}
+
+# Fills denormalized metadata for chats that predate it
+BACKFILL_METADATA = """
+UPDATE chats SET
+    message_count = (SELECT COUNT(*) FROM messages m WHERE m.session_id = chats.session_id),
+    last_seq = COALESCE((SELECT MAX(seq) FROM messages m WHERE m.session_id = chats.session_id), 0),
+    last_message_at = COALESCE(
+        (SELECT MAX(created_at) FROM messages m WHERE m.session_id = chats.session_id),
+        created_at
+    ),
+    title_locked = (title != ?)
+WHERE last_message_at IS NULL
+"""
+
+
+class SQLiteStorage:
+    """
+    SQLite implementation of the storage backend protocol.
+    
+    Note:
+        The database runs in WAL mode with synchronous=NORMAL. All queries
+        go through a single worker thread, which serializes writes and keeps
+        the event loop free while SQLite touches the disk.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Initialize the SQLite backend.
+        
+        Args:
+            path: Database file path (':memory:' for a throwaway database)
+        """
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._conn: Optional[sqlite3.Connection] = None
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open the connection and create the schema on first use (worker thread only)."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            self._conn = conn
+            logger.info(f"SQLite storage opened at {self.path}")
+        return self._conn
+    
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """Add missing columns to databases created by older versions (worker thread only)."""
+        with conn:
+            for table, migrations in (("chats", CHAT_COLUMN_MIGRATIONS), ("messages", MESSAGE_COLUMN_MIGRATIONS)):
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for name, definition in migrations.items():
+                    if name not in columns:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            conn.execute(BACKFILL_METADATA, (DEFAULT_CHAT_TITLE,))
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chats_user_activity "
+                "ON chats (user_id, last_message_at)"
+            )
+    
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run fn(connection) on the worker thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect()))
+    
+    async def store_message(
+        self, 
+        session_id: str, 
+        role: Literal["user", "assistant"], 
+        content: str,
+        model: Optional[str] = None,
+        truncated: bool = False
+    ) -> None:
+        """
+        Store a message in the chat session.
+        
+        Args:
+            session_id: The chat session ID
+            role: Either 'user' or 'assistant'
+            content: The message content
+            model: Model that generated the message, if any
+            truncated: Whether the message is a partial reply
+            
+        Raises:
+            SessionNotFound: If the session does not exist
+            
+        Side Effects:
+            - Updates chat title if it's the first user message
+        """
+        await self._run(lambda conn: self._insert_messages(conn, [
+            MessageWrite(session_id, role, content, None, model, truncated)
+        ]))
+    
+    async def store_messages(self, messages: List[MessageWrite]) -> None:
+        """
+        Store several messages in one transaction.
+        
+        Args:
+            messages: Messages to persist, in order
+            
+        Raises:
+            SessionNotFound: After storing the rest, if some sessions do not exist
+        """
+        await self._run(lambda conn: self._insert_messages(conn, messages))
+    
+    @staticmethod
+    def _insert_messages(conn: sqlite3.Connection, messages: List[MessageWrite]) -> None:
+        """Insert messages and update chat metadata and titles (worker thread only)."""
+        missing = []
+        with conn:
+            for message in messages:
+                created_at = message.timestamp.timestamp() if message.timestamp else time.time()
+                seq = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE session_id = ?",
+                    (message.session_id,)
+                ).fetchone()[0]
+                # Only messages of an existing chat are inserted
+                updated = conn.execute(
+                    "UPDATE chats SET message_count = message_count + 1, last_seq = ?, "
+                    "last_message_at = ? WHERE session_id = ?",
+                    (seq, created_at, message.session_id)
+                ).rowcount
+                if not updated:
+                    if message.session_id not in missing:
+                        missing.append(message.session_id)
+                    continue
+                conn.execute(
+                    "INSERT INTO messages (session_id, seq, role, content, created_at, model, truncated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        message.session_id, seq, message.role, message.content,
+                        created_at, message.model, int(message.truncated)
+                    )
+                )
+                if message.role == "user":
+                    conn.execute(
+                        "UPDATE chats SET title = ?, title_locked = 1 "
+                        "WHERE session_id = ? AND title_locked = 0",
+                        (derive_chat_title(message.content), message.session_id)
+                    )
+        
+        if missing:
+            raise SessionNotFound(missing)
+    
+    async def get_chat_history(self, session_id: str) -> List[Dict[str, str]]:
+        """
+        Retrieve all messages for a chat session.
+        
+        Args:
+            session_id: The chat session ID
+            
+        Returns:
+            List of message dictionaries with 'role' and 'content'
+        """
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq",
+            (session_id,)
+        ).fetchall())
+        
+        return [{"role": role, "content": content} for role, content in rows]
+    
+    async def get_messages_page(
+        self, 
+        session_id: str, 
+        limit: int, 
+        before: Optional[str] = None
+    ) -> MessagePage:
+        """
+        Retrieve the newest window of messages older than a cursor.
+        
+        Args:
+            session_id: The chat session ID
+            limit: Maximum number of messages to return
+            before: Cursor from a previous window, if any
+            
+        Returns:
+            MessagePage with messages oldest first and the next cursor
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        before_seq = decode_cursor(before, int)[0] if before else None
+        
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT seq, role, content, model, truncated FROM messages "
+            "WHERE session_id = ? AND (? IS NULL OR seq < ?) "
+            "ORDER BY seq DESC LIMIT ?",
+            (session_id, before_seq, before_seq, limit + 1)
+        ).fetchall())
+        
+        has_more = len(rows) > limit
+        window = list(reversed(rows[:limit]))
+        
+        return MessagePage(
+            [
+                {
+                    "role": role,
+                    "content": content,
+                    **({"model": model} if model else {}),
+                    **({"truncated": True} if truncated else {})
+                }
+                for _, role, content, model, truncated in window
+            ],
+            has_more,
+            encode_cursor([window[0][0]]) if has_more else None
+        )
+    
+    async def list_user_sessions(
+        self, 
+        user_id: str, 
+        limit: int, 
+        cursor: Optional[str] = None
+    ) -> SessionPage:
+        """
+        List one page of chat sessions for a specific user, most recently active first.
+        
+        Args:
+            user_id: The user's ID
+            limit: Maximum number of sessions to return
+            cursor: Cursor from the previous page, if any
+            
+        Returns:
+            SessionPage with session summary dicts and the next cursor
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        columns = "session_id, title, message_count, last_message_at, rowid"
+        if cursor:
+            last_message_at, rowid = decode_cursor(cursor, (int, float), int)
+            sql = (
+                f"SELECT {columns} FROM chats "
+                "WHERE user_id = ? AND (last_message_at, rowid) < (?, ?) "
+                "ORDER BY last_message_at DESC, rowid DESC LIMIT ?"
+            )
+            params = (user_id, last_message_at, rowid, limit + 1)
+        else:
+            sql = (
+                f"SELECT {columns} FROM chats "
+                "WHERE user_id = ? ORDER BY last_message_at DESC, rowid DESC LIMIT ?"
+            )
+            params = (user_id, limit + 1)
+        
+        rows = await self._run(lambda conn: conn.execute(sql, params).fetchall())
+        page = rows[:limit]
+        next_cursor = encode_cursor(list(page[-1][3:])) if len(rows) > limit else None
+        
+        return SessionPage(
+            [
+                {
+                    "session_id": session_id,
+                    "title": title or UNTITLED_CHAT,
+                    "message_count": message_count,
+                    "last_message_at": epoch_to_datetime(last_message_at)
+                }
+                for session_id, title, message_count, last_message_at, _ in page
+            ],
+            next_cursor
+        )
+    
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a session's metadata without touching its messages.
+        
+        Args:
+            session_id: The chat session ID
+            
+        Returns:
+            Metadata dictionary, or None if the session does not exist
+        """
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT title, title_locked, message_count, last_seq, created_at, last_message_at "
+            "FROM chats WHERE session_id = ?",
+            (session_id,)
+        ).fetchone())
+        
+        if row is None:
+            return None
+        
+        title, title_locked, message_count, last_seq, created_at, last_message_at = row
+        return {
+            "session_id": session_id,
+            "title": title,
+            "title_locked": bool(title_locked),
+            "message_count": message_count,
+            "last_seq": last_seq,
+            "created_at": epoch_to_datetime(created_at),
+            "last_message_at": epoch_to_datetime(last_message_at)
+        }
+    
+    async def get_summary(self, session_id: str) -> Optional[SessionSummary]:
+        """
+        Read a session's rolling summary.
+        
+        Args:
+            session_id: The chat session ID
+            
+        Returns:
+            The stored summary, or None if the session has none
+        """
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT summary, summary_covers FROM chats WHERE session_id = ? AND summary IS NOT NULL",
+            (session_id,)
+        ).fetchone())
+        
+        return SessionSummary(*row) if row else None
+    
+    async def store_summary(self, session_id: str, summary: SessionSummary) -> None:
+        """
+        Save a session's rolling summary unless a newer one is stored.
+        
+        Args:
+            session_id: The chat session ID
+            summary: Summary text and the number of messages it covers
+        """
+        def write(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute(
+                    "UPDATE chats SET summary = ?, summary_covers = ? "
+                    "WHERE session_id = ? AND summary_covers < ?",
+                    (summary.text, summary.covered, session_id, summary.covered)
+                )
+        
+        await self._run(write)
+    
+    async def create_session(
+        self, 
+        session_id: Optional[str] = None, 
+        user_id: Optional[str] = None
+    ) -> str:
+        """
+        Create a new chat session.
+        
+        Args:
+            session_id: Optional session ID, generates UUID if not provided
+            user_id: Optional user ID for session ownership
+            
+        Returns:
+            The session ID
+        """
+        if not session_id:
+            session_id = str(uuid.uuid4())
+        
+        def write(conn: sqlite3.Connection) -> None:
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO chats "
+                    "(session_id, user_id, title, created_at, last_message_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session_id, user_id, DEFAULT_CHAT_TITLE, now, now)
+                )
+        
+        await self._run(write)
+        return session_id
+    
+    async def tombstone_session(self, session_id: str) -> None:
+        """
+        Hide a session from listings until it is deleted.
+        
+        Args:
+            session_id: The chat session ID
+        """
+        def write(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute(
+                    "UPDATE chats SET deleted_user_id = user_id, user_id = NULL "
+                    "WHERE session_id = ? AND user_id IS NOT NULL",
+                    (session_id,)
+                )
+        
+        await self._run(write)
+    
+    async def delete_session(self, session_id: str) -> None:
+        """
+        Delete a chat session and all its messages.
+        
+        Args:
+            session_id: The chat session ID to delete
+        """
+        def write(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                conn.execute("DELETE FROM chats WHERE session_id = ?", (session_id,))
+        
+        await self._run(write)
+    
+    async def close(self) -> None:
+        """Close the connection and stop the worker thread."""
+        def shutdown(conn: sqlite3.Connection) -> None:
+            conn.close()
+            self._conn = None
+        
+        if self._conn is not None:
+            await self._run(shutdown)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,342 @@
+# services/storage/write_behind.py
+"""
+Write-behind queue that batches message persistence off the request path.
+"""
+
+from typing import Any, Deque, List, Dict, Optional, Literal
+from collections import deque
+import asyncio
+from utils.constants import LOG_MESSAGES_DROPPED
+from utils.timestamps import MessageClock
+from .base import StorageBackend, MessageWrite, MessagePage, SessionNotFound, SessionPage, SessionSummary
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Attempts made to drain the queue when the app shuts down
+SHUTDOWN_FLUSH_ATTEMPTS = 3
+
+
+class WriteBehindStorage:
+    """
+    Storage wrapper that queues message writes and commits them in batches.
+    
+    Note:
+        `store_message` only enqueues, so callers never wait on the backend;
+        it returns a future that resolves once the message is committed,
+        for callers that must know. A background worker commits the queue via `backend.store_messages`
+        when it reaches `max_batch` messages or every `flush_interval`
+        seconds. Commits run one at a time in FIFO order, which keeps
+        per-session ordering. A failed commit is retried with exponential
+        backoff; after `max_attempts` failures its batch is moved to
+        `dead_letters` so it stops blocking the writes queued behind it;
+        only the newest `max_dead_letters` are kept there.
+        Messages for sessions that no longer exist are dropped at once
+        (their futures fail with SessionNotFound) and never retried.
+        Reads and deletes of a session with queued writes flush first, so
+        they see the session's own writes. If that flush fails, a read is
+        served from the backend anyway and the worker keeps retrying.
+    """
+    
+    def __init__(
+        self,
+        backend: StorageBackend,
+        max_batch: int,
+        flush_interval: float,
+        max_attempts: int = 5,
+        retry_backoff: float = 0.1,
+        max_retry_backoff: float = 5.0,
+        max_dead_letters: int = 1000
+    ):
+        """
+        Initialize the queue.
+        
+        Args:
+            backend: The storage backend to write to
+            max_batch: Queue length that triggers an immediate flush
+            flush_interval: Maximum seconds a message waits before a flush
+            max_attempts: Failed commits of one batch before it is dead-lettered
+            retry_backoff: Seconds before the first retry, doubled per attempt
+            max_retry_backoff: Longest wait between retries
+            max_dead_letters: Dead-lettered messages kept, oldest discarded first
+        """
+        self.backend = backend
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.dead_letters: Deque[MessageWrite] = deque(maxlen=max_dead_letters)
+        self._attempts = 0
+        self._pending: List[MessageWrite] = []
+        self._pending_by_session: Dict[str, int] = {}
+        self._written: Dict[MessageWrite, asyncio.Future] = {}
+        self._clock = MessageClock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.commits = 0
+        self.messages_written = 0
+        self.failures = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.dead_letters_discarded = 0
+    
+    async def store_message(
+        self,
+        session_id: str,
+        role: Literal["user", "assistant"],
+        content: str,
+        model: Optional[str] = None,
+        truncated: bool = False
+    ) -> "asyncio.Future[None]":
+        """
+        Queue a message for the next batch commit.
+        
+        Returns:
+            A future resolved once the message is committed, or failed if
+            it is dead-lettered or dropped on shutdown. Awaiting it is
+            optional; transient commit failures are retried first.
+        """
+        self._ensure_worker()
+        
+        message = MessageWrite(session_id, role, content, self._clock.now(), model, truncated)
+        self._pending.append(message)
+        self._pending_by_session[session_id] = self._pending_by_session.get(session_id, 0) + 1
+        written = self._written[message] = self._loop.create_future()
+        # Callers that don't await it never see its error (it is logged instead)
+        written.add_done_callback(lambda future: future.cancelled() or future.exception())
+        
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+        return written
+    
+    async def store_messages(self, messages: List[MessageWrite]) -> None:
+        """Queue several messages, keeping their order."""
+        for message in messages:
+            await self.store_message(message.session_id, message.role, message.content, message.model, message.truncated)
+    
+    async def flush(self) -> None:
+        """
+        Commit everything queued so far.
+        
+        Raises:
+            Exception: If the backend commit fails; the messages stay queued
+        """
+        self._bind_loop()
+        
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:len(batch)]
+                
+                try:
+                    await self.backend.store_messages(batch)
+                except SessionNotFound as e:
+                    # The other sessions' messages were committed
+                    batch = self._drop_missing(batch, e)
+                except Exception:
+                    # Put the batch back in front to preserve ordering
+                    self._pending[:0] = batch
+                    self.failures += 1
+                    self._attempts += 1
+                    raise
+                
+                self._settle(batch)
+                self._attempts = 0
+                self.commits += 1
+                self.messages_written += len(batch)
+    
+    async def get_chat_history(self, session_id: str) -> List[Dict[str, str]]:
+        """Read history, flushing the session's queued writes first."""
+        if session_id in self._pending_by_session:
+            await self._flush_before_read()
+        return await self.backend.get_chat_history(session_id)
+    
+    async def get_messages_page(
+        self,
+        session_id: str,
+        limit: int,
+        before: Optional[str] = None
+    ) -> MessagePage:
+        """Read a window of messages, flushing the session's queued writes first."""
+        if session_id in self._pending_by_session:
+            await self._flush_before_read()
+        return await self.backend.get_messages_page(session_id, limit, before)
+    
+    async def list_user_sessions(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> SessionPage:
+        """List sessions, flushing first so queued title updates are visible."""
+        if self._pending:
+            await self._flush_before_read()
+        return await self.backend.list_user_sessions(user_id, limit, cursor)
+    
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Read session metadata, flushing the session's queued writes first."""
+        if session_id in self._pending_by_session:
+            await self._flush_before_read()
+        return await self.backend.get_session_metadata(session_id)
+    
+    async def get_summary(self, session_id: str) -> Optional[SessionSummary]:
+        """Read the rolling summary (summaries are not queued)."""
+        return await self.backend.get_summary(session_id)
+    
+    async def store_summary(self, session_id: str, summary: SessionSummary) -> None:
+        """Save a rolling summary directly in the backend."""
+        await self.backend.store_summary(session_id, summary)
+    
+    async def create_session(
+        self,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> str:
+        """Create a session in the backend."""
+        return await self.backend.create_session(session_id=session_id, user_id=user_id)
+    
+    async def tombstone_session(self, session_id: str) -> None:
+        """Hide a session from listings ahead of deletion."""
+        await self.backend.tombstone_session(session_id)
+    
+    async def delete_session(self, session_id: str) -> None:
+        """Delete a session after its queued writes have landed."""
+        if session_id in self._pending_by_session:
+            await self.flush()
+        await self.backend.delete_session(session_id)
+    
+    async def close(self) -> None:
+        """Stop the worker, drain the queue and close the backend."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        
+        for attempt in range(1, SHUTDOWN_FLUSH_ATTEMPTS + 1):
+            try:
+                await self.flush()
+                break
+            except Exception as e:
+                logger.error(f"Write-behind flush failed on shutdown (attempt {attempt}): {str(e)}")
+        
+        if self._pending:
+            logger.error(f"Dropping {len(self._pending)} unpersisted messages on shutdown")
+            self._settle(self._pending, RuntimeError("Dropped on shutdown"))
+            self._pending = []
+        
+        await self.backend.close()
+    
+    def stats(self) -> Dict[str, int]:
+        """Return queue depth, commit counters and dead-lettered messages."""
+        return {
+            "pending": len(self._pending),
+            "commits": self.commits,
+            "messages_written": self.messages_written,
+            "failures": self.failures,
+            "dead_lettered": self.dead_lettered,
+            "dead_letters_discarded": self.dead_letters_discarded,
+            "dropped": self.dropped,
+        }
+    
+    async def _flush_before_read(self) -> None:
+        """Flush for a read; on failure the read goes ahead without the queued writes."""
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Write-behind flush before read failed, reading without queued writes: {str(e)}")
+    
+    async def _dead_letter(self, error: Exception) -> None:
+        """Move the batch at the head of the queue, which keeps failing, to dead_letters."""
+        async with self._lock:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:len(batch)]
+            self._settle(batch, error)
+            self._attempts = 0
+            self.dead_lettered += len(batch)
+            self.dead_letters_discarded += max(0, len(self.dead_letters) + len(batch) - self.dead_letters.maxlen)
+            self.dead_letters.extend(batch)
+        
+        sessions = sorted({message.session_id for message in batch})
+        logger.error(
+            f"Write-behind dead-lettered {len(batch)} messages for sessions {', '.join(sessions)} "
+            f"after {self.max_attempts} failed commits: {str(error)}"
+        )
+    
+    def _drop_missing(self, batch: List[MessageWrite], error: SessionNotFound) -> List[MessageWrite]:
+        """Fail a batch's messages for missing sessions and return the committed rest."""
+        missing = set(error.session_ids)
+        dropped = [message for message in batch if message.session_id in missing]
+        self._settle(dropped, error)
+        self.dropped += len(dropped)
+        
+        for session_id in error.session_ids:
+            count = sum(message.session_id == session_id for message in dropped)
+            logger.warning(LOG_MESSAGES_DROPPED.format(count=count, session_id=session_id))
+        return [message for message in batch if message.session_id not in missing]
+    
+    def _settle(self, batch: List[MessageWrite], error: Optional[Exception] = None) -> None:
+        """Take a batch off the books: committed, or failed with `error`."""
+        for message in batch:
+            remaining = self._pending_by_session[message.session_id] - 1
+            if remaining:
+                self._pending_by_session[message.session_id] = remaining
+            else:
+                del self._pending_by_session[message.session_id]
+            
+            written = self._written.pop(message, None)
+            if written is not None and not written.done():
+                if error is None:
+                    written.set_result(None)
+                else:
+                    written.set_exception(error)
+    
+    def _bind_loop(self) -> None:
+        """Create the lock and wake event for the running loop if it changed."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._wake = asyncio.Event()
+            self._worker = None
+            # Futures of a previous loop can no longer be awaited
+            self._written.clear()
+    
+    def _ensure_worker(self) -> None:
+        """Start the flush worker on the running loop if it is not running."""
+        self._bind_loop()
+        if self._worker is None or self._worker.done():
+            self._worker = self._loop.create_task(self._run())
+    
+    async def _run(self) -> None:
+        """Flush on a size trigger or every flush_interval seconds, backing off after failures."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            
+            if not self._pending:
+                continue
+            
+            try:
+                await self.flush()
+            except Exception as e:
+                if self._attempts >= self.max_attempts:
+                    await self._dead_letter(e)
+                    self._wake.set()
+                    continue
+                
+                delay = min(self.retry_backoff * 2 ** (self._attempts - 1), self.max_retry_backoff)
+                logger.error(
+                    f"Write-behind flush failed (attempt {self._attempts}), "
+                    f"retrying in {delay:.2f}s: {str(e)}"
+                )
+                await asyncio.sleep(delay)
+                self._wake.set()
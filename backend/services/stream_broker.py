@@ -0,0 +1,341 @@
+# services/stream_broker.py
+"""
+Fan-out of live replies to every request that wants them.
+
+The first request for a reply owns its generation; a second tab, another
+device or a reconnect racing the original attaches to the live chunks
+instead of starting another completion (and storing another reply).
+
+On the owning worker, subscribers read the generation's chunk buffer
+directly. The owner also relays the reply over pub/sub, so subscribers on
+other workers can follow it: they ask for a snapshot of the chunks so far,
+then apply chunk messages by index from a bounded per-subscriber queue. A
+subscriber that falls behind and overflows its queue asks for a fresh
+snapshot rather than holding up the others.
+
+Once a reply is done its owner stops answering the session's snapshot
+requests, so the next turn in the session finds nobody listening and
+does not wait on a sync. It keeps answering requests to resume that
+particular reply for a while, on a channel of their own.
+"""
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+from config.settings import settings
+from services.generation import Generation
+from services.pubsub import PubSub, Subscription, pubsub
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StreamLost(Exception):
+    """The worker generating a followed reply stopped relaying it."""
+
+
+def reply_channel(session_id: str) -> str:
+    """Channel carrying a session's live reply."""
+    return f"chat:{session_id}"
+
+
+def sync_channel(session_id: str) -> str:
+    """Channel on which subscribers ask the owner for a snapshot."""
+    return f"chat:{session_id}:sync"
+
+
+def resume_channel(session_id: str, stream_id: str) -> str:
+    """Channel on which reconnects ask for a snapshot of one reply, live or just finished."""
+    return f"chat:{session_id}:resume:{stream_id}"
+
+
+class _Follower:
+    """Reassembles a relayed reply from snapshots and chunk messages."""
+    
+    def __init__(self, stream_id: Optional[str] = None):
+        self.stream_id = stream_id
+        self.user_input: Optional[str] = None
+        self.synced = False
+        self.next_index = 0
+        self.count: Optional[int] = None
+        self.error: Optional[str] = None
+        self._pending: Dict[int, str] = {}
+    
+    @property
+    def finished(self) -> bool:
+        return self.synced and self.count is not None and self.next_index >= self.count
+    
+    def apply(self, message: Dict[str, Any]) -> None:
+        # A lingering owner answering a resume of an earlier reply in the
+        # session publishes on the same channel
+        if self.stream_id is not None and message["stream_id"] != self.stream_id:
+            return
+        kind = message["type"]
+        if kind == "snapshot":
+            self.synced = True
+            self.stream_id = message["stream_id"]
+            self.user_input = message["user_input"]
+            for index, chunk in enumerate(message["chunks"]):
+                self._add(index, chunk)
+            if message["done"]:
+                self._finish(len(message["chunks"]), message["error"])
+        elif kind == "chunk":
+            self._add(message["index"], message["data"])
+        elif kind == "done":
+            self._finish(message["count"], message["error"])
+    
+    def ready(self) -> List[Tuple[int, str]]:
+        """Pop the chunks that continue the reply without a gap."""
+        ready = []
+        while self.synced and self.next_index in self._pending:
+            ready.append((self.next_index, self._pending.pop(self.next_index)))
+            self.next_index += 1
+        return ready
+    
+    def _add(self, index: int, chunk: str) -> None:
+        if index >= self.next_index:
+            self._pending[index] = chunk
+    
+    def _finish(self, count: int, error: Optional[str]) -> None:
+        self.count = count
+        self.error = error
+
+
+class StreamBroker:
+    """
+    Lets any number of requests share one live reply per session.
+    
+    Note:
+        Local subscribers count as readers of the generation, so the reply
+        keeps generating while any of them is connected. Subscribers on
+        other workers only follow the relay.
+    """
+    
+    def __init__(
+        self,
+        pubsub: PubSub,
+        queue_size: int,
+        sync_timeout: float,
+        idle_timeout: float,
+        linger: float
+    ):
+        """
+        Initialize the broker.
+        
+        Args:
+            pubsub: Channels shared with the other workers' brokers
+            queue_size: Relay messages buffered per remote subscriber
+            sync_timeout: Seconds to wait for another worker's snapshot
+            idle_timeout: Seconds a remote subscriber waits for the next
+                message before giving the reply up as lost
+            linger: Seconds the owner keeps answering requests to resume
+                a reply after it is done, for reconnects still catching up
+        """
+        self.pubsub = pubsub
+        self.queue_size = queue_size
+        self.sync_timeout = sync_timeout
+        self.idle_timeout = idle_timeout
+        self.linger = linger
+        self._live: Dict[str, Tuple[str, Generation]] = {}
+        self._relays: Set[asyncio.Task] = set()
+        self.owned = 0
+        self.local_subscribers = 0
+        self.remote_subscribers = 0
+        self.resyncs = 0
+    
+    def own(self, session_id: str, user_input: str, generation: Generation) -> None:
+        """
+        Register the generation producing a session's reply and relay it.
+        
+        Args:
+            session_id: The chat session ID
+            user_input: The message being answered
+            generation: The running generation
+        """
+        self._live[session_id] = (user_input, generation)
+        self.owned += 1
+        relay = asyncio.get_running_loop().create_task(self._relay(session_id, user_input, generation))
+        self._relays.add(relay)
+        relay.add_done_callback(self._relays.discard)
+    
+    async def attach(
+        self,
+        session_id: str,
+        user_input: Optional[str] = None,
+        stream_id: Optional[str] = None
+    ) -> Optional[AsyncIterator[Tuple[str, str]]]:
+        """
+        Subscribe to a session's live reply, on this worker or another.
+        
+        Args:
+            session_id: The chat session ID
+            user_input: Only attach to a reply to this message (None for
+                whatever the session is generating)
+            stream_id: Only attach to this reply, as a reconnect resuming
+                it does; it may also have finished on another worker
+                within the last `linger` seconds
+                
+        Returns:
+            The reply from its first chunk as (event id, chunk) pairs, or
+            None if nothing matching is generating
+        """
+        live = self._live.get(session_id)
+        if live is not None and not live[1].done:
+            if user_input is not None and live[0] != user_input:
+                return None
+            if stream_id is not None and live[1].id != stream_id:
+                return None
+            self.local_subscribers += 1
+            return live[1].events()
+        
+        return await self._attach_remote(session_id, user_input, stream_id)
+    
+    async def close(self) -> None:
+        """Stop relaying replies."""
+        relays = list(self._relays)
+        for relay in relays:
+            relay.cancel()
+        await asyncio.gather(*relays, return_exceptions=True)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return live reply and subscriber counts."""
+        return {
+            "live": len(self._live),
+            "owned": self.owned,
+            "local_subscribers": self.local_subscribers,
+            "remote_subscribers": self.remote_subscribers,
+            "resyncs": self.resyncs,
+        }
+    
+    async def _attach_remote(
+        self,
+        session_id: str,
+        user_input: Optional[str],
+        stream_id: Optional[str]
+    ) -> Optional[AsyncIterator[Tuple[str, str]]]:
+        requests = resume_channel(session_id, stream_id) if stream_id is not None else sync_channel(session_id)
+        subscription = await self.pubsub.subscribe(reply_channel(session_id), self.queue_size)
+        follower = _Follower(stream_id)
+        try:
+            # Nobody listening on the channel means nothing matching is live anywhere
+            if await self.pubsub.publish(requests, {"type": "sync"}):
+                await asyncio.wait_for(self._sync(subscription, follower), self.sync_timeout)
+        except asyncio.TimeoutError:
+            pass
+        
+        if (
+            not follower.synced
+            or (stream_id is None and follower.count is not None)
+            or (user_input is not None and follower.user_input != user_input)
+        ):
+            await subscription.close()
+            return None
+        
+        self.remote_subscribers += 1
+        return self._follow(session_id, subscription, follower)
+    
+    async def _sync(self, subscription: Subscription, follower: _Follower) -> None:
+        while not follower.synced:
+            follower.apply(await subscription.get())
+    
+    async def _follow(
+        self,
+        session_id: str,
+        subscription: Subscription,
+        follower: _Follower
+    ) -> AsyncIterator[Tuple[str, str]]:
+        try:
+            while True:
+                for index, chunk in follower.ready():
+                    yield f"{follower.stream_id}:{index}", chunk
+                if follower.finished:
+                    break
+                
+                if subscription.overflowed:
+                    # Dropped messages are recovered from a fresh snapshot,
+                    # asked for as a resume so it still works once the reply is done
+                    subscription.overflowed = False
+                    self.resyncs += 1
+                    request = resume_channel(session_id, follower.stream_id)
+                    if not await self.pubsub.publish(request, {"type": "sync"}):
+                        raise StreamLost(f"Lost the live reply for session {session_id}")
+                
+                try:
+                    message = await asyncio.wait_for(subscription.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    raise StreamLost(f"Lost the live reply for session {session_id}")
+                follower.apply(message)
+        finally:
+            await subscription.close()
+        
+        if follower.error is not None:
+            raise StreamLost(follower.error)
+    
+    async def _relay(self, session_id: str, user_input: str, generation: Generation) -> None:
+        """Publish the reply's chunks, answering snapshot requests until it is done and resumes for `linger` after."""
+        channel = reply_channel(session_id)
+        requests = await self.pubsub.subscribe(sync_channel(session_id), self.queue_size)
+        resumes = await self.pubsub.subscribe(resume_channel(session_id, generation.id), self.queue_size)
+        
+        def snapshot() -> Dict[str, Any]:
+            return {
+                "type": "snapshot",
+                "stream_id": generation.id,
+                "user_input": user_input,
+                "chunks": list(generation.chunks),
+                "done": generation.done,
+                "error": str(generation.error) if generation.error is not None else None,
+            }
+        
+        async def answer(subscription: Subscription):
+            while True:
+                await subscription.get()
+                await self.pubsub.publish(channel, snapshot())
+        
+        loop = asyncio.get_running_loop()
+        answering = [loop.create_task(answer(requests)), loop.create_task(answer(resumes))]
+        count = 0
+        try:
+            try:
+                async for chunk in generation.follow():
+                    await self.pubsub.publish(channel, {
+                        "type": "chunk",
+                        "stream_id": generation.id,
+                        "index": count,
+                        "data": chunk,
+                    })
+                    count += 1
+            except Exception:
+                pass  # Reported to subscribers with the done message
+            
+            await self.pubsub.publish(channel, {
+                "type": "done",
+                "stream_id": generation.id,
+                "count": count,
+                "error": str(generation.error) if generation.error is not None else None,
+            })
+            self._unregister(session_id, generation)
+            
+            # New turns find nobody to sync with; only resumes are answered
+            answering[0].cancel()
+            await requests.close()
+            await asyncio.sleep(self.linger)
+        finally:
+            for task in answering:
+                task.cancel()
+            await requests.close()
+            await resumes.close()
+            self._unregister(session_id, generation)
+    
+    def _unregister(self, session_id: str, generation: Generation) -> None:
+        if self._live.get(session_id, (None, None))[1] is generation:
+            del self._live[session_id]
+
+
+# Create singleton instance
+stream_broker = StreamBroker(
+    pubsub,
+    queue_size=settings.stream_subscriber_queue_size,
+    sync_timeout=settings.stream_sync_timeout_seconds,
+    idle_timeout=settings.stream_idle_timeout_seconds,
+    linger=settings.stream_replay_ttl_seconds
+)
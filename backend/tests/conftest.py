@@ -13,6 +13,10 @@ from unittest.mock import patch
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Run the app against the in-memory storage backend unless told otherwise
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("SUMMARIZER_BACKEND", "stub")
+
 
 @pytest.fixture(scope="session")
 def event_loop():
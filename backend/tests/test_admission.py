@@ -0,0 +1,199 @@
+# tests/test_admission.py
+"""
+Tests for upstream admission control.
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from main import app
+from services.admission import AdmissionController, AdmissionRejected, AdmissionTimeout
+
+client = TestClient(app)
+
+
+def make_controller(max_concurrent=1, max_queue=2, max_wait_seconds=5):
+    """Build a controller with small limits."""
+    return AdmissionController(max_concurrent, max_queue, max_wait_seconds, retry_after=3)
+
+
+async def positions(ticket):
+    """Collect every queue position a ticket reports until granted."""
+    return [position async for position in ticket.wait()]
+
+
+class TestAdmissionController:
+    """Test suite for AdmissionController."""
+    
+    @pytest.mark.asyncio
+    async def test_free_slot_is_granted_immediately(self):
+        """Test requests under the cap never queue."""
+        controller = make_controller(max_concurrent=2)
+        first = controller.enter()
+        second = controller.enter()
+        
+        assert first.granted and second.granted
+        assert await positions(first) == []
+        assert controller.stats()["active"] == 2
+        
+        first.release()
+        first.release()
+        assert controller.stats()["active"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_queue_is_fifo_and_reports_positions(self):
+        """Test waiters are granted in order and see their position move."""
+        controller = make_controller(max_concurrent=1, max_queue=2)
+        holder = controller.enter()
+        first = controller.enter()
+        second = controller.enter()
+        
+        second_positions = asyncio.create_task(positions(second))
+        first_positions = asyncio.create_task(positions(first))
+        await asyncio.sleep(0)
+        assert controller.stats()["queue_depth"] == 2
+        
+        holder.release()
+        assert await first_positions == [1]
+        first.release()
+        assert await second_positions == [2, 1]
+        
+        second.release()
+        stats = controller.stats()
+        assert stats["admitted"] == 3
+        assert stats["active"] == 0
+        assert stats["wait_seconds"]["buckets"]["+Inf"] == 3
+    
+    @pytest.mark.asyncio
+    async def test_full_queue_is_rejected(self):
+        """Test requests beyond the queue bound fail fast with a retry hint."""
+        controller = make_controller(max_concurrent=1, max_queue=1)
+        controller.enter()
+        controller.enter()
+        
+        with pytest.raises(AdmissionRejected) as exc_info:
+            controller.enter()
+        
+        assert exc_info.value.retry_after == 3
+        assert controller.stats()["rejected"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_wait_times_out(self):
+        """Test a waiter gives up after the maximum wait and leaves the queue."""
+        controller = make_controller(max_concurrent=1, max_wait_seconds=0.05)
+        controller.enter()
+        waiter = controller.enter()
+        
+        with pytest.raises(AdmissionTimeout):
+            await positions(waiter)
+        
+        stats = controller.stats()
+        assert stats["timed_out"] == 1
+        assert stats["queue_depth"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_abandoned_waiter_leaves_queue(self):
+        """Test releasing a queued ticket frees its place for those behind."""
+        controller = make_controller(max_concurrent=1)
+        holder = controller.enter()
+        quitter = controller.enter()
+        waiter = controller.enter()
+        
+        waiter_positions = asyncio.create_task(positions(waiter))
+        await asyncio.sleep(0)
+        quitter.release()
+        await asyncio.sleep(0.01)
+        holder.release()
+        
+        assert await waiter_positions == [2, 1]
+        assert controller.stats()["abandoned"] == 1
+
+
+class TestFairScheduling:
+    """Test per-user fair ordering and limits."""
+    
+    @staticmethod
+    def grant_order(controller, tickets):
+        """Release slots one at a time and record whose ticket is granted next."""
+        order = []
+        holder = tickets.pop(0)
+        while tickets:
+            holder.release()
+            holder = next(t for t in tickets if t.granted)
+            tickets.remove(holder)
+            order.append(holder.user_id)
+        return order
+    
+    @pytest.mark.asyncio
+    async def test_users_are_served_round_robin(self):
+        """Test a flooding user does not delay another user's single request."""
+        controller = make_controller(max_concurrent=1, max_queue=100)
+        tickets = [controller.enter("heavy")]
+        tickets += [controller.enter("heavy") for _ in range(5)]
+        tickets.append(controller.enter("light"))
+        
+        assert self.grant_order(controller, tickets) == ["heavy", "light", "heavy", "heavy", "heavy", "heavy"]
+    
+    @pytest.mark.asyncio
+    async def test_weights_scale_share(self):
+        """Test a user type with weight 2 gets two grants per round."""
+        controller = AdmissionController(1, 100, 5, retry_after=3, weights={"premium": 2, "anonymous": 1})
+        tickets = [controller.enter("holder")]
+        tickets += [controller.enter("anon", "anonymous") for _ in range(3)]
+        tickets += [controller.enter("paid", "premium") for _ in range(4)]
+        
+        assert self.grant_order(controller, tickets) == ["anon", "paid", "paid", "anon", "paid", "paid", "anon"]
+    
+    @pytest.mark.asyncio
+    async def test_per_user_in_flight_limit(self):
+        """Test a user at its limit queues while others still get free slots."""
+        controller = make_controller(max_concurrent=3, max_queue=10)
+        controller.max_per_user = 2
+        first = controller.enter("heavy")
+        controller.enter("heavy")
+        third = controller.enter("heavy")
+        light = controller.enter("light")
+        
+        assert not third.granted
+        assert light.granted
+        
+        first.release()
+        assert third.granted
+    
+    @pytest.mark.asyncio
+    async def test_per_user_queue_limit(self):
+        """Test a user's waiting requests are capped without rejecting others."""
+        controller = make_controller(max_concurrent=1, max_queue=10)
+        controller.max_queued_per_user = 2
+        controller.enter("heavy")
+        controller.enter("heavy")
+        controller.enter("heavy")
+        
+        with pytest.raises(AdmissionRejected):
+            controller.enter("heavy")
+        assert not controller.enter("light").granted
+        assert controller.stats()["users_waiting"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_idle_users_are_forgotten(self):
+        """Test per-user state is dropped once a user has nothing running or waiting."""
+        controller = make_controller(max_concurrent=2)
+        ticket = controller.enter("u1")
+        ticket.release()
+        
+        assert controller._users == {}
+
+
+class TestChatStreamAdmission:
+    """Test the streaming endpoint's use of admission control."""
+    
+    def test_full_queue_returns_503(self):
+        """Test a rejected stream gets 503 with Retry-After and stores nothing."""
+        with patch('api.routes.chat.admission_controller.enter', side_effect=AdmissionRejected(7)), \
+                patch('services.storage.storage_service.store_message') as mock_store_message:
+            response = client.get("/chat/stream?session_id=busy-1&user_input=Hello")
+        
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "7"
+        assert not mock_store_message.called
@@ -15,8 +15,8 @@ client = TestClient(app)
 class TestChatEndpoints:
     """Test suite for chat endpoints."""
     
-    @patch('services.firebase_service.firebase_service.store_message')
-    @patch('services.firebase_service.firebase_service.get_chat_history')
+    @patch('services.storage.storage_service.store_message')
+    @patch('services.storage.storage_service.get_chat_history')
     def test_chat_endpoint(self, mock_get_history, mock_store_message):
         """Test the non-streaming chat endpoint."""
         # Setup mocks
@@ -46,9 +46,9 @@ class TestChatEndpoints:
         response = client.get("/chat/stream?user_input=Hello")
         assert response.status_code == 422
     
-    @patch('services.firebase_service.firebase_service.store_message')
-    @patch('services.firebase_service.firebase_service.get_chat_history')
-    @patch('services.openai_service.openai_service.stream_chat_completion')
+    @patch('services.storage.storage_service.store_message')
+    @patch('services.storage.storage_service.get_chat_history')
+    @patch('services.openai_service.openai_service.stream_completion')
     def test_chat_stream_success(
         self, 
         mock_stream_completion, 
@@ -77,9 +77,9 @@ class TestChatEndpoints:
         assert response.status_code == 200
         assert response.headers["content-type"] == "text/event-stream; charset=utf-8"
     
-    @patch('services.firebase_service.firebase_service.store_message')
-    @patch('services.firebase_service.firebase_service.get_chat_history')
-    @patch('services.openai_service.openai_service.stream_chat_completion')
+    @patch('services.storage.storage_service.store_message')
+    @patch('services.storage.storage_service.get_chat_history')
+    @patch('services.openai_service.openai_service.stream_completion')
     def test_chat_stream_error_handling(
         self, 
         mock_stream_completion, 
@@ -0,0 +1,173 @@
+# tests/test_chat_pipeline.py
+"""
+Tests for saving the user message while the reply generates, and the
+per-stage timings of chat stream requests.
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from config.settings import settings
+from services.openai_service import openai_service
+from services.providers import FakeProvider
+from services.stage_timings import StageTimer, StageTimings, stage_timings
+from services.storage import WriteBehindStorage, storage_service
+from tests.test_generation import stream_then_disconnect
+
+
+class RecordingProvider(FakeProvider):
+    """Fake provider noting when the upstream call is opened."""
+    
+    def __init__(self, events, **options):
+        super().__init__(**options)
+        self.events = events
+    
+    async def open(self, model, messages, temperature, max_tokens):
+        self.events.append("upstream")
+        return await super().open(model, messages, temperature, max_tokens)
+
+
+def slow_user_write(events, delay):
+    """Wrap store_message so user-message writes take `delay` seconds."""
+    store_message = storage_service.store_message
+    
+    async def store(session_id, role, content, model=None, truncated=False):
+        if role == "user":
+            await asyncio.sleep(delay)
+            events.append("user saved")
+        await store_message(session_id, role, content, model=model, truncated=truncated)
+    
+    return store
+
+
+async def run_stream(session_id, provider, store, user_input="Hello there"):
+    params = {"session_id": session_id, "user_input": user_input, "no_cache": "true"}
+    with patch.object(openai_service, "provider", provider), \
+            patch.object(storage_service, "store_message", side_effect=store):
+        return await stream_then_disconnect(params, frames_before_disconnect=100)
+
+
+class TestOverlappedPersistence:
+    """Test /chat/stream saves the user message alongside generation."""
+    
+    @pytest.mark.asyncio
+    async def test_upstream_starts_before_user_message_is_saved(self):
+        """Test the upstream call does not wait for the write, and the transcript stays ordered."""
+        events = []
+        provider = RecordingProvider(events, reply="Hi! How can I help?", first_token_delays=(0.0,), token_delay=0)
+        session_id = await storage_service.create_session(user_id="user-1")
+        
+        body = await run_stream(session_id, provider, slow_user_write(events, 0.1))
+        
+        assert body.endswith("data: [DONE]\n\n")
+        assert events == ["upstream", "user saved"]
+        assert provider.last_request["messages"][-1] == {"role": "user", "content": "Hello there"}
+        messages = (await storage_service.get_messages_page(session_id, 10)).messages
+        assert [(m["role"], m["content"]) for m in messages] == [
+            ("user", "Hello there"),
+            ("assistant", "Hi! How can I help?"),
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_failed_user_write_rolls_back_the_reply(self):
+        """Test a reply is stopped and not saved when its user message cannot be saved."""
+        events = []
+        provider = RecordingProvider(events, reply="one two three four", first_token_delays=(0.0,), token_delay=0.05)
+        session_id = await storage_service.create_session(user_id="user-1")
+        
+        async def failing_write(session_id, role, content, model=None, truncated=False):
+            # Fail once the reply is generating
+            while "upstream" not in events:
+                await asyncio.sleep(0.005)
+            raise Exception("write failed")
+        
+        body = await run_stream(session_id, provider, failing_write)
+        
+        assert "event: error\ndata: Your message could not be saved" in body
+        assert "[DONE]" not in body
+        assert provider.cancelled == 1
+        assert (await storage_service.get_messages_page(session_id, 10)).messages == []
+    
+    @pytest.mark.asyncio
+    async def test_rollback_through_write_behind_queue(self):
+        """Test the rollback also works in the default stack, where the write is only queued."""
+        events = []
+        provider = RecordingProvider(events, reply="one two three four", first_token_delays=(0.0,), token_delay=0.05)
+        session_id = await storage_service.create_session(user_id="user-1")
+        queue = storage_service.backend
+        assert isinstance(queue, WriteBehindStorage)
+        params = {"session_id": session_id, "user_input": "Hello there", "no_cache": "true"}
+        
+        with patch.object(openai_service, "provider", provider), \
+                patch.object(queue.backend, "store_messages", side_effect=Exception("commit failed")), \
+                patch.object(queue, "max_attempts", 1):
+            body = await stream_then_disconnect(params, frames_before_disconnect=100)
+        
+        assert "event: error\ndata: Your message could not be saved" in body
+        assert provider.cancelled == 1
+        assert (await storage_service.get_messages_page(session_id, 10)).messages == []
+        assert await storage_service.get_chat_history(session_id) == []
+    
+    @pytest.mark.asyncio
+    async def test_missing_session_rolls_back_the_reply(self):
+        """Test a message for a session that does not exist is never saved, and neither is its reply."""
+        provider = FakeProvider(reply="one two three four", first_token_delays=(0.0,), token_delay=0.05)
+        params = {"session_id": "no-such-session", "user_input": "Hello there", "no_cache": "true"}
+        
+        with patch.object(openai_service, "provider", provider):
+            body = await stream_then_disconnect(params, frames_before_disconnect=100)
+            with patch.object(settings, "chat_overlap_persistence", False):
+                serial = await stream_then_disconnect(params, frames_before_disconnect=100)
+        
+        assert "event: error\ndata: Chat session not found" in body
+        assert "[DONE]" not in body
+        assert serial == '{"detail":"Chat session not found"}'
+        assert provider.calls == 1
+        assert await storage_service.get_chat_history("no-such-session") == []
+    
+    @pytest.mark.asyncio
+    async def test_serial_mode(self):
+        """Test turning the overlap off saves the user message before calling upstream."""
+        events = []
+        provider = RecordingProvider(events, reply="Hi!", first_token_delays=(0.0,), token_delay=0)
+        session_id = await storage_service.create_session(user_id="user-1")
+        
+        with patch.object(settings, "chat_overlap_persistence", False):
+            await run_stream(session_id, provider, slow_user_write(events, 0.05))
+        
+        assert events == ["user saved", "upstream"]
+        assert provider.last_request["messages"][-1] == {"role": "user", "content": "Hello there"}
+    
+    @pytest.mark.asyncio
+    async def test_stage_timings_recorded(self):
+        """Test every stage of a request is timed."""
+        stage_timings.reset()
+        provider = FakeProvider(reply="Hi!", first_token_delays=(0.0,), token_delay=0)
+        session_id = await storage_service.create_session(user_id="user-1")
+        
+        await run_stream(session_id, provider, storage_service.store_message)
+        
+        stats = stage_timings.stats()
+        assert set(stats) == {"history", "persist_user", "context", "queue", "first_token", "ttft"}
+        assert all(stage["count"] == 1 for stage in stats.values())
+
+
+class TestStageTimings:
+    """Test suite for StageTimings."""
+    
+    def test_consecutive_stages(self):
+        """Test marks time the stages back to back and the total covers them all."""
+        now = [0.0]
+        timings = StageTimings(window=10)
+        timer = StageTimer(timings, clock=lambda: now[0])
+        
+        now[0] = 0.02
+        timer.mark("history")
+        now[0] = 0.05
+        timer.mark("context")
+        timer.total("ttft")
+        
+        stats = timings.stats()
+        assert stats["history"]["mean_ms"] == 20
+        assert stats["context"]["mean_ms"] == 30
+        assert stats["ttft"]["p95_ms"] == 50
@@ -0,0 +1,157 @@
+# tests/test_chat_socket.py
+"""
+Tests for chatting over the /chat/ws WebSocket.
+"""
+
+import asyncio
+import json
+import pytest
+from unittest.mock import patch
+from main import app
+from config.settings import settings
+from services.auth_service import auth_service
+from services.generation import generation_manager
+from services.openai_service import openai_service
+from services.providers import FakeProvider
+from services.storage import storage_service
+from tests.test_single_flight import transcript
+
+
+class Socket:
+    """A WebSocket client driving the app directly over ASGI."""
+    
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.task = None
+    
+    async def connect(self):
+        scope = {
+            "type": "websocket",
+            "path": "/chat/ws",
+            "raw_path": b"/chat/ws",
+            "query_string": b"",
+            "headers": [],
+            "scheme": "ws",
+            "server": ("testserver", 80),
+            "client": ("127.0.0.1", 50000),
+            "root_path": "",
+            "subprotocols": [],
+        }
+        self.incoming.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.ensure_future(app(scope, self.incoming.get, self.outgoing.put))
+        assert (await self.receive_raw())["type"] == "websocket.accept"
+        return self
+    
+    async def receive_raw(self):
+        return await asyncio.wait_for(self.outgoing.get(), 5)
+    
+    async def receive(self):
+        message = await self.receive_raw()
+        assert message["type"] == "websocket.send", message
+        return json.loads(message["text"])
+    
+    def send(self, message):
+        self.incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+    
+    async def close(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+async def authenticated():
+    socket = await Socket().connect()
+    socket.send({"type": "auth", "token": auth_service.create_access_token({"sub": "user-1", "type": "anonymous"})})
+    assert await socket.receive() == {"type": "ready"}
+    return socket
+
+
+async def replies(socket, count):
+    """Collect messages until `count` turns have ended, grouped by turn id."""
+    turns, ended = {}, 0
+    while ended < count:
+        message = await socket.receive()
+        turns.setdefault(message["id"], []).append(message)
+        ended += message["type"] in ("done", "error", "cancelled")
+    return turns
+
+
+def text(messages):
+    return "".join(message["data"] for message in messages if message["type"] == "chunk")
+
+
+class TestChatSocket:
+    """Test suite for the chat WebSocket."""
+    
+    @pytest.mark.asyncio
+    async def test_requires_auth(self):
+        """Test a connection whose first message is not a valid token is closed."""
+        socket = await Socket().connect()
+        socket.send({"type": "auth", "token": "not-a-token"})
+        
+        message = await socket.receive_raw()
+        
+        assert message == {"type": "websocket.close", "code": 4401, "reason": ""}
+        await socket.close()
+    
+    @pytest.mark.asyncio
+    async def test_many_sessions_on_one_connection(self):
+        """Test replies for several sessions are multiplexed and each is stored."""
+        provider = FakeProvider(reply="one two three", first_token_delays=(0.0,), token_delay=0.01)
+        sessions = [await storage_service.create_session(user_id="user-1") for _ in range(3)]
+        
+        with patch.object(openai_service, "provider", provider):
+            socket = await authenticated()
+            for index, session_id in enumerate(sessions):
+                socket.send({"type": "send", "id": f"t{index}", "session_id": session_id, "user_input": "Count"})
+            turns = await replies(socket, 3)
+            await socket.close()
+        
+        assert sorted(turns) == ["t0", "t1", "t2"]
+        for messages in turns.values():
+            assert text(messages) == "one two three"
+            assert messages[-1] == {"type": "done", "id": messages[0]["id"]}
+        assert provider.calls == 3
+        for session_id in sessions:
+            assert await transcript(session_id) == [("user", "Count"), ("assistant", "one two three")]
+    
+    @pytest.mark.asyncio
+    async def test_cancel(self):
+        """Test cancelling a turn stops its reply and saves it as truncated."""
+        provider = FakeProvider(reply="a b c d e f g h", first_token_delays=(0.0,), token_delay=0.05)
+        session_id = await storage_service.create_session(user_id="user-1")
+        
+        with patch.object(openai_service, "provider", provider), \
+                patch.object(generation_manager, "resume_grace", 0):
+            socket = await authenticated()
+            socket.send({"type": "send", "id": "t1", "session_id": session_id, "user_input": "Letters"})
+            assert (await socket.receive())["type"] == "chunk"
+            socket.send({"type": "cancel", "id": "t1"})
+            messages = (await replies(socket, 1))["t1"]
+            await socket.close()
+            await asyncio.sleep(0.05)
+        
+        assert messages[-1] == {"type": "cancelled", "id": "t1"}
+        assert provider.cancelled == 1
+        stored = (await storage_service.get_messages_page(session_id, 10)).messages
+        assert stored[-1]["truncated"] is True
+    
+    @pytest.mark.asyncio
+    async def test_invalid_and_excess_turns(self):
+        """Test malformed sends and turns past the per-connection limit are refused."""
+        provider = FakeProvider(reply="a b c", first_token_delays=(0.0,), token_delay=0.05)
+        session_id = await storage_service.create_session(user_id="user-1")
+        
+        with patch.object(openai_service, "provider", provider), \
+                patch.object(settings, "ws_max_turns", 1):
+            socket = await authenticated()
+            socket.send({"type": "send", "id": "t0", "session_id": session_id})
+            assert await socket.receive() == {"type": "error", "id": "t0", "message": "Invalid message"}
+            
+            socket.send({"type": "send", "id": "t1", "session_id": session_id, "user_input": "First"})
+            socket.send({"type": "send", "id": "t2", "session_id": session_id, "user_input": "Second"})
+            turns = await replies(socket, 2)
+            await socket.close()
+        
+        assert turns["t2"] == [{"type": "error", "id": "t2", "message": "Too many replies in progress on this connection"}]
+        assert text(turns["t1"]) == "a b c"
@@ -0,0 +1,226 @@
+# tests/test_circuit_breaker.py
+"""
+Tests for per-model circuit breakers and fallback model routing.
+"""
+
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from main import app
+from services.circuit_breaker import CircuitBreaker, CircuitBreakers, CircuitOpenError
+from services.hedging import Hedger
+from services.http_pool import HTTPPool
+from services.openai_service import OpenAIService
+from services.providers import FakeProvider
+
+client = TestClient(app)
+
+HISTORY = [{"role": "user", "content": "Hi"}]
+
+BREAKER_OPTIONS = dict(
+    failure_rate_threshold=0.5,
+    slow_call_seconds=1.0,
+    slow_call_rate_threshold=0.5,
+    window=10,
+    min_calls=4,
+    open_seconds=30,
+    half_open_probes=2
+)
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(clock):
+    return CircuitBreaker("gpt", clock=clock, **BREAKER_OPTIONS)
+
+
+def make_service(provider, fallback_models=("backup",)):
+    """Build a service over a fake provider with fresh breakers and no hedging."""
+    service = OpenAIService(
+        pool=HTTPPool(
+            max_connections=10,
+            keepalive_seconds=30,
+            connect_timeout=1,
+            first_byte_timeout=2,
+            read_timeout=2,
+            total_timeout=10
+        ),
+        provider=provider,
+        hedger=Hedger(enabled=False, percentile=95, min_samples=20, window=100, max_ratio=0),
+        breakers=CircuitBreakers(event_history=10, **BREAKER_OPTIONS)
+    )
+    service.model = "primary"
+    service.fallback_models = list(fallback_models)
+    return service
+
+
+def failing_model(provider, broken="primary"):
+    """Make the provider fail every request to one model."""
+    async def open(model, *args):
+        if model == broken:
+            raise RuntimeError(f"{model} is down")
+        return await FakeProvider.open(provider, model, *args)
+    
+    provider.open = open
+    return provider
+
+
+class TestCircuitBreaker:
+    """Test suite for CircuitBreaker."""
+    
+    def test_opens_on_failure_rate(self):
+        """Test the breaker opens once enough of the window has failed."""
+        breaker = make_breaker(FakeClock())
+        for _ in range(2):
+            breaker.record_success(breaker.allow(), 0.1)
+        breaker.record_failure(breaker.allow())
+        assert breaker.state == "closed"
+        
+        breaker.record_failure(breaker.allow())
+        
+        assert breaker.state == "open"
+        assert breaker.allow() is None
+        assert breaker.stats()["rejected"] == 1
+    
+    def test_opens_on_slow_calls(self):
+        """Test late first tokens count against the breaker."""
+        breaker = make_breaker(FakeClock())
+        for latency in (0.1, 0.1, 2.0, 2.0):
+            breaker.record_success(breaker.allow(), latency)
+        
+        assert breaker.state == "open"
+    
+    def test_half_open_probes_close_the_breaker(self):
+        """Test limited probes are let through after the cool-down and close it on success."""
+        clock = FakeClock()
+        breaker = make_breaker(clock)
+        for _ in range(4):
+            breaker.record_failure(breaker.allow())
+        
+        clock.now = 31
+        probes = [breaker.allow(), breaker.allow()]
+        assert all(probe is not None and probe.probe for probe in probes)
+        assert breaker.allow() is None
+        assert breaker.state == "half_open"
+        
+        for probe in probes:
+            breaker.record_success(probe, 0.1)
+        
+        assert breaker.state == "closed"
+        assert breaker.stats()["calls"] == 0
+    
+    def test_failed_probe_reopens(self):
+        """Test a failed probe starts a new cool-down."""
+        clock = FakeClock()
+        breaker = make_breaker(clock)
+        for _ in range(4):
+            breaker.record_failure(breaker.allow())
+        
+        clock.now = 31
+        probe = breaker.allow()
+        assert probe is not None
+        breaker.record_failure(probe)
+        
+        assert breaker.state == "open"
+        assert breaker.allow() is None
+        assert breaker.stats()["times_opened"] == 2
+    
+    def test_call_admitted_before_state_change_is_not_a_probe(self):
+        """Test a stream let through while closed and finishing after the breaker went half-open counts for nothing."""
+        clock = FakeClock()
+        breaker = make_breaker(clock)
+        long_stream = breaker.allow()
+        for _ in range(4):
+            breaker.record_failure(breaker.allow())
+        clock.now = 31
+        probe = breaker.allow()
+        
+        breaker.record_success(long_stream, 0.1)
+        breaker.release(long_stream)
+        
+        assert breaker.state == "half_open"
+        assert breaker.allow() is not None
+        assert breaker.allow() is None
+        breaker.record_success(probe, 0.1)
+        assert breaker.state == "half_open"
+
+
+class TestFallbackRouting:
+    """Test model selection across the fallback chain."""
+    
+    @pytest.mark.asyncio
+    async def test_failure_falls_back_and_records_serving_model(self):
+        """Test a failing primary hands the request to the next model."""
+        provider = failing_model(FakeProvider(reply="from backup", first_token_delays=(0.0,)))
+        service = make_service(provider)
+        meta = {}
+        
+        reply = "".join([chunk async for chunk in service.stream_completion(HISTORY, meta)])
+        
+        assert reply == "from backup"
+        assert meta["model"] == "backup"
+        assert provider.last_request["model"] == "backup"
+        stats = service.breakers.stats()
+        assert stats["fallbacks"] == 1
+        assert stats["events"][-1]["to"] == "backup"
+        assert stats["breakers"]["primary"]["failure_rate"] == 1.0
+    
+    @pytest.mark.asyncio
+    async def test_open_breaker_skips_model(self):
+        """Test requests stop reaching a model once its breaker opens."""
+        provider = failing_model(FakeProvider(reply="ok", first_token_delays=(0.0,)))
+        service = make_service(provider)
+        
+        for _ in range(6):
+            async for _ in service.stream_completion(HISTORY):
+                pass
+        
+        breakers = service.breakers.stats()["breakers"]
+        assert breakers["primary"]["state"] == "open"
+        assert breakers["primary"]["calls"] == 4
+        assert breakers["primary"]["rejected"] == 2
+        assert any(e["type"] == "state" and e["to"] == "open" for e in service.breakers.events)
+    
+    @pytest.mark.asyncio
+    async def test_all_models_unavailable(self):
+        """Test the last error surfaces when every model fails, and open breakers fail fast."""
+        provider = failing_model(FakeProvider(first_token_delays=(0.0,)))
+        service = make_service(provider, fallback_models=())
+        
+        for _ in range(4):
+            with pytest.raises(RuntimeError, match="primary is down"):
+                async for _ in service.stream_completion(HISTORY):
+                    pass
+        
+        with pytest.raises(CircuitOpenError):
+            async for _ in service.stream_completion(HISTORY):
+                pass
+
+
+class TestChatStreamModel:
+    """Test the streaming endpoint stores the serving model."""
+    
+    @patch('services.storage.storage_service.store_message')
+    @patch('services.storage.storage_service.get_chat_history')
+    @patch('services.openai_service.openai_service.stream_completion')
+    def test_assistant_message_records_model(self, mock_stream, mock_get_history, mock_store_message):
+        """Test the assistant message is stored with the model that answered."""
+        mock_get_history.return_value = [{"role": "user", "content": "Hello"}]
+        
+        async def reply(context, meta=None, tier=None):
+            meta["model"] = "backup"
+            yield "Hello"
+        
+        mock_stream.side_effect = reply
+        
+        client.get("/chat/stream?session_id=model-1&user_input=Hello&no_cache=true")
+        
+        mock_store_message.assert_called_with("model-1", "assistant", "Hello", model="backup", truncated=False)
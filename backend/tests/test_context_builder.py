@@ -0,0 +1,99 @@
+# tests/test_context_builder.py
+"""
+Tests for token-budgeted context assembly.
+"""
+
+from services.context_builder import ContextBuilder
+from utils.tokens import count_message_tokens, MESSAGE_TOKEN_OVERHEAD, REPLY_PRIMING_TOKENS
+
+
+def message(i, role="user"):
+    """Build a message whose content costs 10 tokens with the stub counter."""
+    return {"role": role, "content": f"message {i}"}
+
+
+def ten_tokens(message):
+    """Stub counter charging every message 10 tokens."""
+    return 10
+
+
+def make_builder(context_window=100, reply_tokens=0, max_sessions=10):
+    """Build a ContextBuilder with a deterministic token counter."""
+    return ContextBuilder(
+        context_window=context_window + REPLY_PRIMING_TOKENS,
+        reply_tokens=reply_tokens,
+        max_sessions=max_sessions,
+        count_tokens=ten_tokens
+    )
+
+
+class TestContextBuilder:
+    """Test suite for ContextBuilder."""
+    
+    def test_short_history_is_sent_whole(self):
+        """Test histories within budget are returned unchanged."""
+        builder = make_builder()
+        history = [message(i) for i in range(5)]
+        
+        assert builder.build("s1", history) == history
+        assert builder.stats()["trimmed"] == 0
+    
+    def test_keeps_newest_messages_within_budget(self):
+        """Test the oldest messages are dropped first."""
+        builder = make_builder(context_window=100, reply_tokens=30)
+        history = [message(i) for i in range(20)]
+        
+        context = builder.build("s1", history)
+        
+        assert context == history[-7:]
+        assert builder.stats()["trimmed"] == 1
+    
+    def test_latest_message_always_included(self):
+        """Test an oversized last message is still sent."""
+        builder = make_builder(context_window=5)
+        history = [message(0), message(1)]
+        
+        assert builder.build("s1", history) == [message(1)]
+    
+    def test_counts_only_new_messages(self):
+        """Test appended messages are the only ones counted on the next build."""
+        counted = []
+        builder = ContextBuilder(
+            context_window=1000,
+            reply_tokens=0,
+            max_sessions=10,
+            count_tokens=lambda m: counted.append(m) or 10
+        )
+        history = [message(i) for i in range(50)]
+        builder.build("s1", history)
+        
+        history.append(message(50, "assistant"))
+        history.append(message(51))
+        builder.build("s1", history)
+        
+        assert len(counted) == 52
+        assert builder.count("s1", history) == 520
+    
+    def test_rewritten_history_is_recounted(self):
+        """Test a history that no longer extends the cached one is recounted."""
+        builder = make_builder()
+        builder.build("s1", [message(i) for i in range(5)])
+        
+        other = [{"role": "user", "content": "something else"}] * 3
+        
+        assert builder.build("s1", other) == other
+        assert builder.stats()["recounts"] == 1
+        assert builder.count("s1", other) == 30
+    
+    def test_session_cache_is_bounded(self):
+        """Test least recently used sessions are dropped beyond max_sessions."""
+        builder = make_builder(max_sessions=2)
+        for session_id in ["a", "b", "c"]:
+            builder.build(session_id, [message(0)])
+        
+        assert builder.stats()["sessions"] == 2
+    
+    def test_default_counter_includes_overhead(self):
+        """Test the default counter charges the per-message overhead."""
+        assert count_message_tokens({"role": "user", "content": ""}) == MESSAGE_TOKEN_OVERHEAD
+        assert count_message_tokens({"role": "user", "content": "x" * 400}) > MESSAGE_TOKEN_OVERHEAD
@@ -0,0 +1,150 @@
+# tests/test_conversation_memory.py
+"""
+Tests for rolling conversation summaries.
+"""
+
+import pytest
+from services.context_builder import ContextBuilder
+from services.conversation_memory import ConversationMemory, StubSummarizer, create_summarizer
+from services.storage import InMemoryStorage, SessionSummary
+
+
+def make_history(count):
+    """Build alternating user/assistant messages."""
+    roles = ("user", "assistant")
+    return [{"role": roles[i % 2], "content": f"message {i}"} for i in range(count)]
+
+
+def make_memory(storage, summarizer=None, enabled=True, context_window=10_000):
+    """Build a ConversationMemory with small windows for testing."""
+    builder = ContextBuilder(
+        context_window=context_window,
+        reply_tokens=0,
+        max_sessions=10,
+        count_tokens=lambda message: 10
+    )
+    return ConversationMemory(
+        storage,
+        builder,
+        summarizer or StubSummarizer(),
+        enabled=enabled,
+        recent_messages=4,
+        summary_batch=3,
+        max_sessions=10
+    )
+
+
+class TestConversationMemory:
+    """Test suite for ConversationMemory."""
+    
+    @pytest.mark.asyncio
+    async def test_without_summary_sends_history(self):
+        """Test sessions without a summary get their (trimmed) history."""
+        memory = make_memory(InMemoryStorage())
+        history = make_history(3)
+        
+        assert await memory.build_context("s1", history) == history
+    
+    @pytest.mark.asyncio
+    async def test_summary_replaces_covered_messages(self):
+        """Test the prompt is the summary plus the messages it does not cover."""
+        storage = InMemoryStorage()
+        session_id = await storage.create_session()
+        await storage.store_summary(session_id, SessionSummary("earlier stuff", 6))
+        memory = make_memory(storage)
+        history = make_history(9)
+        
+        context = await memory.build_context(session_id, history)
+        
+        assert context[0]["role"] == "system"
+        assert "earlier stuff" in context[0]["content"]
+        assert context[1:] == history[6:]
+    
+    @pytest.mark.asyncio
+    async def test_updates_are_incremental(self):
+        """Test each update only summarizes messages the summary does not cover."""
+        seen = []
+        
+        class RecordingSummarizer(StubSummarizer):
+            async def summarize(self, summary, messages):
+                seen.append([m["content"] for m in messages])
+                return await super().summarize(summary, messages)
+        
+        storage = InMemoryStorage()
+        session_id = await storage.create_session()
+        memory = make_memory(storage, RecordingSummarizer())
+        history = make_history(10)
+        
+        memory.schedule_update(session_id, history)
+        await memory.close()
+        history.extend(make_history(4))
+        memory.schedule_update(session_id, history)
+        await memory.close()
+        
+        assert seen == [
+            [f"message {i}" for i in range(6)],
+            [f"message {i}" for i in range(6, 10)]
+        ]
+        stored = await storage.get_summary(session_id)
+        assert stored.covered == 10
+        assert stored.text.startswith("user: message 0")
+    
+    @pytest.mark.asyncio
+    async def test_small_growth_does_not_trigger_update(self):
+        """Test updates wait for at least summary_batch aged-out messages."""
+        summarizer = StubSummarizer()
+        memory = make_memory(InMemoryStorage(), summarizer)
+        
+        memory.schedule_update("s1", make_history(6))
+        await memory.close()
+        
+        assert summarizer.calls == 0
+    
+    @pytest.mark.asyncio
+    async def test_prompt_size_stays_flat(self):
+        """Test the prompt length is bounded however long the chat gets."""
+        storage = InMemoryStorage()
+        session_id = await storage.create_session()
+        memory = make_memory(storage)
+        history = []
+        sizes = []
+        
+        for _ in range(40):
+            history.extend(make_history(2))
+            sizes.append(len(await memory.build_context(session_id, history)))
+            memory.schedule_update(session_id, history)
+            await memory.close()
+        
+        # At most the summary, the recent window and one pending batch
+        assert max(sizes) <= 1 + 4 + 3 + 1
+    
+    @pytest.mark.asyncio
+    async def test_failed_update_is_counted(self):
+        """Test summarizer errors are logged and counted, not raised."""
+        class FailingSummarizer:
+            async def summarize(self, summary, messages):
+                raise RuntimeError("model unavailable")
+        
+        memory = make_memory(InMemoryStorage(), FailingSummarizer())
+        memory.schedule_update("s1", make_history(10))
+        await memory.close()
+        
+        assert memory.stats()["failures"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_disabled_memory_skips_summaries(self):
+        """Test disabling memory falls back to the trimmed history."""
+        storage = InMemoryStorage()
+        session_id = await storage.create_session()
+        await storage.store_summary(session_id, SessionSummary("ignored", 2))
+        memory = make_memory(storage, enabled=False)
+        history = make_history(4)
+        
+        assert await memory.build_context(session_id, history) == history
+
+
+def test_create_summarizer_by_name():
+    """Test the factory builds the stub and rejects unknown names."""
+    assert isinstance(create_summarizer("stub"), StubSummarizer)
+    with pytest.raises(ValueError):
+        create_summarizer("nope")
@@ -0,0 +1,96 @@
+# tests/test_deletion_service.py
+"""
+Tests for background session deletion jobs.
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from services.deletion_service import DeletionService
+from services.storage import InMemoryStorage
+
+
+class TestDeletionService:
+    """Test suite for DeletionService."""
+    
+    @pytest.mark.asyncio
+    async def test_submit_hides_sessions_then_deletes(self):
+        """Test sessions vanish from listings at once and are deleted by the job."""
+        storage = InMemoryStorage()
+        ids = [await storage.create_session(user_id="user-1") for _ in range(3)]
+        for session_id in ids:
+            await storage.store_message(session_id, "user", "Hello")
+        
+        service = DeletionService(storage, session_parallelism=2, retention=10)
+        job = await service.submit(ids)
+        
+        assert (await storage.list_user_sessions("user-1", 10)).sessions == []
+        
+        await service.close()
+        
+        assert job.status == "completed"
+        assert job.deleted == 3
+        assert all([await storage.get_chat_history(sid) == [] for sid in ids])
+        assert service.get_job(job.job_id) is job
+    
+    @pytest.mark.asyncio
+    async def test_failed_sessions_are_reported(self):
+        """Test a failing delete marks the job failed without stopping the rest."""
+        storage = InMemoryStorage()
+        ok_id = await storage.create_session(user_id="user-1")
+        bad_id = await storage.create_session(user_id="user-1")
+        
+        delete_session = storage.delete_session
+        
+        async def flaky_delete(session_id):
+            if session_id == bad_id:
+                raise Exception("Database error")
+            await delete_session(session_id)
+        
+        storage.delete_session = flaky_delete
+        service = DeletionService(storage, session_parallelism=4, retention=10)
+        
+        job = await service.submit([ok_id, bad_id])
+        await service.close()
+        
+        assert job.status == "failed"
+        assert job.deleted == 1
+        assert job.failed == [bad_id]
+    
+    @pytest.mark.asyncio
+    async def test_session_parallelism_is_bounded(self):
+        """Test no more than session_parallelism deletes run at once."""
+        storage = InMemoryStorage()
+        in_flight = 0
+        peak = 0
+        
+        async def slow_delete(session_id):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+        
+        storage.delete_session = slow_delete
+        service = DeletionService(storage, session_parallelism=2, retention=10)
+        
+        await service.submit([f"s{i}" for i in range(6)])
+        await service.close()
+        
+        assert peak == 2
+    
+    @pytest.mark.asyncio
+    async def test_retention_drops_oldest_finished_jobs(self):
+        """Test the registry keeps at most `retention` jobs."""
+        storage = InMemoryStorage()
+        storage.tombstone_session = AsyncMock()
+        storage.delete_session = AsyncMock()
+        service = DeletionService(storage, session_parallelism=1, retention=2)
+        
+        jobs = []
+        for i in range(3):
+            jobs.append(await service.submit([f"s{i}"]))
+            await service.close()
+        
+        assert service.get_job(jobs[0].job_id) is None
+        assert service.get_job(jobs[2].job_id) is jobs[2]
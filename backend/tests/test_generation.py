@@ -0,0 +1,334 @@
+# tests/test_generation.py
+"""
+Tests for background reply generation and what happens when the client
+leaves mid-stream.
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from urllib.parse import urlencode
+from main import app
+from services.generation import GenerationManager, generation_manager
+from services.openai_service import openai_service
+from services.providers import FakeProvider
+from services.storage import storage_service
+
+
+async def collect(reader):
+    return [chunk async for chunk in reader]
+
+
+def data_frames(body):
+    return sum(any(line.startswith("data:") for line in frame.splitlines()) for frame in body)
+
+
+def last_event_id(body):
+    return [line[len("id: "):] for line in body.splitlines() if line.startswith("id: ")][-1]
+
+
+async def stream_then_disconnect(params, frames_before_disconnect, headers=()):
+    """
+    Call /chat/stream directly over ASGI and disconnect after some data frames.
+    
+    Args:
+        params: Query parameters
+        frames_before_disconnect: Data frames to receive before disconnecting
+        headers: Extra (name, value) request headers
+        
+    Returns:
+        The response body received before the disconnect
+    """
+    disconnected = asyncio.Event()
+    body = []
+    request_sent = False
+    
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+    
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            body.append(message["body"].decode())
+            if data_frames(body) >= frames_before_disconnect:
+                disconnected.set()
+    
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/chat/stream",
+        "raw_path": b"/chat/stream",
+        "root_path": "",
+        "query_string": urlencode(params).encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    return "".join(body)
+
+
+class TestGeneration:
+    """Test suite for Generation."""
+    
+    @pytest.mark.asyncio
+    async def test_reply_streams_and_finishes(self):
+        """Test readers see every chunk and the finish callback sees the whole reply."""
+        manager = GenerationManager()
+        finished = []
+        
+        async def finish(generation):
+            finished.append((generation.text, generation.truncated))
+        
+        provider = FakeProvider(reply="one two three", first_token_delays=(0.0,), token_delay=0)
+        generation = manager.start("s1", await provider.open("m", [], 0, 100), finish, reply_budget=100)
+        
+        assert await collect(generation.read()) == ["one ", "two ", "three"]
+        assert finished == [("one two three", False)]
+        assert manager.stats()["completed"] == 1
+        assert manager.stats()["running"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_last_reader_leaving_cancels_upstream(self):
+        """Test closing the only reader cancels the source and finishes a truncated reply."""
+        manager = GenerationManager()
+        finished = []
+        
+        async def finish(generation):
+            finished.append((generation.text, generation.truncated))
+        
+        provider = FakeProvider(reply="one two three four", first_token_delays=(0.0,), token_delay=5.0)
+        generation = manager.start("s1", await provider.open("m", [], 0, 100), finish, reply_budget=100)
+        
+        reader = generation.read()
+        assert await reader.__anext__() == "one "
+        await reader.aclose()
+        await generation.wait()
+        
+        assert provider.cancelled == 1
+        assert finished == [("one ", True)]
+        stats = manager.stats()
+        assert stats["truncated"] == 1
+        assert stats["tokens_generated_before_disconnect"] >= 1
+        assert 0 < stats["tokens_avoided"] < 100
+    
+    @pytest.mark.asyncio
+    async def test_remaining_reader_keeps_generation_alive(self):
+        """Test a reply keeps generating while any reader is still attached."""
+        manager = GenerationManager()
+        
+        async def finish(generation):
+            pass
+        
+        provider = FakeProvider(reply="a b c", first_token_delays=(0.0,), token_delay=0.01)
+        generation = manager.start("s1", await provider.open("m", [], 0, 100), finish)
+        
+        leaving = generation.read()
+        staying = asyncio.ensure_future(collect(generation.read()))
+        await leaving.__anext__()
+        await leaving.aclose()
+        
+        assert "".join(await staying) == "a b c"
+        assert generation.truncated is False
+        assert provider.cancelled == 0
+    
+    @pytest.mark.asyncio
+    async def test_reader_reattaching_within_grace_resumes(self):
+        """Test a reconnect within the resume grace continues the same generation."""
+        manager = GenerationManager(resume_grace=5)
+        
+        async def finish(generation):
+            pass
+        
+        provider = FakeProvider(reply="a b c", first_token_delays=(0.0,), token_delay=0.01)
+        generation = manager.start("s1", await provider.open("m", [], 0, 100), finish)
+        
+        first = generation.read()
+        assert await first.__anext__() == "a "
+        await first.aclose()
+        
+        assert manager.resume(generation.id, "s1") is generation
+        assert await collect(generation.read(start=1)) == ["b ", "c"]
+        assert generation.truncated is False
+        assert provider.calls == 1
+        assert provider.cancelled == 0
+    
+    @pytest.mark.asyncio
+    async def test_no_reconnect_within_grace_cancels(self):
+        """Test a generation left without readers is cancelled once the grace runs out."""
+        manager = GenerationManager(resume_grace=0.05)
+        
+        async def finish(generation):
+            pass
+        
+        provider = FakeProvider(reply="a b c", first_token_delays=(0.0,), token_delay=5.0)
+        generation = manager.start("s1", await provider.open("m", [], 0, 100), finish)
+        
+        reader = generation.read()
+        await reader.__anext__()
+        await reader.aclose()
+        await generation.wait()
+        
+        assert generation.truncated is True
+        assert provider.cancelled == 1
+
+
+class TestReplayBuffer:
+    """Test how long finished replies stay resumable."""
+    
+    async def finished(self, manager, session_id, reply):
+        async def source():
+            yield reply
+        
+        async def finish(generation):
+            pass
+        
+        generation = manager.start(session_id, source(), finish)
+        await generation.wait()
+        return generation
+    
+    @pytest.mark.asyncio
+    async def test_finished_reply_expires(self):
+        """Test a finished reply can be resumed until its replay window passes."""
+        now = [0.0]
+        manager = GenerationManager(replay_max_bytes=100, replay_stream_max_bytes=100, replay_ttl=60, clock=lambda: now[0])
+        generation = await self.finished(manager, "s1", "hello")
+        
+        assert manager.resume(generation.id, "s1") is generation
+        assert manager.resume(generation.id, "other-session") is None
+        
+        now[0] = 61
+        assert manager.resume(generation.id, "s1") is None
+        stats = manager.stats()
+        assert stats["resumed"] == 1
+        assert stats["resume_misses"] == 2
+        assert stats["replay_streams"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_memory_caps(self):
+        """Test oversized replies are not kept and the oldest are evicted past the byte cap."""
+        manager = GenerationManager(replay_max_bytes=10, replay_stream_max_bytes=6, replay_ttl=60)
+        
+        too_big = await self.finished(manager, "s1", "x" * 7)
+        oldest = await self.finished(manager, "s1", "x" * 5)
+        newest = await self.finished(manager, "s1", "x" * 6)
+        
+        assert manager.resume(too_big.id, "s1") is None
+        assert manager.resume(oldest.id, "s1") is None
+        assert manager.resume(newest.id, "s1") is newest
+        stats = manager.stats()
+        assert stats["replay_bytes"] == 6
+        assert stats["replay_evictions"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_memory_caps_count_encoded_bytes(self):
+        """Test replies are measured in UTF-8 bytes, not characters."""
+        manager = GenerationManager(replay_max_bytes=100, replay_stream_max_bytes=5, replay_ttl=60)
+        
+        generation = await self.finished(manager, "s1", "ééé")
+        
+        assert generation.size == 6
+        assert manager.resume(generation.id, "s1") is None
+        assert manager.stats()["replay_bytes"] == 0
+
+
+class TestClientDisconnect:
+    """Test /chat/stream when the browser goes away mid-reply."""
+    
+    @pytest.mark.asyncio
+    async def test_partial_reply_saved_as_truncated(self):
+        """Test the upstream call is cancelled and the partial reply persisted."""
+        provider = FakeProvider(reply="first second third fourth", first_token_delays=(0.0,), token_delay=0.5)
+        session_id = await storage_service.create_session(user_id="user-1")
+        
+        with patch.object(openai_service, "provider", provider), \
+                patch.object(generation_manager, "resume_grace", 0):
+            body = await stream_then_disconnect(
+                {"session_id": session_id, "user_input": "Tell me a story", "no_cache": "true"},
+                frames_before_disconnect=1
+            )
+            while generation_manager.stats()["running"]:
+                await asyncio.sleep(0.01)
+        
+        assert "\ndata: first \n\n" in body
+        assert "[DONE]" not in body
+        assert provider.cancelled == 1
+        
+        messages = (await storage_service.get_messages_page(session_id, 10)).messages
+        assert messages[-1]["role"] == "assistant"
+        assert messages[-1]["content"] == "first "
+        assert messages[-1]["truncated"] is True
+
+
+class TestStreamResume:
+    """Test /chat/stream reconnects that send Last-Event-ID."""
+    
+    @pytest.mark.asyncio
+    async def test_mid_stream_reconnect_resumes_without_new_completion(self):
+        """Test a dropped connection picks up the live reply where it left off."""
+        provider = FakeProvider(reply="one two three four", first_token_delays=(0.0,), token_delay=0.05)
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Count to four", "no_cache": "true"}
+        
+        with patch.object(openai_service, "provider", provider):
+            first = await stream_then_disconnect(params, frames_before_disconnect=2)
+            second = await stream_then_disconnect(
+                params, frames_before_disconnect=100,
+                headers=[("Last-Event-ID", last_event_id(first))]
+            )
+            while generation_manager.stats()["running"]:
+                await asyncio.sleep(0.01)
+        
+        data = [line[len("data: "):] for line in (first + second).splitlines() if line.startswith("data: ")]
+        assert data == ["one ", "two ", "three ", "four", "[DONE]"]
+        assert provider.calls == 1
+        assert provider.cancelled == 0
+        
+        messages = (await storage_service.get_messages_page(session_id, 10)).messages
+        assert [(m["role"], m["content"]) for m in messages] == [
+            ("user", "Count to four"),
+            ("assistant", "one two three four"),
+        ]
+        assert "truncated" not in messages[-1]
+    
+    @pytest.mark.asyncio
+    async def test_reconnect_after_reply_finished_replays_buffer(self):
+        """Test a reconnect that arrives after the reply finished is served from the replay buffer."""
+        provider = FakeProvider(reply="one two three", first_token_delays=(0.0,), token_delay=0)
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Count to three", "no_cache": "true"}
+        
+        with patch.object(openai_service, "provider", provider):
+            first = await stream_then_disconnect(params, frames_before_disconnect=100)
+            stream_id = last_event_id(first).split(":")[0]
+            second = await stream_then_disconnect(
+                params, frames_before_disconnect=100,
+                headers=[("Last-Event-ID", f"{stream_id}:0")]
+            )
+        
+        assert second == f"id: {stream_id}:2\ndata: two three\n\ndata: [DONE]\n\n"
+        assert provider.calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_unknown_stream_reports_error(self):
+        """Test a reconnect for an expired stream gets an error event and starts nothing."""
+        provider = FakeProvider(reply="unused", first_token_delays=(0.0,))
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Hello", "no_cache": "true"}
+        
+        with patch.object(openai_service, "provider", provider):
+            body = await stream_then_disconnect(
+                params, frames_before_disconnect=100,
+                headers=[("Last-Event-ID", "gone:3")]
+            )
+        
+        assert body.startswith("event: error\n")
+        assert provider.calls == 0
+        assert (await storage_service.get_messages_page(session_id, 10)).messages == []
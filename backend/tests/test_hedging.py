@@ -0,0 +1,138 @@
+# tests/test_hedging.py
+"""
+Tests for upstream deadlines and time-to-first-token hedging, run against
+the fake provider.
+"""
+
+import asyncio
+import time
+import pytest
+from services.hedging import Hedger, TTFTTracker
+from services.http_pool import HTTPPool
+from services.openai_service import OpenAIService
+from services.providers import FakeProvider
+
+HISTORY = [{"role": "user", "content": "Hi"}]
+
+
+def make_service(provider, enabled=True, samples=(0.02,) * 20, max_ratio=1.0, **pool_options):
+    """Build a service over a fake provider with a warmed-up hedger."""
+    options = dict(
+        max_connections=10,
+        keepalive_seconds=30,
+        connect_timeout=1,
+        first_byte_timeout=2,
+        read_timeout=2,
+        total_timeout=10
+    )
+    options.update(pool_options)
+    hedger = Hedger(enabled=enabled, percentile=95, min_samples=20, window=100, max_ratio=max_ratio)
+    for sample in samples:
+        hedger.ttft.record(sample)
+    return OpenAIService(pool=HTTPPool(**options), provider=provider, hedger=hedger)
+
+
+async def collect(service):
+    """Stream a completion into one string."""
+    return "".join([chunk async for chunk in service.stream_completion(HISTORY)])
+
+
+class TestTTFTTracker:
+    """Test suite for TTFTTracker."""
+    
+    def test_percentile_over_window(self):
+        """Test percentiles cover only the most recent samples."""
+        tracker = TTFTTracker(window=10)
+        assert tracker.percentile(95) is None
+        
+        for value in range(100):
+            tracker.record(value)
+        
+        assert len(tracker) == 10
+        assert tracker.percentile(0) == 90
+        assert tracker.percentile(95) == 99
+
+
+class TestHedging:
+    """Test hedged completions."""
+    
+    @pytest.mark.asyncio
+    async def test_slow_first_token_is_hedged(self):
+        """Test a late first token starts a second request whose reply wins."""
+        provider = FakeProvider(reply="fast reply", first_token_delays=(1.0, 0.01))
+        service = make_service(provider)
+        
+        start = time.perf_counter()
+        reply = await collect(service)
+        
+        assert reply == "fast reply"
+        assert time.perf_counter() - start < 0.5
+        assert provider.calls == 2
+        assert provider.cancelled == 1
+        stats = service.hedger.stats()
+        assert stats["hedged"] == 1
+        assert stats["hedge_wins"] == 1
+        assert service.pool.stats()["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_fast_first_token_is_not_hedged(self):
+        """Test a timely request is sent once."""
+        provider = FakeProvider(reply="hello there", first_token_delays=(0.0,))
+        service = make_service(provider)
+        
+        assert await collect(service) == "hello there"
+        assert provider.calls == 1
+        assert service.hedger.stats()["hedged"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_no_hedging_before_warm_up_or_beyond_budget(self):
+        """Test hedging waits for enough samples and respects the hedge ratio."""
+        cold = FakeProvider(first_token_delays=(0.1,))
+        assert make_service(cold, samples=()).hedger.hedge_delay() is None
+        await collect(make_service(cold, samples=()))
+        assert cold.calls == 1
+        
+        capped = FakeProvider(first_token_delays=(0.1,))
+        service = make_service(capped, max_ratio=0)
+        await collect(service)
+        assert capped.calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_primary_used_when_hedge_fails(self):
+        """Test an attempt that errors does not win the race."""
+        provider = FakeProvider(reply="primary", first_token_delays=(0.1,))
+        service = make_service(provider)
+        calls = []
+        
+        async def failing_open(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("hedge failed")
+            return await FakeProvider.open(provider, *args)
+        
+        provider.open = failing_open
+        
+        assert await collect(service) == "primary"
+        assert len(calls) == 2
+
+
+class TestUpstreamDeadlines:
+    """Test per-phase deadlines against a stalling provider."""
+    
+    @pytest.mark.asyncio
+    async def test_first_token_deadline(self):
+        """Test a provider that never starts answering times out."""
+        service = make_service(FakeProvider(first_token_delays=(5.0,)), enabled=False, first_byte_timeout=0.05)
+        
+        with pytest.raises(asyncio.TimeoutError, match="No response"):
+            await collect(service)
+    
+    @pytest.mark.asyncio
+    async def test_inter_token_deadline(self):
+        """Test a stream that stalls mid-reply times out."""
+        provider = FakeProvider(reply="a b c", first_token_delays=(0.0,), token_delay=5.0)
+        service = make_service(provider, enabled=False, read_timeout=0.05)
+        
+        with pytest.raises(asyncio.TimeoutError, match="stalled"):
+            await collect(service)
+        assert provider.cancelled == 1
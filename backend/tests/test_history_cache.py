@@ -0,0 +1,163 @@
+# tests/test_history_cache.py
+"""
+Tests for the chat history cache and the cached storage wrapper.
+"""
+
+import pytest
+from unittest.mock import patch
+from services.history_cache import HistoryCache, MESSAGE_OVERHEAD_BYTES
+from services.storage import CachedStorage, InMemoryStorage
+
+
+def make_cache(**overrides):
+    """Build a cache with generous defaults."""
+    options = {"max_sessions": 10, "max_bytes": 10_000, "ttl_seconds": 60}
+    options.update(overrides)
+    return HistoryCache(**options)
+
+
+def fill(cache, session_id, messages):
+    """Fill a session as a storage read would."""
+    return cache.fill(session_id, messages, cache.reserve(session_id))
+
+
+class TestHistoryCache:
+    """Test suite for HistoryCache."""
+    
+    def test_miss_then_hit(self):
+        """Test a filled session is served from cache."""
+        cache = make_cache()
+        assert cache.get("s1") is None
+        
+        fill(cache, "s1", [{"role": "user", "content": "Hello"}])
+        
+        assert cache.get("s1") == [{"role": "user", "content": "Hello"}]
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+    
+    def test_append_only_updates_warm_sessions(self):
+        """Test appends extend warm entries and ignore cold ones."""
+        cache = make_cache()
+        fill(cache, "warm", [])
+        
+        cache.append("warm", {"role": "user", "content": "Hi"})
+        cache.append("cold", {"role": "user", "content": "Hi"})
+        
+        assert cache.get("warm") == [{"role": "user", "content": "Hi"}]
+        assert cache.get("cold") is None
+    
+    def test_fill_racing_append_is_discarded(self):
+        """Test a read started before an append cannot cache stale history."""
+        cache = make_cache()
+        token = cache.reserve("s1")
+        cache.append("s1", {"role": "user", "content": "new"})
+        
+        assert cache.fill("s1", [], token) is False
+        assert cache.get("s1") is None
+    
+    def test_lru_eviction_by_session_count(self):
+        """Test the least recently used session is evicted first."""
+        cache = make_cache(max_sessions=2)
+        fill(cache, "a", [])
+        fill(cache, "b", [])
+        cache.get("a")
+        fill(cache, "c", [])
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == []
+        assert cache.stats()["evictions"] == 1
+    
+    def test_eviction_by_bytes(self):
+        """Test the byte limit evicts older sessions."""
+        cache = make_cache(max_bytes=2 * (MESSAGE_OVERHEAD_BYTES + 10))
+        message = {"role": "user", "content": "x" * 10}
+        fill(cache, "a", [message])
+        fill(cache, "b", [message])
+        fill(cache, "c", [message])
+        
+        assert cache.get("a") is None
+        assert cache.stats()["bytes"] <= cache.max_bytes
+    
+    def test_ttl_expiry(self):
+        """Test entries expire after the TTL."""
+        cache = make_cache(ttl_seconds=10)
+        with patch("services.history_cache.time.monotonic", return_value=100.0):
+            fill(cache, "s1", [])
+        with patch("services.history_cache.time.monotonic", return_value=111.0):
+            assert cache.get("s1") is None
+        assert cache.stats()["expirations"] == 1
+
+
+class CountingStorage(InMemoryStorage):
+    """In-memory backend that counts history reads."""
+    
+    def __init__(self):
+        super().__init__()
+        self.history_reads = 0
+    
+    async def get_chat_history(self, session_id):
+        self.history_reads += 1
+        return await super().get_chat_history(session_id)
+
+
+class TestCachedStorage:
+    """Test suite for the CachedStorage wrapper."""
+    
+    @pytest.mark.asyncio
+    async def test_warm_session_reads_backend_once(self):
+        """Test later turns are served without backend reads."""
+        backend = CountingStorage()
+        storage = CachedStorage(backend, make_cache())
+        session_id = await backend.create_session(user_id="user-1")
+        
+        for turn in range(3):
+            await storage.store_message(session_id, "user", f"question {turn}")
+            history = await storage.get_chat_history(session_id)
+            await storage.store_message(session_id, "assistant", f"answer {turn}")
+        
+        assert backend.history_reads == 1
+        assert len(history) == 5
+        assert await storage.get_chat_history(session_id) == await backend.get_chat_history(session_id)
+    
+    @pytest.mark.asyncio
+    async def test_new_session_starts_warm(self):
+        """Test a freshly created session never reads the backend."""
+        backend = CountingStorage()
+        storage = CachedStorage(backend, make_cache())
+        session_id = await storage.create_session(user_id="user-1")
+        
+        await storage.store_message(session_id, "user", "Hello")
+        
+        assert await storage.get_chat_history(session_id) == [{"role": "user", "content": "Hello"}]
+        assert backend.history_reads == 0
+    
+    @pytest.mark.asyncio
+    async def test_validated_hits_see_other_workers_writes(self):
+        """Test a worker's cached transcript is refreshed once another worker sharing the backend stores a turn."""
+        backend = CountingStorage()
+        worker_a = CachedStorage(backend, make_cache(), validate=True)
+        worker_b = CachedStorage(backend, make_cache(), validate=True)
+        session_id = await backend.create_session(user_id="user-1")
+        await worker_a.store_message(session_id, "user", "First")
+        await worker_a.get_chat_history(session_id)
+        await worker_a.get_chat_history(session_id)
+        assert backend.history_reads == 1
+        
+        await worker_b.store_message(session_id, "assistant", "Answered elsewhere")
+        history = await worker_a.get_chat_history(session_id)
+        
+        assert [m["content"] for m in history] == ["First", "Answered elsewhere"]
+        assert backend.history_reads == 2
+        assert worker_a.cache.stats()["stale"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_delete_invalidates(self):
+        """Test deleting a session drops its cached history."""
+        storage = CachedStorage(InMemoryStorage(), make_cache())
+        session_id = await storage.create_session(user_id="user-1")
+        await storage.store_message(session_id, "user", "Hello")
+        await storage.get_chat_history(session_id)
+        
+        await storage.delete_session(session_id)
+        
+        assert await storage.get_chat_history(session_id) == []
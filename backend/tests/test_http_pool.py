@@ -0,0 +1,110 @@
+# tests/test_http_pool.py
+"""
+Tests for the upstream HTTP connection pool.
+"""
+
+import asyncio
+import openai
+import pytest
+from services.http_pool import HTTPPool
+
+
+def make_pool(**overrides):
+    """Build a pool with short timeouts."""
+    options = dict(
+        max_connections=2,
+        keepalive_seconds=30,
+        connect_timeout=1,
+        first_byte_timeout=0.05,
+        read_timeout=0.05,
+        total_timeout=5
+    )
+    options.update(overrides)
+    return HTTPPool(**options)
+
+
+async def respond(chunks, first_delay=0, delay=0):
+    """Fake SDK call returning a stream with the given delays."""
+    async def stream():
+        await asyncio.sleep(first_delay)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(delay)
+            yield chunk
+    return stream()
+
+
+async def collect(pool, response):
+    """Drain a pooled stream into a list."""
+    return [chunk async for chunk in pool.stream(response)]
+
+
+class TestHTTPPool:
+    """Test suite for HTTPPool."""
+    
+    @pytest.mark.asyncio
+    async def test_session_is_shared_and_closed(self):
+        """Test one session serves every request until close."""
+        pool = make_pool()
+        await pool.start()
+        session = pool._session
+        
+        async with pool.request():
+            assert openai.aiosession.get() is session
+        await pool.start()
+        assert pool._session is session
+        
+        await pool.close()
+        assert session.closed
+        assert pool.stats()["started"] is False
+    
+    @pytest.mark.asyncio
+    async def test_stream_passes_chunks_through(self):
+        """Test a timely stream is re-yielded unchanged."""
+        pool = make_pool()
+        
+        assert await collect(pool, respond(["a", "b", "c"])) == ["a", "b", "c"]
+    
+    @pytest.mark.asyncio
+    async def test_first_byte_timeout(self):
+        """Test a slow first chunk raises and is counted."""
+        pool = make_pool()
+        
+        with pytest.raises(asyncio.TimeoutError, match="No response"):
+            await collect(pool, respond(["a"], first_delay=0.2))
+        assert pool.stats()["first_byte_timeouts"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_read_timeout(self):
+        """Test a stall between chunks raises and is counted."""
+        pool = make_pool()
+        received = []
+        
+        with pytest.raises(asyncio.TimeoutError, match="stalled"):
+            async for chunk in pool.stream(respond(["a", "b"], delay=0.2)):
+                received.append(chunk)
+        assert received == ["a"]
+        assert pool.stats()["read_timeouts"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_saturation_is_reported(self):
+        """Test requests beyond the connection limit are counted as saturated."""
+        pool = make_pool(max_connections=2)
+        release = asyncio.Event()
+        
+        async def hold():
+            async with pool.request():
+                await release.wait()
+        
+        tasks = [asyncio.create_task(hold()) for _ in range(3)]
+        await asyncio.sleep(0)
+        
+        stats = pool.stats()
+        assert stats["in_flight"] == 3
+        assert stats["saturated"] == 1
+        assert stats["utilization"] == 1.5
+        
+        release.set()
+        await asyncio.gather(*tasks)
+        assert pool.stats()["in_flight"] == 0
+        assert pool.stats()["peak_in_flight"] == 3
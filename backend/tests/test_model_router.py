@@ -0,0 +1,159 @@
+# tests/test_model_router.py
+"""
+Tests for per-request model routing, run against the fake provider.
+"""
+
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from main import app
+from services.circuit_breaker import CircuitBreakers
+from services.hedging import Hedger
+from services.http_pool import HTTPPool
+from services.model_router import (
+    DEFAULT_KEYWORD_RULES,
+    RuleRouter,
+    StaticRouter,
+    build_tiers,
+    create_router
+)
+from services.openai_service import OpenAIService
+from services.providers import FakeProvider
+
+client = TestClient(app)
+
+TIERS = build_tiers("gpt-standard", 1000, 0.7, {"complex": {"model": "gpt-complex"}, "fast": {"model": "gpt-fast"}})
+
+
+def make_router(**overrides):
+    options = dict(
+        tiers=TIERS,
+        keyword_rules=DEFAULT_KEYWORD_RULES,
+        complex_min_chars=1200,
+        complex_min_history=40
+    )
+    options.update(overrides)
+    return RuleRouter(**options)
+
+
+def conversation(length):
+    return [{"role": "user", "content": "message"}] * length
+
+
+class TestTiers:
+    """Test the tier table."""
+    
+    def test_overrides_and_reply_cap(self):
+        """Test overrides apply per tier and no tier may exceed the default reply budget."""
+        tiers = build_tiers("gpt", 1000, 0.7, {"complex": {"model": "gpt-big", "max_tokens": 4000}})
+        
+        assert tiers["standard"].model == "gpt"
+        assert tiers["standard"].max_tokens == 1000
+        assert tiers["fast"].max_tokens == 300
+        assert tiers["complex"].model == "gpt-big"
+        assert tiers["complex"].max_tokens == 1000
+
+
+class TestRuleRouter:
+    """Test suite for RuleRouter."""
+    
+    @pytest.mark.parametrize("user_input,history,tier,reason", [
+        ("thanks!", 12, "fast", "keyword:thanks"),
+        ("What is the capital of France?", 1, "standard", "default"),
+        ("Why does this fail?\n```python\nprint(x)\n```", 1, "complex", "code"),
+        ("Please debug my login flow", 1, "complex", "keyword:debug"),
+        ("word " * 300, 1, "complex", "long_input"),
+        ("And then what happened to the old city walls?", 50, "complex", "long_history"),
+        ("Tell me a bit about the history of Rome and its first emperors", 2, "standard", "default"),
+    ])
+    def test_decisions(self, user_input, history, tier, reason):
+        """Test each rule picks its tier."""
+        decision = make_router().route(user_input, conversation(history))
+        
+        assert decision.tier.name == tier
+        assert decision.reason == reason
+    
+    def test_decisions_counted_and_logged(self, caplog):
+        """Test decisions are logged with their features and counted for tuning."""
+        router = make_router()
+        
+        with caplog.at_level("INFO", logger="services.model_router"):
+            router.route("hi", [])
+            router.route("hi", [])
+            router.route("Explain the theory of relativity to me", conversation(20))
+        
+        assert "Routed to fast (keyword:hi): chars=2 history=0 code=False" in caplog.text
+        assert router.stats()["tiers"] == {"fast": 2, "standard": 1}
+    
+    def test_custom_keyword_rules(self):
+        """Test rules are pluggable and must name known tiers."""
+        router = make_router(keyword_rules=[(r"\bpoem\b", "complex")])
+        assert router.route("write a poem", []).tier.model == "gpt-complex"
+        
+        with pytest.raises(ValueError):
+            make_router(keyword_rules=[(r"x", "huge")])
+    
+    def test_create_router(self):
+        """Test the factory builds routers by name."""
+        assert isinstance(create_router("rules"), RuleRouter)
+        assert isinstance(create_router("static"), StaticRouter)
+        with pytest.raises(ValueError):
+            create_router("random")
+
+
+class TestRoutedCompletions:
+    """Test the chosen tier reaches the provider."""
+    
+    @pytest.mark.asyncio
+    async def test_tier_parameters_sent_to_provider(self):
+        """Test the tier's model, reply budget and temperature are used for the request."""
+        provider = FakeProvider(reply="You're welcome!", first_token_delays=(0.0,))
+        service = OpenAIService(
+            pool=HTTPPool(
+                max_connections=10,
+                keepalive_seconds=30,
+                connect_timeout=1,
+                first_byte_timeout=2,
+                read_timeout=2,
+                total_timeout=10
+            ),
+            provider=provider,
+            hedger=Hedger(enabled=False, percentile=95, min_samples=20, window=100, max_ratio=0),
+            breakers=CircuitBreakers(
+                event_history=10,
+                failure_rate_threshold=0.5,
+                slow_call_seconds=10,
+                slow_call_rate_threshold=0.5,
+                window=10,
+                min_calls=5,
+                open_seconds=30,
+                half_open_probes=1
+            )
+        )
+        service.fallback_models = []
+        tier = make_router().route("thanks!", []).tier
+        meta = {}
+        
+        reply = "".join([chunk async for chunk in service.stream_completion([], meta, tier)])
+        
+        assert reply == "You're welcome!"
+        assert meta["model"] == "gpt-fast"
+        assert provider.last_request["max_tokens"] == 300
+        assert provider.last_request["temperature"] == 0.5
+        assert service.cache_key([], tier) != service.cache_key([])
+    
+    @patch('services.storage.storage_service.store_message')
+    @patch('services.storage.storage_service.get_chat_history')
+    @patch('services.openai_service.openai_service.stream_completion')
+    def test_chat_stream_routes_each_turn(self, mock_stream, mock_get_history, mock_store_message):
+        """Test the streaming endpoint passes the routed tier to the completion."""
+        mock_get_history.return_value = [{"role": "user", "content": "thanks!"}]
+        
+        async def reply(context, meta=None, tier=None):
+            yield tier.name
+        
+        mock_stream.side_effect = reply
+        
+        response = client.get("/chat/stream?session_id=route-1&user_input=thanks!&no_cache=true")
+        
+        assert "data: fast\n\n" in response.text
@@ -0,0 +1,110 @@
+# tests/test_pubsub.py
+"""
+Tests for the pub/sub backends that relay live replies between workers.
+"""
+
+import asyncio
+import multiprocessing
+import pytest
+from services.generation import GenerationManager
+from services.pubsub import SQLitePubSub, create_pubsub
+from tests.test_stream_broker import collect, make_broker, start_reply
+
+
+def make_pubsub(path):
+    return SQLitePubSub(str(path), poll_interval=0.005)
+
+
+def publish_from_child(path, count):
+    """Child process: wait for a subscriber, then publish `count` messages."""
+    async def main():
+        pubsub = make_pubsub(path)
+        while not await pubsub.publish("chat:s1", {"type": "ping"}):
+            await asyncio.sleep(0.01)
+        for index in range(count):
+            await pubsub.publish("chat:s1", {"type": "chunk", "index": index})
+        await pubsub.close()
+    
+    asyncio.run(main())
+
+
+class TestSQLitePubSub:
+    """Test suite for SQLitePubSub."""
+    
+    @pytest.mark.asyncio
+    async def test_messages_cross_instances(self, tmp_path):
+        """Test instances sharing a file see each other's subscribers and messages."""
+        publisher, receiver = make_pubsub(tmp_path / "pubsub.db"), make_pubsub(tmp_path / "pubsub.db")
+        
+        assert await publisher.publish("chat:s1", {"n": 0}) == 0
+        subscription = await receiver.subscribe("chat:s1", max_queue=10)
+        assert await publisher.publish("chat:s1", {"n": 1}) == 1
+        await publisher.publish("chat:other", {"n": 2})
+        
+        assert await asyncio.wait_for(subscription.get(), 1) == {"n": 1}
+        await asyncio.sleep(0.05)
+        assert subscription._queue.empty()
+        
+        await subscription.close()
+        await asyncio.sleep(0.05)
+        assert await publisher.publish("chat:s1", {"n": 3}) == 0
+        await publisher.close()
+        await receiver.close()
+    
+    @pytest.mark.asyncio
+    async def test_overflow_is_flagged(self, tmp_path):
+        """Test a full subscriber buffer drops messages and is flagged, as in memory."""
+        pubsub = make_pubsub(tmp_path / "pubsub.db")
+        subscription = await pubsub.subscribe("chat:s1", max_queue=2)
+        
+        for n in range(4):
+            await pubsub.publish("chat:s1", {"n": n})
+        await asyncio.sleep(0.05)
+        
+        assert subscription.overflowed is True
+        assert subscription.dropped == 2
+        await pubsub.close()
+    
+    @pytest.mark.asyncio
+    async def test_messages_cross_processes(self, tmp_path):
+        """Test a subscriber receives what another process publishes."""
+        pubsub = make_pubsub(tmp_path / "pubsub.db")
+        subscription = await pubsub.subscribe("chat:s1", max_queue=100)
+        child = multiprocessing.get_context("spawn").Process(
+            target=publish_from_child, args=(tmp_path / "pubsub.db", 3)
+        )
+        child.start()
+        
+        received = []
+        while len(received) < 3:
+            message = await asyncio.wait_for(subscription.get(), 10)
+            if message["type"] == "chunk":
+                received.append(message["index"])
+        child.join(10)
+        
+        assert received == [0, 1, 2]
+        assert child.exitcode == 0
+        await pubsub.close()
+    
+    @pytest.mark.asyncio
+    async def test_broker_follows_reply_from_another_worker(self, tmp_path):
+        """Test a worker follows a reply generated by a worker on another connection."""
+        owner_worker = make_broker(make_pubsub(tmp_path / "pubsub.db"))
+        other_worker = make_broker(make_pubsub(tmp_path / "pubsub.db"))
+        generation = await start_reply(GenerationManager(), "one two three four", token_delay=0.02)
+        owner_worker.own("s1", "Count", generation)
+        await asyncio.sleep(0.03)
+        
+        live = await other_worker.attach("s1", "Count")
+        
+        assert live is not None
+        assert "".join(chunk for _, chunk in await collect(live)) == "one two three four"
+        for broker in (owner_worker, other_worker):
+            await broker.close()
+            await broker.pubsub.close()
+    
+    def test_create_pubsub(self):
+        """Test the factory knows the sqlite backend and rejects unknown names."""
+        assert isinstance(create_pubsub("sqlite"), SQLitePubSub)
+        with pytest.raises(ValueError):
+            create_pubsub("redis")
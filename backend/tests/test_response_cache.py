@@ -0,0 +1,176 @@
+# tests/test_response_cache.py
+"""
+Tests for the response cache and its use by the streaming chat endpoint.
+"""
+
+import os
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from main import app
+from services.response_cache import ResponseCache, response_cache
+
+client = TestClient(app)
+
+PROMPT = [{"role": "user", "content": "Hello"}]
+
+
+def make_cache(**overrides):
+    """Build an enabled in-memory cache with small limits."""
+    options = dict(enabled=True, max_entries=10, max_bytes=1000, ttl_seconds=60)
+    options.update(overrides)
+    return ResponseCache(**options)
+
+
+def reply_text(body):
+    """The reply an SSE body carries, however its deltas were framed."""
+    return "".join(line[len("data: "):] for line in body.splitlines() if line.startswith("data: "))
+
+
+class TestResponseCache:
+    """Test suite for ResponseCache."""
+    
+    def test_key_covers_parameters_and_prompt(self):
+        """Test keys differ when any input differs."""
+        key = ResponseCache.make_key("gpt", 0.7, 100, PROMPT)
+        
+        assert key == ResponseCache.make_key("gpt", 0.7, 100, [dict(PROMPT[0])])
+        assert key != ResponseCache.make_key("gpt-4", 0.7, 100, PROMPT)
+        assert key != ResponseCache.make_key("gpt", 0.2, 100, PROMPT)
+        assert key != ResponseCache.make_key("gpt", 0.7, 50, PROMPT)
+        assert key != ResponseCache.make_key("gpt", 0.7, 100, [{"role": "user", "content": "Hi"}])
+    
+    @pytest.mark.asyncio
+    async def test_hit_returns_chunks_and_counts(self):
+        """Test a stored reply is returned with its original chunking."""
+        cache = make_cache()
+        
+        assert await cache.get("k", "chat_stream") is None
+        await cache.put("k", ["Hel", "lo"])
+        assert await cache.get("k", "chat_stream") == ["Hel", "lo"]
+        
+        stats = cache.stats()["endpoints"]["chat_stream"]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+    
+    @pytest.mark.asyncio
+    async def test_bypass_and_disabled(self):
+        """Test bypassed and disabled lookups never hit."""
+        cache = make_cache()
+        await cache.put("k", ["a"])
+        
+        assert await cache.get("k", "chat_stream", bypass=True) is None
+        
+        disabled = make_cache(enabled=False)
+        await disabled.put("k", ["a"])
+        assert await disabled.get("k", "chat_stream") is None
+        assert disabled.stats()["entries"] == 0
+        
+        assert cache.stats()["endpoints"]["chat_stream"]["bypassed"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_lru_eviction_by_entries_and_bytes(self):
+        """Test least recently used replies are evicted first."""
+        cache = make_cache(max_entries=2, max_bytes=10)
+        await cache.put("a", ["aaa"])
+        await cache.put("b", ["bbb"])
+        await cache.get("a", "chat_stream")
+        await cache.put("c", ["ccc"])
+        
+        assert await cache.get("b", "chat_stream") is None
+        assert await cache.get("a", "chat_stream") == ["aaa"]
+        
+        await cache.put("d", ["dddddddd"])
+        assert cache.stats()["bytes"] <= 10
+        assert await cache.get("d", "chat_stream") == ["dddddddd"]
+        
+        await cache.put("huge", ["x" * 11])
+        assert await cache.get("huge", "chat_stream") is None
+    
+    @pytest.mark.asyncio
+    async def test_expired_entries_miss(self):
+        """Test replies past their TTL are dropped."""
+        cache = make_cache(ttl_seconds=0)
+        await cache.put("k", ["a"])
+        
+        assert await cache.get("k", "chat_stream") is None
+        assert cache.stats()["entries"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_disk_tier_survives_memory_loss(self, tmp_path):
+        """Test replies are reloaded from disk after the memory tier is cleared."""
+        cache = make_cache(disk_dir=str(tmp_path), disk_max_entries=10)
+        await cache.put("k", ["a", "b"])
+        cache.clear()
+        
+        assert await cache.get("k", "chat_stream") == ["a", "b"]
+        assert cache.stats()["disk_hits"] == 1
+        
+        # A fresh cache over the same directory sees it too
+        other = make_cache(disk_dir=str(tmp_path), disk_max_entries=10)
+        assert await other.get("k", "chat_stream") == ["a", "b"]
+    
+    @pytest.mark.asyncio
+    async def test_disk_tier_is_pruned(self, tmp_path):
+        """Test the disk tier is trimmed to its maximum."""
+        cache = make_cache(disk_dir=str(tmp_path), disk_max_entries=5)
+        with patch("services.response_cache.DISK_PRUNE_INTERVAL", 10):
+            for i in range(10):
+                await cache.put(f"k{i}", ["a"])
+        
+        assert len(os.listdir(tmp_path)) == 5
+
+
+class TestChatStreamCaching:
+    """Test the streaming endpoint's use of the response cache."""
+    
+    @pytest.fixture(autouse=True)
+    def enabled_cache(self):
+        """Enable the shared cache for the duration of a test."""
+        response_cache.enabled = True
+        response_cache.clear()
+        yield
+        response_cache.enabled = False
+        response_cache.clear()
+    
+    @patch('services.storage.storage_service.store_message')
+    @patch('services.storage.storage_service.get_chat_history')
+    @patch('services.openai_service.openai_service.stream_completion')
+    def test_identical_prompt_replays_cached_reply(self, mock_stream, mock_get_history, mock_store_message):
+        """Test a repeated prompt is answered from the cache unless bypassed."""
+        mock_get_history.return_value = [{"role": "user", "content": "Hello"}]
+        
+        async def reply(context, meta=None, tier=None):
+            yield "Hello"
+            yield " there!"
+        
+        mock_stream.side_effect = reply
+        
+        first = client.get("/chat/stream?session_id=cache-1&user_input=Hello")
+        second = client.get("/chat/stream?session_id=cache-1&user_input=Hello")
+        
+        assert reply_text(first.text) == reply_text(second.text) == "Hello there![DONE]"
+        assert mock_stream.call_count == 1
+        
+        client.get("/chat/stream?session_id=cache-1&user_input=Hello&no_cache=true")
+        assert mock_stream.call_count == 2
+    
+    @patch('services.storage.storage_service.store_message')
+    @patch('services.storage.storage_service.get_chat_history')
+    @patch('services.openai_service.openai_service.stream_completion')
+    def test_failed_reply_is_not_cached(self, mock_stream, mock_get_history, mock_store_message):
+        """Test a reply that errors part-way is not replayed."""
+        mock_get_history.return_value = [{"role": "user", "content": "Hello"}]
+        
+        async def failing(context, meta=None, tier=None):
+            yield "Starting..."
+            raise Exception("OpenAI API error")
+        
+        mock_stream.side_effect = failing
+        
+        response = client.get("/chat/stream?session_id=cache-2&user_input=Hello")
+        client.get("/chat/stream?session_id=cache-2&user_input=Hello")
+        
+        assert "Error: OpenAI API error" in response.text
+        assert mock_stream.call_count == 2
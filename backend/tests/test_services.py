@@ -6,9 +6,29 @@ Tests for service layer components.
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 from services.firebase_service import FirebaseService
+from services.admission import AdmissionController
 from services.openai_service import OpenAIService
+from services.providers import FakeProvider
 from utils.constants import DEFAULT_CHAT_TITLE, TITLE_WORD_LIMIT
 import asyncio
+import json
+import zlib
+
+
+def async_stream(items):
+    """Build a callable returning an async iterator over items, like Firestore's stream()."""
+    async def _stream(*args, **kwargs):
+        for item in items:
+            yield item
+    return _stream
+
+
+def route_subcollections(service, **subcollections):
+    """Point chats/{id}/<name> at the given mocks and return the chat reference mock."""
+    chat_ref = MagicMock()
+    chat_ref.collection.side_effect = lambda name: subcollections[name]
+    service.db.collection.return_value.document.return_value = chat_ref
+    return chat_ref
 
 
 class TestFirebaseService:
@@ -18,73 +38,217 @@ class TestFirebaseService:
     def firebase_service(self):
         """Create Firebase service instance with mocked db."""
         with patch('services.firebase_service.get_firebase_app'):
-            with patch('services.firebase_service.firestore.client'):
+            with patch('services.firebase_service.firestore_async.client'):
                 service = FirebaseService()
                 # Mock the database client
                 service.db = MagicMock()
                 return service
     
-    def test_store_message_user(self, firebase_service):
-        """Test storing a user message."""
-        # Setup mocks
-        mock_chat_ref = MagicMock()
-        mock_messages_ref = MagicMock()
-        mock_doc = MagicMock()
-        mock_doc.exists = True
-        mock_doc.to_dict.return_value = {"title": DEFAULT_CHAT_TITLE}
+    @staticmethod
+    def capture_batches(firebase_service):
+        """Make db.batch() return recorded mocks and return the record."""
+        batches = []
         
-        firebase_service.db.collection.return_value.document.return_value = mock_chat_ref
-        mock_chat_ref.collection.return_value = mock_messages_ref
-        mock_chat_ref.get.return_value = mock_doc
+        def new_batch():
+            batch = MagicMock()
+            batch.commit = AsyncMock()
+            batches.append(batch)
+            return batch
+        
+        firebase_service.db.batch.side_effect = new_batch
+        return batches
+    
+    @staticmethod
+    def chat_doc(session_id, **data):
+        """Build a chat document snapshot mock."""
+        doc = MagicMock(id=session_id, exists=True)
+        doc.to_dict.return_value = data
+        return doc
+    
+    @pytest.mark.asyncio
+    async def test_store_message_user(self, firebase_service):
+        """Test storing a user message updates metadata and title in one commit."""
+        from datetime import datetime
+        
+        firebase_service.db.get_all = async_stream([
+            self.chat_doc("test-123", title=DEFAULT_CHAT_TITLE, title_locked=False)
+        ])
+        batches = self.capture_batches(firebase_service)
         
         # Execute - use a message with more than 4 words
         test_message = "Hello world this is a test message"
-        firebase_service.store_message("test-123", "user", test_message)
+        await firebase_service.store_message("test-123", "user", test_message)
         
-        # Assertions
-        mock_messages_ref.add.assert_called_once()
-        call_args = mock_messages_ref.add.call_args[0][0]
-        assert call_args["role"] == "user"
-        assert call_args["content"] == test_message
-        assert "timestamp" in call_args
+        # One commit: the message, then the chat metadata update
+        assert len(batches) == 1
+        batches[0].set.assert_called_once()
+        _, message = batches[0].set.call_args.args
+        _, metadata = batches[0].update.call_args.args
+        assert message["role"] == "user"
+        assert message["content"] == test_message
+        assert isinstance(message["timestamp"], datetime)
+        
+        assert metadata["message_count"].value == 1
+        assert metadata["last_seq"].value == 1
+        assert metadata["last_message_at"] == message["timestamp"]
         
-        # Title should be updated with first 4 words
-        expected_title = "Hello world this is..."
-        mock_chat_ref.update.assert_called_once_with({"title": expected_title})
+        # Title should be updated with first 4 words and locked
+        assert metadata["title"] == "Hello world this is..."
+        assert metadata["title_locked"] is True
+        batches[0].commit.assert_awaited_once()
     
-    def test_store_message_assistant(self, firebase_service):
-        """Test storing an assistant message."""
-        # Setup mocks
-        mock_chat_ref = MagicMock()
-        mock_messages_ref = MagicMock()
+    @pytest.mark.asyncio
+    async def test_single_writes_use_increasing_client_timestamps(self, firebase_service):
+        """Test back-to-back single writes are ordered like queued writes."""
+        firebase_service.db.get_all = async_stream([self.chat_doc("test-123", title_locked=True)])
+        batches = self.capture_batches(firebase_service)
+        
+        await firebase_service.store_message("test-123", "user", "Hi")
+        firebase_service.db.get_all = async_stream([self.chat_doc("test-123", title_locked=True)])
+        await firebase_service.store_message("test-123", "assistant", "Hello")
         
-        firebase_service.db.collection.return_value.document.return_value = mock_chat_ref
-        mock_chat_ref.collection.return_value = mock_messages_ref
+        first, second = (batch.set.call_args.args[1]["timestamp"] for batch in batches)
+        assert first < second
+    
+    @pytest.mark.asyncio
+    async def test_store_message_assistant(self, firebase_service):
+        """Test storing an assistant message."""
+        firebase_service.db.get_all = MagicMock()
+        batches = self.capture_batches(firebase_service)
         
         # Execute
-        firebase_service.store_message("test-123", "assistant", "I'm here to help!")
+        await firebase_service.store_message("test-123", "assistant", "I'm here to help!")
         
         # Assertions
-        mock_messages_ref.add.assert_called_once()
-        # Title should NOT be updated for assistant messages
-        mock_chat_ref.get.assert_not_called()
-        mock_chat_ref.update.assert_not_called()
+        metadata = batches[0].update.call_args[0][1]
+        assert metadata["message_count"].value == 1
+        # Title should NOT be read or updated for assistant messages
+        firebase_service.db.get_all.assert_not_called()
+        assert "title" not in metadata
+    
+    @pytest.mark.asyncio
+    async def test_locked_titles_are_not_read_again(self, firebase_service):
+        """Test a session seen with a locked title skips the title read afterwards."""
+        reads = []
+        
+        async def get_all(refs, field_paths=None):
+            reads.append(field_paths)
+            yield self.chat_doc("test-123", title="Existing title", title_locked=True)
+        
+        firebase_service.db.get_all = get_all
+        batches = self.capture_batches(firebase_service)
+        
+        await firebase_service.store_message("test-123", "user", "First")
+        await firebase_service.store_message("test-123", "user", "Second")
+        
+        assert reads == [["title", "title_locked"]]
+        for batch in batches:
+            assert "title" not in batch.update.call_args[0][1]
     
-    def test_update_chat_title_short_message(self, firebase_service):
+    @pytest.mark.asyncio
+    async def test_store_messages_batches_writes(self, firebase_service):
+        """Test queued messages are committed in batches within the Firestore limit."""
+        from datetime import datetime, timedelta, timezone
+        from services.firebase_service import FIRESTORE_BATCH_LIMIT
+        from services.storage import MessageWrite
+        
+        firebase_service.db.get_all = async_stream([
+            self.chat_doc("test-123", title=DEFAULT_CHAT_TITLE)
+        ])
+        batches = self.capture_batches(firebase_service)
+        now = datetime.now(timezone.utc)
+        messages = [
+            MessageWrite("test-123", "user", f"Hello number {i} of many", now + timedelta(microseconds=i))
+            for i in range(FIRESTORE_BATCH_LIMIT)
+        ]
+        
+        # Execute
+        await firebase_service.store_messages(messages)
+        
+        # Each commit carries its own messages plus a matching metadata update
+        assert len(batches) == 2
+        first_metadata = batches[0].update.call_args[0][1]
+        second_metadata = batches[1].update.call_args[0][1]
+        assert batches[0].set.call_count == FIRESTORE_BATCH_LIMIT - 1
+        assert first_metadata["message_count"].value == FIRESTORE_BATCH_LIMIT - 1
+        assert first_metadata["title"] == "Hello number 0 of..."
+        assert batches[1].set.call_count == 1
+        assert second_metadata["message_count"].value == 1
+        assert second_metadata["last_message_at"] == messages[-1].timestamp
+        assert "title" not in second_metadata
+        for batch in batches:
+            batch.commit.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_store_messages_short_title(self, firebase_service):
         """Test title update with short message."""
-        mock_chat_ref = MagicMock()
-        mock_doc = MagicMock()
-        mock_doc.exists = True
-        mock_doc.to_dict.return_value = {"title": DEFAULT_CHAT_TITLE}
-        mock_chat_ref.get.return_value = mock_doc
+        firebase_service.db.get_all = async_stream([
+            self.chat_doc("test-123", title=DEFAULT_CHAT_TITLE)
+        ])
+        batches = self.capture_batches(firebase_service)
         
         # Execute with short message
-        firebase_service._update_chat_title_if_needed(mock_chat_ref, "Hi there")
+        await firebase_service.store_message("test-123", "user", "Hi there")
         
         # Should not add ellipsis for short messages
-        mock_chat_ref.update.assert_called_once_with({"title": "Hi there"})
+        assert batches[0].update.call_args[0][1]["title"] == "Hi there"
     
-    def test_get_chat_history(self, firebase_service):
+    @pytest.mark.asyncio
+    async def test_store_messages_for_deleted_session_are_dropped(self, firebase_service):
+        """Test a commit failing on a deleted chat is retried without that chat's messages, which are reported."""
+        from datetime import datetime, timezone
+        from google.api_core.exceptions import NotFound
+        from services.storage import MessageWrite, SessionNotFound
+        
+        chats = {}
+        firebase_service.db.collection.return_value.document.side_effect = (
+            lambda session_id: chats.setdefault(session_id, MagicMock(id=session_id))
+        )
+        firebase_service.db.get_all = async_stream([
+            self.chat_doc("live", title="Chat", title_locked=True),
+            MagicMock(id="deleted", exists=False),
+        ])
+        batches = self.capture_batches(firebase_service)
+        batches_made = firebase_service.db.batch.side_effect
+        
+        def new_batch():
+            batch = batches_made()
+            if len(batches) == 1:
+                batch.commit.side_effect = NotFound("No document to update")
+            return batch
+        
+        firebase_service.db.batch.side_effect = new_batch
+        now = datetime.now(timezone.utc)
+        
+        with pytest.raises(SessionNotFound) as raised:
+            await firebase_service.store_messages([
+                MessageWrite("deleted", "assistant", "Too late", now),
+                MessageWrite("live", "assistant", "Hello", now),
+            ])
+        
+        assert raised.value.session_ids == ["deleted"]
+        assert len(batches) == 2
+        retried = batches[1]
+        assert [call.args[1]["content"] for call in retried.set.call_args_list] == ["Hello"]
+        assert [call.args[0] for call in retried.update.call_args_list] == [chats["live"]]
+        retried.commit.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_get_session_metadata(self, firebase_service):
+        """Test metadata comes from the chat document alone."""
+        chat_ref = firebase_service.db.collection.return_value.document.return_value
+        chat_ref.get = AsyncMock(return_value=self.chat_doc(
+            "test-123", title="Chat", title_locked=True, message_count=4, last_seq=4
+        ))
+        
+        metadata = await firebase_service.get_session_metadata("test-123")
+        
+        assert metadata["message_count"] == 4
+        assert metadata["title_locked"] is True
+        chat_ref.collection.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_get_chat_history(self, firebase_service):
         """Test retrieving chat history."""
         # Setup mocks
         mock_docs = [
@@ -92,14 +256,15 @@ class TestFirebaseService:
             MagicMock(to_dict=lambda: {"role": "assistant", "content": "Hi!"})
         ]
         
-        mock_chat_ref = MagicMock()
         mock_messages_ref = MagicMock()
-        mock_messages_ref.order_by.return_value.stream.return_value = mock_docs
+        mock_messages_ref.order_by.return_value.order_by.return_value.stream = async_stream(mock_docs)
+        mock_snapshots_ref = MagicMock()
+        mock_snapshots_ref.order_by.return_value.stream = async_stream([])
         
-        firebase_service.db.collection.return_value.document.return_value.collection.return_value = mock_messages_ref
+        route_subcollections(firebase_service, messages=mock_messages_ref, snapshots=mock_snapshots_ref)
         
         # Execute
-        history = firebase_service.get_chat_history("test-123")
+        history = await firebase_service.get_chat_history("test-123")
         
         # Assertions
         assert len(history) == 2
@@ -108,55 +273,238 @@ class TestFirebaseService:
         assert history[1]["role"] == "assistant"
         assert history[1]["content"] == "Hi!"
     
-    def test_create_session_with_id(self, firebase_service):
+    @pytest.mark.asyncio
+    async def test_get_chat_history_with_snapshots(self, firebase_service):
+        """Test compacted chunks come first, followed by the uncompacted tail."""
+        snapshot = MagicMock()
+        snapshot.to_dict.return_value = {
+            "messages": zlib.compress(json.dumps([["user", "one"], ["assistant", "two"]]).encode()),
+            "count": 2,
+            "last_timestamp": "ts-2",
+            "last_message_id": "m2"
+        }
+        mock_snapshots_ref = MagicMock()
+        mock_snapshots_ref.order_by.return_value.stream = async_stream([snapshot])
+        
+        tail = [MagicMock(to_dict=lambda: {"role": "user", "content": "three"})]
+        mock_messages_ref = MagicMock()
+        ordered = mock_messages_ref.order_by.return_value.order_by.return_value
+        ordered.start_after.return_value.stream = async_stream(tail)
+        
+        route_subcollections(firebase_service, messages=mock_messages_ref, snapshots=mock_snapshots_ref)
+        
+        # Execute
+        history = await firebase_service.get_chat_history("test-123")
+        
+        # Assertions
+        assert [m["content"] for m in history] == ["one", "two", "three"]
+        ordered.start_after.assert_called_once_with({"timestamp": "ts-2", "__name__": "m2"})
+    
+    @pytest.mark.asyncio
+    async def test_compact_session(self, firebase_service):
+        """Test stable messages are folded into full, ordered snapshot chunks."""
+        docs = []
+        for i in range(6):
+            doc = MagicMock(id=f"m{i}")
+            doc.to_dict.return_value = {"role": "user", "content": f"message {i}", "timestamp": f"ts-{i}"}
+            docs.append(doc)
+        
+        mock_snapshots_ref = MagicMock()
+        mock_snapshots_ref.order_by.return_value.select.return_value.stream = async_stream([])
+        mock_messages_ref = MagicMock()
+        mock_messages_ref.order_by.return_value.order_by.return_value.stream = async_stream(docs)
+        route_subcollections(firebase_service, messages=mock_messages_ref, snapshots=mock_snapshots_ref)
+        
+        mock_batch = MagicMock()
+        mock_batch.commit = AsyncMock()
+        firebase_service.db.batch.return_value = mock_batch
+        
+        # Execute: keep 1 recent message, chunks of 2 -> 5 stable messages, 2 full chunks
+        with patch('services.firebase_service.settings') as mock_settings:
+            mock_settings.compaction_keep_recent = 1
+            mock_settings.compaction_chunk_size = 2
+            compacted = await firebase_service.compact_session("test-123")
+        
+        # Assertions
+        assert compacted == 4
+        assert mock_batch.create.call_count == 2
+        mock_snapshots_ref.document.assert_any_call("00000000")
+        mock_snapshots_ref.document.assert_any_call("00000001")
+        
+        chunks = [call[0][1] for call in mock_batch.create.call_args_list]
+        contents = [
+            content
+            for chunk in chunks
+            for _, content in json.loads(zlib.decompress(chunk["messages"]))
+        ]
+        assert contents == [f"message {i}" for i in range(4)]
+        assert chunks[-1]["last_message_id"] == "m3"
+        assert chunks[-1]["last_timestamp"] == "ts-3"
+    
+    @pytest.mark.asyncio
+    async def test_get_messages_page(self, firebase_service):
+        """Test message windows are read newest first and returned oldest first."""
+        from datetime import datetime, timezone
+        
+        timestamp = datetime(2024, 1, 2, tzinfo=timezone.utc)
+        docs = []
+        for doc_id, content in [("m3", "third"), ("m2", "second"), ("m1", "first")]:
+            doc = MagicMock(id=doc_id)
+            doc.to_dict.return_value = {"role": "user", "content": content}
+            doc.get.return_value = timestamp
+            docs.append(doc)
+        
+        query = firebase_service.db.collection.return_value.document.return_value \
+            .collection.return_value.order_by.return_value.order_by.return_value
+        query.limit.return_value.stream = async_stream(docs)
+        
+        # Execute
+        page = await firebase_service.get_messages_page("test-123", 2)
+        
+        # Assertions
+        query.limit.assert_called_once_with(3)
+        assert [m["content"] for m in page.messages] == ["second", "third"]
+        assert page.has_more is True
+        
+        # The cursor resumes before the oldest returned message
+        query.start_after.return_value.limit.return_value.stream = async_stream([])
+        await firebase_service.get_messages_page("test-123", 2, page.next_before)
+        query.start_after.assert_called_once_with({"timestamp": timestamp, "__name__": "m2"})
+    
+    @pytest.mark.asyncio
+    async def test_list_user_sessions_page(self, firebase_service):
+        """Test session listing uses an ordered, projected, limited query."""
+        from datetime import datetime, timezone
+        from firebase_admin import firestore
+        
+        last_message_at = datetime(2024, 1, 2, tzinfo=timezone.utc)
+        docs = []
+        for doc_id in ["b", "a"]:
+            doc = MagicMock(id=doc_id)
+            doc.to_dict.return_value = {
+                "title": f"Chat {doc_id}",
+                "message_count": 3,
+                "last_message_at": last_message_at
+            }
+            doc.get.return_value = last_message_at
+            docs.append(doc)
+        
+        query = firebase_service.db.collection.return_value.where.return_value \
+            .order_by.return_value.order_by.return_value.select.return_value
+        query.limit.return_value.stream = async_stream(docs)
+        
+        # Execute with a page size smaller than the result set
+        page = await firebase_service.list_user_sessions("user-1", 1)
+        
+        # Assertions
+        query.limit.assert_called_once_with(2)
+        firebase_service.db.collection.return_value.where.return_value.order_by.return_value \
+            .order_by.return_value.select.assert_called_once_with(["title", "last_message_at", "message_count"])
+        firebase_service.db.collection.return_value.where.return_value.order_by.assert_called_once_with(
+            "last_message_at", direction=firestore.Query.DESCENDING
+        )
+        assert page.sessions == [{
+            "session_id": "b",
+            "title": "Chat b",
+            "message_count": 3,
+            "last_message_at": last_message_at
+        }]
+        assert page.next_cursor is not None
+        
+        # The cursor resumes after the last returned document
+        query.start_after.return_value.limit.return_value.stream = async_stream([])
+        await firebase_service.list_user_sessions("user-1", 1, page.next_cursor)
+        query.start_after.assert_called_once_with({"last_message_at": last_message_at, "__name__": "b"})
+    
+    @pytest.mark.asyncio
+    async def test_create_session_with_id(self, firebase_service):
         """Test creating a session with provided ID."""
         mock_doc_ref = MagicMock()
+        mock_doc_ref.set = AsyncMock()
         firebase_service.db.collection.return_value.document.return_value = mock_doc_ref
         
         # Execute
-        session_id = firebase_service.create_session("custom-id")
+        session_id = await firebase_service.create_session("custom-id")
         
         # Assertions
         assert session_id == "custom-id"
-        mock_doc_ref.set.assert_called_once()
+        mock_doc_ref.set.assert_awaited_once()
         call_args = mock_doc_ref.set.call_args[0][0]
         assert "created_at" in call_args
         assert call_args["title"] == DEFAULT_CHAT_TITLE
     
-    def test_create_session_without_id(self, firebase_service):
+    @pytest.mark.asyncio
+    async def test_create_session_without_id(self, firebase_service):
         """Test creating a session without provided ID."""
         mock_doc_ref = MagicMock()
+        mock_doc_ref.set = AsyncMock()
         firebase_service.db.collection.return_value.document.return_value = mock_doc_ref
         
         # Execute
-        session_id = firebase_service.create_session()
+        session_id = await firebase_service.create_session()
         
         # Assertions
         assert session_id is not None
         assert len(session_id) == 36  # UUID format
-        mock_doc_ref.set.assert_called_once()
+        mock_doc_ref.set.assert_awaited_once()
     
-    def test_delete_session(self, firebase_service):
+    @pytest.mark.asyncio
+    async def test_delete_session(self, firebase_service):
         """Test deleting a session."""
         # Setup mocks
-        mock_session_ref = MagicMock()
         mock_messages_ref = MagicMock()
+        mock_snapshots_ref = MagicMock()
         mock_batch = MagicMock()
+        mock_batch.commit = AsyncMock()
         
         mock_messages = [MagicMock(reference="msg1"), MagicMock(reference="msg2")]
-        mock_messages_ref.stream.return_value = mock_messages
+        mock_messages_ref.select.return_value.stream = async_stream(mock_messages)
+        mock_snapshots_ref.select.return_value.stream = async_stream([MagicMock(reference="snap1")])
         
-        firebase_service.db.collection.return_value.document.return_value = mock_session_ref
+        mock_session_ref = route_subcollections(
+            firebase_service, messages=mock_messages_ref, snapshots=mock_snapshots_ref
+        )
+        mock_session_ref.delete = AsyncMock()
         firebase_service.db.batch.return_value = mock_batch
-        mock_session_ref.collection.return_value = mock_messages_ref
         
         # Execute
-        firebase_service.delete_session("test-123")
+        await firebase_service.delete_session("test-123")
         
         # Assertions
-        assert mock_batch.delete.call_count == 2
-        mock_batch.commit.assert_called_once()
-        mock_session_ref.delete.assert_called_once()
+        assert mock_batch.delete.call_count == 3
+        mock_batch.commit.assert_awaited_once()
+        mock_session_ref.delete.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_delete_session_chunks_batches(self, firebase_service):
+        """Test that large sessions are deleted in batches of at most 500 operations."""
+        mock_messages_ref = MagicMock()
+        mock_snapshots_ref = MagicMock()
+        batches = []
+        
+        def new_batch():
+            batch = MagicMock()
+            batch.commit = AsyncMock()
+            batches.append(batch)
+            return batch
+        
+        mock_messages_ref.select.return_value.stream = async_stream(
+            [MagicMock(reference=f"msg{i}") for i in range(1200)]
+        )
+        mock_snapshots_ref.select.return_value.stream = async_stream([])
+        
+        mock_session_ref = route_subcollections(
+            firebase_service, messages=mock_messages_ref, snapshots=mock_snapshots_ref
+        )
+        mock_session_ref.delete = AsyncMock()
+        firebase_service.db.batch.side_effect = new_batch
+        
+        await firebase_service.delete_session("test-123")
+        
+        assert [batch.delete.call_count for batch in batches] == [500, 500, 200]
+        assert all(batch.commit.await_count == 1 for batch in batches)
+        mock_messages_ref.select.assert_called_once_with([])
+        mock_session_ref.delete.assert_awaited_once()
 
 
 class TestOpenAIService:
@@ -224,6 +572,26 @@ class TestOpenAIService:
             # Should yield error message
             assert len(result) == 1
             assert "Error:" in result[0]
+    
+    @pytest.mark.asyncio
+    async def test_summarize_sends_only_new_messages(self):
+        """Test summary updates go through the provider and hold an admission slot."""
+        provider = FakeProvider(reply="Updated summary", first_token_delays=(0,), token_delay=0)
+        admission = AdmissionController(max_concurrent=1, max_queue=1, max_wait_seconds=1, retry_after=1)
+        service = OpenAIService(provider=provider, admission=admission)
+        
+        result = await service.summarize(
+            "Earlier summary",
+            [{"role": "user", "content": "New question"}]
+        )
+        
+        assert result == "Updated summary"
+        prompt = provider.last_request["messages"][-1]["content"]
+        assert "Earlier summary" in prompt
+        assert "user: New question" in prompt
+        assert provider.last_request["temperature"] == 0
+        assert admission.stats()["admitted"] == 1
+        assert admission.stats()["active"] == 0
 
 
 @pytest.fixture
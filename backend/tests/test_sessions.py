@@ -8,6 +8,9 @@ from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 from main import app
 from services.auth_service import auth_service
+from services.storage import MessagePage, SessionPage
+from services.storage.base import encode_cursor
+from config.settings import settings
 import uuid
 
 client = TestClient(app)
@@ -34,14 +37,14 @@ class TestSessionEndpoints:
         # Clean up after test
         app.dependency_overrides.clear()
     
-    @patch('services.firebase_service.firebase_service.list_user_sessions')
+    @patch('services.storage.storage_service.list_user_sessions')
     def test_get_all_sessions_success(self, mock_list_sessions):
         """Test successful retrieval of all sessions."""
         # Setup mock
-        mock_list_sessions.return_value = [
+        mock_list_sessions.return_value = SessionPage([
             {"session_id": "123", "title": "Test Chat 1"},
             {"session_id": "456", "title": "Test Chat 2"}
-        ]
+        ], None)
         
         # Make request
         response = client.get("/chats")
@@ -53,14 +56,44 @@ class TestSessionEndpoints:
         assert len(data["sessions"]) == 2
         assert data["sessions"][0]["id"] == "123"
         assert data["sessions"][0]["title"] == "Test Chat 1"
-        # Verify the service was called with the mocked user ID
-        mock_list_sessions.assert_called_once_with("test-user-123")
+        assert data["next_cursor"] is None
+        # Verify the service was called with the mocked user ID and default page size
+        mock_list_sessions.assert_called_once_with("test-user-123", settings.sessions_page_size, None)
     
-    @patch('services.firebase_service.firebase_service.list_user_sessions')
+    @patch('services.storage.storage_service.list_user_sessions')
+    def test_get_all_sessions_paginated(self, mock_list_sessions):
+        """Test limit and cursor are forwarded and the next cursor returned."""
+        # Setup mock
+        mock_list_sessions.return_value = SessionPage(
+            [{"session_id": "123", "title": "Test Chat 1"}], "next-page"
+        )
+        
+        # Make request
+        response = client.get("/chats?limit=1&cursor=abc")
+        
+        # Assertions
+        assert response.status_code == 200
+        assert response.json()["next_cursor"] == "next-page"
+        mock_list_sessions.assert_called_once_with("test-user-123", 1, "abc")
+    
+    @patch('services.storage.storage_service.list_user_sessions')
+    def test_get_all_sessions_invalid_cursor(self, mock_list_sessions):
+        """Test malformed cursors are rejected."""
+        # Setup mock to reject the cursor
+        mock_list_sessions.side_effect = ValueError("Invalid cursor")
+        
+        # Make request
+        response = client.get("/chats?cursor=garbage")
+        
+        # Assertions
+        assert response.status_code == 400
+        assert "Invalid pagination cursor" in response.json()["detail"]
+    
+    @patch('services.storage.storage_service.list_user_sessions')
     def test_get_all_sessions_empty(self, mock_list_sessions):
         """Test retrieval when no sessions exist."""
         # Setup mock
-        mock_list_sessions.return_value = []
+        mock_list_sessions.return_value = SessionPage([], None)
         
         # Make request
         response = client.get("/chats")
@@ -71,7 +104,7 @@ class TestSessionEndpoints:
         assert "sessions" in data
         assert len(data["sessions"]) == 0
     
-    @patch('services.firebase_service.firebase_service.list_user_sessions')
+    @patch('services.storage.storage_service.list_user_sessions')
     def test_get_all_sessions_error(self, mock_list_sessions):
         """Test error handling when fetching sessions fails."""
         # Setup mock to raise exception
@@ -84,7 +117,40 @@ class TestSessionEndpoints:
         assert response.status_code == 500
         assert "Failed to fetch chat sessions" in response.json()["detail"]
     
-    @patch('services.firebase_service.firebase_service.create_session')
+    @patch('services.storage.storage_service.get_session_metadata')
+    def test_get_session_metadata(self, mock_get_metadata):
+        """Test session metadata is served without loading messages."""
+        from datetime import datetime, timezone
+        
+        now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        mock_get_metadata.return_value = {
+            "session_id": "test-123",
+            "title": "Test Chat",
+            "title_locked": True,
+            "message_count": 12,
+            "last_seq": 12,
+            "created_at": now,
+            "last_message_at": now
+        }
+        
+        response = client.get("/chats/test-123")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["message_count"] == 12
+        assert data["last_message_at"] == "2024-01-01T00:00:00Z"
+        mock_get_metadata.assert_called_once_with("test-123")
+    
+    @patch('services.storage.storage_service.get_session_metadata')
+    def test_get_session_metadata_not_found(self, mock_get_metadata):
+        """Test unknown sessions return 404."""
+        mock_get_metadata.return_value = None
+        
+        response = client.get("/chats/missing")
+        
+        assert response.status_code == 404
+    
+    @patch('services.storage.storage_service.create_session')
     def test_create_chat_success(self, mock_create_session):
         """Test successful chat creation."""
         # Setup mock
@@ -102,7 +168,7 @@ class TestSessionEndpoints:
         # Verify the service was called with the user_id parameter
         mock_create_session.assert_called_once_with(user_id="test-user-123")
     
-    @patch('services.firebase_service.firebase_service.create_session')
+    @patch('services.storage.storage_service.create_session')
     def test_create_chat_error(self, mock_create_session):
         """Test error handling when chat creation fails."""
         # Setup mock to raise exception
@@ -115,14 +181,14 @@ class TestSessionEndpoints:
         assert response.status_code == 500
         assert "Failed to create chat session" in response.json()["detail"]
     
-    @patch('services.firebase_service.firebase_service.get_chat_history')
-    def test_get_session_messages_success(self, mock_get_history):
+    @patch('services.storage.storage_service.get_messages_page')
+    def test_get_session_messages_success(self, mock_get_page):
         """Test successful retrieval of session messages."""
         # Setup mock
-        mock_get_history.return_value = [
+        mock_get_page.return_value = MessagePage([
             {"role": "user", "content": "Hello"},
             {"role": "assistant", "content": "Hi there!"}
-        ]
+        ], False, None)
         
         # Make request
         response = client.get("/chats/test-123/messages")
@@ -134,12 +200,32 @@ class TestSessionEndpoints:
         assert len(data["messages"]) == 2
         assert data["messages"][0]["role"] == "user"
         assert data["messages"][1]["role"] == "assistant"
+        assert data["has_more"] is False
+        mock_get_page.assert_called_once_with("test-123", settings.messages_page_size, None)
     
-    @patch('services.firebase_service.firebase_service.get_chat_history')
-    def test_get_session_messages_empty(self, mock_get_history):
+    @patch('services.storage.storage_service.get_messages_page')
+    def test_get_session_messages_older_window(self, mock_get_page):
+        """Test loading older messages forwards the cursor."""
+        # Setup mock
+        mock_get_page.return_value = MessagePage(
+            [{"role": "user", "content": "Hello"}], True, "older"
+        )
+        
+        # Make request
+        response = client.get("/chats/test-123/messages?limit=1&before=abc")
+        
+        # Assertions
+        assert response.status_code == 200
+        data = response.json()
+        assert data["has_more"] is True
+        assert data["next_before"] == "older"
+        mock_get_page.assert_called_once_with("test-123", 1, "abc")
+    
+    @patch('services.storage.storage_service.get_messages_page')
+    def test_get_session_messages_empty(self, mock_get_page):
         """Test retrieval when session has no messages."""
         # Setup mock
-        mock_get_history.return_value = []
+        mock_get_page.return_value = MessagePage([], False, None)
         
         # Make request
         response = client.get("/chats/test-123/messages")
@@ -150,11 +236,11 @@ class TestSessionEndpoints:
         assert "messages" in data
         assert len(data["messages"]) == 0
     
-    @patch('services.firebase_service.firebase_service.get_chat_history')
-    def test_get_session_messages_error(self, mock_get_history):
+    @patch('services.storage.storage_service.get_messages_page')
+    def test_get_session_messages_error(self, mock_get_page):
         """Test error handling when fetching messages fails."""
         # Setup mock to raise exception
-        mock_get_history.side_effect = Exception("Database error")
+        mock_get_page.side_effect = Exception("Database error")
         
         # Make request
         response = client.get("/chats/test-123/messages")
@@ -163,22 +249,37 @@ class TestSessionEndpoints:
         assert response.status_code == 500
         assert "Failed to fetch messages" in response.json()["detail"]
     
-    @patch('services.firebase_service.firebase_service.delete_session')
-    def test_delete_session_success(self, mock_delete_session):
-        """Test successful session deletion."""
+    def test_get_session_messages_wrong_cursor_type(self):
+        """Test a well-encoded cursor of the wrong type is a 400, not a server error."""
+        response = client.get(f"/chats/test-123/messages?before={encode_cursor(['x'])}")
+        
+        assert response.status_code == 400
+        assert "Invalid pagination cursor" in response.json()["detail"]
+    
+    @patch('services.storage.storage_service.delete_session')
+    @patch('services.storage.storage_service.tombstone_session')
+    def test_delete_session_success(self, mock_tombstone_session, mock_delete_session):
+        """Test that deletion is accepted and runs as a background job."""
         # Make request
         response = client.delete("/chats/test-123")
         
         # Assertions
-        assert response.status_code == 200
-        assert response.json()["detail"] == "Session deleted successfully"
-        mock_delete_session.assert_called_once_with("test-123")
+        assert response.status_code == 202
+        data = response.json()
+        assert data["detail"] == "Session deletion scheduled"
+        assert data["total"] == 1
+        mock_tombstone_session.assert_called_once_with("test-123")
+        
+        # The job is pollable by ID
+        status_response = client.get(f"/chats/deletions/{data['job_id']}")
+        assert status_response.status_code == 200
+        assert status_response.json()["job_id"] == data["job_id"]
     
-    @patch('services.firebase_service.firebase_service.delete_session')
-    def test_delete_session_error(self, mock_delete_session):
-        """Test error handling when deletion fails."""
+    @patch('services.storage.storage_service.tombstone_session')
+    def test_delete_session_error(self, mock_tombstone_session):
+        """Test error handling when the session cannot be tombstoned."""
         # Setup mock to raise exception
-        mock_delete_session.side_effect = Exception("Database error")
+        mock_tombstone_session.side_effect = Exception("Database error")
         
         # Make request
         response = client.delete("/chats/test-123")
@@ -186,6 +287,34 @@ class TestSessionEndpoints:
         # Assertions
         assert response.status_code == 500
         assert "Failed to delete session" in response.json()["detail"]
+    
+    @patch('services.storage.storage_service.delete_session')
+    @patch('services.storage.storage_service.tombstone_session')
+    def test_bulk_delete_sessions(self, mock_tombstone_session, mock_delete_session):
+        """Test scheduling deletion of several sessions in one job."""
+        response = client.post("/chats/bulk-delete", json={"session_ids": ["a", "b", "a"]})
+        
+        assert response.status_code == 202
+        assert response.json()["total"] == 2
+        assert mock_tombstone_session.call_count == 2
+    
+    def test_bulk_delete_rejects_oversized_requests(self):
+        """Test that bulk deletes above the per-job limit are rejected."""
+        with patch('api.routes.sessions.settings') as mock_settings:
+            mock_settings.deletion_max_sessions_per_job = 2
+            response = client.post("/chats/bulk-delete", json={"session_ids": ["a", "b", "c"]})
+        
+        assert response.status_code == 400
+    
+    def test_bulk_delete_rejects_empty_requests(self):
+        """Test that an empty bulk delete is a validation error."""
+        response = client.post("/chats/bulk-delete", json={"session_ids": []})
+        assert response.status_code == 422
+    
+    def test_get_unknown_deletion_job(self):
+        """Test that unknown job IDs return 404."""
+        response = client.get("/chats/deletions/missing")
+        assert response.status_code == 404
 
 
 class TestSessionEndpointsUnauthenticated:
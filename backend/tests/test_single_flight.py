@@ -0,0 +1,210 @@
+# tests/test_single_flight.py
+"""
+Tests for coalescing duplicate chat submissions into one reply.
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from services.generation import GenerationManager, generation_manager
+from services.openai_service import openai_service
+from services.providers import FakeProvider
+from services.single_flight import SingleFlight, request_key
+from services.storage import storage_service
+from tests.test_generation import stream_then_disconnect
+from tests.test_stream_broker import data
+
+
+async def start_reply(reply="a b", token_delay=0):
+    async def finish(generation):
+        pass
+    
+    provider = FakeProvider(reply=reply, first_token_delays=(0.0,), token_delay=token_delay)
+    return GenerationManager().start("s1", await provider.open("m", [], 0, 100), finish)
+
+
+async def transcript(session_id):
+    messages = (await storage_service.get_messages_page(session_id, 10)).messages
+    return [(m["role"], m["content"]) for m in messages]
+
+
+class TestSingleFlight:
+    """Test suite for SingleFlight."""
+    
+    @pytest.mark.asyncio
+    async def test_duplicate_waits_for_leader(self):
+        """Test a duplicate gets the leader's generation once it starts."""
+        table = SingleFlight(ttl=10, max_keys=10)
+        flight, leader = table.join("s1", "hi")
+        duplicate, duplicate_leads = table.join("s1", "hi")
+        
+        assert leader is True and duplicate_leads is False
+        assert duplicate is flight
+        waiting = asyncio.ensure_future(duplicate.wait())
+        generation = await start_reply()
+        table.start(flight, generation)
+        
+        assert await waiting is generation
+        assert table.stats()["duplicates"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_abandon_lets_a_duplicate_lead(self):
+        """Test a leader that gives up wakes its duplicates and frees the key."""
+        table = SingleFlight(ttl=10, max_keys=10)
+        flight, _ = table.join("s1", "hi")
+        waiting = asyncio.ensure_future(flight.wait())
+        
+        table.abandon(flight)
+        
+        assert await waiting is None
+        assert table.join("s1", "hi")[1] is True
+    
+    @pytest.mark.asyncio
+    async def test_derived_key_forgotten_when_done(self):
+        """Test the same text sent after its reply is done is a new submission."""
+        table = SingleFlight(ttl=10, max_keys=10)
+        flight, _ = table.join("s1", "hi")
+        generation = await start_reply()
+        table.start(flight, generation)
+        await generation.wait()
+        await asyncio.sleep(0.01)
+        
+        assert table.join("s1", "hi")[1] is True
+    
+    @pytest.mark.asyncio
+    async def test_request_id_kept_for_ttl(self):
+        """Test a client request id dedupes late retries until its TTL runs out."""
+        now = [0.0]
+        table = SingleFlight(ttl=10, max_keys=10, clock=lambda: now[0])
+        flight, _ = table.join("s1", "hi", request_id="r1")
+        generation = await start_reply()
+        table.start(flight, generation)
+        await generation.wait()
+        await asyncio.sleep(0.01)
+        
+        now[0] = 5
+        assert table.join("s1", "hi", request_id="r1") == (flight, False)
+        assert table.join("s1", "hi", request_id="r2")[1] is True
+        now[0] = 11
+        assert table.join("s1", "hi", request_id="r1")[1] is True
+    
+    @pytest.mark.asyncio
+    async def test_request_id_forgotten_when_truncated(self):
+        """Test a retry of a reply that was cut off runs it again instead of replaying it."""
+        table = SingleFlight(ttl=10, max_keys=10)
+        flight, _ = table.join("s1", "hi", request_id="r1")
+        generation = await start_reply("a b c d", token_delay=1)
+        table.start(flight, generation)
+        await asyncio.sleep(0.01)
+        generation.cancel()
+        await generation.wait()
+        await asyncio.sleep(0.01)
+        
+        assert generation.truncated is True
+        assert table.join("s1", "hi", request_id="r1")[1] is True
+    
+    @pytest.mark.asyncio
+    async def test_truncated_reply_reruns_from_saved_history(self):
+        """Test a retry of a cut-off reply whose message was stored leads a rerun from the same history."""
+        table = SingleFlight(ttl=10, max_keys=10)
+        flight, _ = table.join("s1", "hi", request_id="r1")
+        history = [{"role": "user", "content": "hi"}]
+        table.saved(flight, history)
+        generation = await start_reply("a b c d", token_delay=1)
+        table.start(flight, generation)
+        await asyncio.sleep(0.01)
+        generation.cancel()
+        await generation.wait()
+        await asyncio.sleep(0.01)
+        
+        rerun, leader = table.join("s1", "hi", request_id="r1")
+        
+        assert leader is True
+        assert rerun.history == history
+        assert table.join("s1", "hi", request_id="r1") == (rerun, False)
+        assert table.stats()["reruns"] == 1
+    
+    def test_request_key(self):
+        """Test keys are scoped to the session and prefer the client's id."""
+        assert request_key("s1", "hi") == request_key("s1", "hi")
+        assert request_key("s1", "hi") != request_key("s2", "hi")
+        assert request_key("s1", "hi", "r1") == request_key("s1", "other", "r1")
+
+
+class TestChatStreamDedupe:
+    """Test /chat/stream coalesces duplicate submissions."""
+    
+    @pytest.mark.asyncio
+    async def test_duplicate_before_generation_starts(self):
+        """Test a double submit that arrives while the first is still reading history shares its reply."""
+        provider = FakeProvider(reply="one two", first_token_delays=(0.0,), token_delay=0)
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Count to two", "no_cache": "true"}
+        get_chat_history = storage_service.get_chat_history
+        
+        async def slow_history(session_id):
+            await asyncio.sleep(0.05)
+            return await get_chat_history(session_id)
+        
+        with patch.object(openai_service, "provider", provider), \
+                patch.object(storage_service, "get_chat_history", side_effect=slow_history):
+            first, second = await asyncio.gather(
+                stream_then_disconnect(params, frames_before_disconnect=100),
+                stream_then_disconnect(params, frames_before_disconnect=100)
+            )
+        
+        assert "".join(data(first)) == "".join(data(second)) == "one two[DONE]"
+        assert provider.calls == 1
+        assert await transcript(session_id) == [("user", "Count to two"), ("assistant", "one two")]
+    
+    @pytest.mark.asyncio
+    async def test_late_retry_with_request_id(self):
+        """Test a retry with the same request id replays the reply without storing it again."""
+        provider = FakeProvider(reply="one two", first_token_delays=(0.0,), token_delay=0)
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Count", "no_cache": "true", "request_id": "r1"}
+        
+        with patch.object(openai_service, "provider", provider):
+            first = await stream_then_disconnect(params, frames_before_disconnect=100)
+            retry = await stream_then_disconnect(params, frames_before_disconnect=100)
+        
+        assert "".join(data(first)) == "".join(data(retry)) == "one two[DONE]"
+        assert provider.calls == 1
+        assert await transcript(session_id) == [("user", "Count"), ("assistant", "one two")]
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_truncated_reply_stores_message_once(self):
+        """Test a retry of a reply that was cut off answers again without storing the message twice."""
+        provider = FakeProvider(reply="one two three four", first_token_delays=(0.0,), token_delay=0.05)
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Count", "no_cache": "true", "request_id": "r1"}
+        
+        with patch.object(openai_service, "provider", provider), \
+                patch.object(generation_manager, "resume_grace", 0):
+            await stream_then_disconnect(params, frames_before_disconnect=1)
+            while generation_manager.stats()["running"]:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+            retry = await stream_then_disconnect(params, frames_before_disconnect=100)
+        
+        assert "".join(data(retry)) == "one two three four[DONE]"
+        assert provider.calls == 2
+        assert provider.last_request["messages"][-1] == {"role": "user", "content": "Count"}
+        stored = await transcript(session_id)
+        assert [role for role, _ in stored].count("user") == 1
+        assert stored[-1] == ("assistant", "one two three four")
+    
+    @pytest.mark.asyncio
+    async def test_same_text_later_is_a_new_turn(self):
+        """Test resending a message after its reply is done, without a request id, answers it again."""
+        provider = FakeProvider(reply="yes", first_token_delays=(0.0,), token_delay=0)
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Again?", "no_cache": "true"}
+        
+        with patch.object(openai_service, "provider", provider):
+            await stream_then_disconnect(params, frames_before_disconnect=100)
+            await asyncio.sleep(0.01)
+            await stream_then_disconnect(params, frames_before_disconnect=100)
+        
+        assert provider.calls == 2
+        assert [role for role, _ in await transcript(session_id)] == ["user", "assistant", "user", "assistant"]
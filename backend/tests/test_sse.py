@@ -0,0 +1,159 @@
+# tests/test_sse.py
+"""
+Tests for the Server-Sent Events helpers.
+"""
+
+import asyncio
+import re
+import pytest
+from unittest.mock import patch
+from config.settings import settings
+from services.generation import GenerationManager
+from services.openai_service import openai_service
+from services.providers import FakeProvider
+from services.storage import storage_service
+from tests.test_generation import stream_then_disconnect
+from utils.sse import coalesce_events, format_event, parse_event_id
+
+CODE_DELTAS = ["Here is code:", "\n", "```py", "\n", "print(1)", "\n", "```"]
+
+
+class DeltaProvider(FakeProvider):
+    """Fake provider streaming fixed deltas, which may contain newlines."""
+    
+    def __init__(self, deltas):
+        super().__init__(first_token_delays=(0.0,), token_delay=0)
+        self.deltas = deltas
+    
+    async def _stream(self, first_token_delay):
+        for delta in self.deltas:
+            await asyncio.sleep(self.token_delay)
+            yield delta
+
+
+async def timed(pairs):
+    """Yield (event id, chunk) pairs, sleeping the given delay before each."""
+    for index, (delay, chunk) in enumerate(pairs):
+        await asyncio.sleep(delay)
+        yield f"s:{index}", chunk
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def parse_events(body):
+    """Parse an event stream the way EventSource does; return (event, data) pairs."""
+    events, event, data = [], "message", []
+    for line in re.split(r"\r\n|\r|\n", body):
+        if not line:
+            if data:
+                events.append((event, "\n".join(data)))
+            event, data = "message", []
+            continue
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+    return events
+
+
+class TestCoalesceEvents:
+    """Test suite for coalesce_events."""
+    
+    @pytest.mark.asyncio
+    async def test_close_deltas_share_a_frame(self):
+        """Test deltas within the window are joined and keep the last chunk's id."""
+        deltas = [(0, "Hel"), (0, "lo"), (0, " wor"), (0, "ld"), (0.1, "!")]
+        
+        frames = await collect(coalesce_events(timed(deltas), window=0.05, max_bytes=1024))
+        
+        assert frames == [("s:0", "Hel"), ("s:3", "lo world"), ("s:4", "!")]
+        assert "".join(chunk for _, chunk in frames) == "Hello world!"
+    
+    @pytest.mark.asyncio
+    async def test_byte_threshold_flushes_early(self):
+        """Test a batch is sent as soon as it reaches the byte threshold."""
+        deltas = [(0, "a")] + [(0, "xx")] * 4
+        
+        frames = await collect(coalesce_events(timed(deltas), window=10, max_bytes=4))
+        
+        assert frames == [("s:0", "a"), ("s:2", "xxxx"), ("s:4", "xxxx")]
+    
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        """Test a zero window passes every delta through."""
+        deltas = [(0, "a"), (0, "b"), (0, "c")]
+        
+        frames = await collect(coalesce_events(timed(deltas), window=0, max_bytes=1024))
+        
+        assert frames == [("s:0", "a"), ("s:1", "b"), ("s:2", "c")]
+    
+    @pytest.mark.asyncio
+    async def test_closing_detaches_from_generation(self):
+        """Test cancelling the coalesced stream while it waits detaches its reader."""
+        async def finish(generation):
+            pass
+        
+        provider = FakeProvider(reply="a b c d", first_token_delays=(0.0,), token_delay=1.0)
+        generation = GenerationManager().start("s1", await provider.open("m", [], 0, 100), finish)
+        
+        frames = coalesce_events(generation.events(), window=0.05, max_bytes=1024)
+        assert await frames.__anext__() == (f"{generation.id}:0", "a ")
+        waiting = asyncio.ensure_future(frames.__anext__())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        await frames.aclose()
+        await generation.wait()
+        
+        assert generation.truncated is True
+        assert provider.cancelled == 1
+
+
+class TestParseEventId:
+    """Test suite for parse_event_id."""
+    
+    @pytest.mark.parametrize("event_id,expected", [
+        ("abc:3", ("abc", 3)),
+        (" abc:12 ", ("abc", 12)),
+        ("abc", None),
+        ("abc:x", None),
+        (":3", None),
+    ])
+    def test_parse(self, event_id, expected):
+        """Test chunk event ids split into stream id and index."""
+        assert parse_event_id(event_id) == expected
+
+
+class TestFormatEvent:
+    """Test suite for format_event."""
+    
+    def test_one_data_line_per_line(self):
+        """Test multi-line text is split into data lines the client joins back."""
+        frame = format_event("a\n\nb\r\nc\n", event="error", event_id="s:1")
+        
+        assert frame == "event: error\nid: s:1\ndata: a\ndata: \ndata: b\ndata: c\ndata: \n\n"
+        assert parse_events(frame) == [("error", "a\n\nb\nc\n")]
+
+
+class TestMultiLineReplies:
+    """Test replies containing newlines survive /chat/stream."""
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("window_ms", [0, 20])
+    async def test_code_block(self, window_ms):
+        """Test a code block streamed in deltas arrives with its newlines, batched or not."""
+        provider = DeltaProvider(CODE_DELTAS)
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Show code", "no_cache": "true"}
+        
+        with patch.object(openai_service, "provider", provider), \
+                patch.object(settings, "sse_coalesce_window_ms", window_ms):
+            body = await stream_then_disconnect(params, frames_before_disconnect=100)
+        
+        events = parse_events(body)
+        assert events[-1] == ("message", "[DONE]")
+        assert "".join(data for _, data in events[:-1]) == "Here is code:\n```py\nprint(1)\n```"
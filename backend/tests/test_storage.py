@@ -0,0 +1,352 @@
+# tests/test_storage.py
+"""
+Tests for the pluggable storage backends.
+"""
+
+import pytest
+import pytest_asyncio
+import sqlite3
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+from google.api_core.exceptions import NotFound
+from services.firebase_service import FirebaseService
+from services.storage import (
+    InMemoryStorage,
+    MessageWrite,
+    SessionNotFound,
+    SessionSummary,
+    SQLiteStorage,
+    StorageBackend,
+    create_storage_backend
+)
+from services.storage.base import encode_cursor
+from utils.constants import DEFAULT_CHAT_TITLE
+
+
+@pytest_asyncio.fixture(params=["memory", "sqlite"])
+async def backend(request, tmp_path):
+    """Provide each offline backend with a fresh database."""
+    if request.param == "memory":
+        storage = InMemoryStorage()
+    else:
+        storage = SQLiteStorage(str(tmp_path / "chat.db"))
+    yield storage
+    await storage.close()
+
+
+class TestStorageBackends:
+    """Behaviour every offline backend must share with Firestore."""
+    
+    @pytest.mark.asyncio
+    async def test_implements_protocol(self, backend):
+        """Test backends satisfy the StorageBackend protocol."""
+        assert isinstance(backend, StorageBackend)
+    
+    @pytest.mark.asyncio
+    async def test_store_and_get_history(self, backend):
+        """Test messages come back oldest first."""
+        session_id = await backend.create_session(user_id="user-1")
+        await backend.store_message(session_id, "user", "Hello")
+        await backend.store_message(session_id, "assistant", "Hi!")
+        
+        history = await backend.get_chat_history(session_id)
+        
+        assert history == [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi!"}
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_serving_model_recorded(self, backend):
+        """Test the model is kept with assistant messages but left out of the prompt history."""
+        session_id = await backend.create_session(user_id="user-1")
+        await backend.store_message(session_id, "user", "Hello")
+        await backend.store_message(session_id, "assistant", "Hi!", "gpt-4o-mini")
+        
+        page = await backend.get_messages_page(session_id, 10)
+        
+        assert page.messages == [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi!", "model": "gpt-4o-mini"}
+        ]
+        assert "model" not in (await backend.get_chat_history(session_id))[1]
+    
+    @pytest.mark.asyncio
+    async def test_messages_page_windows(self, backend):
+        """Test windows walk backwards and stay stable while messages are appended."""
+        session_id = await backend.create_session(user_id="user-1")
+        for i in range(5):
+            await backend.store_message(session_id, "user", f"message {i}")
+        
+        newest = await backend.get_messages_page(session_id, 2)
+        assert [m["content"] for m in newest.messages] == ["message 3", "message 4"]
+        assert newest.has_more is True
+        
+        # New messages must not shift older windows
+        await backend.store_message(session_id, "assistant", "late reply")
+        
+        older = await backend.get_messages_page(session_id, 2, newest.next_before)
+        assert [m["content"] for m in older.messages] == ["message 1", "message 2"]
+        
+        oldest = await backend.get_messages_page(session_id, 2, older.next_before)
+        assert [m["content"] for m in oldest.messages] == ["message 0"]
+        assert oldest.has_more is False
+        assert oldest.next_before is None
+    
+    @pytest.mark.asyncio
+    async def test_title_set_from_first_user_message(self, backend):
+        """Test the title comes from the first user message only."""
+        session_id = await backend.create_session(user_id="user-1")
+        await backend.store_message(session_id, "assistant", "Welcome")
+        await backend.store_message(session_id, "user", "Hello world this is a test")
+        await backend.store_message(session_id, "user", "Second message")
+        
+        page = await backend.list_user_sessions("user-1", 10)
+        
+        assert [(s["session_id"], s["title"]) for s in page.sessions] == [
+            (session_id, "Hello world this is...")
+        ]
+        assert (await backend.get_session_metadata(session_id))["title_locked"] is True
+    
+    @pytest.mark.asyncio
+    async def test_session_metadata_tracks_messages(self, backend):
+        """Test message count, last sequence and activity time follow every write."""
+        session_id = await backend.create_session(user_id="user-1")
+        created = await backend.get_session_metadata(session_id)
+        
+        assert created["message_count"] == 0
+        assert created["last_seq"] == 0
+        assert created["title_locked"] is False
+        assert created["last_message_at"] == created["created_at"]
+        
+        await backend.store_message(session_id, "user", "Hello")
+        await backend.store_messages([
+            MessageWrite(session_id, "assistant", "Hi!", datetime.now(timezone.utc))
+        ])
+        metadata = await backend.get_session_metadata(session_id)
+        
+        assert metadata["message_count"] == 2
+        assert metadata["last_seq"] == 2
+        assert metadata["last_message_at"] >= created["last_message_at"]
+        assert await backend.get_session_metadata("missing") is None
+    
+    @pytest.mark.asyncio
+    async def test_list_user_sessions_by_activity(self, backend):
+        """Test a new message moves an older session to the top of the listing."""
+        older = await backend.create_session(user_id="user-1")
+        newer = await backend.create_session(user_id="user-1")
+        
+        await backend.store_message(older, "user", "Back to this one")
+        page = await backend.list_user_sessions("user-1", 10)
+        
+        assert [s["session_id"] for s in page.sessions] == [older, newer]
+        assert page.sessions[0]["message_count"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_list_user_sessions_newest_first(self, backend):
+        """Test sessions are scoped to the user and sorted newest first."""
+        first = await backend.create_session(user_id="user-1")
+        second = await backend.create_session(user_id="user-1")
+        await backend.create_session(user_id="user-2")
+        
+        page = await backend.list_user_sessions("user-1", 10)
+        
+        assert [s["session_id"] for s in page.sessions] == [second, first]
+        assert page.sessions[0]["title"] == DEFAULT_CHAT_TITLE
+        assert page.next_cursor is None
+    
+    @pytest.mark.asyncio
+    async def test_list_user_sessions_cursor_pagination(self, backend):
+        """Test walking every page returns each session exactly once."""
+        created = [await backend.create_session(user_id="user-1") for _ in range(5)]
+        
+        seen = []
+        cursor = None
+        while True:
+            page = await backend.list_user_sessions("user-1", 2, cursor)
+            seen.extend(s["session_id"] for s in page.sessions)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        
+        assert seen == list(reversed(created))
+    
+    @pytest.mark.asyncio
+    async def test_list_user_sessions_invalid_cursor(self, backend):
+        """Test malformed cursors raise ValueError."""
+        with pytest.raises(ValueError):
+            await backend.list_user_sessions("user-1", 10, "not-a-cursor")
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("position", [["x"], [None], [1.5], [True], [1, 2], []])
+    async def test_get_messages_page_rejects_wrong_cursor_shape(self, backend, position):
+        """Test well-encoded cursors of the wrong shape raise ValueError."""
+        session_id = await backend.create_session(user_id="user-1")
+        await backend.store_message(session_id, "user", "Hello")
+        
+        with pytest.raises(ValueError):
+            await backend.get_messages_page(session_id, 10, encode_cursor(position))
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("position", [["x", 1], [1.0, "x"], [1.0]])
+    async def test_list_user_sessions_rejects_wrong_cursor_shape(self, backend, position):
+        """Test session cursors must hold a time and a tiebreaker."""
+        await backend.create_session(user_id="user-1")
+        
+        with pytest.raises(ValueError):
+            await backend.list_user_sessions("user-1", 10, encode_cursor(position))
+    
+    @pytest.mark.asyncio
+    async def test_delete_session(self, backend):
+        """Test deletion removes the session and its messages."""
+        session_id = await backend.create_session("custom-id", user_id="user-1")
+        await backend.store_message(session_id, "user", "Hello")
+        
+        await backend.delete_session(session_id)
+        
+        assert await backend.get_chat_history(session_id) == []
+        assert (await backend.list_user_sessions("user-1", 10)).sessions == []
+    
+    @pytest.mark.asyncio
+    async def test_summary_round_trip_keeps_newest(self, backend):
+        """Test summaries are stored with the session and never regress."""
+        session_id = await backend.create_session(user_id="user-1")
+        assert await backend.get_summary(session_id) is None
+        
+        await backend.store_summary(session_id, SessionSummary("first ten", 10))
+        await backend.store_summary(session_id, SessionSummary("stale", 5))
+        
+        assert await backend.get_summary(session_id) == SessionSummary("first ten", 10)
+    
+    @pytest.mark.asyncio
+    async def test_tombstone_hides_session_but_keeps_messages(self, backend):
+        """Test a tombstoned session leaves listings before its data is deleted."""
+        session_id = await backend.create_session("custom-id", user_id="user-1")
+        await backend.store_message(session_id, "user", "Hello")
+        
+        await backend.tombstone_session(session_id)
+        
+        assert (await backend.list_user_sessions("user-1", 10)).sessions == []
+        assert len(await backend.get_chat_history(session_id)) == 1
+
+
+class FakeChatRef:
+    """A chat document reference; its messages' references share its ID."""
+    
+    def __init__(self, session_id):
+        self.id = session_id
+    
+    def collection(self, name):
+        return self
+    
+    def document(self, session_id=None):
+        return FakeChatRef(session_id or self.id)
+
+
+class FakeFirestore:
+    """Just enough of the async Firestore client to store messages, failing updates of missing chats."""
+    
+    def __init__(self):
+        self.chats = set()
+        self.messages = {}
+    
+    def collection(self, name):
+        return FakeChatRef(None)
+    
+    def batch(self):
+        writes, updates = [], []
+        
+        async def commit():
+            if any(chat_ref.id not in self.chats for chat_ref in updates):
+                raise NotFound("No document to update")
+            for session_id, data in writes:
+                self.messages.setdefault(session_id, []).append(data["content"])
+        
+        batch = MagicMock()
+        batch.update.side_effect = lambda chat_ref, metadata: updates.append(chat_ref)
+        batch.set.side_effect = lambda doc_ref, data: writes.append((doc_ref.id, data))
+        batch.commit = AsyncMock(side_effect=commit)
+        return batch
+    
+    async def get_all(self, refs, field_paths):
+        for ref in refs:
+            doc = MagicMock(id=ref.id, exists=ref.id in self.chats)
+            doc.to_dict.return_value = {"title": "Chat", "title_locked": True}
+            yield doc
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", ["memory", "sqlite", "firestore"])
+async def test_messages_for_missing_session_are_dropped(name, tmp_path):
+    """Test every backend stores the other sessions' messages and reports the missing one."""
+    if name == "firestore":
+        storage, db = FirebaseService(), FakeFirestore()
+        storage.db = db
+        db.chats.add("live")
+        
+        async def stored(session_id):
+            return db.messages.get(session_id, [])
+    else:
+        storage = InMemoryStorage() if name == "memory" else SQLiteStorage(str(tmp_path / "chat.db"))
+        await storage.create_session("live", user_id="user-1")
+        
+        async def stored(session_id):
+            return [m["content"] for m in await storage.get_chat_history(session_id)]
+    
+    now = datetime.now(timezone.utc)
+    with pytest.raises(SessionNotFound) as raised:
+        await storage.store_messages([
+            MessageWrite("gone", "user", "Lost", now),
+            MessageWrite("live", "user", "Kept", now),
+        ])
+    with pytest.raises(SessionNotFound):
+        await storage.store_message("gone", "assistant", "Also lost")
+    
+    assert raised.value.session_ids == ["gone"]
+    assert await stored("live") == ["Kept"]
+    assert await stored("gone") == []
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_migrates_older_databases(tmp_path):
+    """Test databases without the newer columns are migrated and backfilled on open."""
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE chats (session_id TEXT PRIMARY KEY, user_id TEXT, title TEXT NOT NULL, created_at REAL NOT NULL);
+        CREATE TABLE messages (
+            session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,
+            content TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (session_id, seq)
+        ) WITHOUT ROWID;
+        INSERT INTO chats VALUES ('old', 'user-1', 'Old chat', 1.0);
+        INSERT INTO messages VALUES ('old', 1, 'user', 'Hi', 2.0), ('old', 2, 'assistant', 'Hello', 3.0);
+    """)
+    conn.close()
+    
+    storage = SQLiteStorage(path)
+    try:
+        metadata = await storage.get_session_metadata("old")
+        page = await storage.list_user_sessions("user-1", 10)
+        await storage.store_message("old", "assistant", "Again", "gpt-4o-mini")
+        messages = (await storage.get_messages_page("old", 10)).messages
+    finally:
+        await storage.close()
+    
+    assert metadata["message_count"] == 2
+    assert metadata["last_seq"] == 2
+    assert metadata["title_locked"] is True
+    assert metadata["last_message_at"].timestamp() == 3.0
+    assert [s["session_id"] for s in page.sessions] == ["old"]
+    assert messages[-1] == {"role": "assistant", "content": "Again", "model": "gpt-4o-mini"}
+
+
+def test_create_storage_backend_by_name():
+    """Test the factory builds the requested backend."""
+    assert isinstance(create_storage_backend("memory"), InMemoryStorage)
+
+
+def test_create_storage_backend_unknown():
+    """Test unknown backend names are rejected."""
+    with pytest.raises(ValueError):
+        create_storage_backend("nope")
@@ -0,0 +1,175 @@
+# tests/test_stream_broker.py
+"""
+Tests for sharing one live reply between requests, on one worker or several.
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from main import app
+from services.generation import GenerationManager
+from services.openai_service import openai_service
+from services.providers import FakeProvider
+from services.pubsub import InMemoryPubSub
+from services.storage import storage_service
+from services.stream_broker import StreamBroker, stream_broker, sync_channel
+from tests.test_generation import stream_then_disconnect
+
+client = TestClient(app)
+
+
+def make_broker(pubsub, queue_size=16):
+    return StreamBroker(pubsub, queue_size=queue_size, sync_timeout=1, idle_timeout=5, linger=1)
+
+
+async def start_reply(manager, reply, token_delay=0.01):
+    async def finish(generation):
+        pass
+    
+    provider = FakeProvider(reply=reply, first_token_delays=(0.0,), token_delay=token_delay)
+    return manager.start("s1", await provider.open("m", [], 0, 100), finish)
+
+
+async def collect(events):
+    return [pair async for pair in events]
+
+
+def data(body):
+    return [line[len("data: "):] for line in body.splitlines() if line.startswith("data: ")]
+
+
+class TestStreamBroker:
+    """Test suite for StreamBroker."""
+    
+    @pytest.mark.asyncio
+    async def test_local_subscriber_joins_live_reply(self):
+        """Test a subscriber on the owning worker gets the reply from its first chunk."""
+        broker = make_broker(InMemoryPubSub())
+        generation = await start_reply(GenerationManager(), "a b c")
+        owner = asyncio.ensure_future(collect(generation.events()))
+        broker.own("s1", "hello", generation)
+        
+        assert await broker.attach("s1", "something else") is None
+        follower = await broker.attach("s1", "hello")
+        
+        assert await collect(follower) == await owner
+        assert broker.stats()["local_subscribers"] == 1
+        await generation.wait()
+        await broker.close()
+        assert broker.stats()["live"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_subscriber_on_another_worker(self):
+        """Test a reply generating on one worker can be followed from another mid-stream."""
+        pubsub = InMemoryPubSub()
+        owner_worker, other_worker = make_broker(pubsub), make_broker(pubsub)
+        generation = await start_reply(GenerationManager(), "one two three four five")
+        owner = asyncio.ensure_future(collect(generation.events()))
+        owner_worker.own("s1", "count", generation)
+        
+        while len(generation.chunks) < 2:
+            await asyncio.sleep(0.005)
+        follower = await other_worker.attach("s1", "count")
+        
+        assert await collect(follower) == await owner
+        assert other_worker.stats()["remote_subscribers"] == 1
+        await owner_worker.close()
+    
+    @pytest.mark.asyncio
+    async def test_slow_remote_subscriber_resyncs(self):
+        """Test a subscriber whose queue overflows catches up from a snapshot."""
+        pubsub = InMemoryPubSub()
+        owner_worker, slow_worker = make_broker(pubsub), make_broker(pubsub, queue_size=2)
+        generation = await start_reply(GenerationManager(), "a b c d e f g h i j", token_delay=0.01)
+        owner = asyncio.ensure_future(collect(generation.events()))
+        owner_worker.own("s1", "letters", generation)
+        
+        while not generation.chunks:
+            await asyncio.sleep(0.005)
+        follower = await slow_worker.attach("s1")
+        pairs = []
+        async for pair in follower:
+            pairs.append(pair)
+            await asyncio.sleep(0.05)
+        
+        assert pairs == await owner
+        assert slow_worker.stats()["resyncs"] >= 1
+        await owner_worker.close()
+    
+    @pytest.mark.asyncio
+    async def test_finished_reply_only_answers_resumes(self):
+        """Test a new turn after a reply is done finds nobody to sync with, while a resume of it still does."""
+        pubsub = InMemoryPubSub()
+        owner_worker, other_worker = make_broker(pubsub), make_broker(pubsub)
+        generation = await start_reply(GenerationManager(), "one two", token_delay=0)
+        owner = asyncio.ensure_future(collect(generation.events()))
+        owner_worker.own("s1", "count", generation)
+        await generation.wait()
+        await asyncio.sleep(0.01)
+        
+        assert await pubsub.publish(sync_channel("s1"), {"type": "sync"}) == 0
+        assert await asyncio.wait_for(other_worker.attach("s1", "next question"), 0.1) is None
+        resumed = await other_worker.attach("s1", stream_id=generation.id)
+        
+        assert resumed is not None
+        assert await collect(resumed) == await owner
+        assert await other_worker.attach("s1", stream_id="other") is None
+        await owner_worker.close()
+    
+    @pytest.mark.asyncio
+    async def test_nothing_live(self):
+        """Test attaching without a live reply anywhere returns at once."""
+        broker = make_broker(InMemoryPubSub())
+        assert await asyncio.wait_for(broker.attach("s1"), 0.1) is None
+
+
+class TestChatStreamFanOut:
+    """Test /chat/stream and /chat/live share one upstream call."""
+    
+    @pytest.mark.asyncio
+    async def test_racing_requests_share_one_completion(self):
+        """Test a second request for the same message follows the first one's reply."""
+        provider = FakeProvider(reply="one two three", first_token_delays=(0.0,), token_delay=0.05)
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Count to three", "no_cache": "true"}
+        
+        with patch.object(openai_service, "provider", provider):
+            first = asyncio.ensure_future(stream_then_disconnect(params, frames_before_disconnect=100))
+            while not provider.calls:
+                await asyncio.sleep(0.005)
+            second = await stream_then_disconnect(params, frames_before_disconnect=100)
+            first = await first
+        
+        assert data(first) == data(second) == ["one ", "two ", "three", "[DONE]"]
+        assert provider.calls == 1
+        messages = (await storage_service.get_messages_page(session_id, 10)).messages
+        assert [m["role"] for m in messages] == ["user", "assistant"]
+    
+    @pytest.mark.asyncio
+    async def test_resume_reply_from_another_worker(self):
+        """Test a reconnect landing on another worker than the reply's picks it up from there."""
+        provider = FakeProvider(reply="unused", first_token_delays=(0.0,))
+        session_id = await storage_service.create_session(user_id="user-1")
+        params = {"session_id": session_id, "user_input": "Count to four", "no_cache": "true"}
+        owner_worker = make_broker(stream_broker.pubsub)
+        generation = await start_reply(GenerationManager(), "one two three four", token_delay=0.02)
+        owner_worker.own(session_id, "Count to four", generation)
+        while len(generation.chunks) < 2:
+            await asyncio.sleep(0.005)
+        
+        with patch.object(openai_service, "provider", provider):
+            body = await stream_then_disconnect(
+                params, frames_before_disconnect=100,
+                headers=[("Last-Event-ID", f"{generation.id}:1")]
+            )
+        
+        assert "".join(data(body)) == "three four[DONE]"
+        assert provider.calls == 0
+        await owner_worker.close()
+    
+    def test_live_without_reply(self):
+        """Test /chat/live answers 204 so EventSource stops reconnecting."""
+        response = client.get("/chat/live?session_id=idle-session")
+        
+        assert response.status_code == 204
@@ -0,0 +1,212 @@
+# tests/test_write_behind.py
+"""
+Tests for the write-behind message queue.
+"""
+
+import asyncio
+import pytest
+from services.storage import InMemoryStorage, SessionNotFound, WriteBehindStorage
+
+
+class RecordingStorage(InMemoryStorage):
+    """In-memory backend that records each batch commit and creates sessions on first write."""
+    
+    def __init__(self, fail_times=0):
+        super().__init__()
+        self.batches = []
+        self.fail_times = fail_times
+    
+    async def store_messages(self, messages):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise Exception("Commit failed")
+        self.batches.append(list(messages))
+        for message in messages:
+            if message.session_id not in self._sessions:
+                await self.create_session(message.session_id)
+        await super().store_messages(messages)
+
+
+def make_queue(backend, max_batch=100, flush_interval=60, **options):
+    """Build a queue whose timer will not fire during a test unless asked."""
+    return WriteBehindStorage(backend, max_batch=max_batch, flush_interval=flush_interval, **options)
+
+
+class TestWriteBehindStorage:
+    """Test suite for WriteBehindStorage."""
+    
+    @pytest.mark.asyncio
+    async def test_store_message_is_deferred_until_flush(self):
+        """Test writes are queued and committed together on flush."""
+        backend = RecordingStorage()
+        queue = make_queue(backend)
+        
+        await queue.store_message("s1", "user", "Hello")
+        await queue.store_message("s2", "user", "Hi")
+        assert backend.batches == []
+        
+        await queue.flush()
+        
+        assert len(backend.batches) == 1
+        assert [m.content for m in backend.batches[0]] == ["Hello", "Hi"]
+        assert queue.stats()["pending"] == 0
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_size_trigger_flushes_in_background(self):
+        """Test reaching max_batch wakes the worker."""
+        backend = RecordingStorage()
+        queue = make_queue(backend, max_batch=2)
+        
+        await queue.store_message("s1", "user", "one")
+        await queue.store_message("s1", "assistant", "two")
+        await asyncio.sleep(0.01)
+        
+        assert len(backend.batches) == 1
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_time_window_flushes_in_background(self):
+        """Test queued writes land after the flush interval."""
+        backend = RecordingStorage()
+        queue = make_queue(backend, flush_interval=0.01)
+        
+        await queue.store_message("s1", "user", "Hello")
+        await asyncio.sleep(0.05)
+        
+        assert await backend.get_chat_history("s1") == [{"role": "user", "content": "Hello"}]
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_per_session_order_across_batches(self):
+        """Test ordering survives splitting into several commits."""
+        backend = RecordingStorage()
+        queue = make_queue(backend, max_batch=3)
+        
+        for i in range(10):
+            await queue.store_message("s1", "user", f"message {i}")
+        await queue.flush()
+        
+        history = await backend.get_chat_history("s1")
+        assert [m["content"] for m in history] == [f"message {i}" for i in range(10)]
+        timestamps = [m.timestamp for batch in backend.batches for m in batch]
+        assert timestamps == sorted(set(timestamps))
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_failed_commit_is_retried_in_order(self):
+        """Test a failed batch stays queued ahead of newer writes."""
+        backend = RecordingStorage(fail_times=1)
+        queue = make_queue(backend)
+        
+        await queue.store_message("s1", "user", "first")
+        with pytest.raises(Exception):
+            await queue.flush()
+        await queue.store_message("s1", "assistant", "second")
+        await queue.flush()
+        
+        history = await backend.get_chat_history("s1")
+        assert [m["content"] for m in history] == ["first", "second"]
+        assert queue.stats()["failures"] == 1
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_failing_batch_is_dead_lettered(self, caplog):
+        """Test a batch that keeps failing is retried with backoff, then set aside for newer writes."""
+        backend = RecordingStorage(fail_times=3)
+        queue = make_queue(backend, max_batch=1, flush_interval=0.01, max_attempts=3, retry_backoff=0.005)
+        
+        await queue.store_message("s1", "user", "poison")
+        await queue.store_message("s2", "user", "Hello")
+        await asyncio.sleep(0.1)
+        
+        assert [m.content for m in queue.dead_letters] == ["poison"]
+        assert queue.stats()["dead_lettered"] == 1
+        assert queue.stats()["failures"] == 3
+        assert queue.stats()["pending"] == 0
+        assert await backend.get_chat_history("s2") == [{"role": "user", "content": "Hello"}]
+        assert "dead-lettered 1 messages for sessions s1" in caplog.text
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_dead_letters_are_capped(self):
+        """Test only the newest dead-lettered messages are kept and the rest are counted."""
+        backend = RecordingStorage(fail_times=3)
+        queue = make_queue(backend, max_batch=2, flush_interval=0.01, max_attempts=1, retry_backoff=0.005, max_dead_letters=2)
+        
+        for content in ["one", "two", "three"]:
+            await queue.store_message("s1", "user", content)
+        await asyncio.sleep(0.1)
+        
+        assert [m.content for m in queue.dead_letters] == ["two", "three"]
+        assert queue.stats()["dead_lettered"] == 3
+        assert queue.stats()["dead_letters_discarded"] == 1
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_write_completion(self):
+        """Test the future returned for a queued write settles with its commit."""
+        backend = RecordingStorage(fail_times=1)
+        queue = make_queue(backend, max_batch=1, flush_interval=0.01, max_attempts=1)
+        
+        lost = await queue.store_message("s1", "user", "lost")
+        saved = await queue.store_message("s1", "user", "saved")
+        
+        with pytest.raises(Exception, match="Commit failed"):
+            await asyncio.wait_for(lost, 1)
+        assert await asyncio.wait_for(saved, 1) is None
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_writes_for_missing_session_are_dropped(self):
+        """Test messages for a session that does not exist fail at once while the rest of the batch lands."""
+        backend = InMemoryStorage()
+        await backend.create_session("live")
+        queue = make_queue(backend)
+        
+        lost = await queue.store_message("gone", "user", "lost")
+        saved = await queue.store_message("live", "user", "saved")
+        await queue.flush()
+        
+        with pytest.raises(SessionNotFound):
+            await lost
+        assert await saved is None
+        assert await backend.get_chat_history("live") == [{"role": "user", "content": "saved"}]
+        assert queue.stats()["dropped"] == 1
+        assert queue.stats()["failures"] == 0
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_read_survives_failed_flush(self):
+        """Test a read whose flush fails is served from the backend and the write stays queued."""
+        backend = RecordingStorage(fail_times=1)
+        queue = make_queue(backend)
+        
+        await queue.store_message("s1", "user", "Hello")
+        
+        assert await queue.get_chat_history("s1") == []
+        assert queue.stats()["pending"] == 1
+        await queue.flush()
+        assert await queue.get_chat_history("s1") == [{"role": "user", "content": "Hello"}]
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_reads_see_queued_writes(self):
+        """Test history reads flush the session's queued writes first."""
+        queue = make_queue(RecordingStorage())
+        
+        await queue.store_message("s1", "user", "Hello")
+        
+        assert await queue.get_chat_history("s1") == [{"role": "user", "content": "Hello"}]
+        await queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_close_drains_queue(self):
+        """Test graceful shutdown persists everything still queued."""
+        backend = RecordingStorage()
+        queue = make_queue(backend)
+        
+        await queue.store_message("s1", "user", "Hello")
+        await queue.close()
+        
+        assert await backend.get_chat_history("s1") == [{"role": "user", "content": "Hello"}]
@@ -21,23 +21,57 @@ DEFAULT_CHAT_TITLE = "New Chat"
 UNTITLED_CHAT = "Untitled Chat"
 TITLE_WORD_LIMIT = 4
 TITLE_SUFFIX = "..."
+WS_CLOSE_UNAUTHORIZED = 4401  # WebSocket close code when the first message does not authenticate
+
+# Conversation Memory
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Update the summary with the new messages, keeping facts, names, "
+    "decisions and open questions. Reply with the updated summary only."
+)
+SUMMARY_UPDATE_TEMPLATE = "Current summary:\n{summary}\n\nNew messages:\n{messages}"
+SUMMARY_CONTEXT_TEMPLATE = "Summary of the earlier conversation:\n{summary}"
+SUMMARY_ADMISSION_USER = "summarizer"  # Admission queue user that summary updates are scheduled as
 
 # Error Messages
 ERROR_SESSION_REQUIRED = "session_id and user_input are required"
 ERROR_FETCH_SESSIONS = "Failed to fetch chat sessions"
 ERROR_CREATE_CHAT = "Failed to create chat session"
 ERROR_FETCH_MESSAGES = "Failed to fetch messages"
+ERROR_FETCH_SESSION = "Failed to fetch chat session"
+ERROR_SESSION_NOT_FOUND = "Chat session not found"
 ERROR_DELETE_SESSION = "Failed to delete session"
 ERROR_OPENAI_STREAMING = "Error in OpenAI streaming"
+ERROR_INVALID_CURSOR = "Invalid pagination cursor"
+ERROR_DELETION_JOB_NOT_FOUND = "Deletion job not found"
+ERROR_TOO_MANY_SESSIONS = "Too many sessions in one deletion request (max {limit})"
+ERROR_SERVER_BUSY = "Server is busy, please retry shortly"
+ERROR_STREAM_EXPIRED = "This reply can no longer be resumed, please send your message again"
+ERROR_MESSAGE_NOT_SAVED = "Your message could not be saved, please send it again"
+ERROR_WS_INVALID_MESSAGE = "Invalid message"
+ERROR_WS_TOO_MANY_REPLIES = "Too many replies in progress on this connection"
 
 # Success Messages
 SUCCESS_SESSION_DELETED = "Session deleted successfully"
+SUCCESS_DELETION_SCHEDULED = "Session deletion scheduled"
 SUCCESS_HEALTH_CHECK = {"status": "healthy", "service": "chatbot-api"}
 
 # Logging Messages
 LOG_CHAT_REQUEST = "Chat stream request - Session: {session_id}, Input length: {input_length}"
 LOG_CHAT_COMPLETE = "Completed streaming response for session {session_id}"
 LOG_CHAT_ERROR = "Error in chat stream for session {session_id}: {error}"
+LOG_CHAT_REJECTED = "Rejected chat stream for session {session_id}: upstream queue full"
+LOG_CHAT_TRUNCATED = "Client left chat stream for session {session_id}; saved partial reply ({length} chars)"
+LOG_CHAT_RESUMED = "Resumed chat stream {stream_id} for session {session_id} after event {index}"
+LOG_CHAT_RESUME_MISSED = "Cannot resume chat stream for session {session_id} from event {event_id}"
+LOG_CHAT_ATTACHED = "Attached to the live reply of session {session_id}"
+LOG_CHAT_PERSIST_FAILED = "Failed to save user message for session {session_id}: {error}"
+LOG_CHAT_SESSION_MISSING = "Message not saved, chat session {session_id} does not exist"
+LOG_CHAT_DEDUPED = "Duplicate chat request for session {session_id} joined the one in flight"
+LOG_WS_CONNECTED = "Chat WebSocket opened for user {user_id}"
+LOG_WS_CLOSED = "Chat WebSocket closed for user {user_id}"
 LOG_SESSION_CREATED = "Created new chat session: {session_id}"
 LOG_SESSION_DELETED = "Deleted chat session: {session_id}"
-LOG_SESSIONS_FOUND = "Found {count} chat sessions"
\ No newline at end of file
+LOG_DELETION_SCHEDULED = "Scheduled deletion job {job_id} for {count} session(s)"
+LOG_SESSIONS_FOUND = "Found {count} chat sessions"
+LOG_MESSAGES_DROPPED = "Dropped {count} message(s) for deleted chat session {session_id}"
\ No newline at end of file
@@ -0,0 +1,170 @@
+# utils/sse.py
+"""
+Server-Sent Events helpers.
+"""
+
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import re
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+def format_event(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """
+    Format one SSE frame.
+    
+    A `data:` line ends at the first line break, so text spanning several
+    lines (code blocks, lists) is sent as one `data:` line per line, which
+    the client joins back together with newlines.
+    
+    Args:
+        data: The event's text
+        event: Event type, if not a plain message
+        event_id: Event id, sent back by a reconnecting client
+        
+    Returns:
+        The frame, including its terminating blank line
+    """
+    lines = []
+    if event is not None:
+        lines.append(f"event: {event}")
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in re.split(r"\r\n|\r|\n", data))
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+    """
+    Split a chunk event id ("<stream id>:<chunk index>").
+    
+    Args:
+        event_id: The id a client sent back in `Last-Event-ID`
+        
+    Returns:
+        (stream id, chunk index), or None if it is not a chunk event id
+    """
+    stream_id, _, index = event_id.strip().rpartition(":")
+    if not stream_id or not index.isdigit():
+        return None
+    return stream_id, int(index)
+
+
+async def coalesce_events(
+    events: AsyncIterator[Tuple[str, str]],
+    window: float,
+    max_bytes: int
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Batch (event id, chunk) pairs into fewer, larger SSE frames.
+    
+    The first frame is sent as soon as anything arrives (it is the time to
+    first token). After that, chunks arriving within `window` seconds of
+    the first one in a batch are joined into one frame, which is sent early
+    once it reaches `max_bytes`. A batch keeps the id of its last chunk, so resuming from
+    it continues after everything it carried, and the concatenated text
+    is unchanged.
+    
+    Args:
+        events: (event id, chunk) pairs
+        window: Longest time a chunk waits for others (0 disables batching)
+        max_bytes: Batch size that flushes a frame before the window ends
+    """
+    if window <= 0:
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+        return
+    
+    # One task reads ahead into the batch, so the response only wakes up
+    # once per frame instead of once per delta
+    loop = asyncio.get_running_loop()
+    batch: List[Tuple[str, str]] = []
+    size = 0
+    arrived = asyncio.Event()
+    flush = asyncio.Event()
+    ended = False
+    
+    async def read_ahead():
+        nonlocal size, ended
+        try:
+            async for event in events:
+                batch.append(event)
+                size += len(event[1])
+                arrived.set()
+                if size >= max_bytes:
+                    flush.set()
+        finally:
+            ended = True
+            arrived.set()
+            flush.set()
+    
+    reading = loop.create_task(read_ahead())
+    first = True
+    try:
+        while True:
+            await arrived.wait()
+            if not first and not flush.is_set():
+                timer = loop.call_later(window, flush.set)
+                try:
+                    await flush.wait()
+                finally:
+                    timer.cancel()
+            first = False
+            
+            if batch:
+                event_id = batch[-1][0]
+                text = "".join(chunk for _, chunk in batch)
+                batch.clear()
+                size = 0
+                if not ended:
+                    arrived.clear()
+                    flush.clear()
+                yield event_id, text
+            elif ended:
+                # Re-raise what the events raised, if anything
+                await reading
+                return
+    finally:
+        reading.cancel()
+        await asyncio.gather(reading, return_exceptions=True)
+        await events.aclose()
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    Streaming `text/event-stream` response that closes its generator when
+    the client disconnects.
+    
+    Starlette stops iterating the body once the client is gone but leaves a
+    generator suspended at `yield` until it is garbage collected. Closing it
+    here runs the generator's cleanup (such as detaching from the reply it
+    streams) as soon as the disconnect is seen.
+    """
+    
+    def __init__(self, content: AsyncIterator[str], headers: Optional[Dict[str, str]] = None):
+        """
+        Initialize the response.
+        
+        Args:
+            content: Async generator of SSE frames
+            headers: Extra response headers
+        """
+        super().__init__(
+            content,
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                **(headers or {}),
+            }
+        )
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
@@ -0,0 +1,28 @@
+# utils/timestamps.py
+"""
+Client-assigned message timestamps.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+
+class MessageClock:
+    """
+    Issues UTC timestamps that strictly increase within the process.
+    
+    Messages are ordered by timestamp, so two written in the same
+    microsecond, or across a small step back of the system clock, must
+    still sort in the order they were written.
+    """
+    
+    def __init__(self):
+        """Start before any real time."""
+        self._last = datetime.min.replace(tzinfo=timezone.utc)
+    
+    def now(self) -> datetime:
+        """Return the current UTC time, nudged forward to stay strictly increasing."""
+        now = datetime.now(timezone.utc)
+        if now <= self._last:
+            now = self._last + timedelta(microseconds=1)
+        self._last = now
+        return now
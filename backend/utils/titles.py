@@ -0,0 +1,27 @@
+# utils/titles.py
+"""
+Helpers for deriving chat titles from message content.
+"""
+
+from utils.constants import TITLE_WORD_LIMIT, TITLE_SUFFIX
+
+
+def derive_chat_title(content: str) -> str:
+    """
+    Build a chat title from the first words of a user message.
+    
+    Args:
+        content: The user's message content
+        
+    Returns:
+        The first TITLE_WORD_LIMIT words, with TITLE_SUFFIX appended
+        when the message was longer than that
+    """
+    all_words = content.strip().split()
+    title = " ".join(all_words[:TITLE_WORD_LIMIT])
+    
+    # Add ellipsis if message is longer
+    if len(all_words) > TITLE_WORD_LIMIT:
+        title += TITLE_SUFFIX
+    
+    return title
@@ -0,0 +1,47 @@
+# utils/tokens.py
+"""
+Helpers for estimating how many prompt tokens a chat message costs.
+"""
+
+from typing import Callable, Dict
+from config.settings import settings
+
+# Tokens the chat format adds around every message (role and separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# Tokens that prime the assistant's reply after the last message
+REPLY_PRIMING_TOKENS = 3
+
+# Characters per token for English text when no tokenizer is installed
+CHARS_PER_TOKEN = 4
+
+
+def _load_encoder() -> Callable[[str], int]:
+    """Return an exact counter when tiktoken is installed, else a character estimate."""
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(settings.openai_model)
+        return lambda text: len(encoding.encode(text))
+    except Exception:
+        return lambda text: -(-len(text) // CHARS_PER_TOKEN)
+
+
+_count_text_tokens = _load_encoder()
+
+
+def count_text_tokens(text: str) -> int:
+    """Count the tokens in a piece of text, without message overhead."""
+    return _count_text_tokens(text)
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    """
+    Count the prompt tokens one chat message costs.
+    
+    Args:
+        message: Dictionary with 'role' and 'content'
+        
+    Returns:
+        Token count including the per-message formatting overhead
+    """
+    return _count_text_tokens(message.get("content") or "") + MESSAGE_TOKEN_OVERHEAD
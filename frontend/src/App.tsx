@@ -25,7 +25,10 @@ function App() {
     isWaitingForResponse,
     chatError,
     retryLoadHistory,
-    retrySendMessage
+    retrySendMessage,
+    hasOlderMessages,
+    isLoadingOlder,
+    loadOlderMessages
   } = useChat()
   
   const { isOpen: isSidebarOpen, toggle: toggleSidebar } = useSidebar()
@@ -235,6 +238,9 @@ function App() {
           isWaitingForResponse={isWaitingForResponse}
           error={chatError}
           onRetryError={handleRetryError}
+          hasOlderMessages={hasOlderMessages}
+          isLoadingOlder={isLoadingOlder}
+          onLoadOlder={loadOlderMessages}
         />
         <ChatInput 
           onSend={sendMessage} 
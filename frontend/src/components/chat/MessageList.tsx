@@ -52,6 +52,9 @@ interface MessageListProps {
   isWaitingForResponse?: boolean
   error?: string | null
   onRetryError?: () => void
+  hasOlderMessages?: boolean
+  isLoadingOlder?: boolean
+  onLoadOlder?: () => void
 }
 
 export const MessageList: React.FC<MessageListProps> = ({ 
@@ -59,7 +62,10 @@ export const MessageList: React.FC<MessageListProps> = ({
   isLoading = false,
   isWaitingForResponse = false,
   error = null, 
-  onRetryError 
+  onRetryError,
+  hasOlderMessages = false,
+  isLoadingOlder = false,
+  onLoadOlder
 }) => {
   return (
     <div className="flex-1 overflow-y-auto p-4 pt-20 relative z-10">
@@ -83,6 +89,17 @@ export const MessageList: React.FC<MessageListProps> = ({
         <EmptyState />
       ) : (
         <div className="space-y-4 animate-fade-in">
+          {hasOlderMessages && (
+            <div className="flex justify-center">
+              <button
+                onClick={onLoadOlder}
+                disabled={isLoadingOlder}
+                className="px-4 py-1 text-sm text-white/80 bg-white/10 hover:bg-white/20 rounded-full transition-colors disabled:opacity-50"
+              >
+                {isLoadingOlder ? "Loading..." : "Load older messages"}
+              </button>
+            </div>
+          )}
           {messages.map((message, index) => (
             <MessageBubble
               key={index}
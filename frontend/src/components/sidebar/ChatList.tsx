@@ -8,13 +8,19 @@ interface ChatListProps {
   currentSessionId: string | null
   onSelect: (id: string) => void
   onDelete: (id: string) => void
+  hasMore?: boolean
+  isLoadingMore?: boolean
+  onLoadMore?: () => void
 }
 
 export const ChatList: React.FC<ChatListProps> = ({
   sessions,
   currentSessionId,
   onSelect,
-  onDelete
+  onDelete,
+  hasMore = false,
+  isLoadingMore = false,
+  onLoadMore
 }) => {
   if (sessions.length === 0) {
     return (
@@ -41,6 +47,17 @@ export const ChatList: React.FC<ChatListProps> = ({
           animationDelay={index * 50}
         />
       ))}
+      {hasMore && (
+        <li className="flex justify-center pt-1">
+          <button
+            onClick={onLoadMore}
+            disabled={isLoadingMore}
+            className="px-4 py-1 text-sm text-white/80 bg-white/10 hover:bg-white/20 rounded-full transition-colors disabled:opacity-50"
+          >
+            {isLoadingMore ? "Loading..." : "Load more chats"}
+          </button>
+        </li>
+      )}
     </ul>
   )
 }
\ No newline at end of file
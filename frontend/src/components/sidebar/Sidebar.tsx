@@ -39,7 +39,9 @@ export const Sidebar: React.FC<SidebarProps> = ({
   onDelete,
 }) => {
   const [sessions, setSessions] = useState<ChatSession[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [isLoadingSessions, setIsLoadingSessions] = useState(false)
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
   const [isCreatingChat, setIsCreatingChat] = useState(false)
   const [sidebarError, setSidebarError] = useState<string | null>(null)
 
@@ -50,19 +52,41 @@ export const Sidebar: React.FC<SidebarProps> = ({
       const data = await api.getAllChats()
       if (Array.isArray(data.sessions)) {
         setSessions(data.sessions)
+        setNextCursor(data.next_cursor ?? null)
       } else {
         console.warn("Unexpected response:", data)
         setSessions([])
+        setNextCursor(null)
       }
     } catch (error) {
       console.error("Failed to fetch sessions:", error)
       setSidebarError("Failed to load conversations")
       setSessions([])
+      setNextCursor(null)
     } finally {
       setIsLoadingSessions(false)
     }
   }
 
+  // The list is paged, newest first; older chats are fetched on request
+  const loadMoreSessions = async () => {
+    if (!nextCursor || isLoadingMore) return
+    setIsLoadingMore(true)
+    setSidebarError(null)
+    try {
+      const data = await api.getAllChats(nextCursor)
+      const page: ChatSession[] = Array.isArray(data.sessions) ? data.sessions : []
+      // A chat that became active since the first page may show up again
+      setSessions(prev => [...prev, ...page.filter(s => !prev.some(p => p.id === s.id))])
+      setNextCursor(data.next_cursor ?? null)
+    } catch (error) {
+      console.error("Failed to fetch more sessions:", error)
+      setSidebarError("Failed to load more conversations")
+    } finally {
+      setIsLoadingMore(false)
+    }
+  }
+
   useEffect(() => {
     fetchSessions()
   }, [])
@@ -142,6 +166,9 @@ export const Sidebar: React.FC<SidebarProps> = ({
               currentSessionId={currentSessionId}
               onSelect={onSelect}
               onDelete={handleDelete}
+              hasMore={nextCursor !== null}
+              isLoadingMore={isLoadingMore}
+              onLoadMore={loadMoreSessions}
             />
           )}
         </div>
@@ -1,8 +1,11 @@
 // hooks/useChat.ts
-import { useState, useEffect } from "react"
+import { useState, useEffect, useRef } from "react"
 import { ChatMessage } from "../types"
 import { api } from "../services/api"
 
+// Dropped streams are resumed by the browser (it sends Last-Event-ID)
+const MAX_STREAM_RECONNECTS = 3
+
 export const useChat = () => {
   const [messages, setMessages] = useState<ChatMessage[]>([])
   const [currentSessionId, setCurrentSessionId] = useState<string | null>(null)
@@ -10,18 +13,26 @@ export const useChat = () => {
   const [isSending, setIsSending] = useState(false)
   const [isWaitingForResponse, setIsWaitingForResponse] = useState(false)
   const [chatError, setChatError] = useState<string | null>(null)
+  const [olderCursor, setOlderCursor] = useState<string | null>(null)
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false)
+  // Idempotency key of the last message sent, reused when it is retried
+  const lastRequestId = useRef<string | null>(null)
+
+  const formatMessages = (rawMessages: any[]): ChatMessage[] =>
+    rawMessages.map((msg: any) => ({
+      role: msg.role,
+      content: msg.content,
+      timestamp: new Date().toLocaleTimeString(),
+    }))
 
   const loadChatHistory = async (sessionId: string) => {
     setIsLoadingHistory(true)
     setChatError(null)
     try {
+      // Only the newest window; older messages load on demand
       const data = await api.getChatMessages(sessionId)
-      const formattedMessages: ChatMessage[] = data.messages.map((msg: any) => ({
-        role: msg.role,
-        content: msg.content,
-        timestamp: new Date().toLocaleTimeString(),
-      }))
-      setMessages(formattedMessages)
+      setMessages(formatMessages(data.messages))
+      setOlderCursor(data.has_more ? data.next_before : null)
     } catch (error) {
       console.error("Failed to load chat history:", error)
       setChatError("Failed to load chat history. Please try again.")
@@ -30,6 +41,22 @@ export const useChat = () => {
     }
   }
 
+  const loadOlderMessages = async () => {
+    if (!currentSessionId || !olderCursor || isLoadingOlder) return
+
+    setIsLoadingOlder(true)
+    try {
+      const data = await api.getChatMessages(currentSessionId, olderCursor)
+      setMessages(prev => [...formatMessages(data.messages), ...prev])
+      setOlderCursor(data.has_more ? data.next_before : null)
+    } catch (error) {
+      console.error("Failed to load older messages:", error)
+      setChatError("Failed to load older messages. Please try again.")
+    } finally {
+      setIsLoadingOlder(false)
+    }
+  }
+
   useEffect(() => {
     if (currentSessionId) {
       loadChatHistory(currentSessionId)
@@ -37,13 +64,15 @@ export const useChat = () => {
       setMessages([])
       setChatError(null)
     }
+    setOlderCursor(null)
   }, [currentSessionId])
 
-  const sendMessage = async (text: string) => {
+  const sendMessage = async (text: string, requestId: string = crypto.randomUUID()) => {
     if (!currentSessionId) {
       setChatError("No session selected")
       return
     }
+    lastRequestId.current = requestId
 
     setIsSending(true)
     setIsWaitingForResponse(false)
@@ -64,8 +93,9 @@ export const useChat = () => {
     setMessages((prev) => [...prev, assistantMessage])
 
     try {
-      const streamUrl = api.createStreamUrl(currentSessionId, text)
+      const streamUrl = api.createStreamUrl(currentSessionId, text, requestId)
       const eventSource = new EventSource(streamUrl)
+      let reconnects = 0
 
       // Connection timeout handler
       const connectionTimeout = setTimeout(() => {
@@ -109,6 +139,14 @@ export const useChat = () => {
       }
 
       eventSource.onerror = (err: Event) => {
+        // A dropped connection is retried with Last-Event-ID; the server
+        // continues the same reply instead of starting a new one
+        if (eventSource.readyState === EventSource.CONNECTING && reconnects < MAX_STREAM_RECONNECTS) {
+          reconnects += 1
+          console.warn(`SSE connection dropped, resuming (attempt ${reconnects})`)
+          return
+        }
+
         console.error("SSE error:", err)
         eventSource.close()
         clearTimeout(connectionTimeout)
@@ -182,7 +220,7 @@ export const useChat = () => {
       if (lastMessage && lastMessage.role === 'assistant' && lastMessage.content === '') {
         setMessages(prev => prev.slice(0, -1))
       }
-      sendMessage(lastUserMessage.content)
+      sendMessage(lastUserMessage.content, lastRequestId.current ?? undefined)
     }
   }
 
@@ -199,6 +237,9 @@ export const useChat = () => {
     chatError,
     setChatError,
     retryLoadHistory,
-    retrySendMessage
+    retrySendMessage,
+    hasOlderMessages: olderCursor !== null,
+    isLoadingOlder,
+    loadOlderMessages
   }
 }
\ No newline at end of file
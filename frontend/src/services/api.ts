@@ -51,9 +51,13 @@ export const api = {
     }
   },
 
-  async getAllChats() {
+  async getAllChats(cursor?: string | null, limit?: number) {
     try {
-      const res = await fetchWithAuthRetry(`${API_BASE_URL}/chats`)
+      const url = new URL(`${API_BASE_URL}/chats`)
+      if (cursor) url.searchParams.append("cursor", cursor)
+      if (limit) url.searchParams.append("limit", String(limit))
+
+      const res = await fetchWithAuthRetry(url.toString())
       if (!res.ok) {
         if (res.status >= 500) {
           throw new Error('Server error. Please try again later.')
@@ -93,9 +97,13 @@ export const api = {
     }
   },
 
-  async getChatMessages(sessionId: string) {
+  async getChatMessages(sessionId: string, before?: string | null, limit?: number) {
     try {
-      const res = await fetchWithAuthRetry(`${API_BASE_URL}/chats/${sessionId}/messages`)
+      const url = new URL(`${API_BASE_URL}/chats/${sessionId}/messages`)
+      if (before) url.searchParams.append("before", before)
+      if (limit) url.searchParams.append("limit", String(limit))
+
+      const res = await fetchWithAuthRetry(url.toString())
       if (!res.ok) {
         if (res.status >= 500) {
           throw new Error('Server error. Please try again later.')
@@ -114,10 +122,14 @@ export const api = {
     }
   },
 
-  createStreamUrl(sessionId: string, userInput: string) {
+  createStreamUrl(sessionId: string, userInput: string, requestId?: string) {
     const url = new URL(`${API_BASE_URL}/chat/stream`)
     url.searchParams.append("session_id", sessionId)
     url.searchParams.append("user_input", userInput)
+    // Duplicate submits and retries with the same id share one reply
+    if (requestId) {
+      url.searchParams.append("request_id", requestId)
+    }
 
     const token = authService.getToken()
     if (token) {
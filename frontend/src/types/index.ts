@@ -10,6 +10,8 @@ export interface ChatSession {
   title: string
   created_at: string
   updated_at: string
+  message_count?: number
+  last_message_at?: string
 }
 
 export interface ChatInputProps {